@@ -0,0 +1,283 @@
+"""
+A low-overhead instrumentation layer for the hot paths (fk, ik, collision checks, planner phases)
+It is off by default; when off, an instrumented call costs a function call and a flag check.
+Counters and histograms are kept per (name, labels) in this process, see enable, get_report and gen_prometheus_text.
+Usage:
+    import basis.instrumentation as inst
+    inst.enable()
+    ... (plan)
+    print(inst.gen_report_text())
+"""
+import math
+import time
+import bisect
+import functools
+import numpy as np
+
+# upper bounds of the histogram buckets, the last bucket is +inf
+DURATION_BUCKETS = tuple(10 ** (k / 4) for k in range(-24, 9))  # 1us to 100s, four buckets per decade
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 30, 50, 100, 200, 300, 500, 1000, 2000, 5000, 10000)
+
+_is_enabled = False
+_counter_dict = {}  # (name, labels) -> value
+_histogram_dict = {}  # (name, labels) -> Histogram
+
+
+class Histogram(object):
+    """
+    Fixed-bucket histogram, the quantiles are interpolated in the buckets
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = tuple(float(bound) for bound in buckets)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        :param q: 0 to 1
+        :return: the value interpolated linearly in the bucket that holds the quantile, clipped to [min, max]
+        """
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        cumulative_counts = np.cumsum(self.bucket_counts)
+        id = int(np.searchsorted(cumulative_counts, rank))
+        lower = self.buckets[id - 1] if id > 0 else self.min
+        upper = self.buckets[id] if id < len(self.buckets) else self.max
+        previous_count = cumulative_counts[id - 1] if id > 0 else 0
+        ratio = (rank - previous_count) / max(self.bucket_counts[id], 1)
+        return float(min(max(lower + (upper - lower) * ratio, self.min), self.max))
+
+
+def enable():
+    global _is_enabled
+    _is_enabled = True
+
+
+def disable():
+    global _is_enabled
+    _is_enabled = False
+
+
+def is_enabled():
+    return _is_enabled
+
+
+def reset():
+    _counter_dict.clear()
+    _histogram_dict.clear()
+
+
+def _get_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def count(name, value=1, **labels):
+    """
+    :param name: e.g. 'num_ik_restarts'
+    :param value: the increment
+    :param labels: e.g. planner='RRTConnect'
+    :return:
+    """
+    if not _is_enabled:
+        return
+    key = _get_key(name, labels)
+    _counter_dict[key] = _counter_dict.get(key, 0) + value
+
+
+def observe(name, value, buckets=DURATION_BUCKETS, **labels):
+    """
+    :param name: e.g. 'num_ik_iterations'
+    :param value:
+    :param buckets: used when the histogram is created by the first observation
+    :param labels:
+    :return:
+    """
+    if not _is_enabled:
+        return
+    key = _get_key(name, labels)
+    if key not in _histogram_dict:
+        _histogram_dict[key] = Histogram(buckets)
+    _histogram_dict[key].observe(value)
+
+
+class _Timer(object):
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.tic = None
+
+    def __enter__(self):
+        self.tic = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        observe(self.name, time.perf_counter() - self.tic, **self.labels)
+        return False
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+def timer(name, **labels):
+    """
+    a context manager that observes the duration of its block in seconds
+    :param name: e.g. 'planner_seconds'
+    :param labels:
+    :return:
+    """
+    if not _is_enabled:
+        return _null_timer
+    return _Timer(name, labels)
+
+
+def timed(name, **labels):
+    """
+    a decorator that observes the duration of each call in seconds
+    :param name: e.g. 'jlchain_fk_seconds'
+    :param labels:
+    :return:
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _is_enabled:
+                return function(*args, **kwargs)
+            tic = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - tic, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+def _format_name(name, labels):
+    if len(labels) == 0:
+        return name
+    return name + "{" + ",".join(key + "=" + str(value) for key, value in labels) + "}"
+
+
+def get_report():
+    """
+    :return: a json-serializable dict, {'counters': {name{labels}: value},
+             'histograms': {name{labels}: {count, sum, mean, min, p50, p90, p99, max}}}
+    """
+    report = {'counters': {}, 'histograms': {}}
+    for (name, labels), value in sorted(_counter_dict.items()):
+        report['counters'][_format_name(name, labels)] = value
+    for (name, labels), histogram in sorted(_histogram_dict.items()):
+        report['histograms'][_format_name(name, labels)] = {'count': int(histogram.count),
+                                                            'sum': histogram.sum,
+                                                            'mean': histogram.sum / histogram.count,
+                                                            'min': histogram.min,
+                                                            'p50': histogram.quantile(.5),
+                                                            'p90': histogram.quantile(.9),
+                                                            'p99': histogram.quantile(.99),
+                                                            'max': histogram.max}
+    return report
+
+
+def gen_report_text():
+    """
+    :return: a table of the histograms sorted by their total, followed by the counters
+    """
+    report = get_report()
+    line_list = ["%-60s %10s %12s %12s %12s %12s" % ("histogram", "count", "sum", "mean", "p50", "p99")]
+    for name, item in sorted(report['histograms'].items(), key=lambda name_item: -name_item[1]['sum']):
+        line_list.append("%-60s %10d %12.6g %12.6g %12.6g %12.6g" %
+                         (name, item['count'], item['sum'], item['mean'], item['p50'], item['p99']))
+    line_list.append("%-60s %10s" % ("counter", "value"))
+    for name, value in report['counters'].items():
+        line_list.append("%-60s %10g" % (name, value))
+    return "\n".join(line_list)
+
+
+def _format_prometheus_labels(labels, extra_labels=()):
+    labels = tuple(labels) + tuple(extra_labels)
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(key + "=\"" + str(value).replace("\\", "\\\\").replace("\"", "\\\"") + "\""
+                          for key, value in labels) + "}"
+
+
+def gen_prometheus_text(prefix='wrs_'):
+    """
+    the counters and histograms in the Prometheus text exposition format
+    :param prefix: prepended to the metric names
+    :return: str
+    """
+    line_list = []
+    for name in sorted({name for name, _ in _counter_dict}):
+        metric_name = prefix + name + "_total"
+        line_list.append("# TYPE " + metric_name + " counter")
+        for (counter_name, labels), value in sorted(_counter_dict.items()):
+            if counter_name == name:
+                line_list.append(metric_name + _format_prometheus_labels(labels) + " " + repr(float(value)))
+    for name in sorted({name for name, _ in _histogram_dict}):
+        metric_name = prefix + name
+        line_list.append("# TYPE " + metric_name + " histogram")
+        for (histogram_name, labels), histogram in sorted(_histogram_dict.items()):
+            if histogram_name != name:
+                continue
+            cumulative_counts = np.cumsum(histogram.bucket_counts)
+            for bound, cumulative_count in zip(histogram.buckets, cumulative_counts):
+                line_list.append(metric_name + "_bucket" + _format_prometheus_labels(labels, [('le', "%.6g" % bound)]) +
+                                 " " + str(int(cumulative_count)))
+            line_list.append(metric_name + "_bucket" + _format_prometheus_labels(labels, [('le', "+Inf")]) + " " +
+                             str(int(histogram.count)))
+            line_list.append(metric_name + "_sum" + _format_prometheus_labels(labels) + " " + repr(histogram.sum))
+            line_list.append(metric_name + "_count" + _format_prometheus_labels(labels) + " " +
+                             str(int(histogram.count)))
+    return "\n".join(line_list) + "\n"
+
+
+if __name__ == '__main__':
+    # the instrumented modules import basis.instrumentation, not this __main__ module
+    import basis.instrumentation as inst
+    import robotsim.robots.yumi.yumi as ym
+    import modeling.collisionmodel as cm
+    import motion.probabilistic.rrt_connect as rrtc
+
+    robot_instance = ym.Yumi(enable_cc=True)
+    obstacle = cm.gen_box(extent=np.array([.1, .1, .4]))
+    obstacle.set_pos(np.array([.45, -.2, .2]))
+    start_conf = robot_instance.get_jnt_values('rgt_arm')
+    goal_conf = robot_instance.ik('rgt_arm', np.array([.4, -.35, .15]), np.array([[1, 0, 0], [0, -1, 0], [0, 0, -1]]))
+    inst.enable()
+    rrtc_planner = rrtc.RRTConnect(robot_instance)
+    path = rrtc_planner.plan(component_name='rgt_arm',
+                             start_conf=start_conf,
+                             goal_conf=goal_conf,
+                             obstacle_list=[obstacle],
+                             ext_dist=.05,
+                             maxtime=30)
+    inst.disable()
+    print(inst.gen_report_text())
+    print(inst.gen_prometheus_text())
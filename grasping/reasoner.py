@@ -1,14 +1,33 @@
-def get_collisionfree_graspids(hnd, grasp_info_list, goal_info, obstacle_list):
+import numpy as np
+
+
+def _get_reachable_mask(rmap, grasp_info_list, graspids, goal_pos, goal_rotmat):
+    """
+    :param rmap: robotsim._kinematics.reachabilitymap.ReachabilityMap, every grasp is reachable if None
+    :return: a bool list aligned with graspids
+    """
+    if rmap is None or len(graspids) == 0:
+        return [True] * len(graspids)
+    gl_hnd_pos_array = np.array([grasp_info_list[i][2] for i in graspids]).dot(goal_rotmat.T) + goal_pos
+    gl_hnd_rotmat_array = goal_rotmat @ np.array([grasp_info_list[i][3] for i in graspids])
+    return list(rmap.is_reachable_many(gl_hnd_pos_array, gl_hnd_rotmat_array))
+
+
+def get_collisionfree_graspids(hnd, grasp_info_list, goal_info, obstacle_list, rmap=None):
     """
     :param hnd:
     :param grasp_info_list:
     :param goal_info: [goal_pos, goal_rotmat]
     :param obstacle_list
+    :param rmap: a reachability map of the arm holding hnd, unreachable grasps are skipped before collision checking
     :return:
     """
     goal_pos, goal_rotmat = goal_info
     available_graspids = []
+    is_reachable = _get_reachable_mask(rmap, grasp_info_list, range(len(grasp_info_list)), goal_pos, goal_rotmat)
     for graspid, grasp_info in enumerate(grasp_info_list):
+        if not is_reachable[graspid]:
+            continue
         jaw_width, _, loc_hnd_pos, loc_hnd_rotmat = grasp_info
         gl_hnd_pos = goal_rotmat.dot(loc_hnd_pos) + goal_pos
         gl_hnd_rotmat = goal_rotmat.dot(loc_hnd_rotmat)
@@ -19,13 +38,14 @@ def get_collisionfree_graspids(hnd, grasp_info_list, goal_info, obstacle_list):
     return available_graspids
 
 
-def get_common_collisionfree_graspids(hnd, grasp_info_list, goal_info_list, obstacle_list):
+def get_common_collisionfree_graspids(hnd, grasp_info_list, goal_info_list, obstacle_list, rmap=None):
     """
     get the common collisionfree graspids from a list of [goal_pos, goal_rotmat] and obstacle_list
     :param hnd:
     :param grasp_info_list:
     :param goal_info_list: [[goal_pos, goal_rotmat], ...]
     :param obstacle_list
+    :param rmap: a reachability map of the arm holding hnd, unreachable grasps are skipped before collision checking
     :return:
     """
     previously_available_graspids = range(len(grasp_info_list))
@@ -34,8 +54,12 @@ def get_common_collisionfree_graspids(hnd, grasp_info_list, goal_info_list, obst
         goal_pos, goal_rotmat = goal_info
         graspid_and_graspinfo_list = zip(previously_available_graspids,  # need .copy()?
                                          [grasp_info_list[i] for i in previously_available_graspids])
+        is_reachable = _get_reachable_mask(rmap, grasp_info_list, previously_available_graspids, goal_pos,
+                                           goal_rotmat)
         previously_available_graspids = []
-        for graspid, grasp_info in graspid_and_graspinfo_list:
+        for i, (graspid, grasp_info) in enumerate(graspid_and_graspinfo_list):
+            if not is_reachable[i]:
+                continue
             jaw_width, _, loc_hnd_pos, loc_hnd_rotmat = grasp_info
             gl_hnd_pos = goal_rotmat.dot(loc_hnd_pos) + goal_pos
             gl_hnd_rotmat = goal_rotmat.dot(loc_hnd_rotmat)
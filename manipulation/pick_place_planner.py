@@ -4,6 +4,7 @@ import copy
 import pickle
 import numpy as np
 import basis.data_adapter as da
+import basis.instrumentation as inst
 import modeling.collisionmodel as cm
 import motion.optimization_based.incremental_nik as inik
 import motion.probabilistic.rrt_connect as rrtc
@@ -46,6 +47,7 @@ class PickPlacePlanner(adp.ADPlanner):
             raise ValueError('Type must be absolute or relative!')
         return objpose_list
 
+    @inst.timed('planner_seconds', planner='pick_place', phase='find_common_graspids')
     def find_common_graspids(self,
                              component_name,
                              hnd_name,
@@ -75,44 +77,71 @@ class PickPlacePlanner(adp.ADPlanner):
         for goalid, goal_homomat in enumerate(goal_homomat_list):
             goal_pos = goal_homomat[:3, 3]
             goal_rotmat = goal_homomat[:3, :3]
-            graspid_and_graspinfo_list = zip(previously_available_graspids,  # need .copy()?
-                                             [grasp_info_list[i] for i in previously_available_graspids])
+            graspid_and_graspinfo_list = list(zip(previously_available_graspids,  # need .copy()?
+                                                  [grasp_info_list[i] for i in previously_available_graspids]))
             previously_available_graspids = []
-            for graspid, grasp_info in graspid_and_graspinfo_list:
-                jaw_width, _, loc_hnd_pos, loc_hnd_rotmat = grasp_info
-                gl_hnd_pos = goal_rotmat.dot(loc_hnd_pos) + goal_pos
-                gl_hnd_rotmat = goal_rotmat.dot(loc_hnd_rotmat)
+            # unreachable grasps are rejected by the reachability map (if any) and counted as ik failures,
+            # hand collision is checked next, the ik of the remaining grasps is solved in one batch
+            if len(graspid_and_graspinfo_list) > 0:
+                gl_hnd_pos_array = np.array([grasp_info[2] for _, grasp_info in graspid_and_graspinfo_list]).dot(
+                    goal_rotmat.T) + goal_pos
+                gl_hnd_rotmat_array = goal_rotmat @ np.array([grasp_info[3] for _, grasp_info in
+                                                              graspid_and_graspinfo_list])
+                is_reachable = self.rbt.is_reachable_many(component_name, gl_hnd_pos_array, gl_hnd_rotmat_array)
+            hndcdfree_graspids = []
+            gl_hnd_pos_list = []
+            gl_hnd_rotmat_list = []
+            for i, (graspid, grasp_info) in enumerate(graspid_and_graspinfo_list):
+                if not is_reachable[i]:
+                    ikfailed_grasps_num += 1
+                    continue
+                jaw_width = grasp_info[0]
+                gl_hnd_pos = gl_hnd_pos_array[i]
+                gl_hnd_rotmat = gl_hnd_rotmat_array[i]
                 hnd_instance.fix_to(gl_hnd_pos, gl_hnd_rotmat)
                 hnd_instance.jaw_to(jaw_width)  # TODO detect a range?
                 if not hnd_instance.is_mesh_collided(obstacle_list):  # common graspid without considering robots
-                    jnt_values = self.rbt.ik(component_name, gl_hnd_pos, gl_hnd_rotmat)
-                    if jnt_values is not None:  # common graspid consdiering robot ik
-                        if toggle_debug:
-                            hnd_tmp = hnd_instance.copy()
-                            hnd_tmp.gen_meshmodel(rgba=[0, 1, 0, .2]).attach_to(base)
-                        self.rbt.fk(component_name, jnt_values)
-                        is_rbt_collided = self.rbt.is_collided(obstacle_list)  # common graspid consdiering robot cd
-                        # TODO is_obj_collided
-                        is_obj_collided = False  # common graspid consdiering obj cd
-                        if (not is_rbt_collided) and (
-                                not is_obj_collided):  # hnd cdfree, robot ikfeasible, robot cdfree
-                            if toggle_debug:
-                                self.rbt.gen_meshmodel(rgba=[0, 1, 0, .5]).attach_to(base)
-                            previously_available_graspids.append(graspid)
-                        elif (not is_obj_collided):  # hnd cdfree, robot ikfeasible, robot collided
-                            rbtcollided_grasps_num += 1
-                            if toggle_debug:
-                                self.rbt.gen_meshmodel(rgba=[1, 0, 1, .5]).attach_to(base)
-                    else:  # hnd cdfree, robot ik infeasible
-                        ikfailed_grasps_num += 1
-                        if toggle_debug:
-                            hnd_tmp = hnd_instance.copy()
-                            hnd_tmp.gen_meshmodel(rgba=[1, .6, 0, .2]).attach_to(base)
+                    hndcdfree_graspids.append(graspid)
+                    gl_hnd_pos_list.append(gl_hnd_pos)
+                    gl_hnd_rotmat_list.append(gl_hnd_rotmat)
                 else:  # hnd collided
                     hndcollided_grasps_num += 1
                     if toggle_debug:
                         hnd_tmp = hnd_instance.copy()
                         hnd_tmp.gen_meshmodel(rgba=[1, 0, 1, .2]).attach_to(base)
+            if len(hndcdfree_graspids) == 0:
+                jnt_values_array, is_solved = [], []
+            else:
+                jnt_values_array, is_solved = self.rbt.ik_batch(component_name,
+                                                                np.array(gl_hnd_pos_list),
+                                                                np.array(gl_hnd_rotmat_list))
+            for i, graspid in enumerate(hndcdfree_graspids):
+                if is_solved[i]:  # common graspid consdiering robot ik
+                    if toggle_debug:
+                        hnd_instance.fix_to(gl_hnd_pos_list[i], gl_hnd_rotmat_list[i])
+                        hnd_instance.jaw_to(grasp_info_list[graspid][0])
+                        hnd_tmp = hnd_instance.copy()
+                        hnd_tmp.gen_meshmodel(rgba=[0, 1, 0, .2]).attach_to(base)
+                    self.rbt.fk(component_name, jnt_values_array[i])
+                    is_rbt_collided = self.rbt.is_collided(obstacle_list)  # common graspid consdiering robot cd
+                    # TODO is_obj_collided
+                    is_obj_collided = False  # common graspid consdiering obj cd
+                    if (not is_rbt_collided) and (
+                            not is_obj_collided):  # hnd cdfree, robot ikfeasible, robot cdfree
+                        if toggle_debug:
+                            self.rbt.gen_meshmodel(rgba=[0, 1, 0, .5]).attach_to(base)
+                        previously_available_graspids.append(graspid)
+                    elif (not is_obj_collided):  # hnd cdfree, robot ikfeasible, robot collided
+                        rbtcollided_grasps_num += 1
+                        if toggle_debug:
+                            self.rbt.gen_meshmodel(rgba=[1, 0, 1, .5]).attach_to(base)
+                else:  # hnd cdfree, robot ik infeasible
+                    ikfailed_grasps_num += 1
+                    if toggle_debug:
+                        hnd_instance.fix_to(gl_hnd_pos_list[i], gl_hnd_rotmat_list[i])
+                        hnd_instance.jaw_to(grasp_info_list[graspid][0])
+                        hnd_tmp = hnd_instance.copy()
+                        hnd_tmp.gen_meshmodel(rgba=[1, .6, 0, .2]).attach_to(base)
             intermediate_available_graspids.append(previously_available_graspids.copy())
             print('-----start-----')
             print('Number of collided grasps at goal-' + str(goalid) + ': ', hndcollided_grasps_num)
@@ -159,6 +188,7 @@ class PickPlacePlanner(adp.ADPlanner):
         self.rbt.release(objcm, jaw_width, hnd_name)
         return conf_list, jawwidth_list, objpose_list
 
+    @inst.timed('planner_seconds', planner='pick_place', phase='moveto')
     def gen_moveto_motion(self,
                           component_name,
                           hnd_name,
@@ -268,6 +298,7 @@ class PickPlacePlanner(adp.ADPlanner):
                        approach_jawwidth_list + depart_jawwidth_list, \
                        approach_objpose_list + depart_objpose_list
 
+    @inst.timed('planner_seconds', planner='pick_place', phase='pickup')
     def gen_pickup_motion(self,
                           component_name,
                           hnd_name,
@@ -430,6 +461,7 @@ class PickPlacePlanner(adp.ADPlanner):
                        down_jawwidth_list + up_jawwidth_list, \
                        down_objpose_list + up_objpose_list
 
+    @inst.timed('planner_seconds', planner='pick_place', phase='placedown')
     def gen_placedown_motion(self,
                              component_name,
                              hnd_name,
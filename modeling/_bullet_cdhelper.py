@@ -1,5 +1,6 @@
 from panda3d.bullet import BulletRigidBodyNode, BulletPlaneShape
 from panda3d.bullet import BulletTriangleMeshShape, BulletTriangleMesh
+from panda3d.core import TransformState
 import numpy as np
 import basis.data_adapter as da
 
@@ -17,6 +18,18 @@ def gen_cdmesh_vvnf(vertices, vertex_normals, faces, name='auto'):
     return geombullnode
 
 
+def update_cdmesh_homomat(cdmesh, homomat):
+    """
+    move a cdmesh generated in the local frame to the given pose
+    :param cdmesh: BulletRigidBodyNode
+    :param homomat: 4x4 nparray
+    :return:
+    """
+    scaled_homomat = homomat.copy()
+    scaled_homomat[:3, 3] = scaled_homomat[:3, 3] * SCALE_FOR_PRECISION
+    cdmesh.setTransform(TransformState.makeMat(da.npmat4_to_pdmat4(scaled_homomat)))
+
+
 def gen_plane_cdmesh(updirection=np.array([0, 0, 1]), offset=0, name='autogen'):
     """
     generate a plane bulletrigidbody node
@@ -43,9 +56,10 @@ def is_collided(objcm0, objcm1):
     author: weiwei
     date: 20210117
     """
-    # avoid using objcm.cdmesh -> be compatible with other cdhelpers
-    obj0 = gen_cdmesh_vvnf(*objcm0.extract_rotated_vvnf())
-    obj1 = gen_cdmesh_vvnf(*objcm1.extract_rotated_vvnf())
+    obj0 = objcm0.get_cdmesh_cache(gen_cdmesh_vvnf)
+    update_cdmesh_homomat(obj0, objcm0.get_homomat())
+    obj1 = objcm1.get_cdmesh_cache(gen_cdmesh_vvnf)
+    update_cdmesh_homomat(obj1, objcm1.get_homomat())
     result = base.physicsworld.contactTestPair(obj0, obj1)
     contacts = result.getContacts()
     contact_points = [da.pdv3_to_npv3(ct.getManifoldPoint().getPositionWorldOnB()) / SCALE_FOR_PRECISION for ct in
@@ -0,0 +1,826 @@
+"""
+A self-contained mesh collision backend in numpy, with the interface of the other cdhelpers
+(gen_cdmesh_vvnf, update_cdmesh_homomat, is_collided) and the queries they cannot answer:
+batched poses (is_collided_many, min_distance_many), minimum distances with witness points (min_distance),
+and penetration depths (penetration_depth).
+A mesh is a bounding volume hierarchy (BVH) of aabbs in its local frame, built once per CollisionModel and pickled
+with it. A query traverses the pairs of nodes level by level: the aabbs of one mesh are obbs in the frame of the
+other and are tested by the separating axes, the triangles of the leaf pairs are tested in batches.
+The meshes are surfaces, a mesh that is completely inside another one is not collided (the same as ode).
+"""
+import math
+import numpy as np
+
+LEAF_SIZE = 8
+CHUNK_SIZE = 16384  # the number of triangle pairs tested in one batch
+EPS = 1e-12
+MAX_NCONVEX_FACES = 2048  # the larger meshes are not tested for convexity, see _is_convex
+MAX_NSAT_AXES = 16384  # the edge-edge axes of the separating axis test are skipped beyond this number
+MAX_NSAMPLES = 4096  # the number of surface samples of each mesh for the penetration depths of non-convex meshes
+
+
+class BVHMesh(object):
+    """
+    The nodes are kept in arrays, the root is 0. Node nid has the aabb node_center[nid]+-node_extent[nid], the
+    children node_children[nid] ([-1, -1] for leaves), and, if it is a leaf, the triangles node_tri_ids[nid]
+    (padded with -1). node_rep_point[nid] is a vertex in the node, used for the upper bounds of distances.
+    """
+
+    def __init__(self, vertices, faces, leaf_size=LEAF_SIZE):
+        """
+        :param vertices: nx3 nparray, in the local frame
+        :param faces: mx3 nparray
+        :param leaf_size: the maximum number of triangles of a leaf
+        """
+        self.vertices = np.asarray(vertices, dtype=np.float64)
+        self.faces = np.asarray(faces, dtype=np.int64)
+        if len(self.faces) == 0:
+            raise ValueError("The mesh must have at least one face!")
+        self.triangles = self.vertices[self.faces]  # mx3x3
+        self.leaf_size = leaf_size
+        self.homomat = np.eye(4)  # the pose of the local frame, see update_cdmesh_homomat
+        self._build()
+
+    def _build(self):
+        centroids = self.triangles.mean(axis=1)
+        tri_mins = self.triangles.min(axis=1)
+        tri_maxs = self.triangles.max(axis=1)
+        center_list = []
+        extent_list = []
+        rep_point_list = []
+        children_list = []
+        tri_ids_list = []
+        stack = [(np.arange(len(self.faces)), -1, 0)]  # triangle ids, parent nid, child id in the parent
+        while len(stack) > 0:
+            tri_ids, parent_nid, child_id = stack.pop()
+            nid = len(center_list)
+            if parent_nid >= 0:
+                children_list[parent_nid][child_id] = nid
+            lower = tri_mins[tri_ids].min(axis=0)
+            upper = tri_maxs[tri_ids].max(axis=0)
+            center_list.append((lower + upper) / 2)
+            extent_list.append((upper - lower) / 2)
+            rep_point_list.append(self.triangles[tri_ids[0], 0])
+            children_list.append([-1, -1])
+            padded_tri_ids = np.full(self.leaf_size, -1, dtype=np.int64)
+            if len(tri_ids) <= self.leaf_size:
+                padded_tri_ids[:len(tri_ids)] = tri_ids
+                tri_ids_list.append(padded_tri_ids)
+                continue
+            tri_ids_list.append(padded_tri_ids)
+            # median split along the longest axis of the centroids
+            sub_centroids = centroids[tri_ids]
+            axis = np.argmax(sub_centroids.max(axis=0) - sub_centroids.min(axis=0))
+            nhalf = len(tri_ids) // 2
+            order = np.argpartition(sub_centroids[:, axis], nhalf)
+            stack.append((tri_ids[order[nhalf:]], nid, 1))
+            stack.append((tri_ids[order[:nhalf]], nid, 0))
+        self.node_center = np.array(center_list)
+        self.node_extent = np.array(extent_list)
+        self.node_radius = np.linalg.norm(self.node_extent, axis=1)
+        self.node_rep_point = np.array(rep_point_list)
+        self.node_children = np.array(children_list, dtype=np.int64)
+        self.node_tri_ids = np.array(tri_ids_list)
+
+    def __len__(self):
+        return len(self.node_center)
+
+    def is_leaf(self, nid_array):
+        return self.node_children[nid_array, 0] < 0
+
+
+# util functions
+def gen_cdmesh_vvnf(vertices, vertex_normals, faces):
+    """
+    generate cdmesh given vertices, _, and faces
+    :return: BVHMesh
+    """
+    return BVHMesh(vertices, faces)
+
+
+def update_cdmesh_homomat(cdmesh, homomat):
+    """
+    move a cdmesh generated in the local frame to the given pose
+    :param cdmesh: BVHMesh
+    :param homomat: 4x4 nparray
+    :return:
+    """
+    cdmesh.homomat = np.array(homomat, dtype=np.float64)
+
+
+def _get_relative_poses(homomat_array0, homomat1):
+    """
+    :param homomat_array0: kx4x4 nparray
+    :param homomat1: 4x4 nparray
+    :return: [rotmat_array, pos_array], the poses of 0 in the frame of 1, kx3x3 and kx3
+    """
+    rotmat1_t = homomat1[:3, :3].T
+    rotmat_array = np.einsum('ij,kjl->kil', rotmat1_t, homomat_array0[:, :3, :3])
+    pos_array = (homomat_array0[:, :3, 3] - homomat1[:3, 3]).dot(rotmat1_t.T)
+    return rotmat_array, pos_array
+
+
+def _transform(rotmat_array, pos_array, points):
+    """
+    :param rotmat_array: nx3x3
+    :param pos_array: nx3
+    :param points: nx...x3, the i-th group is transformed by the i-th pose
+    :return:
+    """
+    rotmat_array = rotmat_array.reshape((len(rotmat_array),) + (1,) * (points.ndim - 2) + (3, 3))
+    pos_array = pos_array.reshape((len(pos_array),) + (1,) * (points.ndim - 2) + (3,))
+    return np.einsum('...ij,...j->...i', rotmat_array, points) + pos_array
+
+
+def _is_box_overlapped(rotmat_array, pos_array, center0, extent0, center1, extent1):
+    """
+    separating axis test of obbs (0, rotated by rotmat_array) and aabbs (1), batched
+    :return: 1xn bool nparray
+    """
+    pos = _transform(rotmat_array, pos_array, center0) - center1
+    abs_rotmat_array = np.abs(rotmat_array) + EPS
+    # the axes of 1
+    is_separated = np.any(np.abs(pos) > extent1 + np.einsum('nij,nj->ni', abs_rotmat_array, extent0), axis=1)
+    # the axes of 0
+    pos0 = np.einsum('nji,nj->ni', rotmat_array, pos)
+    is_separated |= np.any(np.abs(pos0) > extent0 + np.einsum('nji,nj->ni', abs_rotmat_array, extent1), axis=1)
+    # the cross products of the axes
+    for i in range(3):
+        i1, i2 = (i + 1) % 3, (i + 2) % 3
+        for j in range(3):
+            j1, j2 = (j + 1) % 3, (j + 2) % 3
+            radius1 = extent1[:, i1] * abs_rotmat_array[:, i2, j] + extent1[:, i2] * abs_rotmat_array[:, i1, j]
+            radius0 = extent0[:, j1] * abs_rotmat_array[:, i, j2] + extent0[:, j2] * abs_rotmat_array[:, i, j1]
+            distance = np.abs(pos[:, i2] * rotmat_array[:, i1, j] - pos[:, i1] * rotmat_array[:, i2, j])
+            is_separated |= distance > radius0 + radius1
+    return ~is_separated
+
+
+def _box_lower_bounds(rotmat_array, pos_array, center0, extent0, center1, extent1):
+    """
+    lower bounds of the distances of obbs (0, rotated by rotmat_array) and aabbs (1), batched
+    the larger one of the distances of the aabbs of the boxes in the frame of 1 and in the frame of 0
+    :return: 1xn nparray
+    """
+    pos = _transform(rotmat_array, pos_array, center0) - center1
+    abs_rotmat_array = np.abs(rotmat_array)
+    gaps1 = np.abs(pos) - extent1 - np.einsum('nij,nj->ni', abs_rotmat_array, extent0)
+    pos0 = np.einsum('nji,nj->ni', rotmat_array, pos)
+    gaps0 = np.abs(pos0) - extent0 - np.einsum('nji,nj->ni', abs_rotmat_array, extent1)
+    return np.maximum(np.linalg.norm(np.maximum(gaps1, 0), axis=1), np.linalg.norm(np.maximum(gaps0, 0), axis=1))
+
+
+def _is_triangle_overlapped(tri0, tri1):
+    """
+    separating axis test of triangle pairs, the candidate axes are the normals, the cross products of the edges, and
+    the in-plane normals of the edges (for coplanar triangles)
+    :param tri0: nx3x3
+    :param tri1: nx3x3
+    :return: 1xn bool nparray
+    """
+    edges0 = np.roll(tri0, -1, axis=1) - tri0
+    edges1 = np.roll(tri1, -1, axis=1) - tri1
+    normal0 = np.cross(edges0[:, 0], edges0[:, 1])
+    normal1 = np.cross(edges1[:, 0], edges1[:, 1])
+    axes = np.concatenate([normal0[:, None, :],
+                           normal1[:, None, :],
+                           np.cross(edges0[:, :, None, :], edges1[:, None, :, :]).reshape(-1, 9, 3),
+                           np.cross(normal0[:, None, :], edges0),
+                           np.cross(normal1[:, None, :], edges1)], axis=1)
+    # any direction separates as well as its multiples, the (near) zero ones are left as they are
+    lengths = np.linalg.norm(axes, axis=2, keepdims=True)
+    axes = axes / np.where(lengths > EPS, lengths, 1.0)
+    projections0 = np.einsum('nad,nvd->nav', axes, tri0)
+    projections1 = np.einsum('nad,nvd->nav', axes, tri1)
+    is_separated = (projections0.min(axis=2) > projections1.max(axis=2) + EPS) | \
+                   (projections1.min(axis=2) > projections0.max(axis=2) + EPS)
+    return ~np.any(is_separated, axis=1)
+
+
+def _intersect_edges_triangles(tri0, tri1):
+    """
+    the intersections of the edges of tri0 with tri1
+    :return: [points, is_valid], nx3x3 and nx3
+    """
+    starts = tri0
+    ends = np.roll(tri0, -1, axis=1)
+    normal = np.cross(tri1[:, 1] - tri1[:, 0], tri1[:, 2] - tri1[:, 0])
+    start_dists = np.einsum('nvd,nd->nv', starts - tri1[:, None, 0], normal)
+    end_dists = np.einsum('nvd,nd->nv', ends - tri1[:, None, 0], normal)
+    is_valid = (start_dists * end_dists <= 0) & (start_dists != end_dists)
+    ratios = start_dists / np.where(start_dists != end_dists, start_dists - end_dists, 1.0)
+    points = starts + ratios[:, :, None] * (ends - starts)
+    # inside the triangle if on the inner side of all the edges
+    edges1 = np.roll(tri1, -1, axis=1) - tri1
+    sides = np.einsum('nped,nd->npe',
+                      np.cross(edges1[:, None, :, :], points[:, :, None, :] - tri1[:, None, :, :]), normal)
+    is_valid &= np.all(sides >= -EPS * np.einsum('nd,nd->n', normal, normal)[:, None, None], axis=2)
+    return points, is_valid
+
+
+def _gen_contact_points(tri0, tri1):
+    """
+    the points where the edges of one triangle cross the other one, the middle of the centroids for coplanar pairs
+    :return: a list of the contact points of each pair, the points are 1x3 nparrays
+    """
+    points0, is_valid0 = _intersect_edges_triangles(tri0, tri1)
+    points1, is_valid1 = _intersect_edges_triangles(tri1, tri0)
+    points = np.concatenate([points0, points1], axis=1)
+    is_valid = np.concatenate([is_valid0, is_valid1], axis=1)
+    contact_points_list = []
+    for i in range(len(points)):
+        if np.any(is_valid[i]):
+            contact_points_list.append(list(points[i][is_valid[i]]))
+        else:
+            contact_points_list.append([(tri0[i].mean(axis=0) + tri1[i].mean(axis=0)) / 2])
+    return contact_points_list
+
+
+def _expand_leaf_pairs(bvh0, bvh1, pose_ids, nid_array0, nid_array1):
+    """
+    :return: [pose_ids, tri_ids0, tri_ids1] of the triangle pairs of the leaf pairs
+    """
+    tri_ids0 = np.broadcast_to(bvh0.node_tri_ids[nid_array0][:, :, None],
+                               (len(nid_array0), bvh0.leaf_size, bvh1.leaf_size))
+    tri_ids1 = np.broadcast_to(bvh1.node_tri_ids[nid_array1][:, None, :],
+                               (len(nid_array1), bvh0.leaf_size, bvh1.leaf_size))
+    pose_ids = np.broadcast_to(pose_ids[:, None, None], tri_ids0.shape)
+    is_valid = (tri_ids0 >= 0) & (tri_ids1 >= 0)
+    return pose_ids[is_valid], tri_ids0[is_valid], tri_ids1[is_valid]
+
+
+def _split(bvh0, bvh1, pose_ids, nid_array0, nid_array1):
+    """
+    replace each pair of nodes (not both leaves) by the pairs of the children of the larger node
+    :return: [pose_ids, nid_array0, nid_array1]
+    """
+    is_leaf0 = bvh0.is_leaf(nid_array0)
+    is_leaf1 = bvh1.is_leaf(nid_array1)
+    is_split0 = ~is_leaf0 & (is_leaf1 | (bvh0.node_radius[nid_array0] >= bvh1.node_radius[nid_array1]))
+    is_split1 = ~is_split0
+    children0 = bvh0.node_children[nid_array0[is_split0]]
+    children1 = bvh1.node_children[nid_array1[is_split1]]
+    pose_ids = np.concatenate([np.repeat(pose_ids[is_split0], 2), np.repeat(pose_ids[is_split1], 2)])
+    nid_array0 = np.concatenate([children0.ravel(), np.repeat(nid_array0[is_split1], 2)])
+    nid_array1 = np.concatenate([np.repeat(nid_array1[is_split0], 2), children1.ravel()])
+    return pose_ids, nid_array0, nid_array1
+
+
+def _collide(bvh0, bvh1, rotmat_array, pos_array, toggle_contacts=False):
+    """
+    :param rotmat_array: kx3x3, the poses of bvh0 in the frame of bvh1
+    :param pos_array: kx3
+    :param toggle_contacts: collect the contact points of the collided triangle pairs
+                            the traversal of a pose stops at the first batch of triangle pairs that collides, the
+                            contact points are those of the batch
+    :return: [is_collided_array, contact_points_list], the contact points are in the frame of bvh1
+    """
+    npose = len(rotmat_array)
+    is_collided_array = np.zeros(npose, dtype=bool)
+    contact_points_list = [[] for _ in range(npose)]
+    pose_ids = np.arange(npose)
+    nid_array0 = np.zeros(npose, dtype=np.int64)
+    nid_array1 = np.zeros(npose, dtype=np.int64)
+    while len(pose_ids) > 0:
+        is_overlapped = _is_box_overlapped(rotmat_array[pose_ids],
+                                           pos_array[pose_ids],
+                                           bvh0.node_center[nid_array0],
+                                           bvh0.node_extent[nid_array0],
+                                           bvh1.node_center[nid_array1],
+                                           bvh1.node_extent[nid_array1])
+        pose_ids, nid_array0, nid_array1 = pose_ids[is_overlapped], nid_array0[is_overlapped], nid_array1[is_overlapped]
+        is_leaf_pair = bvh0.is_leaf(nid_array0) & bvh1.is_leaf(nid_array1)
+        tri_pose_ids, tri_ids0, tri_ids1 = _expand_leaf_pairs(bvh0,
+                                                              bvh1,
+                                                              pose_ids[is_leaf_pair],
+                                                              nid_array0[is_leaf_pair],
+                                                              nid_array1[is_leaf_pair])
+        for start in range(0, len(tri_pose_ids), CHUNK_SIZE):
+            chunk_pose_ids = tri_pose_ids[start:start + CHUNK_SIZE]
+            is_open = ~is_collided_array[chunk_pose_ids]
+            chunk_pose_ids = chunk_pose_ids[is_open]
+            tri0 = _transform(rotmat_array[chunk_pose_ids],
+                              pos_array[chunk_pose_ids],
+                              bvh0.triangles[tri_ids0[start:start + CHUNK_SIZE][is_open]])
+            tri1 = bvh1.triangles[tri_ids1[start:start + CHUNK_SIZE][is_open]]
+            # aabbs of the triangles first
+            is_candidate = np.all((tri0.min(axis=1) <= tri1.max(axis=1) + EPS) &
+                                  (tri1.min(axis=1) <= tri0.max(axis=1) + EPS), axis=1)
+            is_candidate[is_candidate] = _is_triangle_overlapped(tri0[is_candidate], tri1[is_candidate])
+            if not np.any(is_candidate):
+                continue
+            collided_pose_ids = chunk_pose_ids[is_candidate]
+            is_collided_array[collided_pose_ids] = True
+            if toggle_contacts:
+                for pose_id, contact_points in zip(collided_pose_ids,
+                                                   _gen_contact_points(tri0[is_candidate], tri1[is_candidate])):
+                    contact_points_list[pose_id].extend(contact_points)
+        is_open = ~is_leaf_pair & ~is_collided_array[pose_ids]
+        pose_ids, nid_array0, nid_array1 = _split(bvh0,
+                                                  bvh1,
+                                                  pose_ids[is_open],
+                                                  nid_array0[is_open],
+                                                  nid_array1[is_open])
+    return is_collided_array, contact_points_list
+
+
+def _closest_points_on_triangles(points, tri):
+    """
+    the closest points on the triangles (Ericson, Real-Time Collision Detection, 5.1.5), broadcast
+    :param points: ...x3
+    :param tri: ...x3x3
+    :return: ...x3
+    """
+    a, b, c = tri[..., 0, :], tri[..., 1, :], tri[..., 2, :]
+    ab = b - a
+    ac = c - a
+    ap = points - a
+    bp = points - b
+    cp = points - c
+    d1 = np.sum(ab * ap, axis=-1)
+    d2 = np.sum(ac * ap, axis=-1)
+    d3 = np.sum(ab * bp, axis=-1)
+    d4 = np.sum(ac * bp, axis=-1)
+    d5 = np.sum(ab * cp, axis=-1)
+    d6 = np.sum(ac * cp, axis=-1)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # the regions are checked in the reverse order of Ericson, so that the first match of Ericson wins
+        denom = va + vb + vc
+        denom = np.where(denom != 0, denom, 1.0)
+        result = a + ab * (vb / denom)[..., None] + ac * (vc / denom)[..., None]
+        ratio = (d4 - d3) / np.where((d4 - d3) + (d5 - d6) != 0, (d4 - d3) + (d5 - d6), 1.0)
+        result = np.where(((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0))[..., None], b + (c - b) * ratio[..., None],
+                          result)
+        ratio = d2 / np.where(d2 - d6 != 0, d2 - d6, 1.0)
+        result = np.where(((vb <= 0) & (d2 >= 0) & (d6 <= 0))[..., None], a + ac * ratio[..., None], result)
+        result = np.where(((d6 >= 0) & (d5 <= d6))[..., None], c, result)
+        ratio = d1 / np.where(d1 - d3 != 0, d1 - d3, 1.0)
+        result = np.where(((vc <= 0) & (d1 >= 0) & (d3 <= 0))[..., None], a + ab * ratio[..., None], result)
+        result = np.where(((d3 >= 0) & (d4 <= d3))[..., None], b, result)
+        result = np.where(((d1 <= 0) & (d2 <= 0))[..., None], a, result)
+    return result
+
+
+def _closest_points_on_segments(start0, end0, start1, end1):
+    """
+    the closest points of segment pairs (Ericson, Real-Time Collision Detection, 5.1.9), broadcast
+    :return: [points0, points1], ...x3
+    """
+    direction0 = end0 - start0
+    direction1 = end1 - start1
+    offset = start0 - start1
+    a = np.sum(direction0 * direction0, axis=-1)
+    e = np.sum(direction1 * direction1, axis=-1)
+    b = np.sum(direction0 * direction1, axis=-1)
+    c = np.sum(direction0 * offset, axis=-1)
+    f = np.sum(direction1 * offset, axis=-1)
+    safe_a = np.where(a > EPS, a, 1.0)
+    safe_e = np.where(e > EPS, e, 1.0)
+    denom = a * e - b * b
+    s = np.where(denom > EPS, np.clip((b * f - c * e) / np.where(denom > EPS, denom, 1.0), 0, 1), 0.0)
+    t = (b * s + f) / safe_e
+    s = np.where(t < 0, np.clip(-c / safe_a, 0, 1), np.where(t > 1, np.clip((b - c) / safe_a, 0, 1), s))
+    t = np.clip(t, 0, 1)
+    # degenerate segments
+    s = np.where(e <= EPS, np.clip(-c / safe_a, 0, 1), s)
+    t = np.where(e <= EPS, 0.0, t)
+    t = np.where(a <= EPS, np.clip(f / safe_e, 0, 1), t)
+    s = np.where(a <= EPS, 0.0, s)
+    return start0 + direction0 * s[..., None], start1 + direction1 * t[..., None]
+
+
+def _triangle_distances(tri0, tri1):
+    """
+    the distances of triangle pairs that do not intersect, the minimum of the edge-edge and vertex-triangle distances
+    :param tri0: nx3x3
+    :param tri1: nx3x3
+    :return: [distances, points0, points1], 1xn, nx3, nx3
+    """
+    ntris = len(tri0)
+    ends0 = np.roll(tri0, -1, axis=1)
+    ends1 = np.roll(tri1, -1, axis=1)
+    edge_points0, edge_points1 = _closest_points_on_segments(tri0[:, :, None, :],
+                                                             ends0[:, :, None, :],
+                                                             tri1[:, None, :, :],
+                                                             ends1[:, None, :, :])
+    vertex_points1 = _closest_points_on_triangles(tri0, tri1[:, None, :, :])
+    vertex_points0 = _closest_points_on_triangles(tri1, tri0[:, None, :, :])
+    points0 = np.concatenate([edge_points0.reshape(ntris, 9, 3), tri0, vertex_points0], axis=1)
+    points1 = np.concatenate([edge_points1.reshape(ntris, 9, 3), vertex_points1, tri1], axis=1)
+    distances = np.linalg.norm(points0 - points1, axis=2)
+    ids = np.argmin(distances, axis=1)
+    rows = np.arange(ntris)
+    return distances[rows, ids], points0[rows, ids], points1[rows, ids]
+
+
+def _update_best(best_distances, best_points0, best_points1, pose_ids, distances, points0, points1):
+    """
+    update the best distances (and their points) of the poses in place by the minimum of the candidates of each pose
+    """
+    if len(pose_ids) == 0:
+        return
+    order = np.lexsort((distances, pose_ids))
+    unique_pose_ids, first_ids = np.unique(pose_ids[order], return_index=True)
+    candidate_ids = order[first_ids]
+    is_better = distances[candidate_ids] < best_distances[unique_pose_ids]
+    unique_pose_ids = unique_pose_ids[is_better]
+    candidate_ids = candidate_ids[is_better]
+    best_distances[unique_pose_ids] = distances[candidate_ids]
+    best_points0[unique_pose_ids] = points0[candidate_ids]
+    best_points1[unique_pose_ids] = points1[candidate_ids]
+
+
+def _min_distance(bvh0, bvh1, rotmat_array, pos_array):
+    """
+    branch and bound over the pairs of nodes, the lower bounds are the distances of the boxes of the nodes (see
+    _box_lower_bounds) and of the triangles, the upper bounds are the distances of the representative vertices
+    the meshes must not collide, see _collide
+    :param rotmat_array: kx3x3, the poses of bvh0 in the frame of bvh1
+    :param pos_array: kx3
+    :return: [distances, points0, points1], the points are in the frame of bvh1
+    """
+    npose = len(rotmat_array)
+    best_distances = np.full(npose, np.inf)
+    best_points0 = np.zeros((npose, 3))
+    best_points1 = np.zeros((npose, 3))
+    pose_ids = np.arange(npose)
+    nid_array0 = np.zeros(npose, dtype=np.int64)
+    nid_array1 = np.zeros(npose, dtype=np.int64)
+    while len(pose_ids) > 0:
+        rotmats = rotmat_array[pose_ids]
+        poss = pos_array[pose_ids]
+        rep_points0 = _transform(rotmats, poss, bvh0.node_rep_point[nid_array0])
+        rep_points1 = bvh1.node_rep_point[nid_array1]
+        _update_best(best_distances, best_points0, best_points1, pose_ids,
+                     np.linalg.norm(rep_points0 - rep_points1, axis=1), rep_points0, rep_points1)
+        lower_bounds = _box_lower_bounds(rotmats,
+                                         poss,
+                                         bvh0.node_center[nid_array0],
+                                         bvh0.node_extent[nid_array0],
+                                         bvh1.node_center[nid_array1],
+                                         bvh1.node_extent[nid_array1])
+        is_open = lower_bounds < best_distances[pose_ids]
+        pose_ids, nid_array0, nid_array1 = pose_ids[is_open], nid_array0[is_open], nid_array1[is_open]
+        is_leaf_pair = bvh0.is_leaf(nid_array0) & bvh1.is_leaf(nid_array1)
+        tri_pose_ids, tri_ids0, tri_ids1 = _expand_leaf_pairs(bvh0,
+                                                              bvh1,
+                                                              pose_ids[is_leaf_pair],
+                                                              nid_array0[is_leaf_pair],
+                                                              nid_array1[is_leaf_pair])
+        for start in range(0, len(tri_pose_ids), CHUNK_SIZE):
+            chunk_pose_ids = tri_pose_ids[start:start + CHUNK_SIZE]
+            tri0 = _transform(rotmat_array[chunk_pose_ids],
+                              pos_array[chunk_pose_ids],
+                              bvh0.triangles[tri_ids0[start:start + CHUNK_SIZE]])
+            tri1 = bvh1.triangles[tri_ids1[start:start + CHUNK_SIZE]]
+            # the distances of the aabbs of the triangles first
+            gaps = np.maximum(tri0.min(axis=1) - tri1.max(axis=1), tri1.min(axis=1) - tri0.max(axis=1))
+            is_open = np.linalg.norm(np.maximum(gaps, 0), axis=1) < best_distances[chunk_pose_ids]
+            chunk_pose_ids, tri0, tri1 = chunk_pose_ids[is_open], tri0[is_open], tri1[is_open]
+            distances, points0, points1 = _triangle_distances(tri0, tri1)
+            _update_best(best_distances, best_points0, best_points1, chunk_pose_ids, distances, points0, points1)
+        is_open = ~is_leaf_pair
+        pose_ids, nid_array0, nid_array1 = _split(bvh0,
+                                                  bvh1,
+                                                  pose_ids[is_open],
+                                                  nid_array0[is_open],
+                                                  nid_array1[is_open])
+    return best_distances, best_points0, best_points1
+
+
+def _points_min_distance(bvh, points):
+    """
+    the closest points on the mesh, branch and bound as _min_distance
+    :param points: nx3, in the frame of bvh
+    :return: [distances, closest_points]
+    """
+    npoints = len(points)
+    best_distances = np.full(npoints, np.inf)
+    best_points = np.zeros((npoints, 3))
+    point_ids = np.arange(npoints)
+    nid_array = np.zeros(npoints, dtype=np.int64)
+    while len(point_ids) > 0:
+        rep_points = bvh.node_rep_point[nid_array]
+        _update_best(best_distances, best_points, best_points, point_ids,
+                     np.linalg.norm(points[point_ids] - rep_points, axis=1), rep_points, rep_points)
+        lower_bounds = np.linalg.norm(points[point_ids] - bvh.node_center[nid_array], axis=1) - \
+                       bvh.node_radius[nid_array]
+        is_open = lower_bounds < best_distances[point_ids]
+        point_ids, nid_array = point_ids[is_open], nid_array[is_open]
+        is_leaf = bvh.is_leaf(nid_array)
+        tri_ids = bvh.node_tri_ids[nid_array[is_leaf]]
+        leaf_point_ids = np.broadcast_to(point_ids[is_leaf][:, None], tri_ids.shape)[tri_ids >= 0]
+        tri_ids = tri_ids[tri_ids >= 0]
+        closest_points = _closest_points_on_triangles(points[leaf_point_ids], bvh.triangles[tri_ids])
+        _update_best(best_distances, best_points, best_points, leaf_point_ids,
+                     np.linalg.norm(points[leaf_point_ids] - closest_points, axis=1), closest_points, closest_points)
+        point_ids = np.repeat(point_ids[~is_leaf], 2)
+        nid_array = bvh.node_children[nid_array[~is_leaf]].ravel()
+    return best_distances, best_points
+
+
+def _is_inside(bvh, points):
+    """
+    inside test by the generalized winding numbers, the mesh should be closed
+    :param points: nx3, in the frame of bvh
+    :return: 1xn bool nparray
+    """
+    is_inside = np.zeros(len(points), dtype=bool)
+    lower = bvh.node_center[0] - bvh.node_extent[0]
+    upper = bvh.node_center[0] + bvh.node_extent[0]
+    candidate_ids = np.where(np.all((points >= lower) & (points <= upper), axis=1))[0]
+    nchunk = max(CHUNK_SIZE * 16 // len(bvh.triangles), 1)
+    for start in range(0, len(candidate_ids), nchunk):
+        ids = candidate_ids[start:start + nchunk]
+        vectors = bvh.triangles[None, :, :, :] - points[ids][:, None, None, :]  # nxmx3x3
+        lengths = np.linalg.norm(vectors, axis=3)
+        a, b, c = vectors[:, :, 0], vectors[:, :, 1], vectors[:, :, 2]
+        numerator = np.einsum('nmd,nmd->nm', a, np.cross(b, c))
+        denominator = lengths[:, :, 0] * lengths[:, :, 1] * lengths[:, :, 2] + \
+                      np.einsum('nmd,nmd->nm', a, b) * lengths[:, :, 2] + \
+                      np.einsum('nmd,nmd->nm', a, c) * lengths[:, :, 1] + \
+                      np.einsum('nmd,nmd->nm', b, c) * lengths[:, :, 0]
+        winding_numbers = np.sum(np.arctan2(numerator, denominator), axis=1) / (2 * math.pi)
+        is_inside[ids] = np.abs(winding_numbers) > .5
+    return is_inside
+
+
+def _get_cdmesh_homomat(objcm):
+    cdmesh = objcm.get_cdmesh_cache(gen_cdmesh_vvnf)
+    update_cdmesh_homomat(cdmesh, objcm.get_homomat())
+    return cdmesh, cdmesh.homomat
+
+
+def _to_world(homomat, points):
+    return points.dot(homomat[:3, :3].T) + homomat[:3, 3]
+
+
+def is_collided(objcm0, objcm1):
+    """
+    check if two objcm are collided after converting the specified cdmesh_type
+    :param objcm0: an instance of CollisionModel
+    :param objcm1: an instance of CollisionModel
+    :return: [bool, contact_points]
+    """
+    bvh0, homomat0 = _get_cdmesh_homomat(objcm0)
+    bvh1, homomat1 = _get_cdmesh_homomat(objcm1)
+    rotmat_array, pos_array = _get_relative_poses(homomat0[None, :, :], homomat1)
+    is_collided_array, contact_points_list = _collide(bvh0, bvh1, rotmat_array, pos_array, toggle_contacts=True)
+    contact_points = [_to_world(homomat1, point) for point in contact_points_list[0]]
+    return (True, contact_points) if is_collided_array[0] else (False, contact_points)
+
+
+def is_collided_many(objcm0, objcm1, homomat_array0):
+    """
+    check objcm0 at many poses against objcm1 at its current pose, in one traversal
+    :param objcm0: an instance of CollisionModel, its current pose is ignored
+    :param objcm1: an instance of CollisionModel
+    :param homomat_array0: kx4x4 nparray, the poses of objcm0
+    :return: 1xk bool nparray
+    """
+    bvh0, _ = _get_cdmesh_homomat(objcm0)
+    bvh1, homomat1 = _get_cdmesh_homomat(objcm1)
+    rotmat_array, pos_array = _get_relative_poses(np.asarray(homomat_array0, dtype=np.float64), homomat1)
+    return _collide(bvh0, bvh1, rotmat_array, pos_array)[0]
+
+
+def min_distance_many(objcm0, objcm1, homomat_array0):
+    """
+    the minimum distances of objcm0 at many poses to objcm1 at its current pose
+    a collided pose has the distance 0 and one of its contact points as the witness points
+    :param objcm0: an instance of CollisionModel, its current pose is ignored
+    :param objcm1: an instance of CollisionModel
+    :param homomat_array0: kx4x4 nparray, the poses of objcm0
+    :return: [distances, points0, points1], 1xk, kx3, kx3, the witness points on objcm0 and objcm1
+    """
+    bvh0, _ = _get_cdmesh_homomat(objcm0)
+    bvh1, homomat1 = _get_cdmesh_homomat(objcm1)
+    rotmat_array, pos_array = _get_relative_poses(np.asarray(homomat_array0, dtype=np.float64), homomat1)
+    is_collided_array, contact_points_list = _collide(bvh0, bvh1, rotmat_array, pos_array, toggle_contacts=True)
+    distances = np.zeros(len(rotmat_array))
+    points0 = np.zeros((len(rotmat_array), 3))
+    points1 = np.zeros((len(rotmat_array), 3))
+    for pose_id in np.where(is_collided_array)[0]:
+        points0[pose_id] = points1[pose_id] = contact_points_list[pose_id][0]
+    free_ids = np.where(~is_collided_array)[0]
+    if len(free_ids) > 0:
+        distances[free_ids], points0[free_ids], points1[free_ids] = _min_distance(bvh0,
+                                                                                  bvh1,
+                                                                                  rotmat_array[free_ids],
+                                                                                  pos_array[free_ids])
+    return distances, _to_world(homomat1, points0), _to_world(homomat1, points1)
+
+
+def min_distance(objcm0, objcm1):
+    """
+    :param objcm0: an instance of CollisionModel
+    :param objcm1: an instance of CollisionModel
+    :return: [distance, point0, point1], 0 if collided, the witness points on objcm0 and objcm1
+    """
+    distances, points0, points1 = min_distance_many(objcm0, objcm1, objcm0.get_homomat()[None, :, :])
+    return distances[0], points0[0], points1[0]
+
+
+def _is_convex(bvh):
+    """
+    whether all the vertices are behind the planes of all the faces, cached in the bvh
+    the meshes with more than MAX_NCONVEX_FACES faces are treated as non-convex
+    :return: bool
+    """
+    if getattr(bvh, '_is_convex', None) is None:
+        is_convex = False
+        if len(bvh.faces) <= MAX_NCONVEX_FACES:
+            normals = np.cross(bvh.triangles[:, 1] - bvh.triangles[:, 0], bvh.triangles[:, 2] - bvh.triangles[:, 0])
+            lengths = np.linalg.norm(normals, axis=1)
+            normals = normals[lengths > EPS] / lengths[lengths > EPS, None]
+            offsets = bvh.vertices.dot(normals.T) - np.einsum('md,md->m', bvh.triangles[lengths > EPS, 0], normals)
+            tolerance = 1e-6 * max(np.max(bvh.node_extent[0]), EPS)
+            is_convex = bool(np.all(offsets <= tolerance) or np.all(offsets >= -tolerance))
+        bvh._is_convex = is_convex
+    return bvh._is_convex
+
+
+def _get_unit_directions(vectors):
+    """
+    :param vectors: nx3
+    :return: mx3, the unique directions up to sign of the nonzero vectors
+    """
+    lengths = np.linalg.norm(vectors, axis=1)
+    directions = vectors[lengths > EPS] / lengths[lengths > EPS, None]
+    # flip to the side of the first nonzero coordinate, so that opposite directions are merged
+    signs = np.sign(directions[np.arange(len(directions)), np.argmax(np.abs(directions) > 1e-9, axis=1)])
+    return np.unique(np.round(directions * signs[:, None], 9), axis=0)
+
+
+def _sat_depth(vertices0, triangles0, vertices1, triangles1):
+    """
+    the penetration depth of two convex meshes by the separating axis test over the face normals and the cross
+    products of the edge directions, it is the exact minimum translation distance unless the edge-edge axes are
+    skipped (more than MAX_NSAT_AXES of them), in which case it is an upper bound
+    :param vertices0: nx3, in the same frame as the others
+    :param triangles0: mx3x3
+    :param vertices1:
+    :param triangles1:
+    :return: [depth, point0, point1], point0 is the deepest vertex of mesh 0 along the separating direction,
+             moving mesh 0 by point1-point0 separates the meshes
+    """
+    edges0 = _get_unit_directions((np.roll(triangles0, -1, axis=1) - triangles0).reshape(-1, 3))
+    edges1 = _get_unit_directions((np.roll(triangles1, -1, axis=1) - triangles1).reshape(-1, 3))
+    axes_list = [_get_unit_directions(np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]))
+                 for triangles in (triangles0, triangles1)]
+    if len(edges0) * len(edges1) <= MAX_NSAT_AXES:
+        axes_list.append(_get_unit_directions(np.cross(edges0[:, None, :], edges1[None, :, :]).reshape(-1, 3)))
+    axes = np.concatenate(axes_list)
+    projections0 = vertices0.dot(axes.T)
+    projections1 = vertices1.dot(axes.T)
+    # moving mesh 0 by +depth along an axis separates it from the upper side of mesh 1, -depth from the lower side
+    depths = np.concatenate((projections1.max(axis=0) - projections0.min(axis=0),
+                             projections0.max(axis=0) - projections1.min(axis=0)))
+    id = np.argmin(depths)
+    direction = axes[id % len(axes)] * (1 if id < len(axes) else -1)
+    depth = max(depths[id], 0.0)
+    point0 = vertices0[np.argmin(vertices0.dot(direction))]
+    return depth, point0, point0 + depth * direction
+
+
+def _subdivide(triangles, max_edge_length, max_ntriangles):
+    """
+    split the triangles whose longest edge is longer than max_edge_length into four, until there are more than
+    max_ntriangles of them
+    :param triangles: nx3x3
+    :return: mx3x3
+    """
+    while len(triangles) * 4 <= max_ntriangles:
+        is_long = np.max(np.linalg.norm(np.roll(triangles, -1, axis=1) - triangles, axis=2), axis=1) > max_edge_length
+        if not np.any(is_long):
+            break
+        a, b, c = triangles[is_long, 0], triangles[is_long, 1], triangles[is_long, 2]
+        ab, bc, ca = (a + b) / 2, (b + c) / 2, (c + a) / 2
+        triangles = np.concatenate([triangles[~is_long],
+                                    np.stack([a, ab, ca], axis=1),
+                                    np.stack([ab, b, bc], axis=1),
+                                    np.stack([ca, bc, c], axis=1),
+                                    np.stack([ab, bc, ca], axis=1)])
+    return triangles
+
+
+def _deepest_sample(triangles, bvh):
+    """
+    the deepest point of the surface samples inside bvh, the samples are the vertices and the centroids of the
+    triangles (in the frame of bvh) that overlap its aabb, subdivided to about MAX_NSAMPLES
+    :return: [depth, point, closest_point], [0, None, None] if no sample is inside
+    """
+    lower = bvh.node_center[0] - bvh.node_extent[0]
+    upper = bvh.node_center[0] + bvh.node_extent[0]
+    triangles = triangles[np.all((triangles.min(axis=1) <= upper) & (triangles.max(axis=1) >= lower), axis=1)]
+    if len(triangles) == 0:
+        return 0.0, None, None
+    region_extent = np.minimum(triangles.max(axis=(0, 1)), upper) - np.maximum(triangles.min(axis=(0, 1)), lower)
+    triangles = _subdivide(triangles, max(np.max(region_extent), EPS) / 16, MAX_NSAMPLES)
+    points = np.concatenate((np.unique(triangles.reshape(-1, 3), axis=0), triangles.mean(axis=1)))
+    points = points[_is_inside(bvh, points)]
+    if len(points) == 0:
+        return 0.0, None, None
+    distances, closest_points = _points_min_distance(bvh, points)
+    id = np.argmax(distances)
+    return distances[id], points[id], closest_points[id]
+
+
+def penetration_depth(objcm0, objcm1):
+    """
+    the exact minimum translation distance by the separating axis test if both meshes are convex (e.g. the aabb, obb,
+    and convex_hull cdmesh types, or convex triangle meshes), otherwise approximated by the deepest vertex of one mesh
+    inside the other one, or, if no vertex is inside (e.g. two crossing bars), by the deepest sample of the surfaces
+    NOTE: for non-convex meshes the depth of a point is its distance to the closest surface of the other mesh, so
+    that a thin object pushed through another one reports the distance to its nearer face, not the distance to
+    separate them; the meshes should be closed
+    :param objcm0: an instance of CollisionModel
+    :param objcm1: an instance of CollisionModel
+    :return: [depth, point0, point1], [0, None, None] if not collided, the depth of a collided pair is positive
+             the deepest point of one mesh and its closest point on the other one (moving objcm0 by point1-point0
+             separates convex meshes)
+    """
+    bvh0, homomat0 = _get_cdmesh_homomat(objcm0)
+    bvh1, homomat1 = _get_cdmesh_homomat(objcm1)
+    rotmat_array, pos_array = _get_relative_poses(homomat0[None, :, :], homomat1)
+    is_collided_array, contact_points_list = _collide(bvh0, bvh1, rotmat_array, pos_array, toggle_contacts=True)
+    if not is_collided_array[0]:
+        return 0.0, None, None
+    # mesh 0 in the frame of 1
+    vertices0 = _transform(rotmat_array, pos_array, bvh0.vertices[None, :, :])[0]
+    triangles0 = vertices0[bvh0.faces]
+    if _is_convex(bvh0) and _is_convex(bvh1):
+        depth, point0, point1 = _sat_depth(vertices0, triangles0, bvh1.vertices, bvh1.triangles)
+        return max(depth, EPS), _to_world(homomat1, point0), _to_world(homomat1, point1)
+    depth = 0.0
+    point0 = point1 = _to_world(homomat1, contact_points_list[0][0])
+    # the vertices of 0 inside 1, in the frame of 1
+    inside_vertices0 = vertices0[_is_inside(bvh1, vertices0)]
+    if len(inside_vertices0) > 0:
+        distances, closest_points = _points_min_distance(bvh1, inside_vertices0)
+        id = np.argmax(distances)
+        depth = distances[id]
+        point0 = _to_world(homomat1, inside_vertices0[id])
+        point1 = _to_world(homomat1, closest_points[id])
+    # the vertices of 1 inside 0, in the frame of 0
+    vertices1 = (bvh1.vertices - pos_array[0]).dot(rotmat_array[0])
+    inside_vertices1 = vertices1[_is_inside(bvh0, vertices1)]
+    if len(inside_vertices1) > 0:
+        distances, closest_points = _points_min_distance(bvh0, inside_vertices1)
+        id = np.argmax(distances)
+        if distances[id] > depth:
+            depth = distances[id]
+            point0 = _to_world(homomat0, closest_points[id])
+            point1 = _to_world(homomat0, inside_vertices1[id])
+    if depth == 0.0:
+        # no vertex is inside, sample the surfaces of both meshes
+        sample_depth, sample_point, closest_point = _deepest_sample(triangles0, bvh1)
+        if sample_depth > depth:
+            depth = sample_depth
+            point0 = _to_world(homomat1, sample_point)
+            point1 = _to_world(homomat1, closest_point)
+        sample_depth, sample_point, closest_point = _deepest_sample(vertices1[bvh1.faces], bvh0)
+        if sample_depth > depth:
+            depth = sample_depth
+            point0 = _to_world(homomat0, closest_point)
+            point1 = _to_world(homomat0, sample_point)
+    # the meshes are collided but the samples only touch, e.g. grazing faces
+    return max(depth, EPS), point0, point1
+
+
+if __name__ == '__main__':
+    import os, math, basis
+    import numpy as np
+    import visualization.panda.world as wd
+    import modeling.geometricmodel as gm
+    import modeling.collisionmodel as cm
+    import basis.robot_math as rm
+
+    wd.World(campos=[.3, .3, .3], lookatpos=[0, 0, 0])
+    objpath = os.path.join(basis.__path__[0], 'objects', 'bunnysim.stl')
+    objcm1 = cm.CollisionModel(objpath)
+    homomat = np.eye(4)
+    homomat[:3, :3] = rm.rotmat_from_axangle([0, 0, 1], math.pi / 2)
+    homomat[:3, 3] = np.array([0.02, 0.02, 0])
+    objcm1.set_homomat(homomat)
+    objcm1.set_rgba([1, 1, .3, .2])
+    objcm2 = objcm1.copy()
+    objcm2.set_pos(objcm1.get_pos() + np.array([.05, .02, .0]))
+    iscollided, contact_points = is_collided(objcm1, objcm2)
+    print(iscollided)
+    for ctpt in contact_points:
+        gm.gen_sphere(ctpt, radius=.001).attach_to(base)
+    depth, point1, point2 = penetration_depth(objcm1, objcm2)
+    print("penetration depth", depth)
+    objcm3 = objcm1.copy()
+    objcm3.set_pos(objcm1.get_pos() + np.array([.15, .02, .0]))
+    distance, point1, point3 = min_distance(objcm1, objcm3)
+    print("min distance", distance)
+    gm.gen_stick(spos=point1, epos=point3, thickness=.001, rgba=[0, 1, 0, 1]).attach_to(base)
+    objcm1.attach_to(base)
+    objcm2.attach_to(base)
+    objcm3.attach_to(base)
+    base.run()
@@ -14,6 +14,16 @@ def gen_cdmesh_vvnf(vertices, vertex_normals, faces):
     obj_ot_geom = OdeTriMeshGeom(OdeTriMeshData(objpdnp, True))
     return obj_ot_geom
 
+def update_cdmesh_homomat(cdmesh, homomat):
+    """
+    move a cdmesh generated in the local frame to the given pose
+    :param cdmesh: panda3d.ode.OdeTriMeshGeom
+    :param homomat: 4x4 nparray
+    :return:
+    """
+    cdmesh.setPosition(da.npv3_to_pdv3(homomat[:3, 3]))
+    cdmesh.setQuaternion(da.npmat3_to_pdquat(homomat[:3, :3]))
+
 # def gen_plane_cdmesh(updirection=np.array([0, 0, 1]), offset=0, name='autogen'):
 #     """
 #     generate a plane bulletrigidbody node
@@ -39,8 +49,10 @@ def is_collided(objcm0, objcm1):
     author: weiwei
     date: 20210118
     """
-    obj0 = gen_cdmesh_vvnf(*objcm0.extract_rotated_vvnf())
-    obj1 = gen_cdmesh_vvnf(*objcm1.extract_rotated_vvnf())
+    obj0 = objcm0.get_cdmesh_cache(gen_cdmesh_vvnf)
+    update_cdmesh_homomat(obj0, objcm0.get_homomat())
+    obj1 = objcm1.get_cdmesh_cache(gen_cdmesh_vvnf)
+    update_cdmesh_homomat(obj1, objcm1.get_homomat())
     contact_entry = OdeUtil.collide(obj0, obj1)
     contact_points = [da.pdv3_to_npv3(point) for point in contact_entry.getContactPoints()]
     return (True, contact_points) if len(contact_points)>0 else (False, contact_points)
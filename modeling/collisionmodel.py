@@ -5,14 +5,17 @@ from panda3d.core import CollisionNode, CollisionBox, CollisionSphere, NodePath,
 from visualization.panda.world import ShowBase
 import basis.robot_math as rm
 import basis.data_adapter as da
+import basis.instrumentation as inst
 import modeling.geometricmodel as gm
 import modeling.modelcollection as mc
 import modeling._panda_cdhelper as pcd
 import modeling._ode_cdhelper as mcd
+import modeling._bvh_cdhelper as bcd
 
 
 # import modeling._gimpact_cdhelper as mcd
 # import modeling._bullet_cdhelper as mcd
+# import modeling._bvh_cdhelper as mcd
 
 class CollisionModel(gm.GeometricModel):
     """
@@ -56,6 +59,7 @@ class CollisionModel(gm.GeometricModel):
             self._localframe = copy.deepcopy(initor.localframe)
             self._cdprimitive_type = copy.deepcopy(initor.cdprimitive_type)
             self._cdmesh_type = copy.deepcopy(initor.cdmesh_type)
+            self._cdmesh_cache_dict = {}
         else:
             super().__init__(initor=initor, name=name, btransparency=btransparency, btwosided=btwosided)
             self._cdprimitive_type, collision_node = self._update_cdprimit(cdprimit_type,
@@ -64,9 +68,17 @@ class CollisionModel(gm.GeometricModel):
             # use pdnp.getChild instead of a new self._cdnp variable as collision nodepath is not compatible with deepcopy
             self._objpdnp.attachNewNode(collision_node)
             self._objpdnp.getChild(1).setCollideMask(BitMask32(2 ** 31))
+            self._cdmesh_cache_dict = {}
             self.cdmesh_type = cdmesh_type
             self._localframe = None
 
+    def __getstate__(self):
+        # the cached narrow-phase geometry is rebuilt by the copies when needed, except the bvh (pure numpy)
+        state = self.__dict__.copy()
+        state['_cdmesh_cache_dict'] = {name: cdmesh for name, cdmesh in self._cdmesh_cache_dict.items()
+                                       if isinstance(cdmesh, bcd.BVHMesh)}
+        return state
+
     def _update_cdprimit(self, cdprimitive_type, expand_radius, userdefined_cdprimitive_fn):
         if cdprimitive_type is not None and cdprimitive_type not in ['box',
                                                                      'surface_balls',
@@ -110,6 +122,7 @@ class CollisionModel(gm.GeometricModel):
                                                            'triangles']:
             raise ValueError("Wrong mesh collision model type name!")
         self._cdmesh_type = cdmesh_type
+        self._cdmesh_cache_dict = {}
 
     @property
     def cdnp(self):
@@ -119,7 +132,22 @@ class CollisionModel(gm.GeometricModel):
     def cdmesh(self):
         return mcd.gen_cdmesh_vvnf(*self.extract_rotated_vvnf())
 
-    def extract_rotated_vvnf(self):
+    def get_cdmesh_cache(self, gen_cdmesh_fn=mcd.gen_cdmesh_vvnf):
+        """
+        the cdmesh of a cdhelper in the local frame of this cm, built by its gen_cdmesh_vvnf at the first query
+        the cdhelpers only update its pose per query; it is cleared when the cdmesh_type or the scale is changed
+        :param gen_cdmesh_fn: the gen_cdmesh_vvnf of a cdhelper, one cdmesh is cached per cdhelper
+        :return:
+        """
+        if gen_cdmesh_fn.__module__ not in self._cdmesh_cache_dict:
+            self._cdmesh_cache_dict[gen_cdmesh_fn.__module__] = gen_cdmesh_fn(*self.extract_local_vvnf())
+        return self._cdmesh_cache_dict[gen_cdmesh_fn.__module__]
+
+    def extract_local_vvnf(self):
+        """
+        the vertices, vertex_normals, and faces of the cdmesh_type in the local frame, scaled by self.get_scale()
+        :return:
+        """
         if self.cdmesh_type == 'aabb':
             objtrm = self.objtrm.bounding_box
         elif self.cdmesh_type == 'obb':
@@ -128,12 +156,20 @@ class CollisionModel(gm.GeometricModel):
             objtrm = self.objtrm.convex_hull
         elif self.cdmesh_type == 'triangles':
             objtrm = self.objtrm
-        homomat = self.get_homomat()
-        vertices = rm.homomat_transform_points(homomat, objtrm.vertices)
-        vertex_normals = rm.homomat_transform_points(homomat, objtrm.vertex_normals)
+        scale = self.get_scale()
+        vertices = objtrm.vertices * scale
+        vertex_normals = objtrm.vertex_normals / scale
+        vertex_normals = vertex_normals / np.linalg.norm(vertex_normals, axis=1)[:, None]
         faces = objtrm.faces
         return vertices, vertex_normals, faces
 
+    def extract_rotated_vvnf(self):
+        vertices, vertex_normals, faces = self.extract_local_vvnf()
+        homomat = self.get_homomat()
+        vertices = rm.homomat_transform_points(homomat, vertices)
+        vertex_normals = rm.homomat_transform_points(homomat, vertex_normals)
+        return vertices, vertex_normals, faces
+
     def change_cdprimitive_type(self, cdprimitive_type='ball', expand_radius=.01, userdefined_cdprimitive_fn=None):
         """
         :param cdprimitive_type:
@@ -159,6 +195,10 @@ class CollisionModel(gm.GeometricModel):
         """
         self.cdmesh_type = cdmesh_type
 
+    def set_scale(self, scale=[1, 1, 1]):
+        super().set_scale(scale)
+        self._cdmesh_cache_dict = {}
+
     def copy_cdnp_to(self, nodepath, homomat=None, clearmask=False):
         """
         Return a nodepath including the cdcn,
@@ -212,6 +252,7 @@ class CollisionModel(gm.GeometricModel):
     def unshow_cdprimit(self):
         self.cdnp.hide()
 
+    @inst.timed('cm_is_mcdwith_seconds')
     def is_mcdwith(self, objcm_list, toggle_contacts=False):
         """
         Is the mesh of the cm collide with the mesh of the given cm
@@ -0,0 +1,250 @@
+"""
+A sparse voxel occupancy grid for sensor point clouds, an obstacle type of
+robotsim._kinematics.collisionchecker.SphereCollisionChecker
+The occupied voxels are kept as sorted integer keys; the coarser levels (voxel_size*2**level) are the occupied cells
+of an implicit octree over them, so that a sphere is tested against the occupied voxels by descending only the cells
+it overlaps. Points are inserted or cleared in bulk, e.g. frame by frame from a camera in drivers/devices.
+"""
+import numpy as np
+import modeling.geometricmodel as gm
+
+KEY_BITS = 21  # bits per axis of a key
+KEY_OFFSET = 2 ** (KEY_BITS - 1)  # the voxel indices are in [-KEY_OFFSET, KEY_OFFSET)
+MAX_NLEVELS = KEY_BITS
+
+
+class OccupancyGrid(object):
+
+    def __init__(self, voxel_size=.01, points=None, homomat=None, name="occupancy_grid"):
+        """
+        :param voxel_size: the edge length of a voxel
+        :param points: nx3 nparray, the initial points
+        :param homomat: the pose of the frame of points, e.g. the pose of the camera; the world frame if None
+        :param name:
+        """
+        if voxel_size <= 0:
+            raise ValueError("The voxel size must be positive!")
+        self.name = name
+        self.voxel_size = float(voxel_size)
+        self._key_array_list = [np.zeros(0, dtype=np.int64)]  # sorted keys of the occupied cells of every level
+        if points is not None:
+            self.insert_points(points, homomat=homomat)
+
+    def __len__(self):
+        return len(self._key_array_list[0])
+
+    @staticmethod
+    def _encode(index_array):
+        """
+        :param index_array: nx3 voxel indices
+        :return: 1xn int64 keys, the keys of the indices outside of the key range are -1
+        """
+        index_array = np.asarray(index_array, dtype=np.int64).reshape(-1, 3) + KEY_OFFSET
+        is_valid = np.all((index_array >= 0) & (index_array < 2 * KEY_OFFSET), axis=1)
+        key_array = (index_array[:, 0] << (2 * KEY_BITS)) | (index_array[:, 1] << KEY_BITS) | index_array[:, 2]
+        return np.where(is_valid, key_array, -1)
+
+    @staticmethod
+    def _decode(key_array):
+        """
+        :param key_array: 1xn int64 keys
+        :return: nx3 voxel indices
+        """
+        mask = (1 << KEY_BITS) - 1
+        return np.stack(((key_array >> (2 * KEY_BITS)) & mask,
+                         (key_array >> KEY_BITS) & mask,
+                         key_array & mask), axis=1) - KEY_OFFSET
+
+    def _to_keys(self, points, homomat):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if homomat is not None:
+            points = points.dot(homomat[:3, :3].T) + homomat[:3, 3]
+        key_array = self._encode(np.floor(points / self.voxel_size))
+        return np.unique(key_array[key_array >= 0])
+
+    @classmethod
+    def _get_parent_keys(cls, key_array):
+        """
+        :param key_array: sorted unique keys of a level
+        :return: sorted unique keys of the cells of the next level that hold them
+        """
+        return np.unique(cls._encode(cls._decode(key_array) >> 1))
+
+    def _set_keys(self, key_array):
+        """
+        replace the occupied voxels and rebuild the coarser levels
+        :param key_array: sorted unique keys of level 0
+        :return:
+        """
+        self._key_array_list = [key_array]
+        self._add_levels()
+
+    def _add_levels(self):
+        # the cells around the origin are -1 and 0 at every level, so the top level has at most 8 cells
+        while len(self._key_array_list) < MAX_NLEVELS and len(self._key_array_list[-1]) > 8:
+            self._key_array_list.append(self._get_parent_keys(self._key_array_list[-1]))
+
+    def _lookup(self, key_array, level):
+        """
+        :param key_array: 1xn keys of the cells of the given level
+        :param level: the levels above the top one are generated from it, they have at most a few cells
+        :return: 1xn bool nparray, if the cells are occupied
+        """
+        top_level = len(self._key_array_list) - 1
+        if level > top_level:
+            level_key_array = np.unique(self._encode(self._decode(self._key_array_list[top_level]) >>
+                                                     (level - top_level)))
+        else:
+            level_key_array = self._key_array_list[level]
+        if len(level_key_array) == 0:
+            return np.zeros(len(key_array), dtype=bool)
+        ids = np.minimum(np.searchsorted(level_key_array, key_array), len(level_key_array) - 1)
+        return (level_key_array[ids] == key_array) & (key_array >= 0)
+
+    def insert_points(self, points, homomat=None):
+        """
+        mark the voxels of the given points as occupied
+        :param points: nx3 nparray
+        :param homomat: the pose of the frame of points, the world frame if None
+        :return:
+        """
+        key_array = self._to_keys(points, homomat)
+        if len(key_array) == 0:
+            return
+        key_array_list = []
+        for level, level_key_array in enumerate(self._key_array_list):
+            if level > 0:
+                key_array = self._get_parent_keys(key_array)
+            key_array_list.append(np.union1d(level_key_array, key_array))
+        self._key_array_list = key_array_list
+        self._add_levels()
+
+    def remove_points(self, points, homomat=None):
+        """
+        mark the voxels of the given points as free
+        :param points: nx3 nparray
+        :param homomat: the pose of the frame of points, the world frame if None
+        :return:
+        """
+        self._set_keys(np.setdiff1d(self._key_array_list[0], self._to_keys(points, homomat), assume_unique=True))
+
+    def clear_aabb(self, min_pos, max_pos):
+        """
+        mark the voxels whose centers are in the given box as free, e.g. the region seen by a new frame
+        :param min_pos: 1x3 nparray
+        :param max_pos: 1x3 nparray
+        :return:
+        """
+        center_array = self.get_voxel_centers()
+        is_inside = np.all((center_array >= min_pos) & (center_array <= max_pos), axis=1)
+        self._set_keys(self._key_array_list[0][~is_inside])
+
+    def clear(self):
+        self._set_keys(np.zeros(0, dtype=np.int64))
+
+    def set_points(self, points, homomat=None, min_pos=None, max_pos=None):
+        """
+        update the grid with a new frame, the voxels in [min_pos, max_pos] are replaced by the ones of the points
+        :param points: nx3 nparray
+        :param homomat: the pose of the frame of points, the world frame if None
+        :param min_pos: 1x3 nparray, all the voxels are replaced if min_pos or max_pos is None
+        :param max_pos: 1x3 nparray
+        :return:
+        """
+        if min_pos is None or max_pos is None:
+            self._set_keys(self._to_keys(points, homomat))
+        else:
+            self.clear_aabb(min_pos, max_pos)
+            self.insert_points(points, homomat=homomat)
+
+    def get_voxel_centers(self):
+        """
+        :return: nx3 nparray, the centers of the occupied voxels
+        """
+        return (self._decode(self._key_array_list[0]) + .5) * self.voxel_size
+
+    def is_occupied(self, points):
+        """
+        :param points: nx3 nparray
+        :return: 1xn bool nparray, if the voxels of the points are occupied
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        return self._lookup(self._encode(np.floor(points / self.voxel_size)), 0)
+
+    def are_spheres_occupied(self, center_array, radius_array, toggle_exact=True):
+        """
+        if the spheres overlap any occupied voxel, by descending the octree from the cells as large as the spheres
+        :param center_array: nx3 nparray
+        :param radius_array: 1xn nparray
+        :param toggle_exact: False: a sphere is taken as overlapped once it overlaps an occupied cell of about its size,
+                             which is cheaper and conservative, e.g. for the inner nodes of sphere trees
+        :return: 1xn bool nparray
+        """
+        center_array = np.asarray(center_array, dtype=np.float64).reshape(-1, 3)
+        radius_array = np.broadcast_to(np.asarray(radius_array, dtype=np.float64), len(center_array))
+        result = np.zeros(len(center_array), dtype=bool)
+        if len(center_array) == 0 or len(self) == 0:
+            return result
+        level_array = np.clip(np.ceil(np.log2(np.maximum(2 * radius_array, 1e-12) / self.voxel_size)),
+                              0, KEY_BITS - 1).astype(int)
+        stop_level_array = np.zeros(len(center_array), dtype=int) if toggle_exact else \
+            np.clip(level_array - 1, 0, None)
+        # the cells of the start level are at least as large as the diameters, a sphere overlaps at most 2x2x2 of them
+        level = int(np.max(level_array))
+        cell_size = self.voxel_size * 2 ** level
+        min_index_array = np.floor((center_array - radius_array[:, None]) / cell_size).astype(np.int64)
+        max_index_array = np.floor((center_array + radius_array[:, None]) / cell_size).astype(np.int64)
+        corners = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+        index_array = min_index_array[:, None] + corners[None]
+        is_valid = np.all(index_array <= max_index_array[:, None], axis=2)
+        sphere_ids, corner_ids = np.nonzero(is_valid)
+        index_array = index_array[sphere_ids, corner_ids]
+        while len(sphere_ids) > 0:
+            cell_size = self.voxel_size * 2 ** level
+            is_overlapped = self._lookup(self._encode(index_array), level) & ~result[sphere_ids]
+            sphere_ids, index_array = sphere_ids[is_overlapped], index_array[is_overlapped]
+            diff = center_array[sphere_ids] - np.clip(center_array[sphere_ids], index_array * cell_size,
+                                                      (index_array + 1) * cell_size)
+            is_overlapped = np.einsum('ij,ij->i', diff, diff) < radius_array[sphere_ids] ** 2
+            sphere_ids, index_array = sphere_ids[is_overlapped], index_array[is_overlapped]
+            is_hit = stop_level_array[sphere_ids] >= level
+            result[sphere_ids[is_hit]] = True
+            sphere_ids, index_array = sphere_ids[~is_hit], index_array[~is_hit]
+            # the 8 children of the remaining cells
+            sphere_ids = np.repeat(sphere_ids, 8)
+            index_array = (np.repeat(index_array, 8, axis=0) << 1) + np.tile(corners, (len(index_array), 1))
+            level -= 1
+        return result
+
+    def gen_pointcloud(self, rgba=[.3, .3, .7, 1], pntsize=3):
+        """
+        the centers of the occupied voxels
+        :return: a point cloud StaticGeometricModel
+        """
+        return gm.gen_pointcloud(self.get_voxel_centers(), rgbas=[rgba], pntsize=pntsize)
+
+
+if __name__ == '__main__':
+    import time
+    import visualization.panda.world as wd
+    import robotsim.robots.yumi.yumi as ym
+
+    base = wd.World(campos=[2, 0, 1.5], lookatpos=[.3, 0, .2])
+    # a synthetic capture of a table top with a box standing on it, about 200k points
+    rng = np.random.default_rng(0)
+    table_points = np.column_stack((rng.uniform(.2, .8, 150000), rng.uniform(-.5, .5, 150000), np.zeros(150000)))
+    box_points = rng.uniform([.35, -.3, 0], [.45, -.2, .3], (50000, 3))
+    tic = time.time()
+    occupancy_grid = OccupancyGrid(voxel_size=.01, points=np.vstack((table_points, box_points)))
+    print("build", time.time() - tic, len(occupancy_grid), "voxels")
+    occupancy_grid.gen_pointcloud().attach_to(base)
+    robot_s = ym.Yumi(enable_cc=True)
+    robot_s.enable_sphere_tree_cc()
+    conf_array = np.array([robot_s.rand_conf('rgt_arm') for _ in range(200)])
+    tic = time.time()
+    is_collided_array = robot_s.is_collided_many('rgt_arm', conf_array, obstacle_list=[occupancy_grid])
+    print("check", (time.time() - tic) / len(conf_array), "per configuration,", np.sum(is_collided_array), "collided")
+    for conf in conf_array[~is_collided_array][:5]:
+        robot_s.fk('rgt_arm', conf)
+        robot_s.gen_meshmodel(rgba=[0, 1, 0, .3]).attach_to(base)
+    base.run()
@@ -0,0 +1,227 @@
+"""
+Signed distance fields (SDF) of static obstacles, for the clearance queries of optimization-based motion, see
+robotsim.robots.robot_interface.RobotInterface.min_distance
+The distances to the cdmesh of a CollisionModel are sampled on a grid in its local frame (negative inside) and
+trilinearly interpolated, so that a query of many points is a few array lookups and its gradients are exact for the
+interpolant. The grid values close to the surface are computed by the numpy BVH of modeling._bvh_cdhelper, the other ones are
+the distances to samples of the surface; the signs are found by flood filling the grid from its boundary, and by the
+winding numbers for the grid points close to the surface.
+The fields of mesh files are cached next to them (e.g. 0000_huri/objects/tubestand_sdf.npz), they can be generated offline by
+    python -m modeling.signeddistancefield 0000_huri/objects
+"""
+import os
+import sys
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+import modeling._bvh_cdhelper as bcd
+import modeling.spheretree as spt
+
+VOXEL_SIZE = .005  # the spacing of the grid points
+PADDING = .05  # the margin of the grid around the mesh, the distances are extrapolated beyond it (upper bounds)
+MAX_NPOINTS = 2 ** 22  # the spacing is enlarged if the grid has more points than this
+CHUNK_SIZE = 65536  # the number of grid points whose distances are computed at once
+
+_sdf_dict = {}  # (path, voxel_size, padding): SignedDistanceField, the fields loaded in this process
+_scaled_sdf_dict = {}  # (path, scale): SignedDistanceField, the loaded fields scaled by get_sdf
+
+
+class SignedDistanceField(object):
+    """
+    value_array[i, j, k] is the signed distance at the grid point min_pos+voxel_size*[i, j, k] in the local frame
+    """
+
+    def __init__(self, value_array, min_pos, voxel_size):
+        self.value_array = np.asarray(value_array, dtype=np.float64)
+        self.min_pos = np.asarray(min_pos, dtype=np.float64)
+        self.voxel_size = float(voxel_size)
+        if self.value_array.ndim != 3 or min(self.value_array.shape) < 2:
+            raise ValueError("The grid must have at least two points along every axis!")
+        self.max_pos = self.min_pos + (np.array(self.value_array.shape) - 1) * self.voxel_size
+        self._strides = np.array([self.value_array.shape[1] * self.value_array.shape[2], self.value_array.shape[2], 1])
+        self._corners = np.array([[i, j, k] for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+        self._corner_offsets = self._corners.dot(self._strides)
+
+    def scale(self, scale):
+        """
+        :param scale: a uniform scale
+        :return: a scaled copy
+        """
+        return SignedDistanceField(self.value_array * scale, self.min_pos * scale, self.voxel_size * scale)
+
+    def save(self, path, voxel_size, padding, nfaces):
+        np.savez(path, value_array=self.value_array, min_pos=self.min_pos, grid_voxel_size=self.voxel_size,
+                 voxel_size=voxel_size, padding=padding, nfaces=nfaces)
+
+    def get_distances(self, points, toggle_gradients=False):
+        """
+        the trilinear interpolation of the grid values; outside of the grid, the distance of the closest grid point
+        plus the distance to it (an upper bound, the grid is padded so that it seldom matters)
+        :param points: nx3 nparray, in the local frame
+        :param toggle_gradients: also return the gradients of the distances
+        :return: 1xn nparray, or [1xn nparray, nx3 nparray] if toggle_gradients is True
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        clamped_points = np.clip(points, self.min_pos, self.max_pos)
+        grid_points = (clamped_points - self.min_pos) / self.voxel_size
+        index_array = np.minimum(np.floor(grid_points).astype(np.int64), np.array(self.value_array.shape) - 2)
+        frac_array = grid_points - index_array
+        # nx8 corner values, corner [i, j, k] is weighted by the products of frac (1) or 1-frac (0) along the axes
+        corner_values = self.value_array.ravel()[index_array.dot(self._strides)[:, None] + self._corner_offsets]
+        factors = np.where(self._corners[None], frac_array[:, None], 1 - frac_array[:, None])  # nx8x3
+        distances = np.einsum('nc,nc->n', corner_values, np.prod(factors, axis=2))
+        offsets = points - clamped_points
+        outside_distances = np.linalg.norm(offsets, axis=1)
+        distances += outside_distances
+        if not toggle_gradients:
+            return distances
+        gradients = np.empty((len(points), 3))
+        signs = np.where(self._corners, 1.0, -1.0)  # the derivatives of the factors
+        for axis in range(3):
+            other_axes = [other_axis for other_axis in range(3) if other_axis != axis]
+            weights = signs[:, axis] * np.prod(factors[:, :, other_axes], axis=2)
+            gradients[:, axis] = np.einsum('nc,nc->n', corner_values, weights) / self.voxel_size
+        # the clamped coordinates only change the distances to the grid
+        is_clamped = offsets != 0
+        gradients[is_clamped] = (offsets / np.maximum(outside_distances, 1e-12)[:, None])[is_clamped]
+        return distances, gradients
+
+
+def gen_sdf(vertices, faces, voxel_size=VOXEL_SIZE, padding=PADDING):
+    """
+    :param vertices: nx3 nparray
+    :param faces: mx3 nparray, the mesh should be closed, the points in the holes of open meshes are outside
+    :param voxel_size: the spacing of the grid points, enlarged if the grid has more than MAX_NPOINTS points
+    :param padding: the margin of the grid around the mesh
+    :return: SignedDistanceField
+    """
+    if voxel_size <= 0 or padding < 0:
+        raise ValueError("The voxel size must be positive and the padding must not be negative!")
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    bvh = bcd.gen_cdmesh_vvnf(vertices, None, faces)
+    min_pos = vertices.min(axis=0) - padding - voxel_size
+    extent = vertices.max(axis=0) + padding + voxel_size - min_pos
+    while np.prod(np.ceil(extent / voxel_size) + 1) > MAX_NPOINTS:
+        voxel_size *= 1.25
+    shape = tuple((np.ceil(extent / voxel_size) + 1).astype(int))
+    grid_points = min_pos + np.stack(np.meshgrid(*[np.arange(n) for n in shape], indexing='ij'),
+                                     axis=3).reshape(-1, 3) * voxel_size
+    # the distances to the vertices of the subdivided triangles are upper bounds that exceed the exact ones by less
+    # than the longest edge, the exact ones are only computed in the band where they may be at most voxel_size/2
+    triangles = spt._subdivide(bvh.triangles, voxel_size)
+    max_edge_length = np.max(np.linalg.norm(np.roll(triangles, -1, axis=1) - triangles, axis=2))
+    distances = cKDTree(np.unique(triangles.reshape(-1, 3), axis=0)).query(grid_points)[0]
+    band_ids = np.nonzero(distances <= voxel_size / 2 + max_edge_length)[0]
+    distances[band_ids] = np.concatenate([bcd._points_min_distance(bvh, grid_points[ids])[0]
+                                          for ids in np.split(band_ids, np.arange(CHUNK_SIZE, len(band_ids),
+                                                                                  CHUNK_SIZE))])
+    # a grid edge that crosses the surface has an end within voxel_size/2 of it, the points farther away are
+    # separated into outside (connected to the boundary of the grid) and inside components
+    is_near = distances <= voxel_size / 2
+    label_array, _ = ndimage.label(~is_near.reshape(shape))
+    boundary_labels = np.unique(np.concatenate([label_array[[0, -1]].ravel(),
+                                                label_array[:, [0, -1]].ravel(),
+                                                label_array[:, :, [0, -1]].ravel()]))
+    is_inside = ~np.isin(label_array.ravel(), boundary_labels)
+    near_ids = np.nonzero(is_near)[0]
+    is_inside[near_ids] = bcd._is_inside(bvh, grid_points[near_ids])
+    return SignedDistanceField(np.where(is_inside, -distances, distances).reshape(shape), min_pos, voxel_size)
+
+
+def gen_cdmesh_vvnf(vertices, vertex_normals, faces):
+    """
+    the interface of the cdhelpers, so that a CollisionModel can cache its field, see CollisionModel.get_cdmesh_cache
+    :return: SignedDistanceField
+    """
+    return gen_sdf(vertices, faces)
+
+
+def _get_cache_path(mesh_path, voxel_size, padding):
+    if voxel_size == VOXEL_SIZE and padding == PADDING:
+        return os.path.splitext(mesh_path)[0] + "_sdf.npz"
+    return os.path.splitext(mesh_path)[0] + "_sdf_%g_%g.npz" % (voxel_size, padding)
+
+
+def load_or_gen_sdf(mesh_path, voxel_size=VOXEL_SIZE, padding=PADDING, objtrm=None):
+    """
+    load the field cached next to the mesh file, or generate and cache it
+    a cache generated from a mesh with a different number of faces is regenerated
+    :param mesh_path:
+    :param voxel_size:
+    :param padding:
+    :param objtrm: the loaded mesh of the file, loaded from mesh_path if None
+    :return: SignedDistanceField
+    """
+    key = (os.path.abspath(mesh_path), voxel_size, padding)
+    if key in _sdf_dict:
+        return _sdf_dict[key]
+    if objtrm is None:
+        import basis.data_adapter as da
+        objtrm = da.trm.load(mesh_path)
+    nfaces = len(objtrm.faces)
+    cache_path = _get_cache_path(mesh_path, voxel_size, padding)
+    sdf = None
+    if os.path.isfile(cache_path):
+        cache = np.load(cache_path)
+        if float(cache['voxel_size']) == voxel_size and float(cache['padding']) == padding and \
+                int(cache['nfaces']) == nfaces:
+            sdf = SignedDistanceField(cache['value_array'], cache['min_pos'], float(cache['grid_voxel_size']))
+    if sdf is None:
+        sdf = gen_sdf(objtrm.vertices, objtrm.faces, voxel_size=voxel_size, padding=padding)
+        try:
+            sdf.save(cache_path, voxel_size, padding, nfaces)
+        except OSError:
+            print("Failed to cache the signed distance field at " + cache_path + "!")
+    _sdf_dict[key] = sdf
+    return sdf
+
+
+def get_sdf(objcm):
+    """
+    the signed distance field of the cdmesh of a collision model in its local frame, scaled by its scale
+    a model loaded from a mesh file with the triangles cdmesh and a uniform scale uses the field cached next to the
+    file (generated with the spacing and padding divided by the scale), the other ones cache it in themselves
+    :param objcm: CollisionModel
+    :return: SignedDistanceField
+    """
+    scale = np.asarray(objcm.get_scale())
+    if isinstance(objcm.objpath, str) and os.path.isfile(objcm.objpath) and objcm.cdmesh_type == 'triangles' and \
+            np.allclose(scale, scale[0]):
+        scale = abs(scale[0])
+        key = (os.path.abspath(objcm.objpath), scale)
+        if key not in _scaled_sdf_dict:
+            sdf = load_or_gen_sdf(objcm.objpath, voxel_size=VOXEL_SIZE / scale, padding=PADDING / scale,
+                                  objtrm=objcm.objtrm)
+            _scaled_sdf_dict[key] = sdf if scale == 1 else sdf.scale(scale)
+        return _scaled_sdf_dict[key]
+    return objcm.get_cdmesh_cache(gen_cdmesh_vvnf)
+
+
+def get_distances(objcm, points, toggle_gradients=False):
+    """
+    the signed distances from points to the cdmesh of a collision model at its current pose
+    :param objcm: CollisionModel
+    :param points: nx3 nparray, in the world frame
+    :param toggle_gradients: also return the gradients of the distances
+    :return: 1xn nparray, or [1xn nparray, nx3 nparray] if toggle_gradients is True, the gradients are in the world frame
+    """
+    rotmat = objcm.get_rotmat()
+    loc_points = (np.asarray(points, dtype=np.float64).reshape(-1, 3) - objcm.get_pos()).dot(rotmat)
+    if not toggle_gradients:
+        return get_sdf(objcm).get_distances(loc_points)
+    distances, gradients = get_sdf(objcm).get_distances(loc_points, toggle_gradients=True)
+    return distances, gradients.dot(rotmat.T)
+
+
+if __name__ == '__main__':
+    # generate the fields of all the meshes in the given directories
+    import glob
+    import time
+
+    for directory in sys.argv[1:]:
+        for mesh_path in sorted(glob.glob(os.path.join(directory, "*.stl")) +
+                                glob.glob(os.path.join(directory, "*.dae"))):
+            tic = time.time()
+            sdf = load_or_gen_sdf(mesh_path)
+            print(mesh_path, sdf.value_array.shape, time.time() - tic)
@@ -0,0 +1,206 @@
+"""
+Sphere trees of meshes, used by robotsim._kinematics.collisionchecker.SphereCollisionChecker
+The triangles are subdivided until they are small compared with the leaves, and split recursively at the median of
+their centroids along the longest axis. Each node is the (approximately) smallest sphere that encloses all the
+vertices of its triangles, so that every level covers the whole surface.
+The trees of mesh files are cached next to them (e.g. meshes/link1_spheretree.npz), they can be generated offline by
+    python -m modeling.spheretree robotsim/robots/yumi/meshes
+"""
+import os
+import sys
+import numpy as np
+
+DEPTH = 8  # 2**8 = 256 leaves at most, the deep levels are only visited where the shallow ones overlap
+MAX_NTRIANGLES = 200000  # stop subdividing at this number of triangles
+
+_sphere_tree_dict = {}  # (path, depth): SphereTree, the trees loaded in this process
+
+
+class SphereTree(object):
+    """
+    The nodes are kept in arrays, the root is 0 and a node is stored after its parent
+    center_array[i] and radius_array[i] are the sphere of node i, parent_array[i] is its parent (-1 for the root),
+    children_array[i] are its two children (-1 for the leaves)
+    """
+
+    def __init__(self, center_array, radius_array, parent_array):
+        self.center_array = np.asarray(center_array, dtype=np.float64).reshape(-1, 3)
+        self.radius_array = np.asarray(radius_array, dtype=np.float64)
+        self.parent_array = np.asarray(parent_array, dtype=np.int64)
+        self.children_array = np.full((len(self.parent_array), 2), -1, dtype=np.int64)
+        for id, parent_id in enumerate(self.parent_array):
+            if parent_id >= 0:
+                self.children_array[parent_id, int(self.children_array[parent_id, 0] >= 0)] = id
+
+    def __len__(self):
+        return len(self.radius_array)
+
+    @property
+    def leaf_ids(self):
+        return np.nonzero(self.children_array[:, 0] < 0)[0]
+
+    @property
+    def leaf_center_array(self):
+        return self.center_array[self.leaf_ids]
+
+    @property
+    def leaf_radius_array(self):
+        return self.radius_array[self.leaf_ids]
+
+    def scale(self, scale):
+        """
+        :param scale: 1x3, the radii are scaled by the largest component
+        :return: a scaled copy
+        """
+        scale = np.asarray(scale, dtype=np.float64)
+        return SphereTree(self.center_array * scale, self.radius_array * np.max(np.abs(scale)), self.parent_array)
+
+    def save(self, path, depth, nfaces):
+        np.savez(path, center_array=self.center_array, radius_array=self.radius_array,
+                 parent_array=self.parent_array, depth=depth, nfaces=nfaces)
+
+
+def _subdivide(triangles, max_edge_length):
+    """
+    split the triangles whose longest edge is longer than max_edge_length at the middles of their edges
+    :param triangles: nx3x3
+    :return: mx3x3
+    """
+    while len(triangles) < MAX_NTRIANGLES:
+        edge_lengths = np.linalg.norm(np.roll(triangles, -1, axis=1) - triangles, axis=2)
+        is_long = np.max(edge_lengths, axis=1) > max_edge_length
+        if not np.any(is_long):
+            break
+        a, b, c = triangles[is_long, 0], triangles[is_long, 1], triangles[is_long, 2]
+        ab, bc, ca = (a + b) / 2, (b + c) / 2, (c + a) / 2
+        triangles = np.concatenate([triangles[~is_long],
+                                    np.stack([a, ab, ca], axis=1),
+                                    np.stack([ab, b, bc], axis=1),
+                                    np.stack([ca, bc, c], axis=1),
+                                    np.stack([ab, bc, ca], axis=1)])
+    return triangles
+
+
+def _enclose(points, niterations=32):
+    """
+    an approximately smallest enclosing sphere, the better one of the aabb center and the Badoiu-Clarkson iterations
+    :param points: nx3
+    :return: [center 1x3, radius]
+    """
+    center = (points.min(axis=0) + points.max(axis=0)) / 2
+    radius = np.max(np.linalg.norm(points - center, axis=1))
+    bc_center = center.copy()
+    for i in range(niterations):
+        farthest_point = points[np.argmax(np.linalg.norm(points - bc_center, axis=1))]
+        bc_center = bc_center + (farthest_point - bc_center) / (i + 2)
+    bc_radius = np.max(np.linalg.norm(points - bc_center, axis=1))
+    if bc_radius < radius:
+        return bc_center, bc_radius
+    return center, radius
+
+
+def gen_sphere_tree(vertices, faces, depth=DEPTH):
+    """
+    :param vertices: nx3 nparray
+    :param faces: mx3 nparray, the vertices are taken as points if it is empty (e.g. point clouds)
+    :param depth: the leaves are at most depth levels below the root
+    :return: SphereTree
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    if len(vertices) == 0:
+        raise ValueError("The mesh must have at least one vertex!")
+    triangles = vertices[faces] if len(faces) > 0 else np.repeat(vertices[:, None, :], 3, axis=1)
+    _, root_radius = _enclose(vertices)
+    # the leaves of a surface are about root_radius/2**(depth/2) large
+    triangles = _subdivide(triangles, 2 * root_radius / 2 ** (depth / 2) / 4)
+    centroids = triangles.mean(axis=1)
+    center_list = []
+    radius_list = []
+    parent_list = []
+    stack = [(np.arange(len(triangles)), -1, 0)]  # triangle ids, parent id, level
+    while len(stack) > 0:
+        tri_ids, parent_id, level = stack.pop()
+        center, radius = _enclose(triangles[tri_ids].reshape(-1, 3))
+        center_list.append(center)
+        radius_list.append(radius)
+        parent_list.append(parent_id)
+        if level == depth or len(tri_ids) < 2:
+            continue
+        sub_centroids = centroids[tri_ids]
+        axis = np.argmax(sub_centroids.max(axis=0) - sub_centroids.min(axis=0))
+        nhalf = len(tri_ids) // 2
+        order = np.argpartition(sub_centroids[:, axis], nhalf)
+        node_id = len(center_list) - 1
+        stack.append((tri_ids[order[nhalf:]], node_id, level + 1))
+        stack.append((tri_ids[order[:nhalf]], node_id, level + 1))
+    return SphereTree(center_list, radius_list, parent_list)
+
+
+def gen_cdmesh_vvnf(vertices, vertex_normals, faces):
+    """
+    the interface of the cdhelpers, so that a CollisionModel can cache its tree, see CollisionModel.get_cdmesh_cache
+    :return: SphereTree
+    """
+    return gen_sphere_tree(vertices, faces)
+
+
+def _get_cache_path(mesh_path, depth):
+    return os.path.splitext(mesh_path)[0] + ("_spheretree.npz" if depth == DEPTH else "_spheretree%d.npz" % depth)
+
+
+def load_or_gen_sphere_tree(mesh_path, depth=DEPTH, objtrm=None):
+    """
+    load the tree cached next to the mesh file, or generate and cache it
+    a cache generated from a mesh with a different number of faces is regenerated
+    :param mesh_path:
+    :param depth:
+    :param objtrm: the loaded mesh of the file, loaded from mesh_path if None
+    :return: SphereTree
+    """
+    key = (os.path.abspath(mesh_path), depth)
+    if key in _sphere_tree_dict:
+        return _sphere_tree_dict[key]
+    if objtrm is None:
+        import basis.data_adapter as da
+        objtrm = da.trm.load(mesh_path)
+    nfaces = len(objtrm.faces)
+    cache_path = _get_cache_path(mesh_path, depth)
+    sphere_tree = None
+    if os.path.isfile(cache_path):
+        cache = np.load(cache_path)
+        if int(cache['depth']) == depth and int(cache['nfaces']) == nfaces:
+            sphere_tree = SphereTree(cache['center_array'], cache['radius_array'], cache['parent_array'])
+    if sphere_tree is None:
+        sphere_tree = gen_sphere_tree(objtrm.vertices, objtrm.faces, depth=depth)
+        try:
+            sphere_tree.save(cache_path, depth, nfaces)
+        except OSError:
+            print("Failed to cache the sphere tree at " + cache_path + "!")
+    _sphere_tree_dict[key] = sphere_tree
+    return sphere_tree
+
+
+def get_sphere_tree(objcm):
+    """
+    the sphere tree of a collision model in its local frame, scaled by its scale
+    a model loaded from a mesh file uses the tree cached next to the file, the other ones cache it in themselves
+    :param objcm: CollisionModel
+    :return: SphereTree
+    """
+    if isinstance(objcm.objpath, str) and os.path.isfile(objcm.objpath):
+        return load_or_gen_sphere_tree(objcm.objpath, objtrm=objcm.objtrm).scale(objcm.get_scale())
+    return objcm.get_cdmesh_cache(gen_cdmesh_vvnf)
+
+
+if __name__ == '__main__':
+    # generate the trees of all the meshes in the given directories
+    import glob
+    import time
+
+    for directory in sys.argv[1:]:
+        for mesh_path in sorted(glob.glob(os.path.join(directory, "*.stl")) +
+                                glob.glob(os.path.join(directory, "*.dae"))):
+            tic = time.time()
+            sphere_tree = load_or_gen_sphere_tree(mesh_path)
+            print(mesh_path, len(sphere_tree.leaf_ids), "leaves", time.time() - tic)
@@ -10,7 +10,15 @@ import basis.robot_math as rm
 
 class FKOptBasedIK(object):
 
-    def __init__(self, robot, component_name, obstacle_list=[], toggle_debug=False):
+    def __init__(self, robot, component_name, obstacle_list=[], clearance=.0, toggle_debug=False):
+        """
+        :param robot:
+        :param component_name:
+        :param obstacle_list: a list of CollisionModel, kept away by the smooth clearance constraint, see
+                              robot.min_distance
+        :param clearance: the minimum distance to the obstacles
+        :param toggle_debug:
+        """
         self.rbt = robot
         self.jlc_name = component_name
         self.result = None
@@ -32,6 +40,8 @@ class FKOptBasedIK(object):
         self._y_limit = 1e-6
         self._z_limit = 1e-6
         self.obstacle_list = obstacle_list
+        self.clearance = clearance
+        self._min_distance_cache = [None, None]  # [jnt_values, (distance, gradient)], shared by fun and jac
         self.toggle_debug = toggle_debug
 
     def _get_bnds(self, jlc_name):
@@ -73,14 +83,30 @@ class FKOptBasedIK(object):
         return self._z_limit - z_err
 
     def _constraint_collision(self, jnt_values):
+        # the obstacles are kept away by _constraint_clearance, whose gradients the optimizer can follow
         self.rbt.fk(jnt_values=jnt_values, component_name=self.jlc_name)
-        if self.rbt.is_collided(obstacle_list=self.obstacle_list):
+        if self.rbt.is_collided():
             return -1
         else:
             return 1
 
-    def add_constraint(self, fun, type="ineq"):
-        self.cons.append({'type': type, 'fun': fun})
+    def _min_distance(self, jnt_values):
+        if self._min_distance_cache[0] is None or not np.array_equal(self._min_distance_cache[0], jnt_values):
+            self._min_distance_cache = [np.array(jnt_values),
+                                        self.rbt.min_distance(self.jlc_name, jnt_values, self.obstacle_list)]
+        return self._min_distance_cache[1]
+
+    def _constraint_clearance(self, jnt_values):
+        return self._min_distance(jnt_values)[0] - self.clearance
+
+    def _constraint_clearance_jac(self, jnt_values):
+        return self._min_distance(jnt_values)[1]
+
+    def add_constraint(self, fun, type="ineq", jac=None):
+        if jac is None:
+            self.cons.append({'type': type, 'fun': fun})
+        else:
+            self.cons.append({'type': type, 'fun': fun, 'jac': jac})
 
     def optimization_goal(self, jnt_values):
         if self.toggle_debug:
@@ -101,12 +127,15 @@ class FKOptBasedIK(object):
         self.seed_jnt_values = seed_jnt_values
         self.tgt_pos = tgt_pos
         self.tgt_rotmat = tgt_rotmat
+        self.cons = []
         self.add_constraint(self._constraint_xangle, type="ineq")
         self.add_constraint(self._constraint_zangle, type="ineq")
         self.add_constraint(self._constraint_x, type="ineq")
         self.add_constraint(self._constraint_y, type="ineq")
         self.add_constraint(self._constraint_z, type="ineq")
         self.add_constraint(self._constraint_collision, type="ineq")
+        if len(self.obstacle_list) > 0:
+            self.add_constraint(self._constraint_clearance, type="ineq", jac=self._constraint_clearance_jac)
         time_start = time.time()
         sol = minimize(self.optimization_goal,
                        seed_jnt_values,
@@ -5,8 +5,147 @@ import basis.robot_math as rm
 
 class IncrementalNIK(object):
 
-    def __init__(self, robot):
+    def __init__(self, robot, max_iterations=10, manipulability_threshold=.01, max_damping=.01, batch_size=8):
+        """
+        :param robot:
+        :param max_iterations: the resolved-rate iterations per waypoint before falling back to self.rbt.ik
+        :param manipulability_threshold: the steps are damped below it (damped least squares near singularities)
+        :param max_damping: the damping at a singularity
+        :param batch_size: the number of configurations collision-checked by one is_collided_many
+        """
         self.rbt = robot
+        self.max_iterations = max_iterations
+        self.manipulability_threshold = manipulability_threshold
+        self.max_damping = max_damping
+        self.batch_size = batch_size
+
+    def _resolved_rate(self, jlc, tgt_pos, tgt_rotmat, jnt_values):
+        """
+        move jnt_values to the target pose with damped pseudoinverse jacobian steps
+        the damping grows as the manipulability drops below self.manipulability_threshold, a step is shortened
+        so that no joint leaves its range, and halved until it reduces the error
+        :param jlc: the jlchain of the component, its state is changed
+        :param tgt_pos:
+        :param tgt_rotmat:
+        :param jnt_values: the solution of the previous waypoint
+        :return: 1xn nparray, None if not converged
+        """
+        ikt = jlc._ikt
+        ws_wtdiagmat = np.diag(ikt.ws_wtlist)
+        jnt_values = np.array(jnt_values, dtype=np.float64)
+        jlc.fk(jnt_values=jnt_values)
+        err = ikt.tcp_error(tgt_pos, tgt_rotmat, jlc.tcp_jntid, jlc.tcp_loc_pos, jlc.tcp_loc_rotmat)
+        errnorm = err.dot(ws_wtdiagmat).dot(err)
+        for _ in range(self.max_iterations):
+            if errnorm < 1e-6:
+                return jnt_values
+            j = ikt.jacobian(jlc.tcp_jntid)
+            jjt = j.dot(j.T)
+            manipulability = math.sqrt(max(np.linalg.det(jjt), 0.0))
+            damping = 0.0
+            if manipulability < self.manipulability_threshold:
+                damping = (1.0 - manipulability / self.manipulability_threshold) ** 2 * self.max_damping
+            dq = j.T.dot(np.linalg.solve(jjt + damping * np.eye(len(jjt)), err))
+            # shorten the step at the joint limits
+            with np.errstate(divide='ignore', invalid='ignore'):
+                ratio_array = np.where(dq > 0, (ikt.jmvmax - jnt_values) / dq,
+                                       np.where(dq < 0, (ikt.jmvmin - jnt_values) / dq, np.inf))
+            dq = dq * min(1.0, np.min(ratio_array))
+            while True:
+                if np.max(np.abs(dq)) < 1e-9:
+                    return None
+                new_jnt_values = jnt_values + dq
+                jlc.fk(jnt_values=new_jnt_values)
+                new_err = ikt.tcp_error(tgt_pos, tgt_rotmat, jlc.tcp_jntid, jlc.tcp_loc_pos, jlc.tcp_loc_rotmat)
+                new_errnorm = new_err.dot(ws_wtdiagmat).dot(new_err)
+                if new_errnorm < errnorm:
+                    break
+                dq = dq / 2.0
+            jnt_values, err, errnorm = new_jnt_values, new_err, new_errnorm
+        return jnt_values if errnorm < 1e-6 else None
+
+    def _is_batch_collided(self, component_name, jnt_values_list, last_jnt_values, obstacle_list):
+        """
+        :param jnt_values_list: the configurations of a batch
+        :param last_jnt_values: the last configuration of the previous batch, None for the first batch
+        :return:
+        """
+        if np.any(self.rbt.is_collided_many(component_name,
+                                            np.array(jnt_values_list),
+                                            obstacle_list=obstacle_list,
+                                            toggle_stop_at_first=True)):
+            print("Intermediate pose collided in gen_linear_motion!")
+            return True
+        # the motions between the poses are checked only if the edge validator of the robot is enabled
+        if self.rbt.edge_validator is not None:
+            conf_list = jnt_values_list if last_jnt_values is None else [last_jnt_values] + jnt_values_list
+            for conf0, conf1 in zip(conf_list[:-1], conf_list[1:]):
+                if self.rbt.is_edge_collided(component_name, conf0, conf1, obstacle_list):
+                    print("Intermediate motion collided in gen_linear_motion!")
+                    return True
+        return False
+
+    def gen_linear_motion_iter(self,
+                               component_name,
+                               start_hnd_pos,
+                               start_hnd_rotmat,
+                               goal_hnd_pos,
+                               goal_hnd_rotmat,
+                               obstacle_list=[],
+                               granularity=0.03,
+                               seed_jnt_values=None):
+        """
+        a generator of the joint values along a linear motion, so that the execution can start before the whole
+        motion is solved
+        the start pose is solved by self.rbt.ik, the following ones by resolved-rate steps from the previous solution
+        (self.rbt.ik is the fallback); the configurations are collision-checked in batches of self.batch_size and
+        yielded once their batch is collision free
+        :param component_name:
+        :param start_hnd_pos:
+        :param start_hnd_rotmat:
+        :param goal_hnd_pos:
+        :param goal_hnd_rotmat:
+        :param obstacle_list:
+        :param granularity:
+        :param seed_jnt_values:
+        :return: yields 1xn nparrays, and a final None if the motion failed
+        """
+        if component_name not in self.rbt.manipulator_dict:
+            raise ValueError("The component must be in manipulator_dict!")
+        jlc = self.rbt.manipulator_dict[component_name].jlc
+        jnt_values_bk = self.rbt.get_jnt_values(component_name)
+        pos_list, rotmat_list = rm.interplate_pos_rotmat(start_hnd_pos,
+                                                         start_hnd_rotmat,
+                                                         goal_hnd_pos,
+                                                         goal_hnd_rotmat,
+                                                         granularity=granularity)
+        if seed_jnt_values is None:
+            seed_jnt_values = jnt_values_bk
+        jnt_values = None
+        last_jnt_values = None
+        batch = []
+        for id, (pos, rotmat) in enumerate(zip(pos_list, rotmat_list)):
+            if jnt_values is not None:
+                jnt_values = self._resolved_rate(jlc, pos, rotmat, jnt_values)
+            if jnt_values is None:
+                jnt_values = self.rbt.ik(component_name, pos, rotmat, seed_conf=seed_jnt_values)
+            if jnt_values is None:
+                print("IK not solvable in gen_linear_motion!")
+                self.rbt.fk(component_name, jnt_values_bk)
+                yield None
+                return
+            seed_jnt_values = jnt_values
+            batch.append(jnt_values)
+            if len(batch) < self.batch_size and id < len(pos_list) - 1:
+                continue
+            self.rbt.fk(component_name, jnt_values_bk)
+            if self._is_batch_collided(component_name, batch, last_jnt_values, obstacle_list):
+                yield None
+                return
+            for batch_jnt_values in batch:
+                yield batch_jnt_values
+            last_jnt_values = batch[-1]
+            batch = []
 
     def gen_linear_motion(self,
                           component_name,
@@ -30,30 +169,18 @@ class IncrementalNIK(object):
         author: weiwei
         date: 20210125
         """
-        jnt_values_bk = self.rbt.get_jnt_values(component_name)
-        pos_list, rotmat_list = rm.interplate_pos_rotmat(start_hnd_pos,
-                                                         start_hnd_rotmat,
-                                                         goal_hnd_pos,
-                                                         goal_hnd_rotmat,
-                                                         granularity=granularity)
         jnt_values_list = []
-        if seed_jnt_values is None:
-            seed_jnt_values = jnt_values_bk
-        for (pos, rotmat) in zip(pos_list, rotmat_list):
-            jnt_values = self.rbt.ik(component_name, pos, rotmat, seed_conf=seed_jnt_values)
+        for jnt_values in self.gen_linear_motion_iter(component_name,
+                                                      start_hnd_pos,
+                                                      start_hnd_rotmat,
+                                                      goal_hnd_pos,
+                                                      goal_hnd_rotmat,
+                                                      obstacle_list=obstacle_list,
+                                                      granularity=granularity,
+                                                      seed_jnt_values=seed_jnt_values):
             if jnt_values is None:
-                print("IK not solvable in gen_linear_motion!")
-                self.rbt.fk(component_name, jnt_values_bk)
                 return []
-            else:
-                self.rbt.fk(component_name, jnt_values)
-                if self.rbt.is_collided(obstacle_list):
-                    print("Intermediate pose collided in gen_linear_motion!")
-                    self.rbt.fk(component_name, jnt_values_bk)
-                    return []
             jnt_values_list.append(jnt_values)
-            seed_jnt_values = jnt_values
-        self.rbt.fk(component_name, jnt_values_bk)
         return jnt_values_list
 
     def gen_rel_linear_motion(self,
@@ -139,10 +266,10 @@ if __name__ == '__main__':
     gm.gen_frame(pos=goal_pos, rotmat=goal_rotmat).attach_to(base)
     inik = IncrementalNIK(yumi_instance)
     tic = time.time()
-    jnt_values_list = inik.gen_linear_motion(component_name, start_info, goal_info)
-    toc = time.time()
-    print(toc - tic)
-    for jnt_values in jnt_values_list:
+    for jnt_values in inik.gen_linear_motion_iter(component_name, start_pos, start_rotmat, goal_pos, goal_rotmat):
+        if jnt_values is None:
+            break
+        print("solved", time.time() - tic)
         yumi_instance.fk(component_name, jnt_values)
         yumi_meshmodel = yumi_instance.gen_meshmodel()
         yumi_meshmodel.attach_to(base)
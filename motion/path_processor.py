@@ -0,0 +1,317 @@
+import numpy as np
+from scipy.interpolate import BSpline
+import robotsim._kinematics.edgevalidator as ev
+
+
+class PathProcessor(object):
+    """
+    Post-processing of the joint paths returned by the planners
+    The path is reduced to few waypoints by a deterministic greedy shortcut (each waypoint is linked to the farthest
+    waypoint it sees), then shortened by randomized shortcuts between arbitrary points of the path and by partial
+    shortcuts that straighten one joint while the other joints follow the path (Geraerts & Overmars 2007).
+    Optionally, the corners are rounded by a cubic B-spline. The candidate segments are validated in batches, i.e. the
+    configurations of several candidates are checked in one RobotInterface.is_collided_many call per bisection level.
+    The random candidates that shorten the path by less than the granularity are not validated.
+    The edges are discretized by the robot's edge validator if it is enabled (see RobotInterface.enable_edge_validator),
+    or at the joint-space step granularity.
+    """
+
+    def __init__(self, robot, granularity=.05, batch_size=8, seed=None):
+        """
+        :param robot: a RobotInterface, the robot is not copied
+        :param granularity: the joint-space step of the edge checks, ignored if the edge validator is enabled
+        :param batch_size: the number of random candidates validated together
+        :param seed: the seed of the randomized shortcuts
+        """
+        self.robot = robot
+        self.granularity = granularity
+        self.batch_size = batch_size
+        self.min_gain = granularity
+        self._rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def get_path_length(path):
+        path = np.asarray(path)
+        return float(np.sum(np.linalg.norm(np.diff(path, axis=0), axis=1)))
+
+    def _get_nsteps(self, component_name, conf0, conf1):
+        edge_validator = getattr(self.robot, 'edge_validator', None)
+        if edge_validator is not None:
+            dist = edge_validator.get_displacement_bound(self.robot, component_name, conf0, conf1)
+            return max(int(np.ceil(dist / edge_validator.resolution)), 1)
+        return max(int(np.ceil(np.linalg.norm(conf1 - conf0) / self.granularity)), 1)
+
+    def _interpolate(self, component_name, conf0, conf1):
+        """
+        :return: nxndof nparray, the configurations between conf0 and conf1, the two ends are excluded
+        """
+        nsteps = self._get_nsteps(component_name, conf0, conf1)
+        return np.linspace(conf0, conf1, nsteps + 1)[1:-1]
+
+    def _are_collided(self, component_name, conf_array_list, obstacle_list=[], otherrobot_list=[]):
+        """
+        check several groups of configurations together, level by level in bisection order
+        each level of all the groups that are still collision-free is checked in one is_collided_many call, so that
+        the colliding groups exit early
+        :param conf_array_list: a list of nxndof nparrays
+        :return: 1xngroups bool nparray, True if any configuration of the group is in collision
+        """
+        result = np.zeros(len(conf_array_list), dtype=bool)
+        # the configurations of a group are the inner points of len+1 equal steps
+        levels_list = [[id_array - 1 for id_array in ev.gen_bisection_levels(len(conf_array) + 1)]
+                       for conf_array in conf_array_list]
+        for level in range(max([len(level_list) for level_list in levels_list], default=0)):
+            group_id_list = [group_id for group_id, level_list in enumerate(levels_list)
+                             if not result[group_id] and level < len(level_list)]
+            if len(group_id_list) == 0:
+                break
+            conf_array = np.vstack([conf_array_list[group_id][levels_list[group_id][level]]
+                                    for group_id in group_id_list])
+            is_collided_array = self.robot.is_collided_many(component_name,
+                                                            conf_array,
+                                                            obstacle_list=obstacle_list,
+                                                            otherrobot_list=otherrobot_list)
+            len_array = np.array([len(levels_list[group_id][level]) for group_id in group_id_list])
+            start_array = np.concatenate(([0], np.cumsum(len_array)[:-1]))
+            result[group_id_list] = np.add.reduceat(is_collided_array.astype(np.int64), start_array) > 0
+        return result
+
+    def _are_edges_collided(self, component_name, edge_list, obstacle_list=[], otherrobot_list=[]):
+        """
+        :param edge_list: [[conf0, conf1], ...]
+        :return: 1xnedges bool nparray
+        """
+        return self._are_collided(component_name,
+                                  [self._interpolate(component_name, conf0, conf1) for conf0, conf1 in edge_list],
+                                  obstacle_list,
+                                  otherrobot_list)
+
+    def _densify(self, component_name, path):
+        """
+        :return: nxndof nparray, path with the interpolated configurations of its edges
+        """
+        conf_list = [path[:1]]
+        for conf0, conf1 in zip(path[:-1], path[1:]):
+            conf_list.append(self._interpolate(component_name, conf0, conf1))
+            conf_list.append(conf1[None, :])
+        return np.vstack(conf_list)
+
+    def shortcut(self, component_name, path, obstacle_list=[], otherrobot_list=[]):
+        """
+        deterministic greedy shortcut, each waypoint is linked to the farthest waypoint it sees among the ones
+        2, 4, 8, ... waypoints ahead and the last one; the candidates of a waypoint are validated together
+        :param component_name:
+        :param path: a list of 1xn nparray
+        :param obstacle_list:
+        :param otherrobot_list:
+        :return: a list of 1xn nparray, a subset of path
+        """
+        path = np.asarray(path, dtype=np.float64)
+        new_path = [path[0]]
+        i = 0
+        while i < len(path) - 1:
+            j_list = []
+            step = 2
+            while i + step < len(path) - 1:
+                j_list.append(i + step)
+                step *= 2
+            if i + 1 < len(path) - 1:
+                j_list.append(len(path) - 1)
+            next_i = i + 1
+            if len(j_list) > 0:
+                is_collided_array = self._are_edges_collided(component_name,
+                                                             [[path[i], path[j]] for j in j_list],
+                                                             obstacle_list,
+                                                             otherrobot_list)
+                valid_j_list = [j for j, is_collided in zip(j_list, is_collided_array) if not is_collided]
+                if len(valid_j_list) > 0:
+                    next_i = max(valid_j_list)
+            new_path.append(path[next_i])
+            i = next_i
+        return new_path
+
+    def _get_point(self, path, cumlen_array, length):
+        """
+        :return: [segment id, conf] of the point at the given arc length along path
+        """
+        id = int(np.clip(np.searchsorted(cumlen_array, length, side='right') - 1, 0, len(path) - 2))
+        seglen = cumlen_array[id + 1] - cumlen_array[id]
+        ratio = 0.0 if seglen == 0 else (length - cumlen_array[id]) / seglen
+        return id, path[id] + ratio * (path[id + 1] - path[id])
+
+    @staticmethod
+    def _select_disjoint(candidate_list):
+        """
+        greedily select the candidates with the largest gains whose segment ranges do not overlap
+        :param candidate_list: [[gain, id0, id1, ...], ...], the segments id0 to id1 are replaced
+        :return: the selected candidates, sorted by id0 in descending order so that they can be applied one by one
+        """
+        selected_list = []
+        for candidate in sorted(candidate_list, key=lambda candidate: candidate[0], reverse=True):
+            id0, id1 = candidate[1], candidate[2]
+            if all(id1 < selected[1] or id0 > selected[2] for selected in selected_list):
+                selected_list.append(candidate)
+        return sorted(selected_list, key=lambda candidate: candidate[1], reverse=True)
+
+    def random_shortcut(self, component_name, path, obstacle_list=[], otherrobot_list=[], iterations=10):
+        """
+        link two random points of the path; each iteration validates batch_size candidates together and applies the
+        valid ones that shorten the path most and do not overlap
+        :return: a list of 1xn nparray
+        """
+        path = np.asarray(path, dtype=np.float64)
+        for _ in range(iterations):
+            if len(path) < 3:
+                break
+            cumlen_array = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))))
+            candidate_list = []
+            for length0, length1 in np.sort(self._rng.uniform(0, cumlen_array[-1], (self.batch_size, 2)), axis=1):
+                id0, conf0 = self._get_point(path, cumlen_array, length0)
+                id1, conf1 = self._get_point(path, cumlen_array, length1)
+                if id0 == id1:
+                    continue
+                gain = (length1 - length0) - np.linalg.norm(conf1 - conf0)
+                if gain > self.min_gain:
+                    candidate_list.append([gain, id0, id1, conf0, conf1])
+            if len(candidate_list) == 0:
+                continue
+            is_collided_array = self._are_edges_collided(component_name,
+                                                         [[conf0, conf1] for _, _, _, conf0, conf1 in candidate_list],
+                                                         obstacle_list,
+                                                         otherrobot_list)
+            valid_list = [candidate for candidate, is_collided in zip(candidate_list, is_collided_array)
+                          if not is_collided]
+            if len(valid_list) == 0:
+                continue
+            for _, id0, id1, conf0, conf1 in self._select_disjoint(valid_list):
+                path = np.vstack((path[:id0 + 1], conf0, conf1, path[id1 + 1:]))
+        return list(path)
+
+    def partial_shortcut(self, component_name, path, obstacle_list=[], otherrobot_list=[], iterations=10):
+        """
+        straighten one random joint between two random points of the path, the other joints follow the path
+        each iteration validates batch_size candidates together and applies the valid ones that shorten the path most
+        and do not overlap
+        :return: a list of 1xn nparray
+        """
+        path = np.asarray(path, dtype=np.float64)
+        ndof = path.shape[1]
+        for _ in range(iterations):
+            if len(path) < 3:
+                break
+            cumlen_array = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(path, axis=0), axis=1))))
+            candidate_list = []
+            for length0, length1 in np.sort(self._rng.uniform(0, cumlen_array[-1], (self.batch_size, 2)), axis=1):
+                id0, conf0 = self._get_point(path, cumlen_array, length0)
+                id1, conf1 = self._get_point(path, cumlen_array, length1)
+                if id0 == id1:
+                    continue
+                jnt_id = self._rng.integers(ndof)
+                sub_path = np.vstack((conf0, path[id0 + 1:id1 + 1], conf1))
+                sub_cumlen_array = np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(sub_path, axis=0),
+                                                                                   axis=1))))
+                new_sub_path = sub_path.copy()
+                new_sub_path[:, jnt_id] = np.interp(sub_cumlen_array, [0.0, sub_cumlen_array[-1]],
+                                                    [conf0[jnt_id], conf1[jnt_id]])
+                gain = self.get_path_length(sub_path) - self.get_path_length(new_sub_path)
+                if gain > self.min_gain:
+                    candidate_list.append([gain, id0, id1, new_sub_path])
+            if len(candidate_list) == 0:
+                continue
+            is_collided_array = self._are_collided(component_name,
+                                                   [self._densify(component_name, new_sub_path)[1:-1]
+                                                    for _, _, _, new_sub_path in candidate_list],
+                                                   obstacle_list,
+                                                   otherrobot_list)
+            valid_list = [candidate for candidate, is_collided in zip(candidate_list, is_collided_array)
+                          if not is_collided]
+            if len(valid_list) == 0:
+                continue
+            for _, id0, id1, new_sub_path in self._select_disjoint(valid_list):
+                path = np.vstack((path[:id0 + 1], new_sub_path, path[id1 + 1:]))
+        return list(path)
+
+    def bspline_smooth(self, component_name, path, obstacle_list=[], otherrobot_list=[], corner_ratio=.25):
+        """
+        round the corners of the path with a clamped cubic B-spline
+        the control polygon is path with each edge cut at corner_ratio from both ends, so the curve stays close to
+        the path and keeps its two ends
+        :param corner_ratio: in (0, .5), smaller values keep the curve closer to the corners
+        :return: a list of 1xn nparray sampled from the curve at the edge resolution, None if the curve collides
+        """
+        path = np.asarray(path, dtype=np.float64)
+        if len(path) < 3:
+            return list(path)
+        control_list = [path[0]]
+        for conf0, conf1 in zip(path[:-1], path[1:]):
+            control_list += [conf0 + corner_ratio * (conf1 - conf0), conf1 - corner_ratio * (conf1 - conf0)]
+        control_list.append(path[-1])
+        control_array = np.array(control_list)
+        degree = 3
+        ninner = len(control_array) - degree - 1
+        knot_array = np.concatenate((np.zeros(degree), np.linspace(0, 1, ninner + 2), np.ones(degree)))
+        spline = BSpline(knot_array, control_array, degree)
+        nsamples = sum(self._get_nsteps(component_name, conf0, conf1)
+                       for conf0, conf1 in zip(control_array[:-1], control_array[1:])) + 1
+        curve = spline(np.linspace(0, 1, nsamples))
+        if self._are_collided(component_name, [curve[1:-1]], obstacle_list, otherrobot_list)[0]:
+            return None
+        return list(curve)
+
+    def process(self,
+                component_name,
+                path,
+                obstacle_list=[],
+                otherrobot_list=[],
+                iterations=4,
+                partial_iterations=2,
+                toggle_bspline=False):
+        """
+        random_shortcut, shortcut, random_shortcut, partial_shortcut, shortcut, and optionally bspline_smooth
+        the straight edge between the two ends is validated first, the stages are skipped if it is collision-free
+        the first random shortcuts remove the loops of the raw path cheaply, so that the greedy shortcut sees far
+        :param iterations: the iterations of each random_shortcut
+        :param partial_iterations: the iterations of partial_shortcut
+        :param toggle_bspline: the corners are cut at .25 and then .1, the waypoints are returned if both collide
+        :return: a list of 1xn nparray
+        """
+        path = np.asarray(path, dtype=np.float64)
+        if not self._are_edges_collided(component_name, [[path[0], path[-1]]], obstacle_list, otherrobot_list)[0]:
+            return [path[0], path[-1]]
+        path = self.random_shortcut(component_name, path, obstacle_list, otherrobot_list, iterations)
+        path = self.shortcut(component_name, path, obstacle_list, otherrobot_list)
+        path = self.random_shortcut(component_name, path, obstacle_list, otherrobot_list, iterations)
+        path = self.partial_shortcut(component_name, path, obstacle_list, otherrobot_list, partial_iterations)
+        path = self.shortcut(component_name, path, obstacle_list, otherrobot_list)
+        if toggle_bspline:
+            for corner_ratio in [.25, .1]:
+                curve = self.bspline_smooth(component_name, path, obstacle_list, otherrobot_list, corner_ratio)
+                if curve is not None:
+                    return curve
+        return path
+
+
+if __name__ == '__main__':
+    import time
+    import robotsim.robots.yumi.yumi as ym
+    import modeling.collisionmodel as cm
+    from motion.probabilistic import rrt_connect
+
+    robot_s = ym.Yumi(enable_cc=True)
+    obstacle_list = [cm.gen_box(extent=np.array([.1, .1, .1])) for _ in range(3)]
+    obstacle_list[0].set_pos(np.array([.4, .2, .25]))
+    obstacle_list[1].set_pos(np.array([.4, .1, .35]))
+    obstacle_list[2].set_pos(np.array([.3, .25, .3]))
+    start_conf = robot_s.get_jnt_values('lft_arm')
+    goal_conf = np.radians(np.array([-20, -60, 40, 10, 40, 30, 0]))
+    planner = rrt_connect.RRTConnect(robot_s)
+    path = planner.plan('lft_arm', start_conf, goal_conf, obstacle_list, ext_dist=.05, maxtime=30)
+    print("planned", len(path), "waypoints, length", PathProcessor.get_path_length(path))
+    processor = PathProcessor(robot_s, granularity=.05)
+    tic = time.time()
+    processed_path = processor.process('lft_arm', path, obstacle_list)
+    toc = time.time()
+    print("processed", toc - tic, len(processed_path), "waypoints, length",
+          PathProcessor.get_path_length(processed_path))
+    curve = processor.bspline_smooth('lft_arm', processed_path, obstacle_list)
+    print("bspline", None if curve is None else PathProcessor.get_path_length(curve))
@@ -0,0 +1,279 @@
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import contextlib
+import numpy as np
+import modeling.collisionmodel as cm
+from motion.probabilistic import rrt
+from motion.probabilistic import rrt_connect
+from motion.probabilistic import rrt_connect_classic
+from motion.probabilistic import rrt_connect_wrsold
+from motion.probabilistic import lazy_rrt_connect
+
+# planner name: [planner class, extra arguments of plan]
+PLANNER_DICT = {'rrt': [rrt.RRT, {}],
+                'rrt_connect': [rrt_connect.RRTConnect, {}],
+                'rrt_connect_classic': [rrt_connect_classic.RRTConnect, {}],
+                'rrt_connect_wrsold': [rrt_connect_wrsold.RRTConnect, {}],
+                'lazy_rrt_connect': [lazy_rrt_connect.LazyRRTConnect, {}]}
+
+
+def _gen_table_clutter(rng, table_center, table_extent, clutter_xrange, clutter_yrange, nboxes):
+    """
+    a table and boxes of random sizes standing on it
+    :param rng: np.random.Generator
+    :param table_center: 1x3 nparray
+    :param table_extent: 1x3 nparray
+    :param clutter_xrange: [min, max] of the x of the boxes
+    :param clutter_yrange: [min, max] of the y of the boxes
+    :param nboxes:
+    :return: a list of CollisionModel
+    """
+    table = cm.gen_box(extent=table_extent)
+    table.set_pos(table_center)
+    obstacle_list = [table]
+    table_top = table_center[2] + table_extent[2] / 2
+    for _ in range(nboxes):
+        extent = np.array([rng.uniform(.04, .12), rng.uniform(.04, .12), rng.uniform(.05, .25)])
+        box = cm.gen_box(extent=extent)
+        box.set_pos(np.array([rng.uniform(*clutter_xrange), rng.uniform(*clutter_yrange), table_top + extent[2] / 2]))
+        obstacle_list.append(box)
+    return obstacle_list
+
+
+def gen_yumi_scene(rng):
+    """
+    :param rng: np.random.Generator
+    :return: [robot_instance, component_name, obstacle_list]
+    """
+    import robotsim.robots.yumi.yumi as ym
+    robot_instance = ym.Yumi(enable_cc=True)
+    # the table of yumi is a part of its stand, its top is at z=0
+    obstacle_list = _gen_table_clutter(rng,
+                                       table_center=np.array([.6, 0, -.025]),
+                                       table_extent=np.array([.6, 1.2, .05]),
+                                       clutter_xrange=[.3, .6],
+                                       clutter_yrange=[-.35, .35],
+                                       nboxes=6)
+    return robot_instance, 'rgt_arm', obstacle_list
+
+
+def gen_ur3e_dual_scene(rng):
+    import robotsim.robots.ur3e_dual.ur3e_dual as u3ed
+    robot_instance = u3ed.UR3EDual(enable_cc=True)
+    obstacle_list = _gen_table_clutter(rng,
+                                       table_center=np.array([.9, 0, .975]),
+                                       table_extent=np.array([.6, 1.2, .05]),
+                                       clutter_xrange=[.65, 1.0],
+                                       clutter_yrange=[-.5, .05],  # clear of the left arm
+                                       nboxes=6)
+    return robot_instance, 'rgt_arm', obstacle_list
+
+
+def gen_xarm7_shuidi_mobile_scene(rng):
+    import robotsim.robots.xarm7_shuidi_mobile.xarm7_shuidi_mobile as xsm
+    robot_instance = xsm.XArm7YunjiMobile(enable_cc=True)
+    obstacle_list = _gen_table_clutter(rng,
+                                       table_center=np.array([.75, 0, .575]),
+                                       table_extent=np.array([.5, 1.0, .05]),
+                                       clutter_xrange=[.5, .75],
+                                       clutter_yrange=[-.35, .35],
+                                       nboxes=6)
+    return robot_instance, 'arm', obstacle_list
+
+
+# scene name: a function that builds [robot_instance, component_name, obstacle_list] from a np.random.Generator
+SCENE_DICT = {'yumi': gen_yumi_scene,
+              'ur3e_dual': gen_ur3e_dual_scene,
+              'xarm7_shuidi_mobile': gen_xarm7_shuidi_mobile_scene}
+
+
+def gen_queries(robot_instance, component_name, obstacle_list, nqueries, seed=0):
+    """
+    collision-free start and goal configurations, the same for every planner given the same seed
+    :return: a list of [start_conf, goal_conf]
+    """
+    np_state = np.random.get_state()
+    np.random.seed(seed)
+    jnt_values_bk = robot_instance.get_jnt_values(component_name)
+    conf_list = []
+    for _ in range(1000 * nqueries):
+        if len(conf_list) == 2 * nqueries:
+            break
+        conf = robot_instance.rand_conf(component_name)
+        robot_instance.fk(component_name, conf)
+        if not robot_instance.is_collided(obstacle_list):
+            conf_list.append(conf)
+    robot_instance.fk(component_name, jnt_values_bk)
+    np.random.set_state(np_state)
+    if len(conf_list) < 2 * nqueries:
+        raise ValueError("Failed to sample collision-free queries, the scene might collide with the robot!")
+    return [[conf_list[2 * i], conf_list[2 * i + 1]] for i in range(nqueries)]
+
+
+class CallCounter(object):
+    """
+    Counts the fk, ik and collision calls of a robot instance, e.g. the copy held by a planner
+    The methods are wrapped on the instance. fk is the number of configurations whose forward kinematics is
+    evaluated, by the fk of the robot or by the batched fk_many of its manipulators, so that it does not depend on
+    whether a check is batched. The other counts are calls made by the planner; the calls made inside a counted call
+    (e.g. the is_collided of is_collided_many for the components without batched fk) are not counted again.
+    ncdchecks is the number of configurations sent to is_collided and is_collided_many.
+    """
+
+    def __init__(self, robot_instance):
+        self.robot_instance = robot_instance
+        self.counts = {}
+        self._depth = 0
+        self.reset()
+        for method_name in ['fk', 'ik', 'is_collided', 'is_collided_many']:
+            self._wrap(robot_instance, method_name)
+        for manipulator in getattr(robot_instance, 'manipulator_dict', {}).values():
+            self._wrap(manipulator, 'fk_many')
+
+    def reset(self):
+        self.counts = {'fk': 0, 'ik': 0, 'is_collided': 0, 'is_collided_many': 0, 'ncdchecks': 0}
+
+    def _wrap(self, instance, method_name):
+        method = getattr(instance, method_name)
+
+        def counted_method(*args, **kwargs):
+            if method_name == 'fk':
+                self.counts['fk'] += 1
+            elif method_name == 'fk_many':
+                jnt_values_array = kwargs['jnt_values_array'] if 'jnt_values_array' in kwargs else args[0]
+                self.counts['fk'] += len(jnt_values_array)
+            elif self._depth == 0:
+                self.counts[method_name] += 1
+                if method_name == 'is_collided':
+                    self.counts['ncdchecks'] += 1
+                elif method_name == 'is_collided_many':
+                    conf_array = kwargs['conf_array'] if 'conf_array' in kwargs else args[1]
+                    self.counts['ncdchecks'] += len(conf_array)
+            self._depth += 1
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self._depth -= 1
+
+        setattr(instance, method_name, counted_method)
+
+
+def get_path_length(path):
+    return float(np.sum(np.linalg.norm(np.diff(np.asarray(path), axis=0), axis=1)))
+
+
+def _summarize(record_list):
+    time_array = np.array([record['time'] for record in record_list])
+    success_array = np.array([record['success'] for record in record_list])
+    length_array = np.array([record['path_length'] for record in record_list if record['success']])
+    summary = {'nqueries': len(record_list),
+               'success_rate': float(np.mean(success_array)),
+               'time': {'p50': float(np.percentile(time_array, 50)),
+                        'p90': float(np.percentile(time_array, 90)),
+                        'p99': float(np.percentile(time_array, 99)),
+                        'max': float(np.max(time_array))},
+               'path_length': None if len(length_array) == 0 else {'mean': float(np.mean(length_array)),
+                                                                   'p50': float(np.percentile(length_array, 50))},
+               'calls': {}}
+    for key in record_list[0]['calls']:
+        summary['calls'][key] = float(np.mean([record['calls'][key] for record in record_list]))
+    return summary
+
+
+def run_benchmark(scene_name_list=None,
+                  planner_name_list=None,
+                  nqueries=10,
+                  seed=0,
+                  ext_dist=.05,
+                  maxtime=10.0,
+                  toggle_records=False,
+                  toggle_debug=False):
+    """
+    run every planner over the same seeded queries of every scene, headless
+    query i of a scene is planned with random and np.random seeded by seed+i, so that the runs are reproducible
+    :param scene_name_list: keys of SCENE_DICT, all if None
+    :param planner_name_list: keys of PLANNER_DICT, all if None
+    :param nqueries: per scene
+    :param seed: the seed of the scenes, the queries, and the planners
+    :param ext_dist:
+    :param maxtime: per query, a query that times out is a failure
+    :param toggle_records: include the record of every query in the report
+    :param toggle_debug: print the progress and the messages of the planners
+    :return: a json-serializable dict
+    """
+    if scene_name_list is None:
+        scene_name_list = list(SCENE_DICT)
+    if planner_name_list is None:
+        planner_name_list = list(PLANNER_DICT)
+    for scene_name in scene_name_list:
+        if scene_name not in SCENE_DICT:
+            raise ValueError("Unknown scene " + scene_name + "!")
+    for planner_name in planner_name_list:
+        if planner_name not in PLANNER_DICT:
+            raise ValueError("Unknown planner " + planner_name + "!")
+    report = {'config': {'nqueries': nqueries, 'seed': seed, 'ext_dist': ext_dist, 'maxtime': maxtime},
+              'scenes': {}}
+    for scene_name in scene_name_list:
+        robot_instance, component_name, obstacle_list = SCENE_DICT[scene_name](np.random.default_rng(seed))
+        query_list = gen_queries(robot_instance, component_name, obstacle_list, nqueries, seed=seed)
+        report['scenes'][scene_name] = {}
+        for planner_name in planner_name_list:
+            planner_class, plan_kwargs = PLANNER_DICT[planner_name]
+            planner = planner_class(robot_instance)
+            call_counter = CallCounter(planner.robot)
+            record_list = []
+            for i, (start_conf, goal_conf) in enumerate(query_list):
+                random.seed(seed + i)
+                np.random.seed(seed + i)
+                call_counter.reset()
+                stdout = sys.stdout if toggle_debug else io.StringIO()
+                tic = time.time()
+                with contextlib.redirect_stdout(stdout):
+                    path = planner.plan(component_name=component_name,
+                                        start_conf=start_conf,
+                                        goal_conf=goal_conf,
+                                        obstacle_list=obstacle_list,
+                                        ext_dist=ext_dist,
+                                        maxtime=maxtime,
+                                        **plan_kwargs)
+                toc = time.time()
+                record_list.append({'time': toc - tic,
+                                    'success': path is not None,
+                                    'path_length': None if path is None else get_path_length(path),
+                                    'calls': dict(call_counter.counts)})
+            summary = _summarize(record_list)
+            if toggle_records:
+                summary['records'] = record_list
+            report['scenes'][scene_name][planner_name] = summary
+            if toggle_debug:
+                print(scene_name, planner_name, summary['success_rate'], summary['time'])
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the planners over seeded queries of canned scenes.")
+    parser.add_argument('--scenes', nargs='+', default=None, choices=list(SCENE_DICT))
+    parser.add_argument('--planners', nargs='+', default=None, choices=list(PLANNER_DICT))
+    parser.add_argument('--nqueries', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ext_dist', type=float, default=.05)
+    parser.add_argument('--maxtime', type=float, default=10.0)
+    parser.add_argument('--records', action='store_true', help="include the record of every query")
+    parser.add_argument('--output', default=None, help="a json file, the report is printed if not given")
+    args = parser.parse_args()
+    report = run_benchmark(scene_name_list=args.scenes,
+                           planner_name_list=args.planners,
+                           nqueries=args.nqueries,
+                           seed=args.seed,
+                           ext_dist=args.ext_dist,
+                           maxtime=args.maxtime,
+                           toggle_records=args.records)
+    if args.output is None:
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,158 @@
+import random
+import numpy as np
+from motion.probabilistic import rrt_connect
+from motion import time_optimal_trajectory as tot
+
+
+class CompositeRRTConnect(rrt_connect.RRTConnect):
+    """
+    RRT-Connect in the stacked configuration space of several components, e.g. ['lft_arm', 'rgt_arm'] of a dual-arm
+    robot (7+7=14 dof for Yumi). The components move at the same time and are checked against each other, instead
+    of planning one arm while the other one is a static obstacle.
+    The configurations are 1x(ndof0+ndof1+...) nparrays, see stack_confs and split_conf.
+    The components must be in robot.manipulator_dict and move different cd elements.
+    """
+
+    def _get_ndof_list(self, component_name):
+        if not isinstance(component_name, (list, tuple)):
+            raise ValueError("The component name must be a list of components!")
+        for name in component_name:
+            if name not in self.robot.manipulator_dict:
+                raise ValueError("The component " + name + " must be in manipulator_dict!")
+        return [self.robot.manipulator_dict[name].ndof for name in component_name]
+
+    def stack_confs(self, component_name, conf_list):
+        """
+        :param component_name: a list of components
+        :param conf_list: one 1xndof nparray per component
+        :return: 1x(sum of ndof) nparray
+        """
+        ndof_list = self._get_ndof_list(component_name)
+        for name, conf in zip(component_name, conf_list):
+            if conf is None:
+                raise ValueError("The configuration of " + name + " is None, e.g. a failed ik!")
+        if len(conf_list) != len(ndof_list) or any(len(conf) != ndof for conf, ndof in zip(conf_list, ndof_list)):
+            raise ValueError("The configurations do not match the components!")
+        return np.concatenate([np.asarray(conf, dtype=np.float64) for conf in conf_list])
+
+    def split_conf(self, component_name, conf):
+        """
+        :param component_name: a list of components
+        :param conf: 1x(sum of ndof) nparray, or nx(sum of ndof)
+        :return: a list of 1xndof nparrays (or nxndof), one per component
+        """
+        ndof_list = self._get_ndof_list(component_name)
+        return np.split(np.asarray(conf), np.cumsum(ndof_list)[:-1], axis=-1)
+
+    def _fk(self, component_name, conf):
+        for name, sub_conf in zip(component_name, self.split_conf(component_name, conf)):
+            self.robot.fk(component_name=name, jnt_values=sub_conf)
+
+    def _is_collided(self,
+                     component_name,
+                     conf,
+                     obstacle_list=[],
+                     otherrobot_list=[]):
+        self._fk(component_name, conf)
+        return self.robot.is_collided(obstacle_list=obstacle_list, otherrobot_list=otherrobot_list)
+
+    def _sample_conf(self, component_name, rand_rate, default_conf):
+        if random.randint(0, 100) < rand_rate:
+            return np.concatenate([self.robot.rand_conf(component_name=name) for name in component_name])
+        else:
+            return default_conf
+
+    def plan(self,
+             component_name,
+             start_conf,
+             goal_conf,
+             obstacle_list=[],
+             otherrobot_list=[],
+             ext_dist=2,
+             rand_rate=70,
+             maxiter=1000,
+             maxtime=15.0,
+             animation=False):
+        """
+        :param component_name: a list of components, e.g. ['lft_arm', 'rgt_arm']
+        :param start_conf: 1x(sum of ndof) nparray, or a list of one 1xndof nparray per component
+        :param goal_conf: the same as start_conf
+        :param ext_dist: the extension step in the stacked space
+        :return: a list of 1x(sum of ndof) nparray, None if failed
+        """
+        if start_conf is None or goal_conf is None:
+            raise ValueError("The start and goal configurations must not be None!")
+        if isinstance(start_conf, list):
+            start_conf = self.stack_confs(component_name, start_conf)
+        if isinstance(goal_conf, list):
+            goal_conf = self.stack_confs(component_name, goal_conf)
+        if len(start_conf) != sum(self._get_ndof_list(component_name)) or len(goal_conf) != len(start_conf):
+            raise ValueError("The configurations do not match the components!")
+        jnt_values_bk_list = [self.robot.get_jnt_values(name) for name in component_name]
+        path = super().plan(component_name,
+                            start_conf,
+                            goal_conf,
+                            obstacle_list=obstacle_list,
+                            otherrobot_list=otherrobot_list,
+                            ext_dist=ext_dist,
+                            rand_rate=rand_rate,
+                            maxiter=maxiter,
+                            maxtime=maxtime,
+                            animation=animation)
+        for name, jnt_values in zip(component_name, jnt_values_bk_list):
+            self.robot.fk(component_name=name, jnt_values=jnt_values)
+        return path
+
+    def gen_synchronized_trajectory(self, component_name, path, control_frequency=1000.0):
+        """
+        time-parameterize a stacked path under the joint limits of all the components, so that they start and stop
+        together and the slowest one sets the pace
+        :param component_name: a list of components
+        :param path: a list of 1x(sum of ndof) nparray, e.g. the result of self.plan
+        :param control_frequency:
+        :return: [time_array, conf_array_list], conf_array_list has one nxndof nparray per component
+        """
+        self._get_ndof_list(component_name)
+        vel_limits = np.concatenate([self.robot.get_jnt_vel_limits(name) for name in component_name])
+        acc_limits = np.concatenate([self.robot.get_jnt_acc_limits(name) for name in component_name])
+        traj = tot.TimeOptimalTrajectory(vel_limits, acc_limits)
+        traj.parameterize(path)
+        time_array, conf_array, _, _ = traj.sample(control_frequency=control_frequency)
+        return time_array, self.split_conf(component_name, conf_array)
+
+
+if __name__ == '__main__':
+    import time
+    import robotsim.robots.yumi.yumi as ym
+    import visualization.panda.world as wd
+    import modeling.geometricmodel as gm
+    import modeling.collisionmodel as cm
+
+    base = wd.World(campos=[2.5, 0, 1.5], lookatpos=[0, 0, .2])
+    gm.gen_frame().attach_to(base)
+    robot_s = ym.Yumi(enable_cc=True)
+    obstacle = cm.gen_box(extent=np.array([.1, .1, .3]))
+    obstacle.set_pos(np.array([.45, 0, .15]))
+    obstacle.attach_to(base)
+    component_name = ['lft_arm', 'rgt_arm']
+    # both hands reach down on the two sides of the obstacle at the same time
+    start_conf_list = [robot_s.get_jnt_values('lft_arm'), robot_s.get_jnt_values('rgt_arm')]
+    rotmat = np.array([[1, 0, 0], [0, -1, 0], [0, 0, -1]])
+    goal_conf_list = [robot_s.ik('lft_arm', np.array([.35, .25, .2]), rotmat),
+                      robot_s.ik('rgt_arm', np.array([.35, -.25, .2]), rotmat)]
+    planner = CompositeRRTConnect(robot_s)
+    tic = time.time()
+    path = planner.plan(component_name,
+                        start_conf_list,
+                        goal_conf_list,
+                        obstacle_list=[obstacle],
+                        ext_dist=.1,
+                        maxtime=60)
+    toc = time.time()
+    print("plan", toc - tic)
+    time_array, conf_array_list = planner.gen_synchronized_trajectory(component_name, path, control_frequency=50)
+    print("duration", time_array[-1])
+    for lft_conf, rgt_conf in zip(*planner.split_conf(component_name, np.array(path))):
+        robot_s.fk('both_arm', [lft_conf, rgt_conf])
+        robot_s.gen_meshmodel(rgba=[0, 1, 0, .2]).attach_to(base)
+    base.run()
@@ -0,0 +1,271 @@
+import time
+import numpy as np
+import basis.instrumentation as inst
+import robotsim._kinematics.edgevalidator as ev
+from motion.probabilistic import rrt_connect
+
+
+class LazyRRTConnect(rrt_connect.RRTConnect):
+    """
+    RRT-Connect with lazy edge validation
+    The trees are grown with node checks only: each extension adds one node at most lazy_ext_dist away and checks
+    the node, the edges are left unchecked. Once the two trees meet, the edges on the candidate path are checked at
+    the resolution of ext_dist. A colliding edge is removed together with the subtree cut off by it, and the trees
+    keep growing to repair the gap. The validated edges are marked so that they are checked only once.
+    The path of tree nodes is shortcut before it is densified, so that a shortcut costs the check of one edge instead
+    of the random shortcuts of _smooth_path on the dense path.
+    """
+
+    @inst.timed('planner_seconds', planner='lazy_rrt_connect', phase='extend')
+    def _extend_lazily(self,
+                       component_name,
+                       roadmap,
+                       conf,
+                       lazy_ext_dist,
+                       obstacle_list=[],
+                       otherrobot_list=[]):
+        """
+        add one node from the nearest node of the roadmap towards conf, only the new node is checked
+        :return: [new_nid, is_reached], new_nid is None if the new node is in collision
+        """
+        nearest_nid = self._get_nearest_nid(roadmap, conf)
+        nearest_conf = roadmap.get_conf(nearest_nid)
+        dist = np.linalg.norm(conf - nearest_conf)
+        is_reached = dist <= lazy_ext_dist
+        if is_reached:
+            new_conf = np.array(conf, dtype=np.float64)
+        else:
+            new_conf = nearest_conf + (conf - nearest_conf) * lazy_ext_dist / dist
+        if self._is_collided(component_name, new_conf, obstacle_list, otherrobot_list):
+            return None, False
+        new_nid = roadmap.add_node(new_conf, parent_nid=nearest_nid, is_valid=False)
+        return new_nid, is_reached
+
+    @inst.timed('planner_seconds', planner='lazy_rrt_connect', phase='validate')
+    def _validate_path(self,
+                       component_name,
+                       roadmap_nid_list,
+                       ext_dist,
+                       obstacle_list=[],
+                       otherrobot_list=[]):
+        """
+        check the unvalidated edges along the candidate path
+        :param roadmap_nid_list: [[roadmap, nid], ...], the path runs along each roadmap from its root to nid
+        :return: True if all edges are collision-free; otherwise the first colliding edge is removed together with
+                 the subtree cut off by it, and False is returned
+        """
+        for roadmap, nid in roadmap_nid_list:
+            nid_path = roadmap.get_nid_path(nid)
+            for nid0, nid1 in zip(nid_path[:-1], nid_path[1:]):
+                # the validity of an edge is kept by its child node
+                if roadmap.is_valid_array[nid1]:
+                    continue
+                # the two end nodes have been checked
+                if self._is_edge_collided(component_name, roadmap.get_conf(nid0), roadmap.get_conf(nid1),
+                                          ext_dist, obstacle_list, otherrobot_list):
+                    roadmap.remove_subtree(nid1)
+                    return False
+                roadmap.is_valid_array[nid1] = True
+        return True
+
+    def _is_shortcut_collided(self,
+                              component_name,
+                              conf0,
+                              conf1,
+                              ext_dist,
+                              obstacle_list=[],
+                              otherrobot_list=[]):
+        """
+        the same as _is_edge_collided, the configurations are checked in bisection order
+        """
+        if getattr(self.robot, 'edge_validator', None) is not None:
+            return self.robot.is_edge_collided(component_name, conf0, conf1, obstacle_list, otherrobot_list)
+        conf_array = np.vstack((conf0, self._interpolate(conf0, conf1, ext_dist)))
+        for id_array in ev.gen_bisection_levels(len(conf_array) - 1):
+            if np.any(self._is_collided_many(component_name, conf_array[id_array], obstacle_list, otherrobot_list)):
+                return True
+        return False
+
+    @inst.timed('planner_seconds', planner='lazy_rrt_connect', phase='smooth')
+    def _shortcut_node_path(self,
+                            component_name,
+                            node_path,
+                            ext_dist,
+                            obstacle_list=[],
+                            otherrobot_list=[]):
+        """
+        connect each kept node to the farthest later node that it reaches by a collision-free edge
+        the shortcuts are checked in bisection order (see edgevalidator.gen_bisection_levels), so that the colliding
+        ones, which are most of them, are rejected after a few checks
+        :param node_path: a list of 1xn nparray, the path of tree nodes whose edges are validated
+        :return: a list of 1xn nparray, a subsequence of node_path
+        """
+        shortcut_path = [node_path[0]]
+        i = 0
+        while i < len(node_path) - 1:
+            for j in range(len(node_path) - 1, i + 1, -1):
+                if not self._is_shortcut_collided(component_name, node_path[i], node_path[j], ext_dist, obstacle_list,
+                                                  otherrobot_list):
+                    break
+            else:
+                j = i + 1
+            shortcut_path.append(node_path[j])
+            i = j
+        return shortcut_path
+
+    @inst.timed('planner_seconds', planner='lazy_rrt_connect', phase='plan')
+    def plan(self,
+             component_name,
+             start_conf,
+             goal_conf,
+             obstacle_list=[],
+             otherrobot_list=[],
+             ext_dist=2,
+             lazy_ext_dist=None,
+             rand_rate=70,
+             maxiter=1000,
+             maxtime=15.0,
+             animation=False):
+        """
+        :param ext_dist: the resolution of the edge validation and of the returned path
+        :param lazy_ext_dist: the maximum length of the lazy edges, 10*ext_dist if None
+        :return: a list of 1xn nparray, None if failed
+        """
+        if lazy_ext_dist is None:
+            lazy_ext_dist = ext_dist * 10
+        self.roadmap.clear()
+        self.roadmap_start.clear()
+        self.roadmap_goal.clear()
+        self.start_conf = start_conf
+        self.goal_conf = goal_conf
+        # check start and goal
+        if self._is_collided(component_name, start_conf, obstacle_list, otherrobot_list):
+            print("The start robot configuration is in collision!")
+            return None
+        if self._is_collided(component_name, goal_conf, obstacle_list, otherrobot_list):
+            print("The goal robot configuration is in collision!")
+            return None
+        if self._goal_test(conf=start_conf, goal_conf=goal_conf, threshold=ext_dist) and \
+                not self._is_tree_edge_collided(component_name, start_conf, goal_conf, ext_dist, obstacle_list,
+                                                otherrobot_list):
+            return [start_conf, goal_conf]
+        self.roadmap_start.add_node(start_conf)
+        self.roadmap_goal.add_node(goal_conf)
+        roadmap_a, roadmap_b = self.roadmap_start, self.roadmap_goal
+        tic = time.time()
+        for _ in range(maxiter):
+            toc = time.time()
+            if maxtime > 0.0:
+                if toc - tic > maxtime:
+                    print("Too much motion time! Failed to find a path.")
+                    return None
+            rand_conf = self._sample_conf(component_name=component_name,
+                                          rand_rate=rand_rate,
+                                          default_conf=roadmap_b.get_conf(0))
+            new_nid_a, _ = self._extend_lazily(component_name, roadmap_a, rand_conf, lazy_ext_dist, obstacle_list,
+                                               otherrobot_list)
+            if new_nid_a is not None:
+                # connect the other roadmap towards the new node
+                new_conf = roadmap_a.get_conf(new_nid_a)
+                while True:
+                    new_nid_b, is_reached = self._extend_lazily(component_name, roadmap_b, new_conf, lazy_ext_dist,
+                                                                obstacle_list, otherrobot_list)
+                    if new_nid_b is None or is_reached:
+                        break
+                if animation:
+                    self.draw_wspace([self.roadmap_start, self.roadmap_goal], obstacle_list)
+                if is_reached and self._validate_path(component_name,
+                                                      [[roadmap_a, new_nid_a], [roadmap_b, new_nid_b]],
+                                                      ext_dist,
+                                                      obstacle_list,
+                                                      otherrobot_list):
+                    break
+            roadmap_a, roadmap_b = roadmap_b, roadmap_a
+        else:
+            print("Reach to maximum iteration! Failed to find a path.")
+            return None
+        # the two meeting nodes have the same conf, it is kept once
+        if roadmap_a is self.roadmap_start:
+            node_path = self._path_from_roadmaps(roadmap_a, new_nid_a, roadmap_b, roadmap_b.get_parent_nid(new_nid_b))
+        else:
+            node_path = self._path_from_roadmaps(roadmap_b, new_nid_b, roadmap_a, roadmap_a.get_parent_nid(new_nid_a))
+        node_path = self._shortcut_node_path(component_name, node_path, ext_dist, obstacle_list, otherrobot_list)
+        path = [start_conf]
+        for conf0, conf1 in zip(node_path[:-1], node_path[1:]):
+            path += list(self._interpolate(conf0, conf1, ext_dist))
+        return path
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+    import robotsim._kinematics.jlchain as jl
+    import robotsim.robots.robot_interface as ri
+
+
+    class XYBot(ri.RobotInterface):
+
+        def __init__(self, pos=np.zeros(3), rotmat=np.eye(3), name='XYBot'):
+            super().__init__(pos=pos, rotmat=rotmat, name=name)
+            self.jlc = jl.JLChain(homeconf=np.zeros(2), name='XYBot')
+            self.jlc.jnts[1]['type'] = 'prismatic'
+            self.jlc.jnts[1]['loc_motionax'] = np.array([1, 0, 0])
+            self.jlc.jnts[1]['loc_pos'] = np.zeros(3)
+            self.jlc.jnts[1]['motion_rng'] = [-2.0, 15.0]
+            self.jlc.jnts[2]['type'] = 'prismatic'
+            self.jlc.jnts[2]['loc_motionax'] = np.array([0, 1, 0])
+            self.jlc.jnts[2]['loc_pos'] = np.zeros(3)
+            self.jlc.jnts[2]['motion_rng'] = [-2.0, 15.0]
+            self.jlc.reinitialize()
+            self.ncdchecks = 0
+
+        def fk(self, component_name='all', jnt_values=np.zeros(2)):
+            if component_name != 'all':
+                raise ValueError("Only support component_name == 'all'!")
+            self.jlc.fk(jnt_values)
+
+        def rand_conf(self, component_name='all'):
+            if component_name != 'all':
+                raise ValueError("Only support component_name == 'all'!")
+            return self.jlc.rand_conf()
+
+        def get_jntvalues(self, component_name='all'):
+            if component_name != 'all':
+                raise ValueError("Only support component_name == 'all'!")
+            return self.jlc.get_jnt_values()
+
+        def is_collided(self, obstacle_list=[], otherrobot_list=[]):
+            self.ncdchecks += 1
+            for (obpos, size) in obstacle_list:
+                dist = np.linalg.norm(np.asarray(obpos) - self.get_jntvalues())
+                if dist <= size / 2.0:
+                    return True  # collision
+            return False  # safe
+
+
+    # ====Search Path with LazyRRTConnect====
+    obstacle_list = [
+        ((5, 5), 3),
+        ((3, 6), 3),
+        ((3, 8), 3),
+        ((3, 10), 3),
+        ((7, 5), 3),
+        ((9, 5), 3),
+        ((10, 5), 3),
+        ((10, 0), 3),
+        ((10, -2), 3),
+        ((10, -4), 3),
+        ((0, 12), 3),
+        ((-1, 10), 3),
+        ((-2, 8), 3)
+    ]  # [x,y,size]
+    robot = XYBot()
+    for planner in [rrt_connect.RRTConnect(robot), LazyRRTConnect(robot)]:
+        robot.ncdchecks = 0
+        tic = time.time()
+        path = planner.plan(component_name='all', start_conf=np.array([0, 0]), goal_conf=np.array([5, 10]),
+                            obstacle_list=obstacle_list, ext_dist=.1, rand_rate=70, maxtime=300)
+        toc = time.time()
+        print(type(planner).__name__, toc - tic, "collision checks", planner.robot.ncdchecks)
+    planner.draw_wspace([planner.roadmap_start, planner.roadmap_goal], obstacle_list)
+    plt.plot([conf[0] for conf in path], [conf[1] for conf in path], '-k')
+    plt.show()
@@ -0,0 +1,304 @@
+import math
+import numpy as np
+import networkx as nx
+from scipy.spatial import cKDTree
+
+
+class NNIndex(object):
+    """
+    Incremental nearest neighbor index of configurations
+    The configurations are kept in a growable contiguous nparray. A kd-tree is built over the configurations added
+    before the last build, the ones added after it (the tail) are searched by brute force. The kd-tree is rebuilt
+    once the tail is longer than max(min_tail_size, tail_rate*sqrt(n)), which keeps both the brute-force part and the
+    amortized rebuilding cost sublinear.
+    The metric is the weighted euclidean distance sqrt(sum(weights*(conf0-conf1)**2)).
+    """
+
+    def __init__(self, weights=None, min_tail_size=64, tail_rate=8):
+        """
+        :param weights: 1xndof nparray, the joint weights of the metric, all ones if None
+        :param min_tail_size:
+        :param tail_rate:
+        """
+        self.weights = None if weights is None else np.asarray(weights, dtype=np.float64)
+        self.min_tail_size = min_tail_size
+        self.tail_rate = tail_rate
+        self._conf_array = None  # capacity x ndof, allocated at the first add
+        self._nid_list = []
+        self._kdt = None
+        self._nbuilt = 0
+
+    def __len__(self):
+        return len(self._nid_list)
+
+    @property
+    def conf_array(self):
+        """
+        :return: nxndof nparray, a view of the added configurations
+        """
+        if self._conf_array is None:
+            return np.zeros((0, 0))
+        return self._conf_array[:len(self._nid_list)]
+
+    @property
+    def nid_list(self):
+        return self._nid_list
+
+    def _scale(self, conf_array):
+        if self.weights is None:
+            return conf_array
+        return conf_array * np.sqrt(self.weights)
+
+    def add(self, nid, conf):
+        """
+        :param nid: the node id in the roadmap
+        :param conf: 1xndof nparray
+        :return:
+        """
+        nconfs = len(self._nid_list)
+        if self._conf_array is None:
+            self._conf_array = np.empty((64, len(conf)))
+        elif nconfs == len(self._conf_array):
+            conf_array = np.empty((2 * nconfs, self._conf_array.shape[1]))
+            conf_array[:nconfs] = self._conf_array
+            self._conf_array = conf_array
+        self._conf_array[nconfs] = conf
+        self._nid_list.append(nid)
+        ntail = nconfs + 1 - self._nbuilt
+        if ntail > max(self.min_tail_size, self.tail_rate * math.sqrt(nconfs + 1)):
+            self._kdt = cKDTree(self._scale(self._conf_array[:nconfs + 1]))
+            self._nbuilt = nconfs + 1
+
+    def nearest_k(self, conf, k=1):
+        """
+        :param conf: 1xndof nparray
+        :param k:
+        :return: [nid_list, dist_list], sorted by the distances, at most k nearest ones
+        """
+        nconfs = len(self._nid_list)
+        if nconfs == 0:
+            return [], []
+        scaled_conf = self._scale(np.asarray(conf, dtype=np.float64))
+        id_list = []
+        dist_list = []
+        if self._nbuilt > 0:
+            dists, ids = self._kdt.query(scaled_conf, k=min(k, self._nbuilt))
+            id_list += np.atleast_1d(ids).tolist()
+            dist_list += np.atleast_1d(dists).tolist()
+        if nconfs > self._nbuilt:
+            tail_dists = np.linalg.norm(self._scale(self._conf_array[self._nbuilt:nconfs]) - scaled_conf, axis=1)
+            tail_ids = np.argsort(tail_dists)[:k]
+            id_list += (tail_ids + self._nbuilt).tolist()
+            dist_list += tail_dists[tail_ids].tolist()
+        order = np.argsort(dist_list, kind='stable')[:k]
+        return [self._nid_list[id_list[i]] for i in order], [dist_list[i] for i in order]
+
+    def nearest(self, conf):
+        """
+        :param conf: 1xndof nparray
+        :return: the nid of the nearest configuration, None if the index is empty
+        """
+        nid_list, _ = self.nearest_k(conf, k=1)
+        return nid_list[0] if len(nid_list) > 0 else None
+
+    def clear(self):
+        self._conf_array = None
+        self._nid_list = []
+        self._kdt = None
+        self._nbuilt = 0
+
+
+class Roadmap(nx.Graph):
+    """
+    A networkx graph whose node confs are indexed by NNIndex
+    Nodes added with a conf attribute by add_node are indexed incrementally; the index is rebuilt from the node data
+    if it falls out of sync (e.g. nodes added by add_nodes_from or copied by nx.compose)
+    """
+
+    def __init__(self, incoming_graph_data=None, nn_weights=None, **attr):
+        """
+        :param incoming_graph_data: see nx.Graph
+        :param nn_weights: joint weights of the nearest neighbor metric, see NNIndex
+        :param attr:
+        """
+        self.nnindex = NNIndex(weights=nn_weights)
+        super().__init__(incoming_graph_data, **attr)
+
+    def add_node(self, node_for_adding, **attr):
+        is_new = node_for_adding not in self._node
+        super().add_node(node_for_adding, **attr)
+        if is_new and 'conf' in attr and len(self.nnindex) == len(self._node) - 1:
+            self.nnindex.add(node_for_adding, attr['conf'])
+
+    def remove_node(self, n):
+        super().remove_node(n)
+        self.nnindex.clear()
+
+    def remove_nodes_from(self, nodes):
+        super().remove_nodes_from(nodes)
+        self.nnindex.clear()
+
+    def clear(self):
+        super().clear()
+        self.nnindex.clear()
+
+    def _sync_nnindex(self):
+        if len(self.nnindex) != len(self._node):
+            self.nnindex.clear()
+            for nid, node_conf in self.nodes(data='conf'):
+                self.nnindex.add(nid, node_conf)
+
+    def get_nearest_nid(self, conf):
+        """
+        :param conf: 1xndof nparray
+        :return:
+        """
+        self._sync_nnindex()
+        return self.nnindex.nearest(conf)
+
+    def get_nearest_nids(self, conf, k):
+        """
+        :param conf: 1xndof nparray
+        :param k:
+        :return: [nid_list, dist_list], see NNIndex.nearest_k
+        """
+        self._sync_nnindex()
+        return self.nnindex.nearest_k(conf, k=k)
+
+
+class ArrayTree(object):
+    """
+    A tree of configurations for the RRT planners, kept in growable arrays instead of a networkx graph
+    The nodes are the integers 0, 1, ... in the order they are added, the root is 0. Node nid has the configuration
+    conf_array[nid], the parent parent_array[nid] (-1 for the root), and the flag is_valid_array[nid] of the edge to its
+    parent (used by lazy planners). A node is always added after its parent, so that a path is a walk along the parents
+    and a subtree is found in one pass over the nodes. The configurations are stored once, in the nearest neighbor
+    index; besides them and the kd-tree over them, a node costs about 50 bytes (a networkx node costs about 1 KB).
+    """
+
+    def __init__(self, nn_weights=None):
+        """
+        :param nn_weights: joint weights of the nearest neighbor metric, see NNIndex
+        """
+        self.nnindex = NNIndex(weights=nn_weights)
+        self._parent_array = np.empty(64, dtype=np.int64)
+        self._is_valid_array = np.empty(64, dtype=bool)
+
+    def __len__(self):
+        return len(self.nnindex)
+
+    @property
+    def conf_array(self):
+        """
+        :return: nxndof nparray, a view
+        """
+        return self.nnindex.conf_array
+
+    @property
+    def parent_array(self):
+        """
+        :return: 1xn int nparray, a view
+        """
+        return self._parent_array[:len(self)]
+
+    @property
+    def is_valid_array(self):
+        """
+        :return: 1xn bool nparray, a view
+        """
+        return self._is_valid_array[:len(self)]
+
+    def add_node(self, conf, parent_nid=-1, is_valid=True):
+        """
+        :param conf: 1xndof nparray
+        :param parent_nid: -1 for the root
+        :param is_valid: if the edge to the parent has been checked
+        :return: the nid of the new node
+        """
+        nid = len(self)
+        if (parent_nid < 0) != (nid == 0) or parent_nid >= nid:
+            raise ValueError("The first node must be the root and the others must have an existing parent!")
+        if nid == len(self._parent_array):
+            self._parent_array = np.concatenate([self._parent_array, np.empty(nid, dtype=np.int64)])
+            self._is_valid_array = np.concatenate([self._is_valid_array, np.empty(nid, dtype=bool)])
+        self._parent_array[nid] = parent_nid
+        self._is_valid_array[nid] = is_valid
+        self.nnindex.add(nid, conf)
+        return nid
+
+    def get_conf(self, nid):
+        return self.nnindex.conf_array[nid]
+
+    def get_parent_nid(self, nid):
+        return int(self._parent_array[nid])
+
+    def get_nearest_nid(self, conf):
+        """
+        :param conf: 1xndof nparray
+        :return:
+        """
+        return self.nnindex.nearest(conf)
+
+    def get_nid_path(self, nid):
+        """
+        :return: the nids from the root to nid
+        """
+        nid_path = []
+        while nid >= 0:
+            nid_path.append(nid)
+            nid = self._parent_array[nid]
+        return [int(nid) for nid in reversed(nid_path)]
+
+    def get_path(self, nid):
+        """
+        :return: a list of 1xndof nparray, from the root to nid
+        """
+        return list(self.nnindex.conf_array[self.get_nid_path(nid)])
+
+    def remove_subtree(self, nid):
+        """
+        remove nid and its descendants, the remaining nodes are renumbered in their order
+        :param nid: not the root
+        :return: 1xn int nparray, the new nids of the old ones, -1 for the removed ones
+        """
+        if nid <= 0:
+            raise ValueError("The root cannot be removed!")
+        nnodes = len(self)
+        parent_array = self.parent_array
+        is_removed = np.zeros(nnodes, dtype=bool)
+        is_removed[nid] = True
+        # the parents precede their children
+        for child_nid in range(nid + 1, nnodes):
+            is_removed[child_nid] = is_removed[parent_array[child_nid]]
+        kept_nids = np.flatnonzero(~is_removed)
+        new_nid_array = np.full(nnodes, -1, dtype=np.int64)
+        new_nid_array[kept_nids] = np.arange(len(kept_nids))
+        conf_array = self.conf_array[kept_nids].copy()
+        self._parent_array[:len(kept_nids)] = np.where(parent_array[kept_nids] < 0, -1,
+                                                       new_nid_array[parent_array[kept_nids]])
+        self._is_valid_array[:len(kept_nids)] = self._is_valid_array[kept_nids]
+        self.nnindex.clear()
+        for new_nid, conf in enumerate(conf_array):
+            self.nnindex.add(new_nid, conf)
+        return new_nid_array
+
+    def clear(self):
+        self.nnindex.clear()
+
+
+if __name__ == '__main__':
+    import time
+
+    conf_array = np.random.uniform(-np.pi, np.pi, size=(20000, 7))
+    nnindex = NNIndex()
+    tic = time.time()
+    for i, conf in enumerate(conf_array):
+        nnindex.add(i, conf)
+    toc = time.time()
+    print("add", (toc - tic) / len(conf_array))
+    query_array = np.random.uniform(-np.pi, np.pi, size=(1000, 7))
+    tic = time.time()
+    nid_list = [nnindex.nearest(conf) for conf in query_array]
+    toc = time.time()
+    print("nearest", (toc - tic) / len(query_array))
+    print(all(nid == np.argmin(np.linalg.norm(conf_array - conf, axis=1)) for nid, conf in zip(nid_list, query_array)))
@@ -0,0 +1,282 @@
+import os
+import time
+import queue
+import random
+import importlib
+import numpy as np
+import multiprocessing as mp
+import basis.data_adapter as da
+import modeling.collisionmodel as cm
+from motion.probabilistic import rrt_connect
+
+
+def describe_robot(robot_instance, **kwargs):
+    """
+    a lightweight picklable description of a robot, the robot is rebuilt by build_robot in the worker processes
+    :param robot_instance:
+    :param kwargs: the arguments of the constructor, pos and rotmat are taken from robot_instance if not given
+    :return: a dict
+    NOTE: the objects held by the hands are not described
+    """
+    kwargs.setdefault('pos', np.array(robot_instance.pos))
+    kwargs.setdefault('rotmat', np.array(robot_instance.rotmat))
+    jnt_values_dict = {}
+    for component_name in robot_instance.manipulator_dict:
+        jnt_values_dict[component_name] = np.array(robot_instance.get_jnt_values(component_name))
+    return {'module': type(robot_instance).__module__,
+            'class': type(robot_instance).__name__,
+            'kwargs': kwargs,
+            'jnt_values_dict': jnt_values_dict}
+
+
+def build_robot(robot_description):
+    """
+    :param robot_description: see describe_robot
+    :return:
+    """
+    robot_class = getattr(importlib.import_module(robot_description['module']), robot_description['class'])
+    robot_instance = robot_class(**robot_description['kwargs'])
+    for component_name, jnt_values in robot_description['jnt_values_dict'].items():
+        robot_instance.fk(component_name, jnt_values)
+    return robot_instance
+
+
+def describe_obstacle(obstacle, expand_radius=None):
+    """
+    a lightweight picklable description of an obstacle, the obstacle is rebuilt by build_obstacle in the workers
+    a CollisionModel loaded from a file is described by its path, the other ones by their meshes;
+    obstacles that are not CollisionModels (e.g. the tuples of the 2D demos) are described by themselves
+    :param obstacle:
+    :param expand_radius: the expand_radius used to create the CollisionModel, it is not kept by the instance
+    :return:
+    """
+    if not isinstance(obstacle, cm.CollisionModel):
+        return obstacle
+    description = {'homomat': obstacle.get_homomat(),
+                   'cdprimit_type': obstacle.cdprimitive_type,
+                   'cdmesh_type': obstacle.cdmesh_type,
+                   'expand_radius': expand_radius}
+    if obstacle.objpath is not None:
+        description['path'] = obstacle.objpath
+    else:
+        description['vertices'] = np.array(obstacle.objtrm.vertices)
+        description['faces'] = np.array(obstacle.objtrm.faces)
+    return description
+
+
+def build_obstacle(obstacle_description):
+    """
+    :param obstacle_description: see describe_obstacle
+    :return:
+    """
+    if not isinstance(obstacle_description, dict):
+        return obstacle_description
+    if 'path' in obstacle_description:
+        initor = obstacle_description['path']
+    else:
+        initor = da.trm.Trimesh(vertices=obstacle_description['vertices'], faces=obstacle_description['faces'])
+    obstacle = cm.CollisionModel(initor,
+                                 cdprimit_type=obstacle_description['cdprimit_type'],
+                                 cdmesh_type=obstacle_description['cdmesh_type'],
+                                 expand_radius=obstacle_description['expand_radius'])
+    obstacle.set_homomat(obstacle_description['homomat'])
+    return obstacle
+
+
+class PlanningCancelled(Exception):
+    pass
+
+
+def _make_cancellable(planner, cancel_event):
+    """
+    let the collision checks of planner raise PlanningCancelled once cancel_event is set
+    the checks are the inner loop of every planner, so a cancelled worker stops within one check
+    :param planner:
+    :param cancel_event:
+    :return:
+    """
+    is_collided = planner._is_collided
+    is_collided_many = planner._is_collided_many
+    is_edge_collided = planner._is_edge_collided
+
+    def _is_collided(*args, **kwargs):
+        if cancel_event.is_set():
+            raise PlanningCancelled
+        return is_collided(*args, **kwargs)
+
+    def _is_collided_many(*args, **kwargs):
+        if cancel_event.is_set():
+            raise PlanningCancelled
+        return is_collided_many(*args, **kwargs)
+
+    def _is_edge_collided(*args, **kwargs):
+        if cancel_event.is_set():
+            raise PlanningCancelled
+        return is_edge_collided(*args, **kwargs)
+
+    planner._is_collided = _is_collided
+    planner._is_collided_many = _is_collided_many
+    planner._is_edge_collided = _is_edge_collided
+
+
+def _worker(worker_id, robot_description, task_queue, result_queue, cancel_event):
+    """
+    the loop of a worker process, the robot is built once, the planners are created once per planner class
+    a task is [query_id, planner_class, robot_jnt_values_dict, obstacle_descriptions, otherrobot_descriptions,
+    plan_kwargs, seed], None stops the worker; a result is [query_id, worker_id, path or None]
+    """
+    robot_instance = build_robot(robot_description)
+    planner_dict = {}
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        query_id, planner_class, robot_jnt_values_dict, obstacle_descriptions, otherrobot_descriptions, \
+            plan_kwargs, seed = task
+        path = None
+        try:
+            if planner_class not in planner_dict:
+                planner = planner_class(robot_instance)
+                _make_cancellable(planner, cancel_event)
+                planner_dict[planner_class] = planner
+            planner = planner_dict[planner_class]
+            for component_name, jnt_values in robot_jnt_values_dict.items():
+                planner.robot.fk(component_name, jnt_values)
+            random.seed(seed)
+            np.random.seed(seed)
+            path = planner.plan(obstacle_list=[build_obstacle(description) for description in obstacle_descriptions],
+                                otherrobot_list=[build_robot(description) for description in otherrobot_descriptions],
+                                **plan_kwargs)
+        except PlanningCancelled:
+            pass
+        except Exception as e:
+            print("Worker " + str(worker_id) + " failed:", repr(e))
+        result_queue.put([query_id, worker_id, path])
+
+
+class ParallelPlanner(object):
+    """
+    Races independently seeded planners in a pool of worker processes
+    Every worker rebuilds the robot (and thus its own CollisionChecker) from a robot description once, and rebuilds
+    the obstacles and the other robots of each query from their descriptions, see describe_robot and describe_obstacle.
+    A query is sent to all workers with different seeds; the first path found is returned and the other workers are
+    cancelled cooperatively at their next collision check, so that the pool is ready for the next query.
+    The latency of a query is the minimum of nworkers random planning times instead of a single one.
+    """
+
+    def __init__(self, robot_description, nworkers=None, planner_class=rrt_connect.RRTConnect, seed=None):
+        """
+        :param robot_description: see describe_robot
+        :param nworkers: os.cpu_count() if None
+        :param planner_class: the default planner class, any subclass of rrt.RRT defined at module level
+        :param seed: the seed of the seeds of the workers, random if None
+        """
+        if nworkers is None:
+            nworkers = os.cpu_count()
+        if nworkers < 1:
+            raise ValueError("At least one worker is needed!")
+        self.planner_class = planner_class
+        self._seed_rng = np.random.default_rng(seed)
+        self._query_id = 0
+        self._cancel_event = mp.Event()
+        self._result_queue = mp.Queue()
+        self._task_queue_list = []
+        self._process_list = []
+        for worker_id in range(nworkers):
+            task_queue = mp.Queue()
+            process = mp.Process(target=_worker,
+                                 args=(worker_id, robot_description, task_queue, self._result_queue,
+                                       self._cancel_event),
+                                 daemon=True)
+            process.start()
+            self._task_queue_list.append(task_queue)
+            self._process_list.append(process)
+
+    @property
+    def nworkers(self):
+        return len(self._process_list)
+
+    def plan(self,
+             component_name,
+             start_conf,
+             goal_conf,
+             obstacle_description_list=[],
+             otherrobot_description_list=[],
+             robot_jnt_values_dict={},
+             planner_class=None,
+             timeout=None,
+             **kwargs):
+        """
+        :param component_name:
+        :param start_conf:
+        :param goal_conf:
+        :param obstacle_description_list: see describe_obstacle
+        :param otherrobot_description_list: see describe_robot
+        :param robot_jnt_values_dict: {component_name: jnt_values}, the configurations of the other components
+        :param planner_class: self.planner_class if None
+        :param timeout: seconds, all workers are cancelled after it; None to wait for the maxtime of the planners
+        :param kwargs: the other arguments of planner_class.plan, e.g. ext_dist, maxtime
+        :return: a list of 1xn nparray, None if failed
+        """
+        if planner_class is None:
+            planner_class = self.planner_class
+        if not all(process.is_alive() for process in self._process_list):
+            raise ValueError("The worker processes are closed!")
+        self._query_id += 1
+        self._cancel_event.clear()
+        plan_kwargs = dict(kwargs, component_name=component_name, start_conf=start_conf, goal_conf=goal_conf)
+        seed_list = self._seed_rng.integers(0, 2 ** 31, size=self.nworkers).tolist()
+        for task_queue, seed in zip(self._task_queue_list, seed_list):
+            task_queue.put([self._query_id, planner_class, robot_jnt_values_dict, obstacle_description_list,
+                            otherrobot_description_list, plan_kwargs, seed])
+        path = None
+        nresults = 0
+        tic = time.time()
+        while nresults < self.nworkers:
+            if timeout is None or self._cancel_event.is_set():
+                wait_time = None
+            else:
+                wait_time = max(timeout - (time.time() - tic), 0.0)
+            try:
+                query_id, _, worker_path = self._result_queue.get(timeout=wait_time)
+            except queue.Empty:
+                print("Too much motion time! Cancel the planners.")
+                self._cancel_event.set()
+                continue
+            if query_id != self._query_id:
+                continue
+            nresults += 1
+            if path is None and worker_path is not None:
+                path = worker_path
+                self._cancel_event.set()
+        self._cancel_event.clear()
+        return path
+
+    def close(self):
+        for task_queue in self._task_queue_list:
+            task_queue.put(None)
+        for process in self._process_list:
+            process.join()
+        self._task_queue_list = []
+        self._process_list = []
+
+
+if __name__ == '__main__':
+    import robotsim.robots.yumi.yumi as ym
+
+    robot_s = ym.Yumi(enable_cc=True)
+    obstacle_list = [cm.gen_box(extent=np.array([.1, .1, .1])) for _ in range(3)]
+    obstacle_list[0].set_pos(np.array([.4, .2, .25]))
+    obstacle_list[1].set_pos(np.array([.4, .1, .35]))
+    obstacle_list[2].set_pos(np.array([.3, .25, .3]))
+    start_conf = robot_s.get_jnt_values('lft_arm')
+    goal_conf = np.radians(np.array([-20, -60, 40, 10, 40, 30, 0]))
+    planner = ParallelPlanner(describe_robot(robot_s, enable_cc=True), nworkers=4)
+    for _ in range(5):
+        tic = time.time()
+        path = planner.plan('lft_arm', start_conf, goal_conf,
+                            obstacle_description_list=[describe_obstacle(obstacle) for obstacle in obstacle_list],
+                            ext_dist=.05, maxtime=30)
+        toc = time.time()
+        print("parallel", toc - tic, None if path is None else len(path))
+    planner.close()
@@ -0,0 +1,282 @@
+import time
+import numpy as np
+import networkx as nx
+import basis.instrumentation as inst
+from motion.probabilistic import rrt
+from motion.probabilistic import nnindex
+
+
+class PRM(rrt.RRT):
+    """
+    Multi-query probabilistic roadmap
+    The roadmap is built once against the static obstacles (the other components of the robot stay at their poses
+    during building), saved as a compact .npz file, and loaded at startup. A query connects the start and goal to
+    their nearest roadmap nodes and searches the roadmap with A*. The roadmap nodes and edges on the found path are
+    checked lazily against the movable obstacles and the other robots of the query; the blocked ones are removed for
+    this query only and the search is repeated.
+    """
+
+    def __init__(self, robot):
+        super().__init__(robot)
+        # a graph rather than the tree of rrt
+        self.roadmap = nnindex.Roadmap()
+        self.component_name = None
+        self.ext_dist = None
+
+    def _add_edge(self, nid0, nid1):
+        self.roadmap.add_edge(nid0, nid1,
+                              weight=np.linalg.norm(self.roadmap.nodes[nid0]['conf'] -
+                                                    self.roadmap.nodes[nid1]['conf']))
+
+    @inst.timed('planner_seconds', planner='prm', phase='build')
+    def build(self, component_name, static_obstacle_list=[], nsamples=1000, k=10, ext_dist=.05, toggle_debug=False):
+        """
+        :param component_name:
+        :param static_obstacle_list: the obstacles that do not move between queries
+        :param nsamples: number of collision-free nodes
+        :param k: each node is connected to its k nearest neighbors
+        :param ext_dist: the resolution of the edge checks
+        :param toggle_debug:
+        :return:
+        """
+        self.component_name = component_name
+        self.ext_dist = ext_dist
+        self.roadmap.clear()
+        nid = 0
+        while nid < nsamples:
+            conf = self.robot.rand_conf(component_name)
+            if not self._is_collided(component_name, conf, static_obstacle_list):
+                self.roadmap.add_node(nid, conf=conf)
+                nid += 1
+        for nid in range(nsamples):
+            conf = self.roadmap.nodes[nid]['conf']
+            neighbor_nid_list, _ = self.roadmap.get_nearest_nids(conf, k + 1)
+            for neighbor_nid in neighbor_nid_list:
+                if neighbor_nid == nid or self.roadmap.has_edge(nid, neighbor_nid):
+                    continue
+                if not self._is_edge_collided(component_name, conf, self.roadmap.nodes[neighbor_nid]['conf'],
+                                              ext_dist, static_obstacle_list):
+                    self._add_edge(nid, neighbor_nid)
+            if toggle_debug and (nid + 1) % 100 == 0:
+                print("connected", nid + 1, "nodes,", self.roadmap.number_of_edges(), "edges")
+
+    def save(self, path):
+        """
+        :param path: a .npz file
+        :return:
+        """
+        nid_list = list(self.roadmap.nodes)
+        conf_array = np.array([self.roadmap.nodes[nid]['conf'] for nid in nid_list])
+        nid_to_id = {nid: id for id, nid in enumerate(nid_list)}
+        edge_array = np.array([[nid_to_id[nid0], nid_to_id[nid1]] for nid0, nid1 in self.roadmap.edges],
+                              dtype=np.int32).reshape(-1, 2)
+        np.savez_compressed(path,
+                            component_name=self.component_name,
+                            ext_dist=self.ext_dist,
+                            conf_array=conf_array.astype(np.float32),
+                            edge_array=edge_array)
+
+    def load(self, path):
+        """
+        :param path: a .npz file saved by self.save
+        :return:
+        """
+        data = np.load(path)
+        self.component_name = str(data['component_name'])
+        self.ext_dist = float(data['ext_dist'])
+        self.roadmap.clear()
+        for nid, conf in enumerate(data['conf_array'].astype(np.float64)):
+            self.roadmap.add_node(nid, conf=conf)
+        for nid0, nid1 in data['edge_array'].tolist():
+            self._add_edge(nid0, nid1)
+
+    @inst.timed('planner_seconds', planner='prm', phase='plan')
+    def plan(self,
+             component_name,
+             start_conf,
+             goal_conf,
+             obstacle_list=[],
+             otherrobot_list=[],
+             static_obstacle_list=[],
+             k=10,
+             smoothing_iterations=50,
+             maxtime=15.0):
+        """
+        :param component_name: must be the one the roadmap was built for
+        :param start_conf:
+        :param goal_conf:
+        :param obstacle_list: the movable obstacles of this query
+        :param otherrobot_list:
+        :param static_obstacle_list: the obstacles used to build the roadmap, required to connect start and goal
+        :param k: start and goal are connected to their k nearest nodes
+        :param smoothing_iterations: see RRT._smooth_path, 0 to toggle off smoothing
+        :param maxtime:
+        :return: a list of 1xn nparray, None if failed
+        """
+        if component_name != self.component_name:
+            raise ValueError("The roadmap is built for " + str(self.component_name) + "!")
+        all_obstacle_list = static_obstacle_list + obstacle_list
+        if self._is_collided(component_name, start_conf, all_obstacle_list, otherrobot_list):
+            print("The start robot configuration is in collision!")
+            return None
+        if self._is_collided(component_name, goal_conf, all_obstacle_list, otherrobot_list):
+            print("The goal robot configuration is in collision!")
+            return None
+        is_checked = len(obstacle_list) == 0 and len(otherrobot_list) == 0  # roadmap is valid as it is
+        start_neighbor_nid_list, _ = self.roadmap.get_nearest_nids(start_conf, k)
+        goal_neighbor_nid_list, _ = self.roadmap.get_nearest_nids(goal_conf, k)
+        # the query nodes are temporary, they bypass the nn index of the roadmap
+        nx.Graph.add_node(self.roadmap, 'start', conf=start_conf)
+        nx.Graph.add_node(self.roadmap, 'goal', conf=goal_conf)
+        for nid in start_neighbor_nid_list:
+            self._add_edge('start', nid)
+        for nid in goal_neighbor_nid_list:
+            self._add_edge('goal', nid)
+        if self._goal_test(conf=start_conf, goal_conf=goal_conf, threshold=self.ext_dist):
+            self._add_edge('start', 'goal')
+        node_validity = {'start': True, 'goal': True}
+        edge_validity = {}
+        removed_edge_list = []
+        nid_path = None
+        tic = time.time()
+        while True:
+            if maxtime > 0.0 and time.time() - tic > maxtime:
+                print("Too much motion time! Failed to find a path.")
+                break
+            try:
+                candidate_path = nx.astar_path(self.roadmap, 'start', 'goal',
+                                               heuristic=lambda nid0, nid1: np.linalg.norm(
+                                                   self.roadmap.nodes[nid0]['conf'] -
+                                                   self.roadmap.nodes[nid1]['conf']),
+                                               weight='weight')
+            except nx.NetworkXNoPath:
+                print("The start and goal are not connected by the roadmap!")
+                break
+            blocked_edge_list = []
+            for nid in candidate_path:
+                if nid not in node_validity:
+                    node_validity[nid] = is_checked or not self._is_collided(component_name,
+                                                                             self.roadmap.nodes[nid]['conf'],
+                                                                             obstacle_list, otherrobot_list)
+                if not node_validity[nid]:
+                    blocked_edge_list = list(self.roadmap.edges(nid, data=True))
+                    break
+            else:
+                for nid0, nid1 in zip(candidate_path[:-1], candidate_path[1:]):
+                    edge = frozenset((nid0, nid1))
+                    if edge not in edge_validity:
+                        if nid0 in ('start', 'goal') or nid1 in ('start', 'goal'):
+                            edge_validity[edge] = not self._is_edge_collided(component_name,
+                                                                             self.roadmap.nodes[nid0]['conf'],
+                                                                             self.roadmap.nodes[nid1]['conf'],
+                                                                             self.ext_dist,
+                                                                             all_obstacle_list, otherrobot_list)
+                        else:
+                            edge_validity[edge] = is_checked or not self._is_edge_collided(
+                                component_name, self.roadmap.nodes[nid0]['conf'], self.roadmap.nodes[nid1]['conf'],
+                                self.ext_dist, obstacle_list, otherrobot_list)
+                    if not edge_validity[edge]:
+                        blocked_edge_list = [(nid0, nid1, self.roadmap.edges[nid0, nid1])]
+                        break
+                else:
+                    nid_path = candidate_path
+                    break
+            for nid0, nid1, _ in blocked_edge_list:
+                self.roadmap.remove_edge(nid0, nid1)
+            removed_edge_list += blocked_edge_list
+        # restore the roadmap
+        for nid0, nid1, edge_data in removed_edge_list:
+            if nid0 not in ('start', 'goal') and nid1 not in ('start', 'goal'):
+                self.roadmap.add_edge(nid0, nid1, **edge_data)
+        conf_path = None
+        if nid_path is not None:
+            conf_path = [start_conf]
+            for nid0, nid1 in zip(nid_path[:-1], nid_path[1:]):
+                conf_path += list(self._interpolate(self.roadmap.nodes[nid0]['conf'],
+                                                    self.roadmap.nodes[nid1]['conf'],
+                                                    self.ext_dist))
+        nx.Graph.remove_node(self.roadmap, 'start')
+        nx.Graph.remove_node(self.roadmap, 'goal')
+        if conf_path is not None and smoothing_iterations > 0:
+            conf_path = self._smooth_path(component_name=component_name,
+                                          path=conf_path,
+                                          obstacle_list=all_obstacle_list,
+                                          otherrobot_list=otherrobot_list,
+                                          granularity=self.ext_dist,
+                                          iterations=smoothing_iterations)
+        return conf_path
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    import matplotlib.pyplot as plt
+    import robotsim._kinematics.jlchain as jl
+    import robotsim.robots.robot_interface as ri
+
+
+    class XYBot(ri.RobotInterface):
+
+        def __init__(self, pos=np.zeros(3), rotmat=np.eye(3), name='XYBot'):
+            super().__init__(pos=pos, rotmat=rotmat, name=name)
+            self.jlc = jl.JLChain(homeconf=np.zeros(2), name='XYBot')
+            self.jlc.jnts[1]['type'] = 'prismatic'
+            self.jlc.jnts[1]['loc_motionax'] = np.array([1, 0, 0])
+            self.jlc.jnts[1]['loc_pos'] = np.zeros(3)
+            self.jlc.jnts[1]['motion_rng'] = [-2.0, 15.0]
+            self.jlc.jnts[2]['type'] = 'prismatic'
+            self.jlc.jnts[2]['loc_motionax'] = np.array([0, 1, 0])
+            self.jlc.jnts[2]['loc_pos'] = np.zeros(3)
+            self.jlc.jnts[2]['motion_rng'] = [-2.0, 15.0]
+            self.jlc.reinitialize()
+
+        def fk(self, component_name='all', jnt_values=np.zeros(2)):
+            if component_name != 'all':
+                raise ValueError("Only support component_name == 'all'!")
+            self.jlc.fk(jnt_values)
+
+        def rand_conf(self, component_name='all'):
+            if component_name != 'all':
+                raise ValueError("Only support component_name == 'all'!")
+            return self.jlc.rand_conf()
+
+        def get_jntvalues(self, component_name='all'):
+            if component_name != 'all':
+                raise ValueError("Only support component_name == 'all'!")
+            return self.jlc.get_jnt_values()
+
+        def is_collided(self, obstacle_list=[], otherrobot_list=[]):
+            for (obpos, size) in obstacle_list:
+                dist = np.linalg.norm(np.asarray(obpos) - self.get_jntvalues())
+                if dist <= size / 2.0:
+                    return True  # collision
+            return False  # safe
+
+
+    static_obstacle_list = [
+        ((5, 5), 3),
+        ((3, 6), 3),
+        ((3, 8), 3),
+        ((3, 10), 3),
+        ((7, 5), 3),
+        ((9, 5), 3),
+        ((10, 5), 3)
+    ]  # [x,y,size]
+    movable_obstacle_list = [((2, 2), 2)]
+    robot = XYBot()
+    prm = PRM(robot)
+    tic = time.time()
+    prm.build('all', static_obstacle_list, nsamples=500, k=10, ext_dist=.1)
+    toc = time.time()
+    print("build", toc - tic, prm.roadmap.number_of_edges(), "edges")
+    roadmap_path = os.path.join(tempfile.gettempdir(), "xybot_prm.npz")
+    prm.save(roadmap_path)
+    prm.load(roadmap_path)
+    tic = time.time()
+    path = prm.plan('all', np.array([0, 0]), np.array([5, 10]), obstacle_list=movable_obstacle_list,
+                    static_obstacle_list=static_obstacle_list)
+    toc = time.time()
+    print("query", toc - tic)
+    prm.draw_wspace([prm.roadmap], static_obstacle_list + movable_obstacle_list)
+    plt.plot([conf[0] for conf in path], [conf[1] for conf in path], '-k')
+    plt.show()
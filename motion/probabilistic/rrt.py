@@ -2,15 +2,17 @@ import time
 import math
 import random
 import numpy as np
-import basis.robot_math as rm
 import networkx as nx
+import basis.robot_math as rm
+import basis.instrumentation as inst
 import matplotlib.pyplot as plt
+import motion.probabilistic.nnindex as nni
 
 class RRT(object):
 
     def __init__(self, robot):
         self.robot = robot.copy()
-        self.roadmap = nx.Graph()
+        self.roadmap = nni.ArrayTree()
         self.start_conf = None
         self.goal_conf = None
 
@@ -22,6 +24,57 @@ class RRT(object):
         self.robot.fk(component_name=component_name, jnt_values=conf)
         return self.robot.is_collided(obstacle_list=obstacle_list, otherrobot_list=otherrobot_list)
 
+    def _is_collided_many(self,
+                          component_name,
+                          conf_list,
+                          obstacle_list=[],
+                          otherrobot_list=[]):
+        """
+        :return: 1xn bool nparray, the configurations after the first collided one are reported as collided
+        """
+        return self.robot.is_collided_many(component_name,
+                                           np.asarray(conf_list),
+                                           obstacle_list=obstacle_list,
+                                           otherrobot_list=otherrobot_list,
+                                           toggle_stop_at_first=True)
+
+    def _is_edge_collided(self,
+                          component_name,
+                          conf0,
+                          conf1,
+                          ext_dist,
+                          obstacle_list=[],
+                          otherrobot_list=[]):
+        """
+        check the configurations between conf0 and conf1, the two ends are excluded
+        the robot's edge validator is used if it is enabled, see RobotInterface.enable_edge_validator
+        :param ext_dist: the joint-space step if the edge validator is not enabled
+        :return:
+        """
+        if getattr(self.robot, 'edge_validator', None) is not None:
+            return self.robot.is_edge_collided(component_name, conf0, conf1, obstacle_list, otherrobot_list)
+        conf_array = self._interpolate(conf0, conf1, ext_dist)[:-1]
+        if len(conf_array) == 0:
+            return False
+        return bool(np.any(self._is_collided_many(component_name, conf_array, obstacle_list, otherrobot_list)))
+
+    def _is_tree_edge_collided(self,
+                               component_name,
+                               conf0,
+                               conf1,
+                               ext_dist,
+                               obstacle_list=[],
+                               otherrobot_list=[]):
+        """
+        check the configurations between two nodes of a tree (at most ext_dist apart), whose ends are checked already
+        the trees are only checked at their nodes unless the robot's edge validator is enabled, in which case the
+        links may not move further than its resolution between two checked configurations
+        :return:
+        """
+        if getattr(self.robot, 'edge_validator', None) is None:
+            return False
+        return self._is_edge_collided(component_name, conf0, conf1, ext_dist, obstacle_list, otherrobot_list)
+
     def _sample_conf(self, component_name, rand_rate, default_conf):
         if random.randint(0, 100) < rand_rate:
             return self.robot.rand_conf(component_name=component_name)
@@ -29,6 +82,8 @@ class RRT(object):
             return default_conf
 
     def _get_nearest_nid(self, roadmap, new_conf):
+        if isinstance(roadmap, (nni.ArrayTree, nni.Roadmap)):
+            return roadmap.get_nearest_nid(new_conf)
         dist_nid_list = [[np.linalg.norm(new_conf - roadmap.nodes[nid]['conf']), nid] for nid in roadmap]
         min_dist_nid = min(dist_nid_list, key=lambda t: t[0])
         return min_dist_nid[1]
@@ -45,6 +100,15 @@ class RRT(object):
         conf_array = np.linspace(conf1, conf1 + nval * ext_dist * vec, nval)
         return list(conf_array)
 
+    def _interpolate(self, conf0, conf1, ext_dist):
+        """
+        :return: nxndof nparray, the configurations between conf0 and conf1 at the resolution of ext_dist,
+                 conf0 excluded and conf1 included
+        """
+        nval = max(math.ceil(np.linalg.norm(conf1 - conf0) / ext_dist), 1)
+        return np.linspace(conf0, conf1, nval + 1)[1:]
+
+    @inst.timed('planner_seconds', planner='rrt', phase='extend')
     def _extend_roadmap(self,
                         component_name,
                         roadmap,
@@ -56,30 +120,29 @@ class RRT(object):
                         animation=False):
         """
         find the nearest point between the given roadmap and the conf and then extend towards the conf
-        :return:
+        :param roadmap: nni.ArrayTree
+        :return: [the last added nid (the nearest nid if none is added), True if goal_conf is added]
         author: weiwei
         date: 20201228
         """
         nearest_nid = self._get_nearest_nid(roadmap, conf)
-        new_conf_list = self._extend_conf(roadmap.nodes[nearest_nid]['conf'], conf, ext_dist)
-        for new_conf in new_conf_list:
-            if self._is_collided(component_name, new_conf, obstacle_list, otherrobot_list):
-                return nearest_nid
+        new_conf_list = self._extend_conf(roadmap.get_conf(nearest_nid), conf, ext_dist)
+        is_collided_array = self._is_collided_many(component_name, new_conf_list, obstacle_list, otherrobot_list)
+        for new_conf, is_collided in zip(new_conf_list, is_collided_array):
+            if is_collided or self._is_tree_edge_collided(component_name, roadmap.get_conf(nearest_nid), new_conf,
+                                                          ext_dist, obstacle_list, otherrobot_list):
+                return nearest_nid, False
             else:
-                new_nid = random.randint(0, 1e16)
-                roadmap.add_node(new_nid, conf=new_conf)
-                roadmap.add_edge(nearest_nid, new_nid)
-                nearest_nid = new_nid
-                # all_sampled_confs.append([new_node.point, False])
+                nearest_nid = roadmap.add_node(new_conf, parent_nid=nearest_nid)
                 if animation:
-                    self.draw_wspace([roadmap], obstacle_list, [roadmap.nodes[nearest_nid]['conf'], conf], new_conf, '^c')
+                    self.draw_wspace([roadmap], obstacle_list, [roadmap.get_conf(nearest_nid), conf], new_conf, '^c')
                 # check goal
-                if self._goal_test(conf=roadmap.nodes[new_nid]['conf'], goal_conf=goal_conf, threshold=ext_dist):
-                    roadmap.add_node('connection', conf=goal_conf) # TODO current name -> connection
-                    roadmap.add_edge(new_nid, 'connection')
-                    return 'connection'
+                if self._goal_test(conf=new_conf, goal_conf=goal_conf, threshold=ext_dist) and \
+                        not self._is_tree_edge_collided(component_name, new_conf, goal_conf, ext_dist, obstacle_list,
+                                                        otherrobot_list):
+                    return roadmap.add_node(goal_conf, parent_nid=nearest_nid), True
         else:
-            return nearest_nid
+            return nearest_nid, False
 
     def _goal_test(self, conf, goal_conf, threshold):
         dist = np.linalg.norm(conf - goal_conf)
@@ -89,11 +152,18 @@ class RRT(object):
         else:
             return False
 
-    def _path_from_roadmap(self):
-        nid_path = nx.shortest_path(self.roadmap, 'start', 'goal')
-        conf_path = []
-        for nid in nid_path:
-            conf_path.append(self.roadmap.nodes[nid]['conf'])
+    @staticmethod
+    def _path_from_roadmaps(roadmap_start, nid_start, roadmap_goal=None, nid_goal=None):
+        """
+        :param roadmap_start: nni.ArrayTree rooted at the start
+        :param nid_start: the end of the path in roadmap_start
+        :param roadmap_goal: nni.ArrayTree rooted at the goal, whose node nid_goal continues the path, None for rrt
+        :param nid_goal:
+        :return: a list of 1xn nparray
+        """
+        conf_path = roadmap_start.get_path(nid_start)
+        if roadmap_goal is not None:
+            conf_path += roadmap_goal.get_path(nid_goal)[::-1]
         return conf_path
 
     def _smooth_path(self,
@@ -103,25 +173,30 @@ class RRT(object):
                      otherrobot_list=[],
                      granularity=2,
                      iterations=50):
-        smoothed_path = path
-        for _ in range(iterations):
-            if len(smoothed_path) <= 2:
-                return smoothed_path
-            i = random.randint(0, len(smoothed_path) - 1)
-            j = random.randint(0, len(smoothed_path) - 1)
-            if abs(i - j) <= 1:
-                continue
-            if j < i:
-                i, j = j, i
-            shortcut = self._extend_conf(smoothed_path[i], smoothed_path[j], granularity)
-            if (len(shortcut) < (j - i)) and all(not self._is_collided(component_name=component_name,
-                                                                       conf=conf,
-                                                                       obstacle_list=obstacle_list,
-                                                                       otherrobot_list=otherrobot_list)
-                                                 for conf in shortcut):
-                smoothed_path = smoothed_path[:i + 1] + shortcut + smoothed_path[j + 1:]
-        return smoothed_path
+        # the phase is labeled with the module of the planner, as the subclasses share this method
+        with inst.timer('planner_seconds', planner=type(self).__module__.split('.')[-1], phase='smooth'):
+            smoothed_path = path
+            for _ in range(iterations):
+                if len(smoothed_path) <= 2:
+                    return smoothed_path
+                i = random.randint(0, len(smoothed_path) - 1)
+                j = random.randint(0, len(smoothed_path) - 1)
+                if abs(i - j) <= 1:
+                    continue
+                if j < i:
+                    i, j = j, i
+                # ends at smoothed_path[j], _extend_conf would overshoot it
+                shortcut = list(self._interpolate(smoothed_path[i], smoothed_path[j], granularity))
+                if (len(shortcut) < (j - i)) and not self._is_edge_collided(component_name=component_name,
+                                                                            conf0=smoothed_path[i],
+                                                                            conf1=smoothed_path[j],
+                                                                            ext_dist=granularity,
+                                                                            obstacle_list=obstacle_list,
+                                                                            otherrobot_list=otherrobot_list):
+                    smoothed_path = smoothed_path[:i + 1] + shortcut + smoothed_path[j + 1:]
+            return smoothed_path
 
+    @inst.timed('planner_seconds', planner='rrt', phase='plan')
     def plan(self,
              component_name,
              start_conf,
@@ -134,7 +209,7 @@ class RRT(object):
              maxtime=15.0,
              animation=False):
         """
-        :return: [path, all_sampled_confs]
+        :return: a list of 1xn nparray, None if failed
         author: weiwei
         date: 20201226
         """
@@ -148,9 +223,11 @@ class RRT(object):
         if self._is_collided(component_name, goal_conf, obstacle_list, otherrobot_list):
             print("The goal robot configuration is in collision!")
             return None
-        if self._goal_test(conf=start_conf, goal_conf=goal_conf, threshold=ext_dist):
-            return [[start_conf, goal_conf], None]
-        self.roadmap.add_node('start', conf=start_conf)
+        if self._goal_test(conf=start_conf, goal_conf=goal_conf, threshold=ext_dist) and \
+                not self._is_tree_edge_collided(component_name, start_conf, goal_conf, ext_dist, obstacle_list,
+                                                otherrobot_list):
+            return [start_conf, goal_conf]
+        self.roadmap.add_node(start_conf)
         tic = time.time()
         for _ in range(maxiter):
             toc = time.time()
@@ -160,18 +237,16 @@ class RRT(object):
                     return None
             # Random Sampling
             rand_conf = self._sample_conf(component_name=component_name, rand_rate=rand_rate, default_conf=goal_conf)
-            last_nid = self._extend_roadmap(component_name=component_name,
-                                            roadmap=self.roadmap,
-                                            conf=rand_conf,
-                                            ext_dist=ext_dist,
-                                            goal_conf=goal_conf,
-                                            obstacle_list=obstacle_list,
-                                            otherrobot_list=otherrobot_list,
-                                            animation=True)
-            if last_nid == 'connection':
-                mapping = {'connection':'goal'}
-                self.roadmap = nx.relabel_nodes(self.roadmap, mapping)
-                path = self._path_from_roadmap()
+            last_nid, is_connected = self._extend_roadmap(component_name=component_name,
+                                                          roadmap=self.roadmap,
+                                                          conf=rand_conf,
+                                                          ext_dist=ext_dist,
+                                                          goal_conf=goal_conf,
+                                                          obstacle_list=obstacle_list,
+                                                          otherrobot_list=otherrobot_list,
+                                                          animation=animation)
+            if is_connected:
+                path = self._path_from_roadmaps(self.roadmap, last_nid)
                 smoothed_path = self._smooth_path(component_name=component_name,
                                                   path=path,
                                                   obstacle_list=obstacle_list,
@@ -198,11 +273,17 @@ class RRT(object):
             ax.add_patch(plt.Circle((point[0], point[1]), size / 2.0, color='k'))
         colors = 'bgrcmykw'
         for i, roadmap in enumerate(roadmap_list):
-            for (u, v) in roadmap.edges:
-                plt.plot(roadmap.nodes[u]['conf'][0], roadmap.nodes[u]['conf'][1], 'o'+colors[i])
-                plt.plot(roadmap.nodes[v]['conf'][0], roadmap.nodes[v]['conf'][1], 'o'+colors[i])
-                plt.plot([roadmap.nodes[u]['conf'][0], roadmap.nodes[v]['conf'][0]],
-                         [roadmap.nodes[u]['conf'][1], roadmap.nodes[v]['conf'][1]], '-'+colors[i])
+            if isinstance(roadmap, nx.Graph):  # e.g. the nnindex.Roadmap of PRM
+                conf_array = np.array([node_conf for _, node_conf in roadmap.nodes(data='conf')]).reshape(-1, 2)
+                edge_list = [(roadmap.nodes[nid0]['conf'], roadmap.nodes[nid1]['conf'])
+                             for nid0, nid1 in roadmap.edges]
+            else:
+                conf_array = roadmap.conf_array
+                edge_list = [(conf_array[parent_nid], conf_array[nid])
+                             for nid, parent_nid in enumerate(roadmap.parent_array) if parent_nid >= 0]
+            plt.plot(conf_array[:, 0], conf_array[:, 1], 'o' + colors[i])
+            for conf0, conf1 in edge_list:
+                plt.plot([conf0[0], conf1[0]], [conf0[1], conf1[1]], '-' + colors[i])
         if near_rand_conf_pair is not None:
             plt.plot([near_rand_conf_pair[0][0], near_rand_conf_pair[1][0]],
                      [near_rand_conf_pair[0][1], near_rand_conf_pair[1][1]], "--k")
@@ -1,16 +1,17 @@
 import time
-import random
-import networkx as nx
+import basis.instrumentation as inst
 from motion.probabilistic import rrt
+from motion.probabilistic import nnindex
 
 
 class RRTConnect(rrt.RRT):
 
     def __init__(self, robot):
         super().__init__(robot)
-        self.roadmap_start = nx.Graph()
-        self.roadmap_goal = nx.Graph()
+        self.roadmap_start = nnindex.ArrayTree()
+        self.roadmap_goal = nnindex.ArrayTree()
 
+    @inst.timed('planner_seconds', planner='rrt_connect', phase='extend')
     def _extend_roadmap(self,
                         component_name,
                         roadmap,
@@ -22,32 +23,32 @@ class RRTConnect(rrt.RRT):
                         animation=False):
         """
         find the nearest point between the given roadmap and the conf and then extend towards the conf
-        :return:
+        :param roadmap: nnindex.ArrayTree
+        :return: [the last added nid, True if it is within ext_dist of goal_conf], [-1, False] if collided
         author: weiwei
         date: 20201228
         """
         nearest_nid = self._get_nearest_nid(roadmap, conf)
-        new_conf_list = self._extend_conf(roadmap.nodes[nearest_nid]['conf'], conf, ext_dist)
-        for new_conf in new_conf_list:
-            if self._is_collided(component_name, new_conf, obstacle_list, otherrobot_list):
-                return -1
+        new_conf_list = self._extend_conf(roadmap.get_conf(nearest_nid), conf, ext_dist)
+        is_collided_array = self._is_collided_many(component_name, new_conf_list, obstacle_list, otherrobot_list)
+        for new_conf, is_collided in zip(new_conf_list, is_collided_array):
+            if is_collided or self._is_tree_edge_collided(component_name, roadmap.get_conf(nearest_nid), new_conf,
+                                                          ext_dist, obstacle_list, otherrobot_list):
+                return -1, False
             else:
-                new_nid = random.randint(0, 1e16)
-                roadmap.add_node(new_nid, conf=new_conf)
-                roadmap.add_edge(nearest_nid, new_nid)
-                nearest_nid = new_nid
-                # all_sampled_confs.append([new_node.point, False])
+                nearest_nid = roadmap.add_node(new_conf, parent_nid=nearest_nid)
                 if animation:
                     self.draw_wspace([self.roadmap_start, self.roadmap_goal],
-                                     obstacle_list, [roadmap.nodes[nearest_nid]['conf'], conf], new_conf, '^c')
+                                     obstacle_list, [roadmap.get_conf(nearest_nid), conf], new_conf, '^c')
                 # check goal
-                if self._goal_test(conf=roadmap.nodes[new_nid]['conf'], goal_conf=goal_conf, threshold=ext_dist):
-                    roadmap.add_node('connection', conf=goal_conf) # TODO current name -> connection
-                    roadmap.add_edge(new_nid, 'connection')
-                    return 'connection'
+                if self._goal_test(conf=new_conf, goal_conf=goal_conf, threshold=ext_dist) and \
+                        not self._is_tree_edge_collided(component_name, new_conf, goal_conf, ext_dist, obstacle_list,
+                                                        otherrobot_list):
+                    return nearest_nid, True
         else:
-            return nearest_nid
+            return nearest_nid, False
 
+    @inst.timed('planner_seconds', planner='rrt_connect', phase='plan')
     def plan(self,
              component_name,
              start_conf,
@@ -71,11 +72,13 @@ class RRTConnect(rrt.RRT):
         if self._is_collided(component_name, goal_conf, obstacle_list, otherrobot_list):
             print("The goal robot configuration is in collision!")
             return None
-        if self._goal_test(conf=start_conf, goal_conf=goal_conf, threshold=ext_dist):
+        if self._goal_test(conf=start_conf, goal_conf=goal_conf, threshold=ext_dist) and \
+                not self._is_tree_edge_collided(component_name, start_conf, goal_conf, ext_dist, obstacle_list,
+                                                otherrobot_list):
             return [start_conf, goal_conf]
-        self.roadmap_start.add_node('start', conf=start_conf)
-        self.roadmap_goal.add_node('goal', conf=goal_conf)
-        last_nid = 'goal'
+        self.roadmap_start.add_node(start_conf)
+        self.roadmap_goal.add_node(goal_conf)
+        last_nid = 0
         tic = time.time()
         for _ in range(maxiter):
             toc = time.time()
@@ -87,47 +90,43 @@ class RRTConnect(rrt.RRT):
             while True:
                 if last_nid != -1:
                     goal_nid = last_nid
-                goal_conf = self.roadmap_goal.nodes[goal_nid]['conf']
+                goal_conf = self.roadmap_goal.get_conf(goal_nid)
                 rand_conf = self._sample_conf(component_name=component_name, rand_rate=rand_rate, default_conf=goal_conf)
-                # goal_nid = 'goal'
-                last_nid = self._extend_roadmap(component_name=component_name,
-                                                roadmap=self.roadmap_start,
-                                                conf=rand_conf,
-                                                ext_dist=ext_dist,
-                                                goal_conf=goal_conf,
-                                                obstacle_list=obstacle_list,
-                                                otherrobot_list=otherrobot_list,
-                                                animation=animation)
+                last_nid, is_connected = self._extend_roadmap(component_name=component_name,
+                                                              roadmap=self.roadmap_start,
+                                                              conf=rand_conf,
+                                                              ext_dist=ext_dist,
+                                                              goal_conf=goal_conf,
+                                                              obstacle_list=obstacle_list,
+                                                              otherrobot_list=otherrobot_list,
+                                                              animation=animation)
                 if last_nid != -1:
                     break
-            if last_nid == 'connection':
-                self.roadmap = nx.compose(self.roadmap_start, self.roadmap_goal)
-                self.roadmap.add_edge(last_nid, goal_nid)
+            if is_connected:
+                path = self._path_from_roadmaps(self.roadmap_start, last_nid, self.roadmap_goal, goal_nid)
                 break
             else:
                 while True:
                     if last_nid != -1:
                         goal_nid = last_nid
-                    goal_conf = self.roadmap_start.nodes[goal_nid]['conf']
+                    goal_conf = self.roadmap_start.get_conf(goal_nid)
                     rand_conf = self._sample_conf(component_name=component_name, rand_rate=rand_rate, default_conf=goal_conf)
-                    last_nid = self._extend_roadmap(component_name=component_name,
-                                                    roadmap=self.roadmap_goal,
-                                                    conf=rand_conf,
-                                                    ext_dist=ext_dist,
-                                                    goal_conf=goal_conf,
-                                                    obstacle_list=obstacle_list,
-                                                    otherrobot_list=otherrobot_list,
-                                                    animation=animation)
+                    last_nid, is_connected = self._extend_roadmap(component_name=component_name,
+                                                                  roadmap=self.roadmap_goal,
+                                                                  conf=rand_conf,
+                                                                  ext_dist=ext_dist,
+                                                                  goal_conf=goal_conf,
+                                                                  obstacle_list=obstacle_list,
+                                                                  otherrobot_list=otherrobot_list,
+                                                                  animation=animation)
                     if last_nid != -1:
                         break
-                if last_nid == 'connection':
-                    self.roadmap = nx.compose(self.roadmap_start, self.roadmap_goal)
-                    self.roadmap.add_edge(last_nid, goal_nid)
+                if is_connected:
+                    path = self._path_from_roadmaps(self.roadmap_start, goal_nid, self.roadmap_goal, last_nid)
                     break
         else:
             print("Reach to maximum iteration! Failed to find a path.")
             return None
-        path = self._path_from_roadmap()
         smoothed_path = self._smooth_path(component_name=component_name,
                                           path=path,
                                           obstacle_list=obstacle_list,
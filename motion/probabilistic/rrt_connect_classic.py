@@ -1,16 +1,17 @@
 import time
-import random
-import networkx as nx
+import basis.instrumentation as inst
 from motion.probabilistic import rrt
+from motion.probabilistic import nnindex
 
 
 class RRTConnect(rrt.RRT):
 
     def __init__(self, robot):
         super().__init__(robot)
-        self.roadmap_start = nx.Graph()
-        self.roadmap_goal = nx.Graph()
+        self.roadmap_start = nnindex.ArrayTree()
+        self.roadmap_goal = nnindex.ArrayTree()
 
+    @inst.timed('planner_seconds', planner='rrt_connect_classic', phase='extend')
     def _extend_roadmap(self,
                         roadmap,
                         conf,
@@ -22,32 +23,32 @@ class RRTConnect(rrt.RRT):
                         animation=False):
         """
         find the nearest point between the given roadmap and the conf and then extend towards the conf
-        :return:
+        :param roadmap: nnindex.ArrayTree
+        :return: [the last added nid (the nearest nid if none is added), True if it is within ext_dist of goal_conf]
         author: weiwei
         date: 20201228
         """
         nearest_nid = self._get_nearest_nid(roadmap, conf)
-        new_conf_list = self._extend_conf(roadmap.nodes[nearest_nid]['conf'], conf, ext_dist)
+        new_conf_list = self._extend_conf(roadmap.get_conf(nearest_nid), conf, ext_dist)
         for new_conf in new_conf_list:
-            if self._is_collided(component_name, new_conf, obstacle_list, otherrobot_list):
-                return nearest_nid
+            if self._is_collided(component_name, new_conf, obstacle_list, otherrobot_list) or \
+                    self._is_tree_edge_collided(component_name, roadmap.get_conf(nearest_nid), new_conf, ext_dist,
+                                                obstacle_list, otherrobot_list):
+                return nearest_nid, False
             else:
-                new_nid = random.randint(0, 1e16)
-                roadmap.add_node(new_nid, conf=new_conf)
-                roadmap.add_edge(nearest_nid, new_nid)
-                nearest_nid = new_nid
-                # all_sampled_confs.append([new_node.point, False])
+                nearest_nid = roadmap.add_node(new_conf, parent_nid=nearest_nid)
                 if animation:
                     self.draw_wspace([self.roadmap_start, self.roadmap_goal],
-                                     obstacle_list, [roadmap.nodes[nearest_nid]['conf'], conf], new_conf, '^c')
+                                     obstacle_list, [roadmap.get_conf(nearest_nid), conf], new_conf, '^c')
                 # check goal
-                if self._goal_test(conf=roadmap.nodes[new_nid]['conf'], goal_conf=goal_conf, threshold=ext_dist):
-                    roadmap.add_node('connection', conf=goal_conf) # TODO current name -> connection
-                    roadmap.add_edge(new_nid, 'connection')
-                    return 'connection'
+                if self._goal_test(conf=new_conf, goal_conf=goal_conf, threshold=ext_dist) and \
+                        not self._is_tree_edge_collided(component_name, new_conf, goal_conf, ext_dist, obstacle_list,
+                                                        otherrobot_list):
+                    return nearest_nid, True
         else:
-            return nearest_nid
+            return nearest_nid, False
 
+    @inst.timed('planner_seconds', planner='rrt_connect_classic', phase='plan')
     def plan(self,
              component_name,
              start_conf,
@@ -67,58 +68,57 @@ class RRTConnect(rrt.RRT):
         # check start and goal
         if self._is_collided(component_name, start_conf, obstacle_list, otherrobot_list):
             print("The start robot configuration is in collision!")
-            return [None, None]
+            return None
         if self._is_collided(component_name, goal_conf, obstacle_list, otherrobot_list):
             print("The goal robot configuration is in collision!")
-            return [None, None]
-        if self._goal_test(conf=start_conf, goal_conf=goal_conf, threshold=ext_dist):
-            return [[start_conf, goal_conf], None]
-        self.roadmap_start.add_node('start', conf=start_conf)
-        self.roadmap_goal.add_node('goal', conf=goal_conf)
-        last_nid = 'goal'
+            return None
+        if self._goal_test(conf=start_conf, goal_conf=goal_conf, threshold=ext_dist) and \
+                not self._is_tree_edge_collided(component_name, start_conf, goal_conf, ext_dist, obstacle_list,
+                                                otherrobot_list):
+            return [start_conf, goal_conf]
+        self.roadmap_start.add_node(start_conf)
+        self.roadmap_goal.add_node(goal_conf)
+        last_nid = 0
         tic = time.time()
         for _ in range(maxiter):
             toc = time.time()
             if maxtime > 0.0:
                 if toc - tic > maxtime:
                     print("Too much motion time! Failed to find a path.")
-                    return [None, None]
+                    return None
             # Random Sampling
-            goal_nid = 'goal'
-            goal_conf = self.roadmap_goal.nodes[goal_nid]['conf']
+            goal_nid = 0
+            goal_conf = self.roadmap_goal.get_conf(goal_nid)
             rand_conf = self._sample_conf(component_name=component_name, rand_rate=rand_rate, default_conf=goal_conf)
-            last_nid = self._extend_roadmap(self.roadmap_start,
-                                            conf=rand_conf,
-                                            ext_dist=ext_dist,
-                                            component_name=component_name,
-                                            goal_conf=goal_conf,
-                                            obstacle_list=obstacle_list,
-                                            otherrobot_list=otherrobot_list,
-                                            animation=animation)
-            if last_nid == 'connection':
-                self.roadmap = nx.compose(self.roadmap_start, self.roadmap_goal)
-                self.roadmap.add_edge(last_nid, goal_nid)
+            last_nid, is_connected = self._extend_roadmap(self.roadmap_start,
+                                                          conf=rand_conf,
+                                                          ext_dist=ext_dist,
+                                                          component_name=component_name,
+                                                          goal_conf=goal_conf,
+                                                          obstacle_list=obstacle_list,
+                                                          otherrobot_list=otherrobot_list,
+                                                          animation=animation)
+            if is_connected:
+                path = self._path_from_roadmaps(self.roadmap_start, last_nid, self.roadmap_goal, goal_nid)
                 break
             else:
                 goal_nid = last_nid
-                goal_conf = self.roadmap_start.nodes[goal_nid]['conf']
+                goal_conf = self.roadmap_start.get_conf(goal_nid)
                 rand_conf = self._sample_conf(component_name=component_name, rand_rate=rand_rate, default_conf=goal_conf)
-                last_nid = self._extend_roadmap(self.roadmap_goal,
-                                                conf=rand_conf,
-                                                ext_dist=ext_dist,
-                                                component_name=component_name,
-                                                goal_conf=goal_conf,
-                                                obstacle_list=obstacle_list,
-                                                otherrobot_list=otherrobot_list,
-                                                animation=animation)
-                if last_nid == 'connection':
-                    self.roadmap = nx.compose(self.roadmap_start, self.roadmap_goal)
-                    self.roadmap.add_edge(last_nid, goal_nid)
+                last_nid, is_connected = self._extend_roadmap(self.roadmap_goal,
+                                                              conf=rand_conf,
+                                                              ext_dist=ext_dist,
+                                                              component_name=component_name,
+                                                              goal_conf=goal_conf,
+                                                              obstacle_list=obstacle_list,
+                                                              otherrobot_list=otherrobot_list,
+                                                              animation=animation)
+                if is_connected:
+                    path = self._path_from_roadmaps(self.roadmap_start, goal_nid, self.roadmap_goal, last_nid)
                     break
         else:
             print("Reach to maximum iteration! Failed to find a path.")
-            return [None, None]
-        path = self._path_from_roadmap()
+            return None
         return path
         smoothed_path = self._smooth_path(component_name=component_name,
                                           path=path,
@@ -0,0 +1,211 @@
+import numpy as np
+from scipy.interpolate import CubicSpline
+
+
+class TimeOptimalTrajectory(object):
+    """
+    Minimum-time parameterization of a joint path under per-joint velocity and acceleration limits
+    The waypoints are fitted by a cubic spline q(s) over their cumulative joint-space distance s. Along a grid of s,
+    x = (ds/dt)^2 and u = d^2s/dt^2 are constrained by |q'(s)*sqrt(x)| <= vel_limits and
+    |q'(s)*u + q''(s)*x| <= acc_limits. Following TOPP-RA (Pham & Pham 2018), x is bounded by the maximum velocity
+    curve, then maximized by a backward pass (the largest x from which the end can still be reached while
+    decelerating) and a forward pass (the largest reachable x while accelerating). u is constant in each interval of
+    the grid and the constraints are imposed at both ends of it, which keeps the violations between the grid points
+    second order in grid_size. Both passes are closed form since the constraints are boxes.
+    The remaining violations between the grid points are removed by uniformly slowing the trajectory down until the
+    sampled velocities and accelerations are within the limits, see _enforce_limits.
+    """
+
+    def __init__(self, vel_limits, acc_limits):
+        """
+        :param vel_limits: 1xn nparray, see RobotInterface.get_jnt_vel_limits
+        :param acc_limits: 1xn nparray, see RobotInterface.get_jnt_acc_limits
+        """
+        self.vel_limits = np.asarray(vel_limits, dtype=np.float64)
+        self.acc_limits = np.asarray(acc_limits, dtype=np.float64)
+        if np.any(self.vel_limits <= 0) or np.any(self.acc_limits <= 0):
+            raise ValueError("The velocity and acceleration limits must be positive!")
+        self.spline = None
+        self.s_array = None  # the grid
+        self.x_array = None  # (ds/dt)^2 at the grid
+        self.t_array = None  # time at the grid
+
+    @property
+    def duration(self):
+        return None if self.t_array is None else self.t_array[-1]
+
+    def _get_u_bounds(self, a, b, limits):
+        """
+        the acceleration constraints |a*u+b*x| <= limits bound u by
+        max(slope*x+lo_offset) <= u <= min(slope*x+hi_offset), one line per constraint;
+        the constraints with a=0 only bound x, see _get_max_x
+        :param a: ngrid x m nparray
+        :param b: ngrid x m nparray
+        :param limits: 1xm nparray
+        :return: [slope, lo_offset, hi_offset], ngrid x m nparrays, +-inf for the unbounded
+        """
+        is_bounded = np.abs(a) > 1e-9
+        safe_a = np.where(is_bounded, a, 1.0)
+        slope = np.where(is_bounded, -b / safe_a, 0.0)
+        offset = np.abs(limits / safe_a)
+        lo_offset = np.where(is_bounded, -offset, -np.inf)
+        hi_offset = np.where(is_bounded, offset, np.inf)
+        return slope, lo_offset, hi_offset
+
+    def _get_max_x(self, dq, a, b, limits, slope, lo_offset, hi_offset):
+        """
+        the maximum velocity curve
+        :return: 1xngrid nparray, the largest x of each grid point with an admissible u
+        """
+        max_x = np.min(self.vel_limits ** 2 / np.maximum(dq ** 2, 1e-18), axis=1)
+        # the constraints with a=0: |b*x| <= limits
+        bound_x = np.where(np.abs(a) <= 1e-9, limits / np.maximum(np.abs(b), 1e-18), np.inf)
+        max_x = np.minimum(max_x, np.min(bound_x, axis=1))
+        # lo_j(x) <= hi_k(x) for every pair of lines, i.e. (slope_j-slope_k)*x <= hi_offset_k-lo_offset_j
+        slope_diff = slope[:, :, None] - slope[:, None, :]
+        offset_diff = hi_offset[:, None, :] - lo_offset[:, :, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            pair_x = np.where(slope_diff > 1e-12, offset_diff / slope_diff, np.inf)
+        pair_x = np.where(np.isnan(pair_x), np.inf, pair_x)
+        return np.maximum(np.minimum(max_x, pair_x.reshape(len(max_x), -1).min(axis=1)), 0.0)
+
+    def parameterize(self, path, grid_size=None, bc_type='natural'):
+        """
+        :param path: a list of 1xn nparray, e.g. the output of the planners
+        :param grid_size: the step of s, 1/30 of the mean waypoint distance if None
+        :param bc_type: see scipy.interpolate.CubicSpline
+        :return: the duration of the trajectory
+        """
+        path = np.asarray(path, dtype=np.float64)
+        if path.ndim != 2 or path.shape[1] != len(self.vel_limits):
+            raise ValueError("The path must be a list of configurations with " + str(len(self.vel_limits)) +
+                             " joints!")
+        dist_array = np.linalg.norm(np.diff(path, axis=0), axis=1)
+        path = path[np.concatenate(([True], dist_array > 1e-12))]  # duplicated waypoints break the spline
+        dist_array = dist_array[dist_array > 1e-12]
+        if len(path) < 2:
+            raise ValueError("The path must have at least two different configurations!")
+        knot_array = np.concatenate(([0.0], np.cumsum(dist_array)))
+        if grid_size is None:
+            grid_size = knot_array[-1] / (len(path) - 1) / 30.0
+        self.spline = CubicSpline(knot_array, path, bc_type=bc_type)
+        self.s_array = np.linspace(0, knot_array[-1], max(int(np.ceil(knot_array[-1] / grid_size)), 1) + 1)
+        ds_array = np.diff(self.s_array)
+        dq = self.spline(self.s_array, 1)
+        ddq = self.spline(self.s_array, 2)
+        # the constraints hold at both ends of each interval, u_i is constant in it and x_{i+1} = x_i+2*ds*u_i
+        ds_ext_array = np.append(ds_array, 0.0)[:, None]
+        dq_next = np.vstack((dq[1:], dq[-1:]))
+        ddq_next = np.vstack((ddq[1:], ddq[-1:]))
+        a = np.hstack((dq, dq_next + 2.0 * ds_ext_array * ddq_next))
+        b = np.hstack((ddq, ddq_next))
+        limits = np.concatenate((self.acc_limits, self.acc_limits))
+        slope, lo_offset, hi_offset = self._get_u_bounds(a, b, limits)
+        max_x = self._get_max_x(dq, a, b, limits, slope, lo_offset, hi_offset)
+        max_x[0] = max_x[-1] = 0.0
+        ngrid = len(self.s_array)
+        # backward pass: the largest x_i with x_i+2*ds*u_min(x_i) <= x_{i+1}
+        x_array = max_x.copy()
+        for i in range(ngrid - 2, -1, -1):
+            x_slope = 1.0 + 2.0 * ds_array[i] * slope[i]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                bound = (x_array[i + 1] - 2.0 * ds_array[i] * lo_offset[i]) / x_slope
+            bound = np.where(x_slope > 1e-12, bound, np.inf)
+            x_array[i] = max(min(x_array[i], np.nanmin(bound)), 0.0)
+        # forward pass: x_{i+1} <= x_i+2*ds*u_max(x_i)
+        for i in range(ngrid - 1):
+            u_max = np.min(slope[i] * x_array[i] + hi_offset[i])
+            x_array[i + 1] = max(min(x_array[i + 1], x_array[i] + 2.0 * ds_array[i] * u_max), 0.0)
+        self.x_array = x_array
+        sqrt_x_array = np.sqrt(x_array)
+        dt_array = 2.0 * ds_array / np.maximum(sqrt_x_array[:-1] + sqrt_x_array[1:], 1e-12)
+        self.t_array = np.concatenate(([0.0], np.cumsum(dt_array)))
+        # check each interval at a few points in between and right before its end (u changes at the grid points), and
+        # at the waypoints where the third derivatives of the spline change, x is linear in s within an interval
+        frac_array = np.append(np.linspace(0.0, 1.0, 17)[:-1], 1.0 - 1e-9)
+        time_array = (self.t_array[:-1, None] + dt_array[:, None] * frac_array).ravel()
+        knot_id_array = np.clip(np.searchsorted(self.s_array, knot_array[1:-1], side='right') - 1, 0, ngrid - 2)
+        knot_ds_array = knot_array[1:-1] - self.s_array[knot_id_array]
+        knot_x_array = x_array[knot_id_array] + np.diff(x_array)[knot_id_array] * knot_ds_array / ds_array[
+            knot_id_array]
+        knot_time_array = self.t_array[knot_id_array] + 2.0 * knot_ds_array / np.maximum(
+            sqrt_x_array[knot_id_array] + np.sqrt(np.maximum(knot_x_array, 0.0)), 1e-12)
+        self._enforce_limits(np.concatenate((time_array, knot_time_array, [self.t_array[-1]])))
+        return self.t_array[-1]
+
+    def _evaluate(self, time_array):
+        """
+        :param time_array: 1xnsamples nparray, within [0, duration]
+        :return: [conf_array, vel_array, acc_array], nsamples x n nparrays
+        """
+        sqrt_x_array = np.sqrt(self.x_array)
+        u_array = np.diff(self.x_array) / (2.0 * np.diff(self.s_array))
+        id_array = np.clip(np.searchsorted(self.t_array, time_array, side='right') - 1, 0, len(u_array) - 1)
+        tau_array = time_array - self.t_array[id_array]
+        s_array = self.s_array[id_array] + sqrt_x_array[id_array] * tau_array + .5 * u_array[id_array] * tau_array ** 2
+        s_array = np.clip(s_array, self.s_array[0], self.s_array[-1])
+        sd_array = np.maximum(sqrt_x_array[id_array] + u_array[id_array] * tau_array, 0.0)
+        sdd_array = u_array[id_array]
+        dq = self.spline(s_array, 1)
+        conf_array = self.spline(s_array)
+        vel_array = dq * sd_array[:, None]
+        acc_array = self.spline(s_array, 2) * (sd_array ** 2)[:, None] + dq * sdd_array[:, None]
+        return conf_array, vel_array, acc_array
+
+    def _enforce_limits(self, time_array):
+        """
+        slow the trajectory down by the smallest uniform time scale k that brings the velocities and accelerations
+        at time_array within the limits (t becomes k*t, the velocities are divided by k and the accelerations by k^2)
+        :param time_array: 1xnsamples nparray, within [0, duration]
+        :return: k, 1.0 if the limits already hold
+        """
+        _, vel_array, acc_array = self._evaluate(time_array)
+        k = max(np.max(np.abs(vel_array) / self.vel_limits), np.sqrt(np.max(np.abs(acc_array) / self.acc_limits)))
+        if k <= 1.0:
+            return 1.0
+        k *= 1.0 + 1e-9
+        self.t_array = self.t_array * k
+        self.x_array = self.x_array / k ** 2
+        return k
+
+    def sample(self, control_frequency=1000.0):
+        """
+        sample the parameterized trajectory at the controller rate, the trajectory is slowed down if any sample
+        exceeds the limits (the duration may grow slightly)
+        :param control_frequency: Hz
+        :return: [time_array, conf_array, vel_array, acc_array], nsamples and nsamples x n nparrays
+        """
+        if self.t_array is None:
+            raise ValueError("The path is not parameterized!")
+        # the samples between the checked points of parameterize may still slightly exceed the limits
+        while True:
+            time_array = np.arange(0.0, self.t_array[-1], 1.0 / control_frequency)
+            time_array = np.append(time_array, self.t_array[-1])
+            if self._enforce_limits(time_array) == 1.0:
+                break
+        conf_array, vel_array, acc_array = self._evaluate(time_array)
+        return time_array, conf_array, vel_array, acc_array
+
+
+if __name__ == '__main__':
+    import time
+    import matplotlib.pyplot as plt
+    import robotsim.robots.yumi.yumi as ym
+    from motion.probabilistic import rrt_connect
+
+    robot_s = ym.Yumi(enable_cc=True)
+    start_conf = robot_s.get_jnt_values('lft_arm')
+    goal_conf = np.radians(np.array([-20, -60, 40, 10, 40, 30, 0]))
+    planner = rrt_connect.RRTConnect(robot_s)
+    path = planner.plan('lft_arm', start_conf, goal_conf, ext_dist=.05, maxtime=30)
+    tic = time.time()
+    traj = TimeOptimalTrajectory(robot_s.get_jnt_vel_limits('lft_arm'), robot_s.get_jnt_acc_limits('lft_arm'))
+    duration = traj.parameterize(path)
+    time_array, conf_array, vel_array, acc_array = traj.sample(control_frequency=250)
+    toc = time.time()
+    print("parameterize and sample", toc - tic, "duration", duration, "samples", len(time_array))
+    fig, axs = plt.subplots(3, sharex=True)
+    axs[0].plot(time_array, conf_array)
+    axs[1].plot(time_array, vel_array / traj.vel_limits)
+    axs[2].plot(time_array, acc_array / traj.acc_limits)
+    plt.show()
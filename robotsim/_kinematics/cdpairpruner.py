@@ -0,0 +1,225 @@
+import warnings
+import numpy as np
+import basis.data_adapter as da
+from panda3d.core import NodePath, CollisionTraverser, CollisionHandlerQueue, BitMask32
+
+
+class CDPairPruner(object):
+    """
+    Sampling-based classification of the self-collision pairs of a robot
+    Random configurations of the components are sampled with rand_conf and fk, the contacts between every two cd
+    elements of robot_instance.cc are counted. A pair is "never" if it was never in contact, "always" if it was in
+    contact at every sample (usually adjacent links), and "sometimes" otherwise. Only the sometimes pairs need to be
+    checked, see CollisionChecker.set_cdpair_list and load_cdpairs.
+    As in the self-collision matrix of MoveIt, two more kinds of pairs are disabled by default: the "adjacent" pairs,
+    whose elements are separated by a single joint of the sampled components (e.g. two consecutive links), and the
+    "default" pairs, which are in contact at the configuration when the pruner was created (usually the home
+    configuration). The generated pairs are therefore free of collision at that configuration.
+    NOTE: the never pairs are never observed, not proven; use enough samples and keep the active cdlnks for obstacles
+    NOTE: the hands are sampled at their current jaw widths
+    """
+
+    def __init__(self, robot_instance, component_name_list=None):
+        """
+        :param robot_instance: a robot whose cc is enabled
+        :param component_name_list: the components to sample, all of robot_instance.manipulator_dict if None
+        """
+        if robot_instance.cc is None:
+            raise ValueError("The collision checker of the robot is not enabled!")
+        self.robot_instance = robot_instance
+        if component_name_list is None:
+            component_name_list = list(robot_instance.manipulator_dict.keys())
+        self.component_name_list = component_name_list
+        self.cdelement_list = list(robot_instance.cc.all_cdelements)
+        nelements = len(self.cdelement_list)
+        self.nsamples = 0
+        self.contact_counts = np.zeros((nelements, nelements), dtype=np.int64)  # upper triangle is used
+        # private copies of the cd primitives, every element collides with every other one
+        self._np = NodePath("cdpairpruner")
+        self._ctrav = CollisionTraverser()
+        self._chan = CollisionHandlerQueue()
+        self._cdnp_list = []
+        for id, cdelement in enumerate(self.cdelement_list):
+            cdnp = cdelement['collisionmodel'].copy_cdnp_to(self._np, clearmask=True)
+            cdnp.setName(str(id))
+            cdnp.node().setFromCollideMask(BitMask32(1))
+            cdnp.node().setIntoCollideMask(BitMask32(1))
+            self._ctrav.addCollider(cdnp, self._chan)
+            self._cdnp_list.append(cdnp)
+        self.default_contacts = self._get_contacts()
+        self.adjacent_pairs = self._get_adjacent_pairs()
+
+    def _get_adjacent_pairs(self):
+        """
+        the elements moved by each joint of the components are found by moving the joints one by one, the parents
+        of an element are moved by the same joints but one, and the nearest of them (by the distances of the frames,
+        e.g. the link a component is mounted on among the static ones) is adjacent to it
+        :return: nelements x nelements bool nparray, only the upper triangle is set
+        """
+        is_moved_list = []
+        for component_name in self.component_name_list:
+            jnt_values = self.robot_instance.get_jnt_values(component_name)
+            for jnt_id in range(len(jnt_values)):
+                pose_list = [(cdelement['gl_pos'].copy(), cdelement['gl_rotmat'].copy())
+                             for cdelement in self.cdelement_list]
+                moved_jnt_values = jnt_values.copy()
+                moved_jnt_values[jnt_id] += .01
+                self.robot_instance.fk(component_name, moved_jnt_values)
+                is_moved_list.append([not (np.allclose(cdelement['gl_pos'], pos) and
+                                           np.allclose(cdelement['gl_rotmat'], rotmat))
+                                      for cdelement, (pos, rotmat) in zip(self.cdelement_list, pose_list)])
+                self.robot_instance.fk(component_name, jnt_values)
+        is_moved = np.array(is_moved_list, dtype=bool).reshape(-1, len(self.cdelement_list)).T  # nelements x njnts
+        is_subset = ~np.any(is_moved[:, None, :] & ~is_moved[None, :, :], axis=2)  # [i, j]: joints of i in those of j
+        njnts_array = is_moved.sum(axis=1)
+        is_parent = is_subset & (njnts_array[None, :] - njnts_array[:, None] == 1)  # [i, j]: i is a parent of j
+        pos_array = np.array([cdelement['gl_pos'] for cdelement in self.cdelement_list])
+        distances = np.linalg.norm(pos_array[:, None] - pos_array[None, :], axis=2)
+        distances = np.where(is_parent, distances, np.inf)
+        is_adjacent = is_parent & (distances <= distances.min(axis=0)[None, :] + 1e-9)
+        return np.triu(is_adjacent | is_adjacent.T, k=1)
+
+    def _get_contacts(self):
+        """
+        :return: nelements x nelements bool nparray, only the upper triangle is set
+        """
+        for cdnp, cdelement in zip(self._cdnp_list, self.cdelement_list):
+            cdnp.setMat(da.npv3mat3_to_pdmat4(cdelement['gl_pos'], cdelement['gl_rotmat']))
+        self._ctrav.traverse(self._np)
+        contacts = np.zeros(self.contact_counts.shape, dtype=bool)
+        for i in range(self._chan.getNumEntries()):
+            entry = self._chan.getEntry(i)
+            id0 = int(entry.getFromNodePath().getName())
+            id1 = int(entry.getIntoNodePath().getName())
+            contacts[min(id0, id1), max(id0, id1)] = True
+        return contacts
+
+    def sample(self, nsamples=10000, toggle_debug=False):
+        """
+        sample random configurations and accumulate the contacts, could be called repeatedly
+        the configurations of the components are restored afterwards
+        :param nsamples:
+        :param toggle_debug:
+        :return:
+        """
+        jnt_values_bk = [self.robot_instance.get_jnt_values(component_name)
+                         for component_name in self.component_name_list]
+        for i in range(nsamples):
+            for component_name in self.component_name_list:
+                self.robot_instance.fk(component_name, self.robot_instance.rand_conf(component_name))
+            self.contact_counts += self._get_contacts()
+            if toggle_debug and (i + 1) % 1000 == 0:
+                print("sampled", i + 1, "configurations")
+        self.nsamples += nsamples
+        for component_name, jnt_values in zip(self.component_name_list, jnt_values_bk):
+            self.robot_instance.fk(component_name, jnt_values)
+
+    def _get_pair_ids(self, is_selected):
+        id_array0, id_array1 = np.nonzero(np.triu(is_selected, k=1))
+        return list(zip(id_array0.tolist(), id_array1.tolist()))
+
+    def get_never_pair_ids(self):
+        """
+        :return: [[id0, id1], ...], the ids index robot_instance.cc.all_cdelements
+        """
+        return self._get_pair_ids(self.contact_counts == 0)
+
+    def get_always_pair_ids(self):
+        return self._get_pair_ids(self.contact_counts == self.nsamples)
+
+    def get_default_pair_ids(self):
+        return self._get_pair_ids(np.logical_and(self.default_contacts, self.contact_counts < self.nsamples))
+
+    def get_adjacent_pair_ids(self):
+        return self._get_pair_ids(self.adjacent_pairs)
+
+    def get_sometimes_pair_ids(self):
+        return self._get_pair_ids(np.logical_and(self.contact_counts > 0, self.contact_counts < self.nsamples))
+
+    def get_current_pair_ids(self):
+        """
+        the pairs checked by robot_instance.cc at the moment, e.g. the hand-written ones of the robot definition
+        :return: [[id0, id1], ...]
+        """
+        cc = self.robot_instance.cc
+        childid_array = np.array([cdelement['cdprimit_childid'] for cdelement in self.cdelement_list], dtype=int)
+        if hasattr(cc, '_pair_mat'):
+            is_pair = cc._pair_mat[np.ix_(childid_array, childid_array)]
+        else:
+            cdnode_list = [cc.np.getChild(childid).node() for childid in childid_array]
+            from_masks = np.array([cdnode.getFromCollideMask().getWord() for cdnode in cdnode_list], dtype=np.int64)
+            into_masks = np.array([cdnode.getIntoCollideMask().getWord() for cdnode in cdnode_list], dtype=np.int64)
+            is_pair = (from_masks[:, None] & into_masks[None]) != 0
+        return self._get_pair_ids(np.logical_or(is_pair, is_pair.T))
+
+    def _get_name(self, id):
+        return "%d:%s" % (id, self.cdelement_list[id].get('name', 'cdobj'))
+
+    def _get_selected_pair_ids(self, toggle_keep_default, toggle_keep_adjacent):
+        """
+        the sometimes pairs without the default and the adjacent ones, unless they are kept
+        the number of pairs is reported relative to the current ones
+        :return: [[id0, id1], ...]
+        """
+        if self.nsamples == 0:
+            raise ValueError("No configurations are sampled!")
+        is_selected = np.logical_and(self.contact_counts > 0, self.contact_counts < self.nsamples)
+        if not toggle_keep_adjacent:
+            is_selected &= ~self.adjacent_pairs
+        default_pair_ids = self._get_pair_ids(is_selected & self.default_contacts)
+        if len(default_pair_ids) > 0:
+            names = ", ".join(self._get_name(id0) + "-" + self._get_name(id1) for id0, id1 in default_pair_ids)
+            if toggle_keep_default:
+                warnings.warn("The following pairs are in contact at the starting configuration, which is reported "
+                              "as self collided: " + names)
+            else:
+                warnings.warn("The following pairs are in contact at the starting configuration and are disabled, "
+                              "their collisions at the other configurations will be missed: " + names)
+                is_selected &= ~self.default_contacts
+        pair_ids = self._get_pair_ids(is_selected)
+        if not toggle_keep_default:
+            assert not np.any(self.default_contacts[tuple(np.array(pair_ids, dtype=int).reshape(-1, 2).T)])
+        ncurrent_pairs = len(self.get_current_pair_ids())
+        print("%d pairs, %d pairs are checked at the moment (%.0f%%)" %
+              (len(pair_ids), ncurrent_pairs, 100.0 * len(pair_ids) / max(ncurrent_pairs, 1)))
+        return pair_ids
+
+    def gen_cdpair_list(self, toggle_keep_default=False, toggle_keep_adjacent=False):
+        """
+        :param toggle_keep_default: keep the pairs in contact at the starting configuration
+        :param toggle_keep_adjacent: keep the pairs separated by a single joint
+        :return: [[cdelement0, cdelement1], ...], the sometimes pairs, see CollisionChecker.set_cdpair_list
+        """
+        return [[self.cdelement_list[id0], self.cdelement_list[id1]] for id0, id1 in
+                self._get_selected_pair_ids(toggle_keep_default, toggle_keep_adjacent)]
+
+    def save_cdpairs(self, path, toggle_keep_default=False, toggle_keep_adjacent=False):
+        """
+        save the ids of the sometimes pairs, see CollisionChecker.load_cdpairs
+        :param path: a .npy file
+        :param toggle_keep_default: see gen_cdpair_list
+        :param toggle_keep_adjacent: see gen_cdpair_list
+        :return:
+        """
+        np.save(path, np.array(self._get_selected_pair_ids(toggle_keep_default, toggle_keep_adjacent),
+                               dtype=np.int32).reshape(-1, 2))
+
+
+if __name__ == '__main__':
+    import time
+    import robotsim.robots.yumi.yumi as ym
+
+    robot_instance = ym.Yumi(enable_cc=True)
+    pruner = CDPairPruner(robot_instance)
+    tic = time.time()
+    pruner.sample(nsamples=5000, toggle_debug=True)
+    toc = time.time()
+    print("sample", toc - tic)
+    print("never", len(pruner.get_never_pair_ids()),
+          "always", len(pruner.get_always_pair_ids()),
+          "default", len(pruner.get_default_pair_ids()),
+          "adjacent", len(pruner.get_adjacent_pair_ids()),
+          "sometimes", len(pruner.get_sometimes_pair_ids()),
+          "hand-written", len(pruner.get_current_pair_ids()))
+    robot_instance.cc.set_cdpair_list(pruner.gen_cdpair_list())
+    assert not robot_instance.is_collided()
@@ -1,11 +1,17 @@
+import numpy as np
 import basis.data_adapter as da
+import basis.instrumentation as inst
+import modeling.spheretree as spt
+import modeling.occupancygrid as og
 import modeling.modelcollection as mc
-from panda3d.core import NodePath, CollisionTraverser, CollisionHandlerQueue, BitMask32
+from panda3d.core import NodePath, CollisionTraverser, CollisionHandlerQueue, CollisionBox, BitMask32, Mat4
 
 
 class CollisionChecker(object):
     """
     A fast collision checker that allows maximum 32 collision pairs
+    The obstacles are collision models, modeling.occupancygrid.OccupancyGrid obstacles need SphereCollisionChecker
+    (see RobotInterface.enable_sphere_tree_cc)
     author: weiwei
     date: 20201214osaka
     """
@@ -83,6 +89,57 @@ class CollisionChecker(object):
             cdnp.node().setIntoCollideMask(new_into_cdmask)
         self.nbitmask += 1
 
+    def clear_cdpairs(self):
+        """
+        clear the self collision pairs, the active cdlnks are kept
+        :return:
+        """
+        for cdnp in self.np.getChildren():
+            cdnp.node().setFromCollideMask(cdnp.node().getFromCollideMask() & self._bitmask_ext)
+            cdnp.node().setIntoCollideMask(BitMask32(0))
+        self.nbitmask = 0
+
+    def set_cdpair_list(self, cdpair_list):
+        """
+        replace the self collision pairs by the given element pairs, e.g. the ones generated by cdpairpruner
+        the pairs are grouped into set_cdpair calls: the element in the most remaining pairs is taken as a from element
+        greedily, and the from elements with the same into elements share one group
+        :param cdpair_list: [[cdlnk0, cdlnk1], ...]
+        :return:
+        """
+        remaining_pairs = set()
+        cdelement_dict = {}
+        for cdlnk0, cdlnk1 in cdpair_list:
+            if cdlnk0['cdprimit_childid'] == -1 or cdlnk1['cdprimit_childid'] == -1:
+                raise ValueError("The link needs to be added to collider using the add_cdlnks function first!")
+            cdelement_dict[id(cdlnk0)] = cdlnk0
+            cdelement_dict[id(cdlnk1)] = cdlnk1
+            remaining_pairs.add((id(cdlnk0), id(cdlnk1)))
+        group_dict = {}  # frozenset of into elements: from elements
+        while len(remaining_pairs) > 0:
+            degrees = {}
+            for pair in remaining_pairs:
+                for key in pair:
+                    degrees[key] = degrees.get(key, 0) + 1
+            from_key = max(degrees, key=degrees.get)
+            into_keys = frozenset(pair[1] if pair[0] == from_key else pair[0] for pair in remaining_pairs
+                                  if from_key in pair)
+            remaining_pairs = set(pair for pair in remaining_pairs if from_key not in pair)
+            group_dict.setdefault(into_keys, []).append(from_key)
+        self.clear_cdpairs()
+        for into_keys, from_keys in group_dict.items():
+            self.set_cdpair([cdelement_dict[key] for key in from_keys], [cdelement_dict[key] for key in into_keys])
+
+    def load_cdpairs(self, path):
+        """
+        load the pairs saved by cdpairpruner.CDPairPruner.save_cdpairs, see set_cdpair_list
+        the ids index self.all_cdelements, the cd elements must be added in the same order as when they were saved
+        :param path: a .npy file
+        :return:
+        """
+        pair_ids = np.load(path)
+        self.set_cdpair_list([[self.all_cdelements[id0], self.all_cdelements[id1]] for id0, id1 in pair_ids])
+
     def add_cdobj(self, objcm, rel_pos, rel_rotmat, intolist):
         """
         :return: cdobj_info, a dictionary that mimics a joint link; Besides that, there is an additional 'intolist'
@@ -118,25 +175,12 @@ class CollisionChecker(object):
             new_into_cdmask = current_into_cdmask & ~cdnp.node().getFromCollideMask()
             cdnp.node().setIntoCollideMask(new_into_cdmask)
 
-    def is_collided(self, obstacle_list=[], otherrobot_list=[]):
-        """
-        :param obstacle_list: staticgeometricmodel
-        :param otherrobot_list:
-        :return:
-        """
-        for cdelement in self.all_cdelements:
-            pos = cdelement['gl_pos']
-            rotmat = cdelement['gl_rotmat']
-            cdnp = self.np.getChild(cdelement['cdprimit_childid'])
-            cdnp.setMat(da.npv3mat3_to_pdmat4(pos, rotmat))
-            # print(da.npv3mat3_to_pdmat4(pos, rotmat))
-            # print("From", cdnp.node().getFromCollideMask())
-            # print("Into", cdnp.node().getIntoCollideMask())
-        # print("xxxx colliders xxxx")
-        # for collider in self.ctrav.getColliders():
-        #     print(collider.getMat())
-        #     print("From", collider.node().getFromCollideMask())
-        #     print("Into", collider.node().getIntoCollideMask())
+    def _attach_obstacles(self, obstacle_list, otherrobot_list):
+        # occupancy grids have no panda3d nodes, check before anything is attached
+        for obstacle in obstacle_list:
+            if isinstance(obstacle, og.OccupancyGrid):
+                raise ValueError("Occupancy grid obstacles are only supported by SphereCollisionChecker, "
+                                 "call enable_sphere_tree_cc() of the robot first!")
         # attach obstacles
         for obstacle in obstacle_list:
             obstacle.objpdnp.reparentTo(self.np)
@@ -147,8 +191,8 @@ class CollisionChecker(object):
                 new_into_cdmask = current_into_cdmask | self._bitmask_ext
                 cdnp.node().setIntoCollideMask(new_into_cdmask)
             robot.cc.np.reparentTo(self.np)
-        # collision check
-        self.ctrav.traverse(self.np)
+
+    def _detach_obstacles(self, obstacle_list, otherrobot_list):
         # clear obstacles
         for obstacle in obstacle_list:
             obstacle.objpdnp.detachNode()
@@ -162,11 +206,77 @@ class CollisionChecker(object):
                 robot.cc.np.reparentTo(base.render)
             else:
                 robot.cc.np.detachNode()
+
+    def _update_cdnp_mats(self):
+        for cdelement in self.all_cdelements:
+            pos = cdelement['gl_pos']
+            rotmat = cdelement['gl_rotmat']
+            cdnp = self.np.getChild(cdelement['cdprimit_childid'])
+            cdnp.setMat(da.npv3mat3_to_pdmat4(pos, rotmat))
+
+    @inst.timed('cc_is_collided_seconds', checker='panda')
+    def is_collided(self, obstacle_list=[], otherrobot_list=[]):
+        """
+        :param obstacle_list: staticgeometricmodel
+        :param otherrobot_list:
+        :return:
+        """
+        self._update_cdnp_mats()
+        self._attach_obstacles(obstacle_list, otherrobot_list)
+        # collision check
+        self.ctrav.traverse(self.np)
+        self._detach_obstacles(obstacle_list, otherrobot_list)
         if self.chan.getNumEntries() > 0:
             return True
         else:
             return False
 
+    @inst.timed('cc_is_collided_many_seconds', checker='panda')
+    def is_collided_many(self,
+                         cdelement_list,
+                         gl_pos_array,
+                         gl_rotmat_array,
+                         obstacle_list=[],
+                         otherrobot_list=[],
+                         toggle_stop_at_first=False):
+        """
+        check a batch of poses of the given cd elements, the other cd elements stay at their current poses
+        obstacles and other robots are attached only once for the whole batch
+        :param cdelement_list: k cdlnks or cdobjs, all of them must be added to self
+        :param gl_pos_array: nxkx3 nparray
+        :param gl_rotmat_array: nxkx3x3 nparray
+        :param obstacle_list: staticgeometricmodel
+        :param otherrobot_list:
+        :param toggle_stop_at_first: stop at the first collided pose, the unchecked ones are reported as collided
+        :return: 1xn bool nparray
+        """
+        nposes = gl_pos_array.shape[0]
+        result = np.zeros(nposes, dtype=bool)
+        inst.count('cc_checked_poses', nposes, checker='panda')
+        if nposes == 0:
+            return result
+        # LMatrix4 layout, row-major with the translation in the last row
+        pdmat4_array = np.zeros(gl_pos_array.shape[:2] + (4, 4))
+        pdmat4_array[:, :, :3, :3] = np.swapaxes(gl_rotmat_array, 2, 3)
+        pdmat4_array[:, :, 3, :3] = gl_pos_array
+        pdmat4_array[:, :, 3, 3] = 1
+        pdmat4_array = pdmat4_array.reshape(nposes, -1, 16).tolist()
+        cdnp_list = [self.np.getChild(cdelement['cdprimit_childid']) for cdelement in cdelement_list]
+        self._update_cdnp_mats()
+        self._attach_obstacles(obstacle_list, otherrobot_list)
+        for i in range(nposes):
+            for cdnp, pdmat4 in zip(cdnp_list, pdmat4_array[i]):
+                cdnp.setMat(Mat4(*pdmat4))
+            self.ctrav.traverse(self.np)
+            if self.chan.getNumEntries() > 0:
+                result[i] = True
+                if toggle_stop_at_first:
+                    result[i + 1:] = True
+                    break
+        self._detach_obstacles(obstacle_list, otherrobot_list)
+        self._update_cdnp_mats()
+        return result
+
     def show_cdprimit(self):
         # print("call show_cdprimit")
         self.np.reparentTo(base.render)
@@ -195,4 +305,642 @@ class CollisionChecker(object):
         self.all_cdelements = []
         for child in self.np.getChildren():
             child.removeNode()
-        self.nbitmask = 0
\ No newline at end of file
+        self.nbitmask = 0
+
+
+class MatrixCollisionChecker(CollisionChecker):
+    """
+    A collision checker without the limit on the number of collision pairs
+    The self-collision pairs are kept in a symmetric boolean matrix indexed by cdprimit_childid, and the links active
+    to external obstacles are kept in a boolean vector. The world aabbs of the cd elements (from the local aabbs of their
+    solids) are tested for overlap pair by pair in one numpy broadcast over all the allowed pairs, and the narrow phase
+    of panda3d runs only on the pairs whose aabbs overlap.
+    The interface is the same as CollisionChecker, so that the two could be swapped; neither of them supports
+    modeling.occupancygrid.OccupancyGrid obstacles, see SphereCollisionChecker.
+    """
+
+    def __init__(self, name="auto"):
+        super().__init__(name=name)
+        self._bitmask_self = BitMask32(2 ** 30)  # 30 is not used by CollisionChecker, it is free for any pair
+        self._pair_mat = np.zeros((0, 0), dtype=bool)
+        self._is_active = np.zeros(0, dtype=bool)
+        self._loc_center_array = np.zeros((0, 3))  # local aabbs of the cd elements
+        self._loc_half_array = np.zeros((0, 3))
+        self._ctrav_list = []  # [[ctrav, chan], ...], one traverser per cd element, the collider is the element
+        self._cdelement_info = None  # cache of _get_cdelement_arrays, reset when the elements or pairs are changed
+
+    @staticmethod
+    def _get_aabb(bounds):
+        """
+        :param bounds: a panda3d bounding volume, or a solid that has getMin and getMax (e.g. CollisionBox)
+        :return: [center 1x3 nparray, half extents 1x3 nparray], the half extents are inf if the bounds is infinite
+        """
+        if hasattr(bounds, "getMin") and hasattr(bounds, "getMax"):
+            min_pos = da.pdv3_to_npv3(bounds.getMin())
+            max_pos = da.pdv3_to_npv3(bounds.getMax())
+            return (min_pos + max_pos) / 2, (max_pos - min_pos) / 2
+        if bounds.isEmpty():
+            return np.zeros(3), np.zeros(3)
+        if bounds.isInfinite():
+            return np.zeros(3), np.full(3, np.inf)
+        return da.pdv3_to_npv3(bounds.getCenter()), np.full(3, bounds.getRadius())
+
+    def _get_loc_aabb(self, cdnode):
+        """
+        the aabb of the solids of a collision node in its own frame, tighter than the bounding sphere of the node
+        :param cdnode: CollisionNode
+        :return: [center 1x3 nparray, half extents 1x3 nparray]
+        """
+        if cdnode.getNumSolids() == 0:
+            return self._get_aabb(cdnode.getBounds())
+        min_list = []
+        max_list = []
+        for i in range(cdnode.getNumSolids()):
+            solid = cdnode.getSolid(i)
+            center, half = self._get_aabb(solid if isinstance(solid, CollisionBox) else solid.getBounds())
+            min_list.append(center - half)
+            max_list.append(center + half)
+        min_pos = np.min(min_list, axis=0)
+        max_pos = np.max(max_list, axis=0)
+        return (min_pos + max_pos) / 2, (max_pos - min_pos) / 2
+
+    def _register_cdnp(self, cdnp):
+        """
+        grow the pair matrix and the per-element arrays for a newly attached cdnp
+        :return:
+        """
+        cdnp.node().setFromCollideMask(self._bitmask_self | self._bitmask_ext)
+        cdnp.node().setIntoCollideMask(self._bitmask_self)
+        nelements = self._pair_mat.shape[0] + 1
+        pair_mat = np.zeros((nelements, nelements), dtype=bool)
+        pair_mat[:-1, :-1] = self._pair_mat
+        self._pair_mat = pair_mat
+        self._is_active = np.append(self._is_active, False)
+        loc_center, loc_half = self._get_loc_aabb(cdnp.node())
+        self._loc_center_array = np.vstack((self._loc_center_array, loc_center))
+        self._loc_half_array = np.vstack((self._loc_half_array, loc_half))
+        self._ctrav_list.append([CollisionTraverser(), CollisionHandlerQueue()])
+
+    def _get_ctrav(self, childid):
+        ctrav, chan = self._ctrav_list[childid]
+        if ctrav.getNumColliders() == 0:  # new or deep copied
+            ctrav.addCollider(self.np.getChild(childid), chan)
+        return ctrav, chan
+
+    def add_cdlnks(self, jlcobj, lnk_idlist):
+        """
+        :param jlcobj:
+        :param lnk_idlist:
+        :return:
+        """
+        for id in lnk_idlist:
+            if jlcobj.lnks[id]['cdprimit_childid'] == -1:  # first time add
+                cdnp = jlcobj.lnks[id]['collisionmodel'].copy_cdnp_to(self.np, clearmask=True)
+                self.ctrav.addCollider(cdnp, self.chan)
+                self.all_cdelements.append(jlcobj.lnks[id])
+                jlcobj.lnks[id]['cdprimit_childid'] = self.np.getNumChildren() - 1
+                self._register_cdnp(cdnp)
+            else:
+                raise ValueError("The link is already added!")
+
+    def set_active_cdlnks(self, activelist):
+        """
+        :param activelist: [jlchain.lnk0, jlchain.lnk1...]
+        :return:
+        """
+        for cdlnk in activelist:
+            if cdlnk['cdprimit_childid'] == -1:
+                raise ValueError("The link needs to be added to collider using the add_cdlnks function first!")
+            self._is_active[cdlnk['cdprimit_childid']] = True
+        self._cdelement_info = None
+
+    def set_cdpair(self, fromlist, intolist):
+        """
+        all pairs between fromlist and intolist will be used for self collision detection, there is no limit
+        :param fromlist: [cdlnk, ...]
+        :param intolist: [cdlnk, ...]
+        :return:
+        """
+        for cdlnk in fromlist + intolist:
+            if cdlnk['cdprimit_childid'] == -1:
+                raise ValueError("The link needs to be added to collider using the add_cdlnks function first!")
+        from_ids = [cdlnk['cdprimit_childid'] for cdlnk in fromlist]
+        into_ids = [cdlnk['cdprimit_childid'] for cdlnk in intolist]
+        self._pair_mat[np.ix_(from_ids, into_ids)] = True
+        self._pair_mat[np.ix_(into_ids, from_ids)] = True
+        self._cdelement_info = None
+        self.nbitmask += 1
+
+    def clear_cdpairs(self):
+        """
+        clear the self collision pairs, the active cdlnks are kept
+        :return:
+        """
+        self._pair_mat[:] = False
+        self._cdelement_info = None
+        self.nbitmask = 0
+
+    def add_cdobj(self, objcm, rel_pos, rel_rotmat, intolist):
+        """
+        :return: cdobj_info, see CollisionChecker.add_cdobj
+        """
+        cdobj_info = {}
+        cdobj_info['collisionmodel'] = objcm  # for reversed lookup
+        cdobj_info['gl_pos'] = objcm.get_pos()
+        cdobj_info['gl_rotmat'] = objcm.get_rotmat()
+        cdobj_info['rel_pos'] = rel_pos
+        cdobj_info['rel_rotmat'] = rel_rotmat
+        cdobj_info['intolist'] = intolist
+        cdnp = objcm.copy_cdnp_to(self.np, clearmask=True)
+        self.ctrav.addCollider(cdnp, self.chan)
+        self.all_cdelements.append(cdobj_info)
+        # the child id differs from the index in all_cdelements once an obj is deleted
+        cdobj_info['cdprimit_childid'] = self.np.getNumChildren() - 1
+        self._register_cdnp(cdnp)
+        self._is_active[cdobj_info['cdprimit_childid']] = True
+        self.set_cdpair([cdobj_info], intolist)
+        return cdobj_info
+
+    def delete_cdobj(self, cdobj_info):
+        """
+        :param cdobj_info: an lnk-like object generated by self.add_cdobj
+        :return:
+        """
+        self.all_cdelements.remove(cdobj_info)
+        childid = cdobj_info['cdprimit_childid']
+        self.ctrav.removeCollider(self.np.getChild(childid))
+        self._pair_mat[childid, :] = False
+        self._pair_mat[:, childid] = False
+        self._is_active[childid] = False
+        self._cdelement_info = None
+
+    def _attach_obstacles(self, obstacle_list, otherrobot_list):
+        # the cdnps of the other robots are moved lazily by their own checkers
+        for robot in otherrobot_list:
+            robot.cc._update_cdnp_mats()
+        super()._attach_obstacles(obstacle_list, otherrobot_list)
+
+    def _get_ext_aabbs(self, obstacle_list, otherrobot_list):
+        """
+        the external cdnps and their aabbs in the frame of self.np, call after _attach_obstacles
+        :return: [cdnp_list, min_array nx3, max_array nx3]
+        """
+        cdnp_list = []
+        for obstacle in obstacle_list:
+            cdnp_list.append(obstacle.objpdnp)
+        for robot in otherrobot_list:
+            cdnp_list += list(robot.cc.np.getChildren())
+        center_array = np.zeros((len(cdnp_list), 3))
+        half_array = np.zeros((len(cdnp_list), 3))
+        for i, cdnp in enumerate(cdnp_list):
+            center_array[i], half_array[i] = self._get_aabb(cdnp.getBounds())
+        return cdnp_list, center_array - half_array, center_array + half_array
+
+    def _get_cdelement_arrays(self):
+        """
+        :return: [childid_array 1xk, gl_pos_array kx3, gl_rotmat_array kx3x3, cdelement_info]
+                 cdelement_info holds the local aabbs, the allowed self pairs (two 1xm nparrays), and the elements
+                 active to external obstacles, the ids index the k cd elements in self.all_cdelements
+        """
+        childid_array = np.array([cdelement['cdprimit_childid'] for cdelement in self.all_cdelements], dtype=int)
+        gl_pos_array = np.array([cdelement['gl_pos'] for cdelement in self.all_cdelements],
+                                dtype=np.float64).reshape(-1, 3)
+        gl_rotmat_array = np.array([cdelement['gl_rotmat'] for cdelement in self.all_cdelements],
+                                   dtype=np.float64).reshape(-1, 3, 3)
+        childid_tuple = tuple(childid_array.tolist())
+        if self._cdelement_info is None or self._cdelement_info['childids'] != childid_tuple:
+            self._cdelement_info = {'childids': childid_tuple,
+                                    'loc_center': self._loc_center_array[childid_array],
+                                    'loc_half': self._loc_half_array[childid_array],
+                                    'pair_ids': np.nonzero(
+                                        np.triu(self._pair_mat[np.ix_(childid_array, childid_array)])),
+                                    'active_ids': np.nonzero(self._is_active[childid_array])[0]}
+        return childid_array, gl_pos_array, gl_rotmat_array, self._cdelement_info
+
+    def _is_collided_at(self, childid_array, gl_pos_array, gl_rotmat_array, cdelement_info, ext_cdnp_list,
+                        ext_min_array, ext_max_array):
+        """
+        broad phase and narrow phase at one set of poses, see _get_cdelement_arrays and _get_ext_aabbs for the params
+        :return: bool
+        """
+        center_array = np.einsum('kij,kj->ki', gl_rotmat_array, cdelement_info['loc_center']) + gl_pos_array
+        half_array = np.einsum('kij,kj->ki', np.abs(gl_rotmat_array), cdelement_info['loc_half'])
+        min_array = center_array - half_array
+        max_array = center_array + half_array
+        # allowed self pairs
+        id_array0, id_array1 = cdelement_info['pair_ids']
+        is_overlapped = np.all((min_array[id_array0] <= max_array[id_array1]) &
+                               (min_array[id_array1] <= max_array[id_array0]), axis=1)
+        cdpair_list = list(zip(id_array0[is_overlapped].tolist(), id_array1[is_overlapped].tolist()))
+        # active elements x external cdnps, the external ids are offset by the number of cd elements
+        nself = len(childid_array)
+        active_ids = cdelement_info['active_ids']
+        if len(ext_cdnp_list) > 0 and len(active_ids) > 0:
+            is_overlapped = np.all((min_array[active_ids, None] <= ext_max_array[None]) &
+                                   (ext_min_array[None] <= max_array[active_ids, None]), axis=2)
+            active_id_array, ext_id_array = np.nonzero(is_overlapped)
+            cdpair_list += list(zip(active_ids[active_id_array].tolist(), (ext_id_array + nself).tolist()))
+        childid_list = childid_array.tolist()
+        is_updated = [False] * nself
+        for id0, id1 in cdpair_list:
+            for id in (id0, id1):
+                if id < nself and not is_updated[id]:
+                    cdnp = self.np.getChild(childid_list[id])
+                    cdnp.setMat(da.npv3mat3_to_pdmat4(gl_pos_array[id], gl_rotmat_array[id]))
+                    is_updated[id] = True
+            ctrav, chan = self._get_ctrav(childid_list[id0])
+            if id1 < nself:
+                ctrav.traverse(self.np.getChild(childid_list[id1]))
+            else:
+                ctrav.traverse(ext_cdnp_list[id1 - nself])
+            if chan.getNumEntries() > 0:
+                return True
+        return False
+
+    @inst.timed('cc_is_collided_seconds', checker='matrix')
+    def is_collided(self, obstacle_list=[], otherrobot_list=[]):
+        """
+        :param obstacle_list: staticgeometricmodel
+        :param otherrobot_list:
+        :return:
+        """
+        self._attach_obstacles(obstacle_list, otherrobot_list)
+        ext_aabbs = self._get_ext_aabbs(obstacle_list, otherrobot_list)
+        is_collided = self._is_collided_at(*self._get_cdelement_arrays(), *ext_aabbs)
+        self._detach_obstacles(obstacle_list, otherrobot_list)
+        return is_collided
+
+    @inst.timed('cc_is_collided_many_seconds', checker='matrix')
+    def is_collided_many(self,
+                         cdelement_list,
+                         gl_pos_array,
+                         gl_rotmat_array,
+                         obstacle_list=[],
+                         otherrobot_list=[],
+                         toggle_stop_at_first=False):
+        """
+        see CollisionChecker.is_collided_many
+        :param cdelement_list: k cdlnks or cdobjs, all of them must be added to self
+        :param gl_pos_array: nxkx3 nparray
+        :param gl_rotmat_array: nxkx3x3 nparray
+        :return: 1xn bool nparray
+        """
+        nposes = gl_pos_array.shape[0]
+        result = np.zeros(nposes, dtype=bool)
+        inst.count('cc_checked_poses', nposes, checker='matrix')
+        if nposes == 0:
+            return result
+        self._attach_obstacles(obstacle_list, otherrobot_list)
+        ext_aabbs = self._get_ext_aabbs(obstacle_list, otherrobot_list)
+        childid_array, cur_gl_pos_array, cur_gl_rotmat_array, cdelement_info = self._get_cdelement_arrays()
+        element_ids = {id(cdelement): i for i, cdelement in enumerate(self.all_cdelements)}
+        moved_ids = [element_ids[id(cdelement)] for cdelement in cdelement_list]
+        for i in range(nposes):
+            cur_gl_pos_array[moved_ids] = gl_pos_array[i]
+            cur_gl_rotmat_array[moved_ids] = gl_rotmat_array[i]
+            if self._is_collided_at(childid_array, cur_gl_pos_array, cur_gl_rotmat_array, cdelement_info,
+                                    *ext_aabbs):
+                result[i] = True
+                if toggle_stop_at_first:
+                    result[i + 1:] = True
+                    break
+        self._detach_obstacles(obstacle_list, otherrobot_list)
+        self._update_cdnp_mats()
+        return result
+
+    def disable(self):
+        """
+        clear pairs and nodepath
+        :return:
+        """
+        super().disable()
+        self._pair_mat = np.zeros((0, 0), dtype=bool)
+        self._is_active = np.zeros(0, dtype=bool)
+        self._loc_center_array = np.zeros((0, 3))
+        self._loc_half_array = np.zeros((0, 3))
+        self._ctrav_list = []
+        self._cdelement_info = None
+
+
+class SphereCollisionChecker(MatrixCollisionChecker):
+    """
+    A collision checker that approximates the cd elements by their sphere trees (see modeling.spheretree)
+    The allowed self pairs and the active elements x obstacles are descended level by level as numpy broadcasts, for one
+    set of poses or for a batch of them, without the panda3d traverser. Only the node pairs whose spheres overlap are
+    expanded, and two overlapped leaves are a collision.
+    The obstacles whose cd primitive is a box are tested as oriented boxes, modeling.occupancygrid.OccupancyGrid
+    obstacles by looking up their voxels, and the other ones by their sphere trees; the cd elements of the other robots
+    are sphere trees at their current poses.
+    The pairs and the active elements are set in the same way as MatrixCollisionChecker.
+    """
+
+    def __init__(self, name="auto", batch_size=32, max_npairs=2048):
+        """
+        :param name:
+        :param batch_size: the number of poses tested at once by is_collided_many
+        :param max_npairs: the number of node pairs tested at once, see _descend_trees
+        """
+        super().__init__(name=name)
+        self.batch_size = batch_size
+        self.max_npairs = max_npairs
+        self._ext_trees_cache = [[], None]  # [objcm_list, stacked trees], the external trees of the last check
+
+    @staticmethod
+    def _get_stacked_trees(objcm_list):
+        """
+        the sphere trees of the given collision models in their local frames, stacked into flat arrays
+        the trees are padded to the same number of nodes m, node j of tree i is node i*m+j of the stacked arrays
+        :param objcm_list:
+        :return: [center_array (k*m)x3, radius_array 1x(k*m), children_array (k*m)x2, m], the children are stacked ids
+                 and the children of the leaves are -1
+        """
+        sphere_tree_list = [spt.get_sphere_tree(objcm) for objcm in objcm_list]
+        nnodes = max([len(sphere_tree) for sphere_tree in sphere_tree_list], default=1)
+        center_array = np.zeros((len(sphere_tree_list), nnodes, 3))
+        radius_array = np.zeros((len(sphere_tree_list), nnodes))
+        children_array = np.full((len(sphere_tree_list), nnodes, 2), -1, dtype=int)
+        for i, sphere_tree in enumerate(sphere_tree_list):
+            center_array[i, :len(sphere_tree)] = sphere_tree.center_array
+            radius_array[i, :len(sphere_tree)] = sphere_tree.radius_array
+            children_array[i, :len(sphere_tree)] = np.where(sphere_tree.children_array >= 0,
+                                                            sphere_tree.children_array + i * nnodes, -1)
+        return center_array.reshape(-1, 3), radius_array.ravel(), children_array.reshape(-1, 2), nnodes
+
+    @staticmethod
+    def _get_stacked_poses(gl_pos_array, gl_rotmat_array):
+        """
+        :param gl_pos_array: nxkx3
+        :param gl_rotmat_array: nxkx3x3
+        :return: (n*k)x12, the flattened rotmat and pos of element j at pose i are in row i*k+j
+        """
+        return np.concatenate((gl_rotmat_array.reshape(gl_pos_array.shape[:2] + (9,)), gl_pos_array),
+                              axis=2).reshape(-1, 12)
+
+    def _get_cdelement_arrays(self):
+        """
+        see MatrixCollisionChecker._get_cdelement_arrays, cdelement_info additionally holds the stacked sphere trees of
+        the cd elements, see _get_stacked_trees
+        """
+        childid_array, gl_pos_array, gl_rotmat_array, cdelement_info = super()._get_cdelement_arrays()
+        if 'trees' not in cdelement_info:
+            cdelement_info['trees'] = self._get_stacked_trees([cdelement['collisionmodel'] for cdelement in
+                                                               self.all_cdelements])
+        return childid_array, gl_pos_array, gl_rotmat_array, cdelement_info
+
+    def _get_ext_obstacles(self, obstacle_list, otherrobot_list):
+        """
+        :return: [ext_trees, ext_boxes, ext_grids], ext_trees are [stacked trees, stacked poses] of the obstacles and
+                 the cd elements of the other robots, see _get_stacked_trees and _get_stacked_poses,
+                 ext_boxes are [center_array bx3, rotmat_array bx3x3, half_array bx3],
+                 ext_grids are a list of OccupancyGrid
+                 either one is None if there is nothing in it
+        """
+        objcm_list = []
+        pos_list = []
+        rotmat_list = []
+        box_list = []
+        grid_list = []
+        for obstacle in obstacle_list:
+            if isinstance(obstacle, og.OccupancyGrid):
+                grid_list.append(obstacle)
+            elif obstacle.cdprimitive_type == 'box':
+                center, half = self._get_aabb(obstacle.cdnp.node().getSolid(0))
+                scale = np.abs(np.asarray(obstacle.get_scale()))
+                rotmat = obstacle.get_rotmat()
+                box_list.append([rotmat.dot(center * scale) + obstacle.get_pos(), rotmat, half * scale])
+            else:
+                objcm_list.append(obstacle)
+                pos_list.append(obstacle.get_pos())
+                rotmat_list.append(obstacle.get_rotmat())
+        for robot in otherrobot_list:
+            for cdelement in robot.cc.all_cdelements:
+                objcm_list.append(cdelement['collisionmodel'])
+                pos_list.append(cdelement['gl_pos'])
+                rotmat_list.append(cdelement['gl_rotmat'])
+        ext_trees = None
+        if len(objcm_list) > 0:
+            cached_objcm_list, stacked_trees = self._ext_trees_cache
+            if len(cached_objcm_list) != len(objcm_list) or \
+                    any(objcm is not cached_objcm for objcm, cached_objcm in zip(objcm_list, cached_objcm_list)):
+                stacked_trees = self._get_stacked_trees(objcm_list)
+                self._ext_trees_cache = [objcm_list, stacked_trees]
+            ext_trees = [stacked_trees,
+                         self._get_stacked_poses(np.array(pos_list, dtype=np.float64)[None],
+                                                 np.array(rotmat_list, dtype=np.float64)[None])]
+        ext_boxes = None
+        if len(box_list) > 0:
+            ext_boxes = [np.array(item, dtype=np.float64) for item in zip(*box_list)]
+        return ext_trees, ext_boxes, grid_list if len(grid_list) > 0 else None
+
+    @staticmethod
+    def _get_gl_spheres(trees, stacked_pose_array, pose_ids, node_ids):
+        """
+        :param trees: see _get_stacked_trees
+        :param stacked_pose_array: see _get_stacked_poses
+        :param pose_ids: 1xm, the rows of stacked_pose_array
+        :param node_ids: 1xm, the stacked node ids
+        :return: [center_array mx3, radius_array 1xm]
+        """
+        pose_array = stacked_pose_array[pose_ids]
+        center_array = np.einsum('mij,mj->mi', pose_array[:, :9].reshape(-1, 3, 3), trees[0][node_ids])
+        return center_array + pose_array[:, 9:], trees[1][node_ids]
+
+    def _descend_trees(self, result, trees0, stacked_pose_array0, trees1, stacked_pose_array1, pose_ids, pose_ids0,
+                       node_ids0, pose_ids1, node_ids1):
+        """
+        descend the pairs of nodes, the poses that have two overlapped leaves are set in result
+        both nodes of an overlapped pair are replaced by their children, a leaf stays as it is
+        the pairs are descended depth first in chunks of at most self.max_npairs, so that a deep overlap ends at its
+        first pair of leaves instead of expanding all of its pairs
+        :param result: 1xn bool nparray, the poses that are already collided are skipped
+        :param trees0: see _get_stacked_trees
+        :param stacked_pose_array0: see _get_stacked_poses
+        :param pose_ids: 1xm, the poses of the pairs, they index result
+        :param pose_ids0: 1xm, the rows of stacked_pose_array0
+        :param node_ids0: 1xm, the stacked node ids in trees0, e.g. the roots
+        :return:
+        """
+        stack = [(pose_ids, pose_ids0, node_ids0, pose_ids1, node_ids1)]
+        while len(stack) > 0:
+            pose_ids, pose_ids0, node_ids0, pose_ids1, node_ids1 = stack.pop()
+            if len(pose_ids) > self.max_npairs:
+                nhalf = len(pose_ids) // 2
+                stack.append(tuple(array[nhalf:] for array in (pose_ids, pose_ids0, node_ids0, pose_ids1, node_ids1)))
+                stack.append(tuple(array[:nhalf] for array in (pose_ids, pose_ids0, node_ids0, pose_ids1, node_ids1)))
+                continue
+            center_array0, radius_array0 = self._get_gl_spheres(trees0, stacked_pose_array0, pose_ids0, node_ids0)
+            center_array1, radius_array1 = self._get_gl_spheres(trees1, stacked_pose_array1, pose_ids1, node_ids1)
+            diff = center_array0 - center_array1
+            is_overlapped = (np.einsum('mi,mi->m', diff, diff) < (radius_array0 + radius_array1) ** 2) & \
+                            ~result[pose_ids]
+            pose_ids, pose_ids0, pose_ids1 = pose_ids[is_overlapped], pose_ids0[is_overlapped], pose_ids1[is_overlapped]
+            node_ids0, node_ids1 = node_ids0[is_overlapped], node_ids1[is_overlapped]
+            children0 = trees0[2][node_ids0]
+            children1 = trees1[2][node_ids1]
+            is_leaf0 = children0[:, 0] < 0
+            is_leaf1 = children1[:, 0] < 0
+            result[pose_ids[is_leaf0 & is_leaf1]] = True
+            children0[is_leaf0, 0] = node_ids0[is_leaf0]
+            children1[is_leaf1, 0] = node_ids1[is_leaf1]
+            pair_ids, child_ids0, child_ids1 = np.nonzero((children0[:, :, None] >= 0) & (children1[:, None, :] >= 0) &
+                                                          ~result[pose_ids, None, None])
+            if len(pair_ids) > 0:
+                stack.append((pose_ids[pair_ids], pose_ids0[pair_ids], children0[pair_ids, child_ids0],
+                              pose_ids1[pair_ids], children1[pair_ids, child_ids1]))
+
+    def _descend_boxes(self, result, trees, stacked_pose_array, boxes, pose_ids, pose_ids0, node_ids, box_ids):
+        """
+        descend the nodes against oriented boxes, see _descend_trees
+        :param boxes: [center_array bx3, rotmat_array bx3x3, half_array bx3]
+        :param box_ids: 1xm
+        :return:
+        """
+        box_center_array, box_rotmat_array, box_half_array = boxes
+        stack = [(pose_ids, pose_ids0, node_ids, box_ids)]
+        while len(stack) > 0:
+            pose_ids, pose_ids0, node_ids, box_ids = stack.pop()
+            if len(pose_ids) > self.max_npairs:
+                nhalf = len(pose_ids) // 2
+                stack.append(tuple(array[nhalf:] for array in (pose_ids, pose_ids0, node_ids, box_ids)))
+                stack.append(tuple(array[:nhalf] for array in (pose_ids, pose_ids0, node_ids, box_ids)))
+                continue
+            center_array, radius_array = self._get_gl_spheres(trees, stacked_pose_array, pose_ids0, node_ids)
+            loc_center_array = np.einsum('mji,mj->mi', box_rotmat_array[box_ids],
+                                         center_array - box_center_array[box_ids])
+            half_array = box_half_array[box_ids]
+            diff = loc_center_array - np.clip(loc_center_array, -half_array, half_array)
+            is_overlapped = (np.einsum('mi,mi->m', diff, diff) < radius_array ** 2) & ~result[pose_ids]
+            pose_ids, pose_ids0, box_ids = pose_ids[is_overlapped], pose_ids0[is_overlapped], box_ids[is_overlapped]
+            children = trees[2][node_ids[is_overlapped]]
+            is_leaf = children[:, 0] < 0
+            result[pose_ids[is_leaf]] = True
+            pair_ids, child_ids = np.nonzero(~is_leaf[:, None] & ~result[pose_ids, None])
+            if len(pair_ids) > 0:
+                stack.append((pose_ids[pair_ids], pose_ids0[pair_ids], children[pair_ids, child_ids],
+                              box_ids[pair_ids]))
+
+    def _descend_grids(self, result, trees, stacked_pose_array, grid_list, pose_ids, pose_ids0, node_ids, grid_ids):
+        """
+        descend the nodes against occupancy grids, see _descend_trees
+        the inner nodes are tested against the cells of about their sizes, and the leaves against the voxels
+        :param grid_list: a list of OccupancyGrid
+        :param grid_ids: 1xm
+        :return:
+        """
+        stack = [(pose_ids, pose_ids0, node_ids, grid_ids)]
+        while len(stack) > 0:
+            pose_ids, pose_ids0, node_ids, grid_ids = stack.pop()
+            if len(pose_ids) > self.max_npairs:
+                nhalf = len(pose_ids) // 2
+                stack.append(tuple(array[nhalf:] for array in (pose_ids, pose_ids0, node_ids, grid_ids)))
+                stack.append(tuple(array[:nhalf] for array in (pose_ids, pose_ids0, node_ids, grid_ids)))
+                continue
+            center_array, radius_array = self._get_gl_spheres(trees, stacked_pose_array, pose_ids0, node_ids)
+            children = trees[2][node_ids]
+            is_leaf = children[:, 0] < 0
+            is_overlapped = np.zeros(len(pose_ids), dtype=bool)
+            for grid_id, grid in enumerate(grid_list):
+                for toggle_exact in (True, False):
+                    ids = np.nonzero((grid_ids == grid_id) & (is_leaf == toggle_exact))[0]
+                    is_overlapped[ids] = grid.are_spheres_occupied(center_array[ids], radius_array[ids],
+                                                                   toggle_exact=toggle_exact)
+            is_overlapped &= ~result[pose_ids]
+            result[pose_ids[is_overlapped & is_leaf]] = True
+            pair_ids, child_ids = np.nonzero((is_overlapped & ~is_leaf)[:, None] & ~result[pose_ids, None])
+            if len(pair_ids) > 0:
+                stack.append((pose_ids[pair_ids], pose_ids0[pair_ids], children[pair_ids, child_ids],
+                              grid_ids[pair_ids]))
+
+    def _are_collided_at(self, gl_pos_array, gl_rotmat_array, cdelement_info, ext_trees, ext_boxes, ext_grids):
+        """
+        :param gl_pos_array: nxkx3, the poses of the k cd elements of _get_cdelement_arrays
+        :param gl_rotmat_array: nxkx3x3
+        :param cdelement_info: see _get_cdelement_arrays
+        :param ext_trees: see _get_ext_obstacles
+        :param ext_boxes:
+        :param ext_grids:
+        :return: 1xn bool nparray
+        """
+        nposes, nelements = gl_pos_array.shape[:2]
+        result = np.zeros(nposes, dtype=bool)
+        trees = cdelement_info['trees']
+        nnodes = trees[3]
+        stacked_pose_array = self._get_stacked_poses(gl_pos_array, gl_rotmat_array)
+        # allowed self pairs
+        id_array0, id_array1 = cdelement_info['pair_ids']
+        if len(id_array0) > 0:
+            pose_ids = np.repeat(np.arange(nposes), len(id_array0))
+            ids0, ids1 = np.tile(id_array0, nposes), np.tile(id_array1, nposes)
+            self._descend_trees(result, trees, stacked_pose_array, trees, stacked_pose_array, pose_ids,
+                                pose_ids * nelements + ids0, ids0 * nnodes, pose_ids * nelements + ids1, ids1 * nnodes)
+        # active elements x external trees and boxes
+        active_ids = cdelement_info['active_ids']
+        if ext_trees is not None and len(active_ids) > 0:
+            ext_stacked_trees, ext_stacked_pose_array = ext_trees
+            pose_ids, active_id_array, ext_ids = np.nonzero(
+                np.ones((nposes, len(active_ids), len(ext_stacked_pose_array)), dtype=bool))
+            ids = active_ids[active_id_array]
+            self._descend_trees(result, trees, stacked_pose_array, ext_stacked_trees, ext_stacked_pose_array, pose_ids,
+                                pose_ids * nelements + ids, ids * nnodes, ext_ids, ext_ids * ext_stacked_trees[3])
+        if ext_boxes is not None and len(active_ids) > 0:
+            pose_ids, active_id_array, box_ids = np.nonzero(
+                np.ones((nposes, len(active_ids), len(ext_boxes[0])), dtype=bool))
+            ids = active_ids[active_id_array]
+            self._descend_boxes(result, trees, stacked_pose_array, ext_boxes, pose_ids, pose_ids * nelements + ids,
+                                ids * nnodes, box_ids)
+        if ext_grids is not None and len(active_ids) > 0:
+            pose_ids, active_id_array, grid_ids = np.nonzero(
+                np.ones((nposes, len(active_ids), len(ext_grids)), dtype=bool))
+            ids = active_ids[active_id_array]
+            self._descend_grids(result, trees, stacked_pose_array, ext_grids, pose_ids, pose_ids * nelements + ids,
+                                ids * nnodes, grid_ids)
+        return result
+
+    @inst.timed('cc_is_collided_seconds', checker='sphere')
+    def is_collided(self, obstacle_list=[], otherrobot_list=[]):
+        """
+        :param obstacle_list: collision models or occupancy grids
+        :param otherrobot_list:
+        :return:
+        """
+        _, gl_pos_array, gl_rotmat_array, cdelement_info = self._get_cdelement_arrays()
+        ext_obstacles = self._get_ext_obstacles(obstacle_list, otherrobot_list)
+        return bool(self._are_collided_at(gl_pos_array[None], gl_rotmat_array[None], cdelement_info,
+                                          *ext_obstacles)[0])
+
+    @inst.timed('cc_is_collided_many_seconds', checker='sphere')
+    def is_collided_many(self,
+                         cdelement_list,
+                         gl_pos_array,
+                         gl_rotmat_array,
+                         obstacle_list=[],
+                         otherrobot_list=[],
+                         toggle_stop_at_first=False):
+        """
+        see CollisionChecker.is_collided_many, the poses are tested self.batch_size at a time
+        :param cdelement_list: k cdlnks or cdobjs, all of them must be added to self
+        :param gl_pos_array: nxkx3 nparray
+        :param gl_rotmat_array: nxkx3x3 nparray
+        :return: 1xn bool nparray
+        """
+        nposes = gl_pos_array.shape[0]
+        result = np.zeros(nposes, dtype=bool)
+        inst.count('cc_checked_poses', nposes, checker='sphere')
+        if nposes == 0:
+            return result
+        ext_obstacles = self._get_ext_obstacles(obstacle_list, otherrobot_list)
+        _, cur_gl_pos_array, cur_gl_rotmat_array, cdelement_info = self._get_cdelement_arrays()
+        element_ids = {id(cdelement): i for i, cdelement in enumerate(self.all_cdelements)}
+        moved_ids = [element_ids[id(cdelement)] for cdelement in cdelement_list]
+        for start in range(0, nposes, self.batch_size):
+            end = min(start + self.batch_size, nposes)
+            batch_gl_pos_array = np.repeat(cur_gl_pos_array[None], end - start, axis=0)
+            batch_gl_rotmat_array = np.repeat(cur_gl_rotmat_array[None], end - start, axis=0)
+            batch_gl_pos_array[:, moved_ids] = gl_pos_array[start:end]
+            batch_gl_rotmat_array[:, moved_ids] = gl_rotmat_array[start:end]
+            result[start:end] = self._are_collided_at(batch_gl_pos_array, batch_gl_rotmat_array, cdelement_info,
+                                                      *ext_obstacles)
+            if toggle_stop_at_first and np.any(result[start:end]):
+                result[end:] = True
+                break
+        return result
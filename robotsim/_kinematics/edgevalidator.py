@@ -0,0 +1,162 @@
+import numpy as np
+import basis.data_adapter as da
+
+
+def gen_bisection_levels(nsteps):
+    """
+    the inner points 1, ..., nsteps-1 of nsteps equal steps in bisection order
+    :param nsteps:
+    :return: a list of id nparrays, the middle point first, then the middles of the two halves, ...
+    """
+    level_list = []
+    interval_list = [(0, nsteps)]
+    while len(interval_list) > 0:
+        id_list = []
+        next_interval_list = []
+        for start, end in interval_list:
+            if end - start < 2:
+                continue
+            middle = (start + end) // 2
+            id_list.append(middle)
+            next_interval_list += [(start, middle), (middle, end)]
+        if len(id_list) > 0:
+            level_list.append(np.array(id_list))
+        interval_list = next_interval_list
+    return level_list
+
+
+class EdgeValidator(object):
+    """
+    Edge checking with a bound on the displacement of the links
+    Along the straight joint-space edge between two configurations, no point of the cd elements moved by a component
+    travels further than sum(lipschitz*|conf1-conf0|). lipschitz is the distance from a revolute joint to the farthest
+    point it moves (1 for prismatic joints), bounded along the chain so that it holds at any configuration.
+    An edge is split into the fewest equal steps whose displacement bound is at most resolution, and the steps are
+    checked in bisection order (the middle first, then the quarters, ...) so that colliding edges exit early.
+    Every point of the robot between two checked configurations is within resolution/2 of one of them, so obstacles
+    thicker than resolution cannot be missed, and long edges of the wrist joints need fewer checks than those of the
+    base joints.
+    NOTE: Panda3D reports no distances, the number of checks adapts to the link displacement, not to the clearance
+    """
+
+    def __init__(self, resolution=.02):
+        """
+        :param resolution: the maximum displacement of the links between two checked configurations, in meter
+        """
+        if resolution <= 0:
+            raise ValueError("The resolution must be positive!")
+        self.resolution = resolution
+        self.ncdchecks = 0
+        self._lipschitz_dict = {}
+
+    def get_lipschitz(self, robot_instance, component_name):
+        """
+        the bounds are computed once per component and per set of cd elements (e.g. after holding an object)
+        :param robot_instance:
+        :param component_name: a component, or a list of components whose configurations are stacked
+        :return: 1xndof nparray
+        """
+        if isinstance(component_name, (list, tuple)):
+            return np.concatenate([self.get_lipschitz(robot_instance, name) for name in component_name])
+        if robot_instance.cc is None or component_name not in robot_instance.manipulator_dict:
+            raise ValueError("The edge validator needs an enabled cc and a component in manipulator_dict!")
+        key = (component_name, tuple(id(cdelement) for cdelement in robot_instance.cc.all_cdelements))
+        if key not in self._lipschitz_dict:
+            self._lipschitz_dict[key] = self._compute_lipschitz(robot_instance, component_name)
+        return self._lipschitz_dict[key]
+
+    def _compute_lipschitz(self, robot_instance, component_name):
+        manipulator = robot_instance.manipulator_dict[component_name]
+        jnt_values_bk = robot_instance.get_jnt_values(component_name)
+        cdelement_list = robot_instance.cc.all_cdelements
+        # the bounding spheres of the cd elements at the current configuration
+        center_list = []
+        radius_list = []
+        for cdelement in cdelement_list:
+            bounds = robot_instance.cc.np.getChild(cdelement['cdprimit_childid']).node().getBounds()
+            loc_center = da.pdv3_to_npv3(bounds.getCenter()) if not bounds.isEmpty() else np.zeros(3)
+            center_list.append(cdelement['gl_pos'] + cdelement['gl_rotmat'].dot(loc_center))
+            radius_list.append(bounds.getRadius() if not bounds.isEmpty() else 0.0)
+        pose_list = [(cdelement['gl_pos'], cdelement['gl_rotmat']) for cdelement in cdelement_list]
+        jnt_pos_list = [manipulator.jnts[jnt_id]['gl_posq'] for jnt_id in manipulator.tgtjnts]
+        # the cd elements moved by each joint
+        moved_list = []
+        for i in range(len(jnt_values_bk)):
+            jnt_values = np.array(jnt_values_bk, dtype=np.float64)
+            jnt_values[i] += .1
+            robot_instance.fk(component_name, jnt_values)
+            moved_list.append({id for id, (cdelement, (pos, rotmat)) in enumerate(zip(cdelement_list, pose_list))
+                               if not (np.allclose(cdelement['gl_pos'], pos) and
+                                       np.allclose(cdelement['gl_rotmat'], rotmat))})
+        robot_instance.fk(component_name, jnt_values_bk)
+        # reach: the distance from a joint to the farthest point it moves, from the last joint to the first one
+        ndof = len(jnt_values_bk)
+        reach_array = np.zeros(ndof)
+        lipschitz = np.ones(ndof)
+        for i in range(ndof - 1, -1, -1):
+            rigid_id_set = moved_list[i] - moved_list[i + 1] if i < ndof - 1 else moved_list[i]
+            reach = max([np.linalg.norm(center_list[id] - jnt_pos_list[i]) + radius_list[id]
+                         for id in rigid_id_set], default=0.0)
+            if i < ndof - 1:
+                next_jnt = manipulator.jnts[manipulator.tgtjnts[i + 1]]
+                offset = np.linalg.norm(jnt_pos_list[i + 1] - jnt_pos_list[i])
+                if next_jnt['type'] == 'prismatic':
+                    offset += next_jnt['motion_rng'][1] - next_jnt['motion_rng'][0]
+                reach = max(reach, offset + reach_array[i + 1])
+            reach_array[i] = reach
+            if manipulator.jnts[manipulator.tgtjnts[i]]['type'] != 'prismatic':
+                lipschitz[i] = reach
+        return lipschitz
+
+    def get_displacement_bound(self, robot_instance, component_name, conf0, conf1):
+        """
+        :return: the maximum displacement of the links moving from conf0 to conf1, in meter
+        """
+        return float(self.get_lipschitz(robot_instance, component_name).dot(np.abs(np.asarray(conf1) -
+                                                                                     np.asarray(conf0))))
+
+    def is_edge_collided(self,
+                         robot_instance,
+                         component_name,
+                         conf0,
+                         conf1,
+                         obstacle_list=[],
+                         otherrobot_list=[]):
+        """
+        check the configurations between conf0 and conf1, the two ends are excluded
+        :return:
+        """
+        conf0 = np.asarray(conf0, dtype=np.float64)
+        conf1 = np.asarray(conf1, dtype=np.float64)
+        nsteps = int(np.ceil(self.get_displacement_bound(robot_instance, component_name, conf0, conf1) /
+                             self.resolution))
+        if nsteps <= 1:
+            return False
+        for id_array in gen_bisection_levels(nsteps):
+            conf_array = conf0 + (id_array / nsteps)[:, None] * (conf1 - conf0)
+            self.ncdchecks += len(conf_array)
+            if np.any(robot_instance.is_collided_many(component_name,
+                                                      conf_array,
+                                                      obstacle_list=obstacle_list,
+                                                      otherrobot_list=otherrobot_list,
+                                                      toggle_stop_at_first=True)):
+                return True
+        return False
+
+
+if __name__ == '__main__':
+    import time
+    import robotsim.robots.yumi.yumi as ym
+    import modeling.collisionmodel as cm
+
+    robot_instance = ym.Yumi(enable_cc=True)
+    edge_validator = EdgeValidator(resolution=.01)
+    print("lipschitz", edge_validator.get_lipschitz(robot_instance, 'lft_arm'))
+    thin_obstacle = cm.gen_box(extent=np.array([.6, .6, .005]))
+    thin_obstacle.set_pos(np.array([.4, .2, .3]))
+    conf0 = robot_instance.get_jnt_values('lft_arm')
+    conf1 = np.radians(np.array([-20, -60, 40, 10, 40, 30, 0]))
+    tic = time.time()
+    is_collided = edge_validator.is_edge_collided(robot_instance, 'lft_arm', conf0, conf1, [thin_obstacle])
+    toc = time.time()
+    print(is_collided, toc - tic, "checks", edge_validator.ncdchecks)
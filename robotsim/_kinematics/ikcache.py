@@ -0,0 +1,178 @@
+import os
+import math
+import collections
+import numpy as np
+import basis.robot_math as rm
+
+
+class IKCache(object):
+    """
+    Memoized ik solutions keyed on discretized poses
+    A key consists of the component name, the local minima option, the discretized base pose and tcp of the
+    component, and the discretized target pose. Each key (a cell) keeps the exact poses of its last query (target,
+    base, and tcp) and the solution (None for a known failure).
+    A query whose exact poses match the stored ones returns the stored result; any other query that falls in the
+    same cell gets the stored solution as a warm seed. The least recently used cells in memory are evicted once
+    there are more than max_nentries of them.
+    The entries loaded from a saved directory stay memory mapped and are only copied into memory when they are used.
+    """
+
+    def __init__(self, pos_res=.005, agl_res=math.radians(2), max_nentries=100000, seed_tol=math.pi / 4):
+        """
+        :param pos_res: resolution of the discretized positions, in meter
+        :param agl_res: resolution of the discretized rotation vectors, in radian
+        :param max_nentries: the memory bound of the entries in memory, each entry takes about (36+ndof)*8 bytes
+                             plus the key
+        :param seed_tol: a stored solution is returned to a seeded query only if it is within seed_tol
+                         (maximum joint difference) of the seed, so that seeded queries keep their branches
+        """
+        self.pos_res = pos_res
+        self.agl_res = agl_res
+        self.max_nentries = max_nentries
+        self.seed_tol = seed_tol
+        self._entries = collections.OrderedDict()  # key: (exact_pose 1x36 nparray, jnt_values or None)
+        self._loaded_ids = {}  # key: row of the memory mapped arrays, see load
+        self._loaded_arrays = None  # [exact_poses, ndofs, jnt_values_array], memory mapped
+        self.nhits = 0
+        self.nmisses = 0
+
+    def __len__(self):
+        return len(self._entries) + len(self._loaded_ids)
+
+    def _discretize(self, pos, rotmat):
+        rotvec = rm.deltaw_between_rotmat(np.eye(3), rotmat)
+        return tuple(np.round(np.asarray(pos) / self.pos_res).astype(int).tolist()) + \
+               tuple(np.round(rotvec / self.agl_res).astype(int).tolist())
+
+    def gen_key(self, component_name, tgt_pos, tgt_rotmat, base_pos, base_rotmat, tcp_jntid, tcp_loc_pos,
+                tcp_loc_rotmat, local_minima="accept"):
+        """
+        :return: a hashable tuple
+        """
+        return (component_name, local_minima) + \
+               self._discretize(base_pos, base_rotmat) + \
+               (int(tcp_jntid),) + self._discretize(tcp_loc_pos, tcp_loc_rotmat) + \
+               self._discretize(tgt_pos, tgt_rotmat)
+
+    @staticmethod
+    def gen_exact_pose(tgt_pos, tgt_rotmat, base_pos, base_rotmat, tcp_loc_pos, tcp_loc_rotmat):
+        """
+        the undiscretized poses of a query, an exact hit needs all of them to match
+        :return: 1x36 nparray
+        """
+        return np.concatenate([np.asarray(value, dtype=np.float64).ravel() for value in
+                               (tgt_pos, tgt_rotmat, base_pos, base_rotmat, tcp_loc_pos, tcp_loc_rotmat)])
+
+    def _get_entry(self, key):
+        """
+        the entry of a key in memory, an entry in the memory mapped arrays is copied into memory first
+        :return: (exact_pose, jnt_values) or None
+        """
+        if key in self._loaded_ids:
+            exact_poses, ndofs, jnt_values_array = self._loaded_arrays
+            row = self._loaded_ids.pop(key)
+            jnt_values = None if ndofs[row] == 0 else np.array(jnt_values_array[row, :ndofs[row]])
+            self._put_entry(key, (np.array(exact_poses[row]), jnt_values))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _put_entry(self, key, entry):
+        self._loaded_ids.pop(key, None)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_nentries:
+            self._entries.popitem(last=False)
+
+    def get(self, key, exact_pose, seed_conf=None):
+        """
+        :param key: see gen_key
+        :param exact_pose: see gen_exact_pose
+        :param seed_conf: the seed of the query, None if not seeded
+        :return: [is_hit, jnt_values, warm_seed]
+                 is_hit is True if jnt_values (None for a known failure) could be returned directly,
+                 otherwise warm_seed is the solution of a nearby query (or None)
+        """
+        entry = self._get_entry(key)
+        if entry is None:
+            self.nmisses += 1
+            return False, None, None
+        stored_exact_pose, jnt_values = entry
+        if np.allclose(stored_exact_pose, exact_pose, rtol=0, atol=1e-9):
+            if jnt_values is None:
+                if seed_conf is None:
+                    self.nhits += 1
+                    return True, None, None
+            elif seed_conf is None or np.max(np.abs(jnt_values - seed_conf)) <= self.seed_tol:
+                self.nhits += 1
+                return True, jnt_values.copy(), None
+        self.nmisses += 1
+        return False, None, None if jnt_values is None else jnt_values.copy()
+
+    def put(self, key, exact_pose, jnt_values):
+        """
+        :param key: see gen_key
+        :param exact_pose: see gen_exact_pose
+        :param jnt_values: the ik solution, None for a failure
+        :return:
+        """
+        self._put_entry(key, (np.array(exact_pose, dtype=np.float64),
+                              None if jnt_values is None else np.array(jnt_values, dtype=np.float64)))
+
+    def clear(self):
+        self._entries.clear()
+        self._loaded_ids = {}
+        self._loaded_arrays = None
+        self.nhits = 0
+        self.nmisses = 0
+
+    def save(self, path):
+        """
+        save the entries in memory and the loaded ones as .npy files in the directory path, see load
+        the files are replaced as a whole, so that a directory can be saved while it is memory mapped
+        :param path: a directory
+        :return:
+        """
+        if not os.path.exists(path):
+            os.makedirs(path)
+        key_list = list(self._loaded_ids) + list(self._entries)
+        entry_list = [(self._loaded_arrays[0][row],
+                       None if self._loaded_arrays[1][row] == 0 else
+                       self._loaded_arrays[2][row, :self._loaded_arrays[1][row]])
+                      for row in self._loaded_ids.values()] + list(self._entries.values())
+        nentries = len(key_list)
+        ndofs = np.array([0 if entry[1] is None else len(entry[1]) for entry in entry_list], dtype=np.int32)
+        jnt_values_array = np.full((nentries, max(ndofs, default=0)), np.nan)
+        for i, entry in enumerate(entry_list):
+            if entry[1] is not None:
+                jnt_values_array[i, :ndofs[i]] = entry[1]
+        array_dict = {"names": np.array([key[0] for key in key_list], dtype=str),
+                      "local_minimas": np.array([key[1] for key in key_list], dtype=str),
+                      "int_keys": np.array([key[2:] for key in key_list], dtype=np.int64).reshape(nentries, -1),
+                      "exact_poses": np.array([entry[0] for entry in entry_list]).reshape(nentries, 36),
+                      "ndofs": ndofs,
+                      "jnt_values": jnt_values_array}
+        for name, array in array_dict.items():
+            file_path = os.path.join(path, name + ".npy")
+            np.save(file_path + ".tmp.npy", array)
+            os.replace(file_path + ".tmp.npy", file_path)
+
+    def load(self, path):
+        """
+        use the entries saved in the directory path, they are memory mapped and copied into memory once they are used
+        the entries in memory take precedence over the loaded ones, a previously loaded directory is replaced
+        :param path: a directory
+        :return:
+        """
+        names = np.load(os.path.join(path, "names.npy"))
+        local_minimas = np.load(os.path.join(path, "local_minimas.npy"))
+        int_keys = np.load(os.path.join(path, "int_keys.npy"), mmap_mode='r')
+        self._loaded_arrays = [np.load(os.path.join(path, "exact_poses.npy"), mmap_mode='r'),
+                               np.load(os.path.join(path, "ndofs.npy"), mmap_mode='r'),
+                               np.load(os.path.join(path, "jnt_values.npy"), mmap_mode='r')]
+        self._loaded_ids = {}
+        for row in range(len(names)):
+            key = (str(names[row]), str(local_minimas[row])) + tuple(int_keys[row].tolist())
+            if key not in self._entries:
+                self._loaded_ids[key] = row
@@ -2,8 +2,10 @@ import math
 import copy
 import numpy as np
 import basis.robot_math as rm
+import basis.instrumentation as inst
 import robotsim._kinematics.jlchainmesh as jlm
 import robotsim._kinematics.jlchainik as jlik
+import robotsim._kinematics.jlchainfk as jlfk
 
 
 class JLChain(object):
@@ -44,6 +46,7 @@ class JLChain(object):
         # initialize joints and links
         self.lnks, self.jnts = self._init_jlchain()
         self.tgtjnts = range(1, self.ndof + 1)
+        self._fkt = jlfk.JLChainFK(self) # t = tool
         self.goto_homeconf()
         # default tcp
         self.tcp_jntid = -1
@@ -96,6 +99,8 @@ class JLChain(object):
             jnts[id]['gl_posq'] = jnts[id]['gl_pos0']  # to be updated by self._update_fk
             jnts[id]['gl_rotmatq'] = jnts[id]['gl_rotmat0']  # to be updated by self._update_fk
             jnts[id]['motion_rng'] = [-math.pi, math.pi] # min, max
+            jnts[id]['motion_vel'] = math.pi  # max speed, rad/s or m/s
+            jnts[id]['motion_acc'] = 2 * math.pi  # max acceleration, rad/s^2 or m/s^2
             # jnts[id]['rngmin'] = -math.pi
             # jnts[id]['rngmax'] = +math.pi
             jnts[id]['motion_val'] = 0
@@ -112,43 +117,12 @@ class JLChain(object):
         Update the kinematics
         Note that this function should not be called explicitly
         It is called automatically by functions like movexxx
+        The computation is delegated to the array-backed self._fkt, the dict view is updated in place
         :return: updated links and joints
         author: weiwei
         date: 20161202, 20201009osaka
         """
-        id = 0
-        while id != -1:
-            # update joint values
-            pjid = self.jnts[id]['parent']
-            if pjid == -1:
-                self.jnts[id]['gl_pos0'] = self.pos
-                self.jnts[id]['gl_rotmat0'] = self.rotmat
-            else:
-                self.jnts[id]['gl_pos0'] = self.jnts[pjid]['gl_posq'] + np.dot(self.jnts[pjid]['gl_rotmatq'],
-                                                                               self.jnts[id]['loc_pos'])
-                self.jnts[id]['gl_rotmat0'] = np.dot(self.jnts[pjid]['gl_rotmatq'], self.jnts[id]['loc_rotmat'])
-            self.jnts[id]['gl_motionax'] = np.dot(self.jnts[id]['gl_rotmat0'], self.jnts[id]['loc_motionax'])
-            if self.jnts[id]['type'] == "end":
-                self.jnts[id]['gl_rotmatq'] = self.jnts[id]['gl_rotmat0']
-                self.jnts[id]['gl_posq'] = self.jnts[id]['gl_pos0']
-            elif self.jnts[id]['type'] == "revolute":
-                self.jnts[id]['gl_rotmatq'] = np.dot(self.jnts[id]['gl_rotmat0'],
-                                                     rm.rotmat_from_axangle(self.jnts[id]['loc_motionax'],
-                                                                            self.jnts[id]['motion_val']))
-                self.jnts[id]['gl_posq'] = self.jnts[id]['gl_pos0']
-            elif self.jnts[id]['type'] == "prismatic":
-                self.jnts[id]['gl_rotmatq'] = self.jnts[id]['gl_rotmat0']
-                tmp_translation = np.dot(self.jnts[id]['gl_rotmatq'],
-                                         self.jnts[id]['loc_motionax'] * self.jnts[id]['motion_val'])
-                self.jnts[id]['gl_posq'] = self.jnts[id]['gl_pos0'] + tmp_translation
-            # update link values, child link id = id
-            if id < self.ndof + 1:
-                self.lnks[id]['gl_pos'] = np.dot(self.jnts[id]['gl_rotmatq'], self.lnks[id]['loc_pos']) + \
-                                          self.jnts[id]['gl_posq']
-                self.lnks[id]['gl_rotmat'] = np.dot(self.jnts[id]['gl_rotmatq'], self.lnks[id]['loc_rotmat'])
-                # self.lnks[id]['cdprimit_cache'][0] = True
-            id = self.jnts[id]['child']
-        return self.lnks, self.jnts
+        return self._fkt.fk()
 
     @property
     def homeconf(self):
@@ -184,6 +158,7 @@ class JLChain(object):
         author: weiwei
         date: 20201126
         """
+        self._fkt.update_params()
         self.goto_homeconf()
         if cdprimitive_type is None: # use previously set values if none
             cdprimitive_type = self.cdprimitive_type
@@ -226,6 +201,19 @@ class JLChain(object):
             jnt_limits.append([self.jnts[id]['motion_rng'][0], self.jnts[id]['motion_rng'][1]])
         return jnt_limits
 
+    def get_jnt_vel_limits(self):
+        """
+        :return: 1xn nparray, the max speeds of the target joints
+        """
+        return np.array([self.jnts[id]['motion_vel'] for id in self.tgtjnts])
+
+    def get_jnt_acc_limits(self):
+        """
+        :return: 1xn nparray, the max accelerations of the target joints
+        """
+        return np.array([self.jnts[id]['motion_acc'] for id in self.tgtjnts])
+
+    @inst.timed('jlchain_fk_seconds')
     def fk(self, jnt_values=None):
         """
         move the joints using forward kinematics
@@ -234,12 +222,18 @@ class JLChain(object):
         author: weiwei
         date: 20161205, 20201009osaka
         """
-        if jnt_values is not None:
-            counter = 0
-            for id in self.tgtjnts:
-                self.jnts[id]['motion_val'] = jnt_values[counter]
-                counter += 1
-        self._update_fk()
+        self._fkt.fk(jnt_values=jnt_values)
+
+    @inst.timed('jlchain_fk_many_seconds')
+    def fk_many(self, jnt_values_array, toggle_jnts=False):
+        """
+        vectorized forward kinematics for a batch of configurations
+        the dict view (self.jnts, self.lnks) is not changed
+        :param jnt_values_array: nxndof nparray, each row is a configuration
+        :param toggle_jnts: return the global poses of the joints as well if True
+        :return: [lnk_gl_pos nx(ndof+1)x3, lnk_gl_rotmat nx(ndof+1)x3x3], see JLChainFK.fk_many for toggle_jnts
+        """
+        return self._fkt.fk_many(jnt_values_array, toggle_jnts=toggle_jnts)
 
     def goto_homeconf(self):
         """
@@ -393,6 +387,33 @@ class JLChain(object):
                                 local_minima=local_minima,
                                 toggle_debug=toggle_debug)
 
+    def num_ik_batch(self,
+                     tgt_pos_array,
+                     tgt_rotmat_array,
+                     seeds=None,
+                     tcp_jntid=None,
+                     tcp_loc_pos=None,
+                     tcp_loc_rotmat=None,
+                     max_niter=100):
+        """
+        Batched numerical IK, many targets and many seeds are solved together, see JLChainIK.num_ik_batch
+        :param tgt_pos_array: nx3 nparray
+        :param tgt_rotmat_array: nx3x3 nparray
+        :param seeds: mxndof nparray shared by all targets, or nxmxndof nparray, self.homeconf will be used if None
+        :param tcp_jntid: a joint ID in the self.tgtjnts
+        :param tcp_loc_pos: 1x3 nparray, decribed in the local frame of self.jnts[tcp_jntid]
+        :param tcp_loc_rotmat: 3x3 nparray, decribed in the local frame of self.jnts[tcp_jntid]
+        :param max_niter:
+        :return: [jnt_values_array nxndof nparray, is_solved 1xn bool nparray]
+        """
+        return self._ikt.num_ik_batch(tgt_pos_array=tgt_pos_array,
+                                      tgt_rotmat_array=tgt_rotmat_array,
+                                      seeds=seeds,
+                                      tcp_jntid=tcp_jntid,
+                                      tcp_loc_pos=tcp_loc_pos,
+                                      tcp_loc_rotmat=tcp_loc_rotmat,
+                                      max_niter=max_niter)
+
     def cvt_loc_intcp_to_gl(self,
                             loc_pos=np.zeros(3),
                             loc_rotmat=np.eye(3),
@@ -0,0 +1,309 @@
+import math
+import numpy as np
+
+
+def _rotmat_many(ax, angles):
+    """
+    rodrigues formula for a fixed unit axis and many angles
+    :param ax: 1x3 nparray, unit vector
+    :param angles: 1xn nparray
+    :return: nx3x3 nparray
+    """
+    k = np.array([[0, -ax[2], ax[1]],
+                  [ax[2], 0, -ax[0]],
+                  [-ax[1], ax[0], 0]])
+    sin_q = np.sin(angles)[:, None, None]
+    cos_q = np.cos(angles)[:, None, None]
+    return np.eye(3) + sin_q * k + (1 - cos_q) * k.dot(k)
+
+
+def _rotate_many(ax, angles, vecs):
+    """
+    rotate many vectors around a fixed unit axis
+    :param ax: 1x3 nparray, unit vector
+    :param angles: 1xn nparray
+    :param vecs: nx3 or 1x3 nparray
+    :return: nx3 nparray
+    """
+    vecs = np.broadcast_to(vecs, (len(angles), 3))
+    sin_q = np.sin(angles)[:, None]
+    cos_q = np.cos(angles)[:, None]
+    vecs_par = vecs.dot(ax)[:, None] * ax
+    return vecs_par + cos_q * (vecs - vecs_par) + sin_q * np.cross(ax, vecs)
+
+
+def _subproblem_dot(ax, x, y, c):
+    """
+    solve q in (rot(ax, q) x).y = c, x and y could be single vectors or nx3 arrays
+    :return: [q_a, q_b, is_valid], q_a and q_b are the two branches
+    """
+    x = np.broadcast_to(x, (len(c), 3))
+    y = np.broadcast_to(y, (len(c), 3))
+    x_par = x.dot(ax)[:, None] * ax
+    a = np.einsum('ij,ij->i', x - x_par, y)
+    b = np.einsum('ij,ij->i', np.cross(ax, x), y)
+    c = c - np.einsum('ij,ij->i', x_par, y)
+    ab = np.sqrt(a * a + b * b)
+    ratio = np.divide(c, ab, out=np.full_like(c, np.inf), where=ab > 1e-12)
+    is_valid = np.abs(ratio) <= 1 + 1e-9
+    phi = np.arctan2(b, a)
+    delta = np.arccos(np.clip(ratio, -1, 1))
+    return phi + delta, phi - delta, is_valid
+
+
+def _subproblem_rot(ax, x, y):
+    """
+    solve q in rot(ax, q) x = y (paden-kahan subproblem 1), the projections onto the plane normal to ax are used
+    q is set to 0 if x is parallel to ax (singular)
+    :return: 1xn nparray
+    """
+    n = max(np.asarray(x).reshape(-1, 3).shape[0], np.asarray(y).reshape(-1, 3).shape[0])
+    x = np.broadcast_to(x, (n, 3))
+    y = np.broadcast_to(y, (n, 3))
+    x_prj = x - x.dot(ax)[:, None] * ax
+    y_prj = y - y.dot(ax)[:, None] * ax
+    return np.arctan2(np.cross(x_prj, y_prj).dot(ax), np.einsum('ij,ij->i', x_prj, y_prj))
+
+
+class URTypeAIK(object):
+    """
+    Closed-form ik for 6-dof arms with the universal robots structure:
+    the second to fourth axes are parallel and perpendicular to the first one, the fifth axis is perpendicular
+    to the fourth one, and the fifth and sixth axes intersect.
+    The solver is formulated with the product of exponentials of the zero configuration of the jlc,
+    the dh parameters are not needed; a target has at most 8 branches (shoulder x wrist x elbow).
+    NOTE: the zero configuration is a snapshot of the arrays of jlc._fkt, it is rebuilt at the next ik call
+          after JLChain.reinitialize (which updates the arrays)
+    """
+
+    def __init__(self, jlc_object):
+        self.jlc_object = jlc_object
+        self.update_params()
+
+    def update_params(self):
+        """
+        extract the axes and the fixed points from the zero configuration, in the local frame of the jlc
+        :return:
+        """
+        fkt = self.jlc_object._fkt
+        if self.jlc_object.ndof != 6 or np.any(fkt.jnt_types[fkt.tgtjnt_ids] != 1):
+            raise ValueError("URTypeAIK requires six revolute joints!")
+        motion_vals = np.zeros((1, fkt.njnts))
+        _, jnts_array = fkt.fk_arrays(motion_vals, pos=np.zeros(3), rotmat=np.eye(3))
+        jids = fkt.tgtjnt_ids
+        axes = jnts_array['gl_motionax'][0, jids]
+        axes = axes / np.linalg.norm(axes, axis=1)[:, None]
+        pnts = jnts_array['gl_posq'][0, jids]
+        if np.linalg.norm(axes[1] - axes[2]) > 1e-6 or np.linalg.norm(axes[1] - axes[3]) > 1e-6 or \
+                abs(axes[0].dot(axes[1])) > 1e-6 or abs(axes[3].dot(axes[4])) > 1e-6 or \
+                abs(axes[4].dot(axes[5])) > 1e-6:
+            raise ValueError("The joint axes do not match the UR structure!")
+        # intersection of the fifth and sixth axes
+        diff = pnts[5] - pnts[4]
+        ax56 = np.cross(axes[4], axes[5])
+        if abs(diff.dot(ax56)) > 1e-6:
+            raise ValueError("The fifth and sixth axes must intersect!")
+        s = np.cross(diff, axes[5]).dot(ax56) / ax56.dot(ax56)
+        self.axes = axes
+        self.pnts = pnts
+        self.wrist_pnt = pnts[4] + s * axes[4]
+        self.flange_pos0 = jnts_array['gl_posq'][0, jids[-1]]
+        self.flange_rotmat0 = jnts_array['gl_rotmatq'][0, jids[-1]]
+        self.loc_wrist_pnt = self.flange_rotmat0.T.dot(self.wrist_pnt - self.flange_pos0)
+        self.shoulder_offset = axes[1].dot(self.wrist_pnt - pnts[0])
+        # planar two-link problem in the plane normal to the parallel axes
+        self.plane_e1 = np.cross(axes[1], axes[0])
+        self.plane_e1 = self.plane_e1 / np.linalg.norm(self.plane_e1)
+        self.plane_e2 = np.cross(axes[1], self.plane_e1)
+        upperarm = pnts[2] - pnts[1]
+        forearm = pnts[3] - pnts[2]
+        self.upperarm_2d = np.array([upperarm.dot(self.plane_e1), upperarm.dot(self.plane_e2)])
+        self.forearm_2d = np.array([forearm.dot(self.plane_e1), forearm.dot(self.plane_e2)])
+        self.upperarm_len = np.linalg.norm(self.upperarm_2d)
+        self.forearm_len = np.linalg.norm(self.forearm_2d)
+        self.jmvmin = np.array([self.jlc_object.jnts[id]['motion_rng'][0] for id in self.jlc_object.tgtjnts])
+        self.jmvmax = np.array([self.jlc_object.jnts[id]['motion_rng'][1] for id in self.jlc_object.tgtjnts])
+        self._jnt_loc_pos = fkt.jnt_loc_pos
+
+    def _sync_params(self):
+        """
+        rebuild the snapshot if the arrays of jlc._fkt were updated since it was taken
+        :return:
+        """
+        if self.jlc_object._fkt.jnt_loc_pos is not self._jnt_loc_pos:
+            self.update_params()
+
+    def is_supported(self, tcp_jntid=None):
+        """
+        the tcp must be fixed to the last joint (the sixth joint or the end joint)
+        :param tcp_jntid:
+        :return:
+        """
+        if tcp_jntid is None:
+            tcp_jntid = self.jlc_object.tcp_jntid
+        if isinstance(tcp_jntid, list):
+            return False
+        return range(self.jlc_object._fkt.njnts)[tcp_jntid] >= self.jlc_object.tgtjnts[-1]
+
+    def _get_loc_tcp(self, tcp_jntid, tcp_loc_pos, tcp_loc_rotmat):
+        """
+        the tcp pose in the frame of the sixth joint
+        :return:
+        """
+        if tcp_jntid is None:
+            tcp_jntid = self.jlc_object.tcp_jntid
+        if tcp_loc_pos is None:
+            tcp_loc_pos = self.jlc_object.tcp_loc_pos
+        if tcp_loc_rotmat is None:
+            tcp_loc_rotmat = self.jlc_object.tcp_loc_rotmat
+        fkt = self.jlc_object._fkt
+        loc_pos = np.zeros(3)
+        loc_rotmat = np.eye(3)
+        for id in range(self.jlc_object.tgtjnts[-1] + 1, range(fkt.njnts)[tcp_jntid] + 1):
+            loc_pos = loc_pos + loc_rotmat.dot(fkt.jnt_loc_pos[id])
+            loc_rotmat = loc_rotmat.dot(fkt.jnt_loc_rotmat[id])
+        return loc_pos + loc_rotmat.dot(tcp_loc_pos), loc_rotmat.dot(tcp_loc_rotmat)
+
+    def _wrap_to_rng(self, jnt_values_array, is_valid):
+        """
+        wrap the joint values into [-pi, pi) and shift them by 2pi to fit the motion ranges if possible
+        :return: [jnt_values_array, is_valid]
+        """
+        jnt_values_array = np.mod(jnt_values_array + math.pi, 2 * math.pi) - math.pi
+        for shift in [2 * math.pi, -2 * math.pi]:
+            selection = np.logical_or(jnt_values_array < self.jmvmin, jnt_values_array > self.jmvmax)
+            shifted = jnt_values_array + shift
+            selection = np.logical_and(selection, np.logical_and(shifted >= self.jmvmin, shifted <= self.jmvmax))
+            jnt_values_array[selection] = shifted[selection]
+        is_in_rng = np.logical_and(jnt_values_array >= self.jmvmin, jnt_values_array <= self.jmvmax)
+        return jnt_values_array, np.logical_and(is_valid, np.all(is_in_rng, axis=-1))
+
+    def ik_all(self, tgt_pos_array, tgt_rotmat_array, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
+        """
+        all branches of many targets
+        :param tgt_pos_array: nx3 nparray
+        :param tgt_rotmat_array: nx3x3 nparray
+        :param tcp_jntid: a joint ID in the self.tgtjnts, single value
+        :param tcp_loc_pos: 1x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :param tcp_loc_rotmat: 3x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :return: [jnt_values_array nx8x6 nparray, is_valid nx8 bool nparray]
+        """
+        if not self.is_supported(tcp_jntid):
+            raise ValueError("The tcp is not fixed to the last joint!")
+        self._sync_params()
+        axes = self.axes
+        pnts = self.pnts
+        tgt_pos_array = np.asarray(tgt_pos_array, dtype=np.float64).reshape(-1, 3)
+        tgt_rotmat_array = np.asarray(tgt_rotmat_array, dtype=np.float64).reshape(-1, 3, 3)
+        ntgt = tgt_pos_array.shape[0]
+        # targets of the sixth joint in the local frame of the jlc
+        loc_tcp_pos, loc_tcp_rotmat = self._get_loc_tcp(tcp_jntid, tcp_loc_pos, tcp_loc_rotmat)
+        jlc_rotmat = self.jlc_object.rotmat
+        flange_rotmat = jlc_rotmat.T @ tgt_rotmat_array @ loc_tcp_rotmat.T
+        flange_pos = (tgt_pos_array - self.jlc_object.pos).dot(jlc_rotmat) - flange_rotmat @ loc_tcp_pos
+        wrist_pnt = flange_pos + flange_rotmat @ self.loc_wrist_pnt
+        rel_rotmat = flange_rotmat @ self.flange_rotmat0.T
+        jnt_values_array = np.zeros((ntgt, 2, 2, 2, 6))
+        is_valid = np.ones((ntgt, 2, 2, 2), dtype=bool)
+        # shoulder
+        q1_a, q1_b, q1_valid = _subproblem_dot(axes[0], axes[1], wrist_pnt - pnts[0], np.full(ntgt, self.shoulder_offset))
+        for i1, q1 in enumerate([q1_a, q1_b]):
+            is_valid[:, i1] &= q1_valid[:, None, None]
+            jnt_values_array[:, i1, :, :, 0] = q1[:, None, None]
+            rotmat1_t = _rotmat_many(axes[0], -q1)
+            rel_rotmat1 = rotmat1_t @ rel_rotmat
+            # wrist
+            c5 = np.einsum('j,ijk,k->i', axes[1], rel_rotmat1, axes[5])
+            q5_a, q5_b, q5_valid = _subproblem_dot(axes[4], axes[5], axes[1], c5)
+            for i5, q5 in enumerate([q5_a, q5_b]):
+                is_valid[:, i1, i5] &= q5_valid[:, None]
+                jnt_values_array[:, i1, i5, :, 4] = q5[:, None]
+                q6 = _subproblem_rot(axes[5],
+                                     axes[1] @ rel_rotmat1,
+                                     _rotate_many(axes[4], -q5, axes[1]))
+                jnt_values_array[:, i1, i5, :, 5] = q6[:, None]
+                theta = _subproblem_rot(axes[1],
+                                        axes[4],
+                                        (rel_rotmat1 @ _rotate_many(axes[5], -q6, axes[4])[:, :, None])[:, :, 0])
+                # elbow, planar two-link problem
+                rotmat1 = rotmat1_t.transpose(0, 2, 1)
+                link4_rotmat = rotmat1 @ _rotmat_many(axes[1], theta)
+                fore_pnt = wrist_pnt - link4_rotmat @ (self.wrist_pnt - pnts[3])
+                fore_pnt = (rotmat1_t @ (fore_pnt - pnts[0])[:, :, None])[:, :, 0] + pnts[0] - pnts[1]
+                fore_pnt_2d = np.stack([fore_pnt.dot(self.plane_e1), fore_pnt.dot(self.plane_e2)], axis=1)
+                dist_sq = np.einsum('ij,ij->i', fore_pnt_2d, fore_pnt_2d)
+                cos_elbow = (dist_sq - self.upperarm_len ** 2 - self.forearm_len ** 2) / (
+                        2 * self.upperarm_len * self.forearm_len)
+                elbow_valid = np.abs(cos_elbow) <= 1 + 1e-9
+                elbow = np.arccos(np.clip(cos_elbow, -1, 1))
+                offset = math.atan2(self.upperarm_2d[1], self.upperarm_2d[0]) - \
+                         math.atan2(self.forearm_2d[1], self.forearm_2d[0])
+                for i3, q3 in enumerate([offset + elbow, offset - elbow]):
+                    is_valid[:, i1, i5, i3] &= elbow_valid
+                    cos_q3 = np.cos(q3)
+                    sin_q3 = np.sin(q3)
+                    elbow_vec_x = self.upperarm_2d[0] + cos_q3 * self.forearm_2d[0] - sin_q3 * self.forearm_2d[1]
+                    elbow_vec_y = self.upperarm_2d[1] + sin_q3 * self.forearm_2d[0] + cos_q3 * self.forearm_2d[1]
+                    q2 = np.arctan2(fore_pnt_2d[:, 1], fore_pnt_2d[:, 0]) - np.arctan2(elbow_vec_y, elbow_vec_x)
+                    jnt_values_array[:, i1, i5, i3, 1] = q2
+                    jnt_values_array[:, i1, i5, i3, 2] = q3
+                    jnt_values_array[:, i1, i5, i3, 3] = theta - q2 - q3
+        jnt_values_array = jnt_values_array.reshape(ntgt, 8, 6)
+        return self._wrap_to_rng(jnt_values_array, is_valid.reshape(ntgt, 8))
+
+    def ik_many(self,
+                tgt_pos_array,
+                tgt_rotmat_array,
+                seed_conf=None,
+                tcp_jntid=None,
+                tcp_loc_pos=None,
+                tcp_loc_rotmat=None):
+        """
+        the branch nearest to seed_conf is selected for each target
+        :param tgt_pos_array: nx3 nparray
+        :param tgt_rotmat_array: nx3x3 nparray
+        :param seed_conf: 1x6 or nx6 nparray, self.jlc_object.homeconf will be used if None
+        :return: [jnt_values_array nx6 nparray, is_solved 1xn bool nparray], unsolved rows are filled with nan
+        """
+        if seed_conf is None:
+            seed_conf = self.jlc_object.homeconf
+        jnt_values_array, is_valid = self.ik_all(tgt_pos_array, tgt_rotmat_array, tcp_jntid=tcp_jntid,
+                                                 tcp_loc_pos=tcp_loc_pos, tcp_loc_rotmat=tcp_loc_rotmat)
+        seed_conf = np.asarray(seed_conf, dtype=np.float64).reshape(-1, 1, 6)
+        dist = np.linalg.norm(jnt_values_array - seed_conf, axis=2)
+        dist[~is_valid] = np.inf
+        nearest_ids = np.argmin(dist, axis=1)
+        results = jnt_values_array[np.arange(len(nearest_ids)), nearest_ids]
+        is_solved = np.any(is_valid, axis=1)
+        results[~is_solved] = np.nan
+        return results, is_solved
+
+    def ik(self, tgt_pos, tgt_rotmat, seed_conf=None, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
+        """
+        :param tgt_pos: 1x3 nparray
+        :param tgt_rotmat: 3x3 nparray
+        :param seed_conf: the branch nearest to seed_conf is returned, self.jlc_object.homeconf will be used if None
+        :return: a 1x6 nparray, None if there is no solution
+        """
+        results, is_solved = self.ik_many(tgt_pos, tgt_rotmat, seed_conf=seed_conf, tcp_jntid=tcp_jntid,
+                                          tcp_loc_pos=tcp_loc_pos, tcp_loc_rotmat=tcp_loc_rotmat)
+        if is_solved[0]:
+            return results[0]
+        return None
+
+
+if __name__ == '__main__':
+    import time
+    import robotsim.manipulators.ur3.ur3 as ur3
+
+    manipulator_instance = ur3.UR3(enable_cc=False)
+    aik = URTypeAIK(manipulator_instance.jlc)
+    jnt_values = manipulator_instance.rand_conf()
+    manipulator_instance.fk(jnt_values)
+    tgt_pos, tgt_rotmat = manipulator_instance.get_gl_tcp()
+    tic = time.time()
+    jnt_values_array, is_valid = aik.ik_all(tgt_pos, tgt_rotmat)
+    toc = time.time()
+    print(toc - tic)
+    print(jnt_values)
+    print(jnt_values_array[0][is_valid[0]])
@@ -0,0 +1,186 @@
+import math
+import numpy as np
+
+# joint type codes used by the array-backed solver
+JNT_TYPE_CODE = {'end': 0, 'revolute': 1, 'prismatic': 2}
+
+
+class JLChainFK(object):
+    """
+    Array-backed forward kinematics for JLChain
+    The joint origins, motion axes, and types are packed into contiguous nparrays so that the forward kinematics
+    of a batch of configurations could be computed in one vectorized pass.
+    NOTE: the arrays are snapshots of self.jlc_object.jnts/lnks, call update_params after changing the
+          'loc_pos', 'loc_rotmat', 'loc_motionax', or 'type' entries of the joints and links
+          (JLChain.reinitialize does it automatically)
+    """
+
+    def __init__(self, jlc_object):
+        self.jlc_object = jlc_object
+        self.update_params()
+
+    def update_params(self):
+        """
+        pack the joint and link parameters of self.jlc_object into nparrays
+        :return:
+        """
+        jnts = self.jlc_object.jnts
+        lnks = self.jlc_object.lnks
+        self.njnts = len(jnts)
+        self.nlnks = len(lnks)
+        self.jnt_types = np.array([JNT_TYPE_CODE[jnt['type']] for jnt in jnts], dtype=np.int32)
+        self.jnt_loc_pos = np.array([jnt['loc_pos'] for jnt in jnts], dtype=np.float64)
+        self.jnt_loc_rotmat = np.array([jnt['loc_rotmat'] for jnt in jnts], dtype=np.float64)
+        self.jnt_loc_motionax = np.array([jnt['loc_motionax'] for jnt in jnts], dtype=np.float64)
+        self.lnk_loc_pos = np.array([lnk['loc_pos'] for lnk in lnks], dtype=np.float64)
+        self.lnk_loc_rotmat = np.array([lnk['loc_rotmat'] for lnk in lnks], dtype=np.float64)
+        self.tgtjnt_ids = np.array(list(self.jlc_object.tgtjnts), dtype=np.int32)
+        # skew-symmetric matrices of the unit motion axes for the rodrigues formula, K and K^2
+        self._ax_skew = np.zeros((self.njnts, 3, 3))
+        self._ax_skew2 = np.zeros((self.njnts, 3, 3))
+        self._eye = np.eye(3)
+        for id in range(self.njnts):
+            ax = self.jnt_loc_motionax[id]
+            ax_len = np.linalg.norm(ax)
+            if ax_len > 0:
+                ax = ax / ax_len
+            self._ax_skew[id] = np.array([[0, -ax[2], ax[1]],
+                                          [ax[2], 0, -ax[0]],
+                                          [-ax[1], ax[0], 0]])
+            self._ax_skew2[id] = self._ax_skew[id].dot(self._ax_skew[id])
+
+    def get_motion_vals(self):
+        """
+        read the current motion values of all joints (including the two end joints) from the dict view
+        :return: 1x(ndof+2) nparray
+        """
+        return np.array([jnt['motion_val'] for jnt in self.jlc_object.jnts], dtype=np.float64)
+
+    def cvt_conf_to_motion_vals(self, jnt_values_array):
+        """
+        scatter a batch of configurations into the per-joint motion values, the untargeted joints are kept as is
+        :param jnt_values_array: nxndof nparray (or a 1xndof nparray)
+        :return: nx(ndof+2) nparray
+        """
+        jnt_values_array = np.asarray(jnt_values_array, dtype=np.float64).reshape(-1, len(self.tgtjnt_ids))
+        motion_vals = np.tile(self.get_motion_vals(), (jnt_values_array.shape[0], 1))
+        motion_vals[:, self.tgtjnt_ids] = jnt_values_array
+        return motion_vals
+
+    def fk_arrays(self, motion_vals, pos=None, rotmat=None):
+        """
+        vectorized forward kinematics
+        :param motion_vals: nx(ndof+2) nparray, motion values of all joints, see cvt_conf_to_motion_vals
+        :param pos: 1x3 nparray, the global pos of the chain, self.jlc_object.pos will be used if None
+        :param rotmat: 3x3 nparray, the global rotmat of the chain, self.jlc_object.rotmat will be used if None
+        :return: [lnks_array, jnts_array], two dictionaries that mirror the keys of the dict view:
+                 lnks_array['gl_pos'] nxnlnksx3, lnks_array['gl_rotmat'] nxnlnksx3x3,
+                 jnts_array['gl_pos0'], jnts_array['gl_motionax'], jnts_array['gl_posq'] nxnjntsx3,
+                 jnts_array['gl_rotmat0'], jnts_array['gl_rotmatq'] nxnjntsx3x3
+        """
+        if pos is None:
+            pos = self.jlc_object.pos
+        if rotmat is None:
+            rotmat = self.jlc_object.rotmat
+        motion_vals = np.asarray(motion_vals, dtype=np.float64)
+        nconf = motion_vals.shape[0]
+        gl_pos0 = np.empty((nconf, self.njnts, 3))
+        gl_rotmat0 = np.empty((nconf, self.njnts, 3, 3))
+        gl_motionax = np.empty((nconf, self.njnts, 3))
+        gl_posq = np.empty((nconf, self.njnts, 3))
+        gl_rotmatq = np.empty((nconf, self.njnts, 3, 3))
+        lnk_gl_pos = np.empty((nconf, self.nlnks, 3))
+        lnk_gl_rotmat = np.empty((nconf, self.nlnks, 3, 3))
+        for id in range(self.njnts):
+            if id == 0:
+                gl_pos0[:, id] = pos
+                gl_rotmat0[:, id] = rotmat
+            else:
+                gl_pos0[:, id] = gl_posq[:, id - 1] + gl_rotmatq[:, id - 1] @ self.jnt_loc_pos[id]
+                gl_rotmat0[:, id] = gl_rotmatq[:, id - 1] @ self.jnt_loc_rotmat[id]
+            gl_motionax[:, id] = gl_rotmat0[:, id] @ self.jnt_loc_motionax[id]
+            if self.jnt_types[id] == 1:  # revolute
+                sin_q = np.sin(motion_vals[:, id])[:, None, None]
+                cos_q = np.cos(motion_vals[:, id])[:, None, None]
+                loc_rotmatq = self._eye + sin_q * self._ax_skew[id] + (1 - cos_q) * self._ax_skew2[id]
+                gl_rotmatq[:, id] = gl_rotmat0[:, id] @ loc_rotmatq
+                gl_posq[:, id] = gl_pos0[:, id]
+            elif self.jnt_types[id] == 2:  # prismatic
+                gl_rotmatq[:, id] = gl_rotmat0[:, id]
+                gl_posq[:, id] = gl_pos0[:, id] + \
+                                 gl_rotmat0[:, id] @ self.jnt_loc_motionax[id] * motion_vals[:, id][:, None]
+            else:  # end
+                gl_rotmatq[:, id] = gl_rotmat0[:, id]
+                gl_posq[:, id] = gl_pos0[:, id]
+            # update link values, child link id = id
+            if id < self.nlnks:
+                lnk_gl_pos[:, id] = gl_rotmatq[:, id] @ self.lnk_loc_pos[id] + gl_posq[:, id]
+                lnk_gl_rotmat[:, id] = gl_rotmatq[:, id] @ self.lnk_loc_rotmat[id]
+        lnks_array = {'gl_pos': lnk_gl_pos,
+                      'gl_rotmat': lnk_gl_rotmat}
+        jnts_array = {'gl_pos0': gl_pos0,
+                      'gl_rotmat0': gl_rotmat0,
+                      'gl_motionax': gl_motionax,
+                      'gl_posq': gl_posq,
+                      'gl_rotmatq': gl_rotmatq}
+        return lnks_array, jnts_array
+
+    def fk(self, jnt_values=None):
+        """
+        compute the forward kinematics of a single configuration and write the results back to the dict view
+        a single configuration does not benefit from broadcasting, the 3x3 matrices are multiplied directly
+        :param jnt_values: a 1xn ndarray, the motion values saved in the dict view will be used if None
+        :return:
+        """
+        jnts = self.jlc_object.jnts
+        lnks = self.jlc_object.lnks
+        if jnt_values is not None:
+            for counter, id in enumerate(self.tgtjnt_ids):
+                jnts[id]['motion_val'] = jnt_values[counter]
+        gl_posq = self.jlc_object.pos
+        gl_rotmatq = self.jlc_object.rotmat
+        for id in range(self.njnts):
+            if id == 0:
+                gl_pos0 = gl_posq
+                gl_rotmat0 = gl_rotmatq
+            else:
+                gl_pos0 = gl_posq + gl_rotmatq.dot(self.jnt_loc_pos[id])
+                gl_rotmat0 = gl_rotmatq.dot(self.jnt_loc_rotmat[id])
+            jnts[id]['gl_pos0'] = gl_pos0
+            jnts[id]['gl_rotmat0'] = gl_rotmat0
+            jnts[id]['gl_motionax'] = gl_rotmat0.dot(self.jnt_loc_motionax[id])
+            if self.jnt_types[id] == 1:  # revolute
+                motion_val = jnts[id]['motion_val']
+                loc_rotmatq = self._eye + math.sin(motion_val) * self._ax_skew[id] + \
+                              (1 - math.cos(motion_val)) * self._ax_skew2[id]
+                gl_rotmatq = gl_rotmat0.dot(loc_rotmatq)
+                gl_posq = gl_pos0
+            elif self.jnt_types[id] == 2:  # prismatic
+                gl_rotmatq = gl_rotmat0
+                gl_posq = gl_pos0 + gl_rotmat0.dot(self.jnt_loc_motionax[id] * jnts[id]['motion_val'])
+            else:  # end
+                gl_rotmatq = gl_rotmat0
+                gl_posq = gl_pos0
+            jnts[id]['gl_posq'] = gl_posq
+            jnts[id]['gl_rotmatq'] = gl_rotmatq
+            # update link values, child link id = id
+            if id < self.nlnks:
+                lnks[id]['gl_pos'] = gl_rotmatq.dot(self.lnk_loc_pos[id]) + gl_posq
+                lnks[id]['gl_rotmat'] = gl_rotmatq.dot(self.lnk_loc_rotmat[id])
+        return lnks, jnts
+
+    def fk_many(self, jnt_values_array, pos=None, rotmat=None, toggle_jnts=False):
+        """
+        batched forward kinematics, the dict view is not changed
+        :param jnt_values_array: nxndof nparray, each row is a configuration
+        :param pos: 1x3 nparray, the global pos of the chain, self.jlc_object.pos will be used if None
+        :param rotmat: 3x3 nparray, the global rotmat of the chain, self.jlc_object.rotmat will be used if None
+        :param toggle_jnts: return the joint arrays as well if True
+        :return: [lnk_gl_pos nxnlnksx3, lnk_gl_rotmat nxnlnksx3x3]
+                 [lnk_gl_pos, lnk_gl_rotmat, jnts_array] if toggle_jnts is True, see fk_arrays for jnts_array
+        """
+        lnks_array, jnts_array = self.fk_arrays(self.cvt_conf_to_motion_vals(jnt_values_array), pos=pos,
+                                                rotmat=rotmat)
+        if toggle_jnts:
+            return lnks_array['gl_pos'], lnks_array['gl_rotmat'], jnts_array
+        return lnks_array['gl_pos'], lnks_array['gl_rotmat']
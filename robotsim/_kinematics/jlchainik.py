@@ -2,6 +2,7 @@ import math
 import numpy as np
 import basis.robot_math as rm
 import warnings as wns
+import basis.instrumentation as inst
 
 
 class JLChainIK(object):
@@ -240,6 +241,7 @@ class JLChainIK(object):
                         "rngmin"]) / 2
         return isdragged, jntvaluesdragged
 
+    @inst.timed('num_ik_seconds')
     def num_ik(self,
                tgt_pos,
                tgt_rot,
@@ -266,7 +268,8 @@ class JLChainIK(object):
         """
         deltapos = tgt_pos - self.jlc_object.jnts[0]['gl_pos0']
         if np.linalg.norm(deltapos) > self.max_rng:
-            wns.WarningMessage("The goal is outside maximum range!")
+            wns.warn("The goal is outside maximum range!")
+            inst.observe('num_ik_iterations', 0, buckets=inst.COUNT_BUCKETS, outcome='out_of_range')
             return None
         if tcp_jntid is None:
             tcp_jntid = self.jlc_object.tcp_jntid
@@ -334,6 +337,7 @@ class JLChainIK(object):
                 # self.regulate_jnts()
                 jntvalues_return = self.jlc_object.get_jnt_values()
                 self.jlc_object.fk(jnt_values=jnt_values_bk)
+                inst.observe('num_ik_iterations', i + 1, buckets=inst.COUNT_BUCKETS, outcome='converged')
                 return jntvalues_return
             else:
                 # judge local minima
@@ -357,9 +361,11 @@ class JLChainIK(object):
                             'Bypassing local minima! The return value is a local minima, rather than the exact IK result.')
                         jntvalues_return = self.jlc_object.get_jnt_values()
                         self.jlc_object.fk(jnt_values_bk)
+                        inst.observe('num_ik_iterations', i + 1, buckets=inst.COUNT_BUCKETS, outcome='local_minima')
                         return jntvalues_return
                     elif local_minima == 'randomrestart':
                         wns.warn('Local Minima! Random restart at local minima!')
+                        inst.count('num_ik_restarts')
                         jnt_values_iter = self.jlc_object.rand_conf()
                         self.jlc_object.fk(jnt_values_iter)
                         continue
@@ -433,9 +439,164 @@ class JLChainIK(object):
                                            tcp_loc_rotmat=tcp_loc_rotmat, toggle_jntscs=True).attach_to(base)
             # base.run()
         self.jlc_object.fk(jnt_values_bk)
+        inst.observe('num_ik_iterations', i + 1, buckets=inst.COUNT_BUCKETS, outcome='failed')
         wns.warn('Failed to solve the IK, returning None.')
         return None
 
+    def _wln_weightmat_many(self, jnt_values_array):
+        """
+        vectorized version of _wln_weightmat, the diagonals are returned instead of the diagonal matrices
+        :param jnt_values_array: nxndof nparray
+        :return: nxndof nparray
+        """
+        wtarray = np.ones_like(jnt_values_array)
+        diff = self.jmvmin_threshhold - jnt_values_array
+        selection = diff > 0
+        wtarray[selection] = -2 * np.power(diff[selection], 3) + 3 * np.power(diff[selection], 2)
+        diff = jnt_values_array - self.jmvmax_threshhold
+        selection = diff > 0
+        wtarray[selection] = -2 * np.power(diff[selection], 3) + 3 * np.power(diff[selection], 2)
+        wtarray[jnt_values_array >= self.jmvmax] = 1e-6
+        wtarray[jnt_values_array <= self.jmvmin] = 1e-6
+        return wtarray
+
+    @staticmethod
+    def _deltaw_many(rotmati_array, rotmatj_array):
+        """
+        vectorized version of rm.deltaw_between_rotmat
+        :param rotmati_array: nx3x3 nparray
+        :param rotmatj_array: nx3x3 nparray
+        :return: nx3 nparray
+        """
+        deltarot = rotmatj_array @ rotmati_array.transpose(0, 2, 1)
+        tempvec = np.stack([deltarot[:, 2, 1] - deltarot[:, 1, 2],
+                            deltarot[:, 0, 2] - deltarot[:, 2, 0],
+                            deltarot[:, 1, 0] - deltarot[:, 0, 1]], axis=1)
+        tempveclength = np.linalg.norm(tempvec, axis=1)
+        trace = np.trace(deltarot, axis1=1, axis2=2)
+        deltaw = np.zeros_like(tempvec)
+        selection = tempveclength > 1e-6
+        deltaw[selection] = (np.arctan2(tempveclength[selection], trace[selection] - 1.0) /
+                             tempveclength[selection])[:, None] * tempvec[selection]
+        diag = np.diagonal(deltarot, axis1=1, axis2=2)
+        selection = np.logical_and(~selection, np.any(diag <= 0, axis=1))
+        deltaw[selection] = math.pi / 2 * (diag[selection] + 1)
+        return deltaw
+
+    def num_ik_batch(self,
+                     tgt_pos_array,
+                     tgt_rotmat_array,
+                     seeds=None,
+                     tcp_jntid=None,
+                     tcp_loc_pos=None,
+                     tcp_loc_rotmat=None,
+                     max_niter=100):
+        """
+        solve the ik of many targets from many seeds in one go
+        the damped weighted-least-norm iterations of num_ik are stacked into ntgt*nseed lanes and advanced together,
+        a target is finished as soon as any of its lanes converges, a lane is dropped once it reaches a local minima
+        only the lanes that are still running are updated at each iteration
+        NOTE: the dict view of self.jlc_object is not changed
+        :param tgt_pos_array: nx3 nparray
+        :param tgt_rotmat_array: nx3x3 nparray
+        :param seeds: mxndof nparray shared by all targets, or nxmxndof nparray for per-target seeds,
+                      self.jlc_object.homeconf will be used if None
+        :param tcp_jntid: a joint ID in the self.tgtjnts, single value
+        :param tcp_loc_pos: 1x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :param tcp_loc_rotmat: 3x3 nparray, decribed in the local frame of self.jnts[tcp_jntid], single value
+        :param max_niter: maximum number of iterations
+        :return: [jnt_values_array nxndof nparray, is_solved 1xn bool nparray], unsolved rows are filled with nan
+        """
+        if tcp_jntid is None:
+            tcp_jntid = self.jlc_object.tcp_jntid
+        if tcp_loc_pos is None:
+            tcp_loc_pos = self.jlc_object.tcp_loc_pos
+        if tcp_loc_rotmat is None:
+            tcp_loc_rotmat = self.jlc_object.tcp_loc_rotmat
+        if isinstance(tcp_jntid, list):
+            raise ValueError("num_ik_batch only supports a single tcp!")
+        fkt = self.jlc_object._fkt
+        ndof = self.jlc_object.ndof
+        tcp_jntid = range(fkt.njnts)[tcp_jntid]  # negative ids like -1 are resolved for the comparisons below
+        tgt_pos_array = np.asarray(tgt_pos_array, dtype=np.float64).reshape(-1, 3)
+        tgt_rotmat_array = np.asarray(tgt_rotmat_array, dtype=np.float64).reshape(-1, 3, 3)
+        ntgt = tgt_pos_array.shape[0]
+        if seeds is None:
+            seeds = self.jlc_object.homeconf
+        seeds = np.asarray(seeds, dtype=np.float64)
+        if seeds.ndim < 3:
+            seeds = np.broadcast_to(seeds.reshape(1, -1, ndof), (ntgt, seeds.size // ndof, ndof))
+        if seeds.shape[0] != ntgt:
+            raise ValueError("The number of seed groups must be equal to the number of targets!")
+        nseed = seeds.shape[1]
+        # lanes are ordered target-major, lane id = tgtid*nseed+seedid
+        lane_tgtids = np.repeat(np.arange(ntgt), nseed)
+        jnt_values_ref = seeds.reshape(-1, ndof).copy()
+        jnt_values_iter = jnt_values_ref.copy()
+        lane_tgt_pos = tgt_pos_array[lane_tgtids]
+        lane_tgt_rotmat = tgt_rotmat_array[lane_tgtids]
+        results = np.full((ntgt, ndof), np.nan)
+        is_solved = np.zeros(ntgt, dtype=bool)
+        # the targets outside of the maximum range are never started
+        is_active = np.repeat(np.linalg.norm(tgt_pos_array - self.jlc_object.pos, axis=1) <= self.max_rng, nseed)
+        errnormlast = np.zeros(len(lane_tgtids))
+        ws_wtarray = np.array(self.ws_wtlist)
+        # columns of the jacobian, only the joints before tcp_jntid contribute
+        tgtjnt_ids = fkt.tgtjnt_ids
+        jac_selection = tgtjnt_ids <= tcp_jntid
+        is_revolute = np.logical_and(fkt.jnt_types[tgtjnt_ids] == 1, jac_selection)
+        is_prismatic = np.logical_and(fkt.jnt_types[tgtjnt_ids] == 2, jac_selection)
+        identity = np.eye(ndof)
+        for _ in range(max_niter):
+            lane_ids = np.nonzero(is_active)[0]
+            if len(lane_ids) == 0:
+                break
+            q = jnt_values_iter[lane_ids]
+            _, _, jnts_array = fkt.fk_many(q, toggle_jnts=True)
+            tcp_gl_rotmatq = jnts_array['gl_rotmatq'][:, tcp_jntid]
+            tcp_gl_pos = tcp_gl_rotmatq @ tcp_loc_pos + jnts_array['gl_posq'][:, tcp_jntid]
+            tcp_gl_rotmat = tcp_gl_rotmatq @ tcp_loc_rotmat
+            err = np.empty((len(lane_ids), 6))
+            err[:, :3] = lane_tgt_pos[lane_ids] - tcp_gl_pos
+            err[:, 3:] = self._deltaw_many(tcp_gl_rotmat, lane_tgt_rotmat[lane_ids])
+            errnorm = np.einsum('ij,j,ij->i', err, ws_wtarray, err)
+            # converged lanes finish their targets, the first converged lane of a target wins
+            converged = errnorm < 1e-6
+            if np.any(converged):
+                converged_tgtids, first = np.unique(lane_tgtids[lane_ids[converged]], return_index=True)
+                results[converged_tgtids] = q[converged][first]
+                is_solved[converged_tgtids] = True
+                is_active[np.isin(lane_tgtids, converged_tgtids)] = False
+            # local minima
+            stuck = np.logical_and(~converged, np.abs(errnorm - errnormlast[lane_ids]) < 1e-12)
+            is_active[lane_ids[stuck]] = False
+            errnormlast[lane_ids] = errnorm
+            running = is_active[lane_ids]
+            if not np.any(running):
+                break
+            lane_ids = lane_ids[running]
+            q = q[running]
+            err = err[running]
+            errnorm = errnorm[running]
+            gl_motionax = jnts_array['gl_motionax'][running][:, tgtjnt_ids]
+            gl_posq = jnts_array['gl_posq'][running][:, tgtjnt_ids]
+            j = np.zeros((len(lane_ids), 6, ndof))
+            j[:, :3, is_revolute] = np.cross(gl_motionax[:, is_revolute],
+                                             tcp_gl_pos[running][:, None, :] - gl_posq[:, is_revolute]).transpose(0, 2, 1)
+            j[:, 3:, is_revolute] = gl_motionax[:, is_revolute].transpose(0, 2, 1)
+            j[:, :3, is_prismatic] = gl_motionax[:, is_prismatic].transpose(0, 2, 1)
+            # damped weighted least-norm, see num_ik for the details
+            dampercoeff = 1e-3 * errnorm + 1e-6
+            winv_jt = (1 / self._wln_weightmat_many(q))[:, :, None] * j.transpose(0, 2, 1)
+            j_winv_jt = j @ winv_jt
+            damper = dampercoeff[:, None, None] * np.eye(6)
+            jsharp = winv_jt @ np.linalg.inv(j_winv_jt + damper)
+            dq = .1 * (jsharp @ err[:, :, None])[:, :, 0]
+            dqref = jnt_values_ref[lane_ids] - q
+            dqref_on_ns = ((identity - jsharp @ j) @ dqref[:, :, None])[:, :, 0]
+            jnt_values_iter[lane_ids] = q + dq + dqref_on_ns
+        return results, is_solved
+
     def numik_rel(self, deltapos, deltarotmat, tcp_jntid=None, tcp_loc_pos=None, tcp_loc_rotmat=None):
         """
         add deltapos, deltarotmat to the current end
@@ -0,0 +1,195 @@
+import math
+import numpy as np
+
+
+class ReachabilityMap(object):
+    """
+    Sampled reachability of the tcp of a jlc
+    The tcp positions are binned into voxels and the directions of one tcp axis (the approaching direction by default)
+    are binned into elevation x azimuth cells, the rotation around the axis is marginalized.
+    The map is expressed in the base frame of the jlc, it remains valid after the jlc is moved by fix_to.
+    NOTE: the map is built with the tcp of the jlc at the time of sampling, a saved map records the name, the number
+          of joints, and the tcp of the jlc, and is only loaded into a map of a matching jlc
+    """
+
+    def __init__(self, jlc_object, pos_res=.05, nelevation=6, nazimuth=12, tcp_axis=2):
+        """
+        :param jlc_object:
+        :param pos_res: edge length of the voxels
+        :param nelevation: number of elevation bins of the tcp axis
+        :param nazimuth: number of azimuth bins of the tcp axis
+        :param tcp_axis: 0, 1, 2 for the x, y, z axis of the tcp rotmat
+        """
+        self.jlc_object = jlc_object
+        self.pos_res = pos_res
+        self.nelevation = nelevation
+        self.nazimuth = nazimuth
+        self.tcp_axis = tcp_axis
+        self.origin = np.zeros(3)
+        self.scores = None  # nx x ny x nz x (nelevation*nazimuth) uint8 nparray, 0 means unreachable
+
+    def _sample_tcp(self, nsamples, batch_size):
+        """
+        sample the tcp poses in the base frame of the jlc
+        :return: [pos_array nx3, ax_array nx3]
+        """
+        fkt = self.jlc_object._fkt
+        jnt_rngs = np.array(self.jlc_object.get_jnt_ranges())
+        tcp_jntid = self.jlc_object.tcp_jntid
+        pos_list = []
+        ax_list = []
+        for i in range(0, nsamples, batch_size):
+            jnt_values_array = np.random.uniform(jnt_rngs[:, 0], jnt_rngs[:, 1],
+                                                 size=(min(batch_size, nsamples - i), len(jnt_rngs)))
+            _, _, jnts_array = fkt.fk_many(jnt_values_array, pos=np.zeros(3), rotmat=np.eye(3), toggle_jnts=True)
+            tcp_gl_rotmatq = jnts_array['gl_rotmatq'][:, tcp_jntid]
+            pos_list.append(tcp_gl_rotmatq @ self.jlc_object.tcp_loc_pos + jnts_array['gl_posq'][:, tcp_jntid])
+            ax_list.append((tcp_gl_rotmatq @ self.jlc_object.tcp_loc_rotmat)[:, :, self.tcp_axis])
+        return np.vstack(pos_list), np.vstack(ax_list)
+
+    def _ax_to_binid(self, ax_array):
+        elevation = np.arccos(np.clip(ax_array[:, 2], -1, 1))
+        azimuth = np.arctan2(ax_array[:, 1], ax_array[:, 0]) + math.pi
+        elevation_id = np.minimum((elevation / math.pi * self.nelevation).astype(int), self.nelevation - 1)
+        azimuth_id = np.minimum((azimuth / (2 * math.pi) * self.nazimuth).astype(int), self.nazimuth - 1)
+        return elevation_id * self.nazimuth + azimuth_id
+
+    def build(self, nsamples=1000000, batch_size=10000, toggle_dilate=True):
+        """
+        :param nsamples: number of sampled configurations
+        :param batch_size: number of configurations in one fk_many call
+        :param toggle_dilate: mark the neighboring voxels and bins of the reached ones to reduce false negatives
+        :return:
+        """
+        pos_array, ax_array = self._sample_tcp(nsamples, batch_size)
+        self.origin = pos_array.min(axis=0) - self.pos_res
+        shape = np.ceil((pos_array.max(axis=0) + self.pos_res - self.origin) / self.pos_res).astype(int) + 1
+        voxel_ids = ((pos_array - self.origin) / self.pos_res).astype(int)
+        flat_ids = np.ravel_multi_index((voxel_ids[:, 0], voxel_ids[:, 1], voxel_ids[:, 2],
+                                         self._ax_to_binid(ax_array)),
+                                        (shape[0], shape[1], shape[2], self.nelevation * self.nazimuth))
+        counts = np.bincount(flat_ids, minlength=np.prod(shape) * self.nelevation * self.nazimuth)
+        counts = counts.reshape(shape[0], shape[1], shape[2], self.nelevation * self.nazimuth)
+        # scale to 1-255, 0 is reserved for unreachable
+        nonzero = counts > 0
+        scores = np.zeros(counts.shape, dtype=np.uint8)
+        scores[nonzero] = np.ceil(counts[nonzero] / counts.max() * 255).astype(np.uint8)
+        if toggle_dilate:
+            scores = self._dilate(scores)
+        self.scores = scores
+
+    def _dilate(self, scores):
+        """
+        max filter over the 3x3x3 voxel neighbors and the 3x3 bin neighbors (the azimuth is periodic)
+        :return:
+        """
+        shape = scores.shape
+        padded = np.pad(scores, ((1, 1), (1, 1), (1, 1), (0, 0)))
+        dilated = scores.copy()
+        for dx in range(3):
+            for dy in range(3):
+                for dz in range(3):
+                    np.maximum(dilated, padded[dx:dx + shape[0], dy:dy + shape[1], dz:dz + shape[2]], out=dilated)
+        binned = dilated.reshape(shape[:3] + (self.nelevation, self.nazimuth))
+        padded = np.pad(binned, ((0, 0), (0, 0), (0, 0), (1, 1), (0, 0)))
+        dilated = binned.copy()
+        for de in range(3):
+            for da in [-1, 0, 1]:
+                np.maximum(dilated, np.roll(padded[:, :, :, de:de + self.nelevation], da, axis=4), out=dilated)
+        return dilated.reshape(shape)
+
+    def get_scores(self, pos_array, rotmat_array):
+        """
+        :param pos_array: nx3 nparray, in the global frame
+        :param rotmat_array: nx3x3 nparray, in the global frame
+        :return: 1xn uint8 nparray, 0 means unreachable
+        """
+        if self.scores is None:
+            raise ValueError("The reachability map is not built!")
+        pos_array = np.asarray(pos_array, dtype=np.float64).reshape(-1, 3)
+        rotmat_array = np.asarray(rotmat_array, dtype=np.float64).reshape(-1, 3, 3)
+        base_rotmat = self.jlc_object.rotmat
+        loc_pos_array = (pos_array - self.jlc_object.pos).dot(base_rotmat)
+        loc_ax_array = rotmat_array[:, :, self.tcp_axis].dot(base_rotmat)
+        voxel_ids = np.floor((loc_pos_array - self.origin) / self.pos_res).astype(int)
+        is_inside = np.all(np.logical_and(voxel_ids >= 0, voxel_ids < self.scores.shape[:3]), axis=1)
+        scores = np.zeros(len(pos_array), dtype=np.uint8)
+        voxel_ids = voxel_ids[is_inside]
+        scores[is_inside] = self.scores[voxel_ids[:, 0], voxel_ids[:, 1], voxel_ids[:, 2],
+                                        self._ax_to_binid(loc_ax_array[is_inside])]
+        return scores
+
+    def is_reachable_many(self, pos_array, rotmat_array):
+        """
+        :param pos_array: nx3 nparray, in the global frame
+        :param rotmat_array: nx3x3 nparray, in the global frame
+        :return: 1xn bool nparray
+        """
+        return self.get_scores(pos_array, rotmat_array) > 0
+
+    def is_reachable(self, pos, rotmat):
+        """
+        :param pos: 1x3 nparray, in the global frame
+        :param rotmat: 3x3 nparray, in the global frame
+        :return:
+        """
+        return bool(self.is_reachable_many(pos, rotmat)[0])
+
+    def _get_tcp(self):
+        """
+        :return: [tcp_jntid, tcp_loc_pos, tcp_loc_rotmat], tcp_jntid is not negative
+        """
+        tcp_jntid = range(self.jlc_object._fkt.njnts)[self.jlc_object.tcp_jntid]
+        return tcp_jntid, np.asarray(self.jlc_object.tcp_loc_pos), np.asarray(self.jlc_object.tcp_loc_rotmat)
+
+    def save(self, path):
+        """
+        :param path: a .npz file
+        :return:
+        """
+        tcp_jntid, tcp_loc_pos, tcp_loc_rotmat = self._get_tcp()
+        np.savez_compressed(path,
+                            scores=self.scores,
+                            origin=self.origin,
+                            params=np.array([self.pos_res, self.nelevation, self.nazimuth, self.tcp_axis]),
+                            jlc_name=self.jlc_object.name,
+                            jlc_ndof=self.jlc_object.ndof,
+                            tcp_jntid=tcp_jntid,
+                            tcp_loc_pos=tcp_loc_pos,
+                            tcp_loc_rotmat=tcp_loc_rotmat)
+
+    def load(self, path):
+        """
+        :param path: a .npz file saved by self.save
+        :return:
+        """
+        data = np.load(path)
+        if 'jlc_name' not in data:
+            raise ValueError("The reachability map at " + path + " does not record its jlc, it needs to be rebuilt!")
+        tcp_jntid, tcp_loc_pos, tcp_loc_rotmat = self._get_tcp()
+        if str(data['jlc_name']) != self.jlc_object.name or int(data['jlc_ndof']) != self.jlc_object.ndof:
+            raise ValueError("The reachability map at " + path + " was built for the jlc " + str(data['jlc_name']) +
+                             " with " + str(int(data['jlc_ndof'])) + " joints!")
+        if int(data['tcp_jntid']) != tcp_jntid or not np.allclose(data['tcp_loc_pos'], tcp_loc_pos) or \
+                not np.allclose(data['tcp_loc_rotmat'], tcp_loc_rotmat):
+            raise ValueError("The reachability map at " + path + " was built with a different tcp!")
+        self.scores = data['scores']
+        self.origin = data['origin']
+        self.pos_res = float(data['params'][0])
+        self.nelevation, self.nazimuth, self.tcp_axis = [int(value) for value in data['params'][1:]]
+
+
+if __name__ == '__main__':
+    import time
+    import robotsim.manipulators.ur3.ur3 as ur3
+
+    manipulator_instance = ur3.UR3(enable_cc=False)
+    rmap = ReachabilityMap(manipulator_instance.jlc)
+    tic = time.time()
+    rmap.build(nsamples=200000)
+    toc = time.time()
+    print("build", toc - tic, rmap.scores.shape, np.count_nonzero(rmap.scores) / rmap.scores.size)
+    jnt_values = manipulator_instance.rand_conf()
+    manipulator_instance.fk(jnt_values)
+    tgt_pos, tgt_rotmat = manipulator_instance.get_gl_tcp()
+    print(rmap.is_reachable(tgt_pos, tgt_rotmat), rmap.is_reachable(tgt_pos + np.array([2, 0, 0]), tgt_rotmat))
@@ -37,6 +37,11 @@ class IRB14050(mi.ManipulatorInterface):
         self.jlc.jnts[7]['loc_pos'] = np.array([0.027, 0.029, 0.0])
         self.jlc.jnts[7]['loc_rotmat'] = rm.rotmat_from_euler(-1.57079632679, 0.0, 0.0)
         self.jlc.jnts[7]['motion_rng'] = [-3.99680398707 + jnt_safemargin, 3.99680398707 - jnt_safemargin]
+        # max speeds of the datasheet, axes 1, 2, 7, 3 (jnts 1-4) 180deg/s and axes 4, 5, 6 (jnts 5-7) 400deg/s
+        for id in [1, 2, 3, 4]:
+            self.jlc.jnts[id]['motion_vel'] = math.radians(180)
+        for id in [5, 6, 7]:
+            self.jlc.jnts[id]['motion_vel'] = math.radians(400)
         # links
         self.jlc.lnks[1]['name'] = "link_1"
         self.jlc.lnks[1]['meshfile'] = os.path.join(this_dir, "meshes", "link_1.stl")
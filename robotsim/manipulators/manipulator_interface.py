@@ -1,6 +1,8 @@
+import os
 import copy
 import numpy as np
 import robotsim._kinematics.collisionchecker as cc
+import robotsim._kinematics.reachabilitymap as rmp
 
 
 class ManipulatorInterface(object):
@@ -13,6 +15,10 @@ class ManipulatorInterface(object):
         self.jlc = None
         # collision detection
         self.cc = None
+        # analytical ik, an object with the interface of jlchainaik.URTypeAIK; numerical ik is used if None
+        self.aik_slvr = None
+        # reachability map, see enable_reachability_map
+        self.rmap = None
 
     @property
     def jnts(self):
@@ -80,6 +86,12 @@ class ManipulatorInterface(object):
     def get_jnt_ranges(self):
         return self.jlc.get_jnt_ranges()
 
+    def get_jnt_vel_limits(self):
+        return self.jlc.get_jnt_vel_limits()
+
+    def get_jnt_acc_limits(self):
+        return self.jlc.get_jnt_acc_limits()
+
     def goto_homeconf(self):
         self.jlc.fk(jnt_values=self.jlc.homeconf)
 
@@ -92,6 +104,9 @@ class ManipulatorInterface(object):
     def fk(self, jnt_values):
         return self.jlc.fk(jnt_values=jnt_values)
 
+    def fk_many(self, jnt_values_array, toggle_jnts=False):
+        return self.jlc.fk_many(jnt_values_array=jnt_values_array, toggle_jnts=toggle_jnts)
+
     def get_jnt_values(self):
         return self.jlc.get_jnt_values()
 
@@ -107,6 +122,13 @@ class ManipulatorInterface(object):
            tcp_loc_rotmat=None,
            local_minima="accept",
            toggle_debug=False):
+        if self.aik_slvr is not None and not isinstance(tgt_pos, list) and self.aik_slvr.is_supported(tcp_jntid):
+            return self.aik_slvr.ik(tgt_pos,
+                                    tgt_rot,
+                                    seed_conf=seed_conf,
+                                    tcp_jntid=tcp_jntid,
+                                    tcp_loc_pos=tcp_loc_pos,
+                                    tcp_loc_rotmat=tcp_loc_rotmat)
         return self.jlc.num_ik(tgt_pos=tgt_pos,
                                tgt_rot=tgt_rot,
                                seed_conf=seed_conf,
@@ -116,6 +138,92 @@ class ManipulatorInterface(object):
                                local_minima=local_minima,
                                toggle_debug=toggle_debug)
 
+    def ik_batch(self,
+                 tgt_pos_array,
+                 tgt_rotmat_array,
+                 seeds=None,
+                 tcp_jntid=None,
+                 tcp_loc_pos=None,
+                 tcp_loc_rotmat=None):
+        if self.aik_slvr is not None and self.aik_slvr.is_supported(tcp_jntid):
+            # the branch nearest to the first seed is selected
+            seed_conf = None
+            if seeds is not None:
+                seeds = np.asarray(seeds)
+                seed_conf = seeds[:, 0] if seeds.ndim == 3 else seeds.reshape(-1, self.ndof)[0]
+            return self.aik_slvr.ik_many(tgt_pos_array,
+                                         tgt_rotmat_array,
+                                         seed_conf=seed_conf,
+                                         tcp_jntid=tcp_jntid,
+                                         tcp_loc_pos=tcp_loc_pos,
+                                         tcp_loc_rotmat=tcp_loc_rotmat)
+        return self.jlc.num_ik_batch(tgt_pos_array=tgt_pos_array,
+                                     tgt_rotmat_array=tgt_rotmat_array,
+                                     seeds=seeds,
+                                     tcp_jntid=tcp_jntid,
+                                     tcp_loc_pos=tcp_loc_pos,
+                                     tcp_loc_rotmat=tcp_loc_rotmat)
+
+    def ik_all(self,
+               tgt_pos,
+               tgt_rot,
+               tcp_jntid=None,
+               tcp_loc_pos=None,
+               tcp_loc_rotmat=None):
+        """
+        all ik branches of a target
+        the numerical ik only finds one branch, it is used when there is no analytical ik
+        :param tgt_pos:
+        :param tgt_rot:
+        :param tcp_jntid:
+        :param tcp_loc_pos:
+        :param tcp_loc_rotmat:
+        :return: a list of 1xn nparrays, empty if there is no solution
+        """
+        if self.aik_slvr is not None and self.aik_slvr.is_supported(tcp_jntid):
+            jnt_values_array, is_valid = self.aik_slvr.ik_all(tgt_pos,
+                                                              tgt_rot,
+                                                              tcp_jntid=tcp_jntid,
+                                                              tcp_loc_pos=tcp_loc_pos,
+                                                              tcp_loc_rotmat=tcp_loc_rotmat)
+            return list(jnt_values_array[0][is_valid[0]])
+        jnt_values = self.jlc.num_ik(tgt_pos=tgt_pos,
+                                     tgt_rot=tgt_rot,
+                                     tcp_jntid=tcp_jntid,
+                                     tcp_loc_pos=tcp_loc_pos,
+                                     tcp_loc_rotmat=tcp_loc_rotmat)
+        return [] if jnt_values is None else [jnt_values]
+
+    def enable_reachability_map(self, path=None, nsamples=1000000, pos_res=.05):
+        """
+        load the reachability map from path, or build it (and save it to path) if path does not exist
+        :param path: a .npz file, ValueError is raised if it was saved for another jlc or tcp
+        :param nsamples: see reachabilitymap.ReachabilityMap.build
+        :param pos_res:
+        :return:
+        """
+        self.rmap = rmp.ReachabilityMap(self.jlc, pos_res=pos_res)
+        if path is not None and os.path.isfile(path):
+            self.rmap.load(path)
+        else:
+            self.rmap.build(nsamples=nsamples)
+            if path is not None:
+                self.rmap.save(path)
+
+    def disable_reachability_map(self):
+        self.rmap = None
+
+    def is_reachable_many(self, tgt_pos_array, tgt_rotmat_array):
+        """
+        the targets are always reachable if there is no reachability map
+        :param tgt_pos_array: nx3 nparray
+        :param tgt_rotmat_array: nx3x3 nparray
+        :return: 1xn bool nparray
+        """
+        if self.rmap is None:
+            return np.ones(len(tgt_pos_array), dtype=bool)
+        return self.rmap.is_reachable_many(tgt_pos_array, tgt_rotmat_array)
+
     def cvt_loc_intcp_to_gl(self,
                             loc_pos=np.zeros(3),
                             loc_rotmat=np.eye(3),
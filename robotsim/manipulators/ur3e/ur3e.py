@@ -3,6 +3,7 @@ import math
 import numpy as np
 import basis.robot_math as rm
 import robotsim._kinematics.jlchain as jl
+import robotsim._kinematics.jlchainaik as jlaik
 import robotsim.manipulators.manipulator_interface as mi
 
 class UR3E(mi.ManipulatorInterface):
@@ -27,6 +28,9 @@ class UR3E(mi.ManipulatorInterface):
         self.jlc.jnts[6]['loc_motionax'] = np.array([0, 1, 0])
         self.jlc.jnts[7]['loc_pos'] = np.array([0, .092, 0])
         self.jlc.jnts[7]['loc_rotmat'] = rm.rotmat_from_euler(-math.pi/2.0, 0, 0)
+        # the wrist joints are twice as fast as the others
+        for id in [4, 5, 6]:
+            self.jlc.jnts[id]['motion_vel'] = 2 * math.pi
         # links
         self.jlc.lnks[0]['name'] = "base"
         self.jlc.lnks[0]['loc_pos'] = np.zeros(3)
@@ -70,6 +74,8 @@ class UR3E(mi.ManipulatorInterface):
         self.jlc.lnks[6]['meshfile'] = os.path.join(this_dir, "meshes", "wrist3.dae")
         self.jlc.lnks[6]['rgba'] = [.5,.5,.5, 1.0]
         self.jlc.reinitialize()
+        # analytical ik
+        self.aik_slvr = jlaik.URTypeAIK(self.jlc)
         # collision checker
         if enable_cc:
             super().enable_cc()
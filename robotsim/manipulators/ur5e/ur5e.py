@@ -3,6 +3,7 @@ import math
 import numpy as np
 import basis.robot_math as rm
 import robotsim._kinematics.jlchain as jl
+import robotsim._kinematics.jlchainaik as jlaik
 import robotsim.manipulators.manipulator_interface as mi
 
 class UR5E(mi.ManipulatorInterface):
@@ -70,6 +71,8 @@ class UR5E(mi.ManipulatorInterface):
         self.jlc.lnks[6]['meshfile'] = os.path.join(this_dir, "meshes", "wrist3.dae")
         self.jlc.lnks[6]['rgba'] = [.5,.5,.5, 1.0]
         self.jlc.reinitialize()
+        # analytical ik
+        self.aik_slvr = jlaik.URTypeAIK(self.jlc)
         # collision checker
         if enable_cc:
             super().enable_cc()
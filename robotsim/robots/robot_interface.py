@@ -1,6 +1,11 @@
+import os
 import copy
 import numpy as np
+import modeling.spheretree as spt
+import modeling.signeddistancefield as sdf
 import robotsim._kinematics.collisionchecker as cc
+import robotsim._kinematics.ikcache as ikc
+import robotsim._kinematics.edgevalidator as ev
 
 
 class RobotInterface(object):
@@ -12,6 +17,16 @@ class RobotInterface(object):
         self.rotmat = rotmat
         # collision detection
         self.cc = None
+        # use cc.SphereCollisionChecker, see enable_sphere_tree_cc
+        self._toggle_sphere_tree = False
+        # ik cache, see enable_ik_cache
+        self.ik_cache = None
+        # edge validator, see enable_edge_validator
+        self.edge_validator = None
+        # the cd elements moved by each component, see is_collided_many
+        self._moved_cdelements_cache = {}
+        # the leaf spheres of the cd elements moved by each component, see min_distance
+        self._clearance_spheres_cache = {}
         # component map for quick access
         self.manipulator_dict = {}
         self.hnd_dict = {}
@@ -25,6 +40,12 @@ class RobotInterface(object):
     def get_jnt_ranges(self, component_name):
         return self.manipulator_dict[component_name].get_jnt_ranges()
 
+    def get_jnt_vel_limits(self, component_name):
+        return self.manipulator_dict[component_name].get_jnt_vel_limits()
+
+    def get_jnt_acc_limits(self, component_name):
+        return self.manipulator_dict[component_name].get_jnt_acc_limits()
+
     def get_jnt_values(self, component_name):
         return self.manipulator_dict[component_name].get_jnt_values()
 
@@ -50,6 +71,9 @@ class RobotInterface(object):
            tcp_loc_rotmat=None,
            local_minima="accept",
            toggle_debug=False):
+        if self.ik_cache is not None and tcp_jntid is None and tcp_loc_pos is None and tcp_loc_rotmat is None \
+                and not isinstance(tgt_pos, list):
+            return self._cached_ik(component_name, tgt_pos, tgt_rot, seed_conf, local_minima)
         return self.manipulator_dict[component_name].ik(tgt_pos,
                                                         tgt_rot,
                                                         seed_conf=seed_conf,
@@ -59,6 +83,70 @@ class RobotInterface(object):
                                                         local_minima=local_minima,
                                                         toggle_debug=toggle_debug)
 
+    def _cached_ik(self, component_name, tgt_pos, tgt_rot, seed_conf, local_minima):
+        """
+        ik with the default tcp of the component, memoized by self.ik_cache
+        failures are only cached for unseeded queries since a seeded failure might be due to the seed
+        :return:
+        """
+        manipulator = self.manipulator_dict[component_name]
+        key = self.ik_cache.gen_key(component_name,
+                                    tgt_pos,
+                                    tgt_rot,
+                                    manipulator.jlc.pos,
+                                    manipulator.jlc.rotmat,
+                                    manipulator.tcp_jntid,
+                                    manipulator.tcp_loc_pos,
+                                    manipulator.tcp_loc_rotmat,
+                                    local_minima=local_minima)
+        exact_pose = self.ik_cache.gen_exact_pose(tgt_pos,
+                                                  tgt_rot,
+                                                  manipulator.jlc.pos,
+                                                  manipulator.jlc.rotmat,
+                                                  manipulator.tcp_loc_pos,
+                                                  manipulator.tcp_loc_rotmat)
+        is_hit, jnt_values, warm_seed = self.ik_cache.get(key, exact_pose, seed_conf=seed_conf)
+        if is_hit:
+            return jnt_values
+        jnt_values = manipulator.ik(tgt_pos,
+                                    tgt_rot,
+                                    seed_conf=warm_seed if seed_conf is None else seed_conf,
+                                    local_minima=local_minima)
+        if jnt_values is not None or (seed_conf is None and warm_seed is None):
+            self.ik_cache.put(key, exact_pose, jnt_values)
+        return jnt_values
+
+    def ik_batch(self,
+                 component_name,
+                 tgt_pos_array,
+                 tgt_rotmat_array,
+                 seeds=None,
+                 tcp_jntid=None,
+                 tcp_loc_pos=None,
+                 tcp_loc_rotmat=None):
+        return self.manipulator_dict[component_name].ik_batch(tgt_pos_array,
+                                                              tgt_rotmat_array,
+                                                              seeds=seeds,
+                                                              tcp_jntid=tcp_jntid,
+                                                              tcp_loc_pos=tcp_loc_pos,
+                                                              tcp_loc_rotmat=tcp_loc_rotmat)
+
+    def ik_all(self,
+               component_name,
+               tgt_pos,
+               tgt_rot,
+               tcp_jntid=None,
+               tcp_loc_pos=None,
+               tcp_loc_rotmat=None):
+        return self.manipulator_dict[component_name].ik_all(tgt_pos,
+                                                            tgt_rot,
+                                                            tcp_jntid=tcp_jntid,
+                                                            tcp_loc_pos=tcp_loc_pos,
+                                                            tcp_loc_rotmat=tcp_loc_rotmat)
+
+    def is_reachable_many(self, component_name, tgt_pos_array, tgt_rotmat_array):
+        return self.manipulator_dict[component_name].is_reachable_many(tgt_pos_array, tgt_rotmat_array)
+
     def rand_conf(self, component_name):
         return self.manipulator_dict[component_name].rand_conf()
 
@@ -81,6 +169,221 @@ class RobotInterface(object):
                                            otherrobot_list=otherrobot_list)
         return is_collided
 
+    def _get_moved_cdelements(self, component_name):
+        """
+        the cd elements that move with the component, found by moving it once and cached per set of cd elements
+        :param component_name: a key of self.manipulator_dict
+        :return:
+        """
+        key = (component_name, tuple(id(cdelement) for cdelement in self.cc.all_cdelements))
+        if key not in self._moved_cdelements_cache:
+            jnt_values_bk = self.get_jnt_values(component_name)
+            pose_list = [(cdelement['gl_pos'], cdelement['gl_rotmat']) for cdelement in self.cc.all_cdelements]
+            self.fk(component_name, jnt_values_bk + .1)
+            self._moved_cdelements_cache[key] = [cdelement for cdelement, (pos, rotmat)
+                                                 in zip(self.cc.all_cdelements, pose_list)
+                                                 if not (np.allclose(cdelement['gl_pos'], pos) and
+                                                         np.allclose(cdelement['gl_rotmat'], rotmat))]
+            self.fk(component_name, jnt_values_bk)
+        return self._moved_cdelements_cache[key]
+
+    def _get_moved_cdelement_poses(self, component_name, conf_array):
+        """
+        the global poses of the cd elements moved by the component at each configuration, using its batched fk
+        the cd elements fixed to the end of the component (hands, objects in hand) follow its last joint
+        :param component_name: a key of self.manipulator_dict
+        :param conf_array: nxndof nparray
+        :return: [cdelement_list, gl_pos_array nxkx3, gl_rotmat_array nxkx3x3]
+        """
+        manipulator = self.manipulator_dict[component_name]
+        moved_cdelement_list = self._get_moved_cdelements(component_name)
+        lnk_gl_pos, lnk_gl_rotmat, jnts_array = manipulator.fk_many(conf_array, toggle_jnts=True)
+        end_gl_pos = jnts_array['gl_posq'][:, -1]
+        end_gl_rotmat = jnts_array['gl_rotmatq'][:, -1]
+        end_pos = manipulator.jnts[-1]['gl_posq']
+        end_rotmat = manipulator.jnts[-1]['gl_rotmatq']
+        lnkid_dict = {id(lnk): lnkid for lnkid, lnk in enumerate(manipulator.lnks)}
+        gl_pos_array = np.empty((len(conf_array), len(moved_cdelement_list), 3))
+        gl_rotmat_array = np.empty((len(conf_array), len(moved_cdelement_list), 3, 3))
+        for i, cdelement in enumerate(moved_cdelement_list):
+            if id(cdelement) in lnkid_dict:
+                gl_pos_array[:, i] = lnk_gl_pos[:, lnkid_dict[id(cdelement)]]
+                gl_rotmat_array[:, i] = lnk_gl_rotmat[:, lnkid_dict[id(cdelement)]]
+            else:
+                rel_pos = end_rotmat.T.dot(cdelement['gl_pos'] - end_pos)
+                rel_rotmat = end_rotmat.T.dot(cdelement['gl_rotmat'])
+                gl_pos_array[:, i] = end_gl_rotmat @ rel_pos + end_gl_pos
+                gl_rotmat_array[:, i] = end_gl_rotmat @ rel_rotmat
+        return moved_cdelement_list, gl_pos_array, gl_rotmat_array
+
+    def is_collided_many(self,
+                         component_name,
+                         conf_array,
+                         obstacle_list=[],
+                         otherrobot_list=[],
+                         toggle_stop_at_first=False):
+        """
+        check many configurations of a component in one go
+        the link poses are computed by the batched fk of the component, the cd elements fixed to the end of the
+        component (hands, objects in hand) follow its last joint; the robot state is not changed
+        components that are not in self.manipulator_dict are checked one by one using self.fk and self.is_collided
+        :param component_name: a component, or a list of components in self.manipulator_dict that move different
+                               cd elements (e.g. ['lft_arm', 'rgt_arm']), whose configurations are stacked in conf_array
+        :param conf_array: nxndof nparray
+        :param obstacle_list:
+        :param otherrobot_list:
+        :param toggle_stop_at_first: stop at the first collided configuration, the unchecked ones are reported
+                                     as collided
+        :return: 1xn bool nparray
+        """
+        if isinstance(component_name, (list, tuple)):
+            component_name_list = list(component_name)
+            if self.cc is None or any(name not in self.manipulator_dict for name in component_name_list):
+                raise ValueError("A list of components needs an enabled cc and components in manipulator_dict!")
+        elif self.cc is None or component_name not in self.manipulator_dict:
+            result = np.zeros(len(conf_array), dtype=bool)
+            for i, conf in enumerate(conf_array):
+                self.fk(component_name=component_name, jnt_values=conf)
+                result[i] = self.is_collided(obstacle_list=obstacle_list, otherrobot_list=otherrobot_list)
+                if result[i] and toggle_stop_at_first:
+                    result[i + 1:] = True
+                    break
+            return result
+        else:
+            component_name_list = [component_name]
+        ndof_list = [self.manipulator_dict[name].ndof for name in component_name_list]
+        conf_array = np.asarray(conf_array, dtype=np.float64).reshape(-1, sum(ndof_list))
+        cdelement_list = []
+        gl_pos_array_list = []
+        gl_rotmat_array_list = []
+        for name, sub_conf_array in zip(component_name_list,
+                                        np.split(conf_array, np.cumsum(ndof_list)[:-1], axis=1)):
+            moved_cdelement_list, gl_pos_array, gl_rotmat_array = self._get_moved_cdelement_poses(name,
+                                                                                                  sub_conf_array)
+            cdelement_list += moved_cdelement_list
+            gl_pos_array_list.append(gl_pos_array)
+            gl_rotmat_array_list.append(gl_rotmat_array)
+        if len({id(cdelement) for cdelement in cdelement_list}) < len(cdelement_list):
+            raise ValueError("The components must move different cd elements!")
+        return self.cc.is_collided_many(cdelement_list,
+                                        np.concatenate(gl_pos_array_list, axis=1),
+                                        np.concatenate(gl_rotmat_array_list, axis=1),
+                                        obstacle_list=obstacle_list,
+                                        otherrobot_list=otherrobot_list,
+                                        toggle_stop_at_first=toggle_stop_at_first)
+
+    def _get_clearance_spheres(self, component_name):
+        """
+        the leaf spheres of the sphere trees of the cd elements moved by the component, cached per set of cd elements
+        :param component_name: a key of self.manipulator_dict
+        :return: [cdelement_list, loc_center_array nx3, radius_array 1xn, element_ids 1xn, njnts_array 1xk]
+                 sphere i is in the local frame of cdelement_list[element_ids[i]], cd element j is moved by the first
+                 njnts_array[j] joints of the component
+        """
+        key = (component_name, tuple(id(cdelement) for cdelement in self.cc.all_cdelements))
+        if key not in self._clearance_spheres_cache:
+            manipulator = self.manipulator_dict[component_name]
+            cdelement_list = self._get_moved_cdelements(component_name)
+            lnkid_dict = {id(lnk): lnkid for lnkid, lnk in enumerate(manipulator.lnks)}
+            tgtjnt_array = np.array(manipulator.tgtjnts)
+            loc_center_list = []
+            radius_list = []
+            element_id_list = []
+            njnts_list = []
+            for i, cdelement in enumerate(cdelement_list):
+                sphere_tree = spt.get_sphere_tree(cdelement['collisionmodel'])
+                loc_center_list.append(sphere_tree.leaf_center_array)
+                radius_list.append(sphere_tree.leaf_radius_array)
+                element_id_list.append(np.full(len(sphere_tree.leaf_ids), i))
+                # the link of joint i is moved by the joints up to i, the elements fixed to the end by all of them
+                njnts_list.append(np.sum(tgtjnt_array <= lnkid_dict[id(cdelement)]) if id(cdelement) in lnkid_dict
+                                  else len(tgtjnt_array))
+            self._clearance_spheres_cache[key] = [cdelement_list,
+                                                  np.concatenate(loc_center_list).reshape(-1, 3),
+                                                  np.concatenate(radius_list),
+                                                  np.concatenate(element_id_list).astype(int),
+                                                  np.array(njnts_list, dtype=int)]
+        return self._clearance_spheres_cache[key]
+
+    def min_distance(self, component_name, conf, obstacle_list=[]):
+        """
+        the clearance between the cd elements moved by the component and the obstacles, and its gradient with respect
+        to the joint values, e.g. a smooth collision constraint for optimization-based ik and motion
+        the cd elements are approximated by the leaves of their sphere trees (see modeling.spheretree), the obstacles
+        by their signed distance fields (see modeling.signeddistancefield); the gradient is the gradient of the field
+        at the closest sphere chained through the jacobian of its center; the robot state is not changed
+        :param component_name: a key of self.manipulator_dict
+        :param conf: 1xndof nparray
+        :param obstacle_list: a list of CollisionModel, their fields are cached at the first query
+        :return: [distance, gradient 1xndof nparray], the distance is negative if penetrated, inf without obstacles
+        """
+        if self.cc is None or component_name not in self.manipulator_dict:
+            raise ValueError("The clearance needs an enabled cc and a component in manipulator_dict!")
+        manipulator = self.manipulator_dict[component_name]
+        conf = np.asarray(conf, dtype=np.float64)
+        gradient = np.zeros(len(conf))
+        if len(obstacle_list) == 0:
+            return np.inf, gradient
+        jnt_values_bk = self.get_jnt_values(component_name)
+        self.fk(component_name, conf)
+        cdelement_list, loc_center_array, radius_array, element_ids, njnts_array = \
+            self._get_clearance_spheres(component_name)
+        gl_pos_array = np.array([cdelement['gl_pos'] for cdelement in cdelement_list], dtype=np.float64)
+        gl_rotmat_array = np.array([cdelement['gl_rotmat'] for cdelement in cdelement_list], dtype=np.float64)
+        gl_center_array = np.einsum('nij,nj->ni', gl_rotmat_array[element_ids], loc_center_array) + \
+                          gl_pos_array[element_ids]
+        min_distance = np.inf
+        for obstacle in obstacle_list:
+            distances, gradients = sdf.get_distances(obstacle, gl_center_array, toggle_gradients=True)
+            distances -= radius_array
+            sphere_id = np.argmin(distances)
+            if distances[sphere_id] < min_distance:
+                min_distance = distances[sphere_id]
+                min_center = gl_center_array[sphere_id]
+                min_direction = gradients[sphere_id]
+                min_njnts = njnts_array[element_ids[sphere_id]]
+        for i, jnt_id in enumerate(manipulator.tgtjnts[:min_njnts]):
+            jnt = manipulator.jnts[jnt_id]
+            if jnt['type'] == 'prismatic':
+                gradient[i] = min_direction.dot(jnt['gl_motionax'])
+            else:
+                gradient[i] = min_direction.dot(np.cross(jnt['gl_motionax'], min_center - jnt['gl_posq']))
+        self.fk(component_name, jnt_values_bk)
+        return float(min_distance), gradient
+
+    def is_edge_collided(self,
+                         component_name,
+                         conf0,
+                         conf1,
+                         obstacle_list=[],
+                         otherrobot_list=[],
+                         granularity=None):
+        """
+        check the straight joint-space edge between conf0 and conf1, the two ends are excluded
+        the edge is checked by self.edge_validator if it is enabled, or at the fixed joint-space step granularity
+        :param component_name:
+        :param conf0:
+        :param conf1:
+        :param obstacle_list:
+        :param otherrobot_list:
+        :param granularity: ignored if the edge validator is enabled
+        :return:
+        """
+        if self.edge_validator is not None:
+            return self.edge_validator.is_edge_collided(self, component_name, conf0, conf1, obstacle_list,
+                                                        otherrobot_list)
+        if granularity is None:
+            raise ValueError("A granularity is needed if the edge validator is not enabled!")
+        nval = max(int(np.ceil(np.linalg.norm(np.asarray(conf1) - np.asarray(conf0)) / granularity)), 1)
+        conf_array = np.linspace(conf0, conf1, nval + 1)[1:-1]
+        if len(conf_array) == 0:
+            return False
+        return bool(np.any(self.is_collided_many(component_name,
+                                                 conf_array,
+                                                 obstacle_list=obstacle_list,
+                                                 otherrobot_list=otherrobot_list,
+                                                 toggle_stop_at_first=True)))
+
     def show_cdprimit(self):
         self.cc.show_cdprimit()
 
@@ -107,8 +410,56 @@ class RobotInterface(object):
                       name='yumi_gripper_meshmodel'):
         raise NotImplementedError
 
-    def enable_cc(self):
-        self.cc = cc.CollisionChecker("collision_checker")
+    def enable_cc(self, toggle_pair_matrix=False):
+        """
+        :param toggle_pair_matrix: use cc.MatrixCollisionChecker, which has no limit on the number of collision pairs,
+               the bitmask cc.CollisionChecker is faster and should be kept for robots within its limit
+        :return:
+        """
+        if self._toggle_sphere_tree:
+            self.cc = cc.SphereCollisionChecker("collision_checker")
+        elif toggle_pair_matrix:
+            self.cc = cc.MatrixCollisionChecker("collision_checker")
+        else:
+            self.cc = cc.CollisionChecker("collision_checker")
+
+    def enable_sphere_tree_cc(self):
+        """
+        rebuild the collision checker as a cc.SphereCollisionChecker, the links are approximated by their sphere trees
+        the objects held in the hands are cleared, they need to be held again
+        :return:
+        """
+        if self.cc is not None:
+            self.disable_cc()
+        self._toggle_sphere_tree = True
+        self.enable_cc()
+
+    def enable_ik_cache(self, path=None, pos_res=.005, agl_res=np.radians(2), max_nentries=100000):
+        """
+        memoize the ik of the components with their default tcps
+        :param path: a directory saved by self.ik_cache.save, the entries will be loaded if it exists
+        :param pos_res: see ikcache.IKCache
+        :param agl_res:
+        :param max_nentries:
+        :return:
+        """
+        self.ik_cache = ikc.IKCache(pos_res=pos_res, agl_res=agl_res, max_nentries=max_nentries)
+        if path is not None and os.path.isdir(path):
+            self.ik_cache.load(path)
+
+    def disable_ik_cache(self):
+        self.ik_cache = None
+
+    def enable_edge_validator(self, resolution=.02):
+        """
+        check the edges by bounding the displacement of the links instead of a fixed joint-space step
+        :param resolution: see edgevalidator.EdgeValidator
+        :return:
+        """
+        self.edge_validator = ev.EdgeValidator(resolution=resolution)
+
+    def disable_edge_validator(self):
+        self.edge_validator = None
 
     def disable_cc(self):
         """
@@ -86,6 +86,11 @@ class UR3EDual(ri.RobotInterface):
         # collision detection
         if enable_cc:
             self.enable_cc()
+        # component map
+        self.manipulator_dict['rgt_arm'] = self.rgt_arm
+        self.manipulator_dict['lft_arm'] = self.lft_arm
+        self.hnd_dict['rgt_hnd'] = self.rgt_hnd
+        self.hnd_dict['lft_hnd'] = self.lft_hnd
 
     @staticmethod
     def _base_combined_cdnp(name, radius):
@@ -114,8 +119,52 @@ class UR3EDual(ri.RobotInterface):
         return collision_node
 
     def enable_cc(self):
-        super().enable_cc()
-        # raise NotImplementedError
+        super().enable_cc(toggle_pair_matrix=True)
+        self.cc.add_cdlnks(self.lft_base, [0])
+        self.cc.add_cdlnks(self.lft_arm.jlc, [1, 2, 3, 4, 5, 6])
+        self.cc.add_cdlnks(self.lft_hnd.lft, [0, 1])
+        self.cc.add_cdlnks(self.lft_hnd.rgt, [1])
+        self.cc.add_cdlnks(self.rgt_arm.jlc, [1, 2, 3, 4, 5, 6])
+        self.cc.add_cdlnks(self.rgt_hnd.lft, [0, 1])
+        self.cc.add_cdlnks(self.rgt_hnd.rgt, [1])
+        lft_list = [self.lft_arm.lnks[1],
+                    self.lft_arm.lnks[2],
+                    self.lft_arm.lnks[3],
+                    self.lft_arm.lnks[4],
+                    self.lft_arm.lnks[5],
+                    self.lft_arm.lnks[6],
+                    self.lft_hnd.lft.lnks[0],
+                    self.lft_hnd.lft.lnks[1],
+                    self.lft_hnd.rgt.lnks[1]]
+        rgt_list = [self.rgt_arm.lnks[1],
+                    self.rgt_arm.lnks[2],
+                    self.rgt_arm.lnks[3],
+                    self.rgt_arm.lnks[4],
+                    self.rgt_arm.lnks[5],
+                    self.rgt_arm.lnks[6],
+                    self.rgt_hnd.lft.lnks[0],
+                    self.rgt_hnd.lft.lnks[1],
+                    self.rgt_hnd.rgt.lnks[1]]
+        self.cc.set_active_cdlnks(lft_list + rgt_list)
+        # base
+        fromlist = [self.lft_base.lnks[0]]
+        intolist = lft_list[2:] + rgt_list[2:]
+        self.cc.set_cdpair(fromlist, intolist)
+        # each arm, see ur3e.UR3E.enable_cc
+        for arm_list in [lft_list, rgt_list]:
+            self.cc.set_cdpair(arm_list[:1], [arm_list[2]] + arm_list[4:])
+            self.cc.set_cdpair(arm_list[1:2], arm_list[3:])
+            self.cc.set_cdpair(arm_list[2:3], arm_list[5:])
+        # between the arms
+        self.cc.set_cdpair(lft_list[1:], rgt_list[1:])
+
+    def get_hnd_on_component(self, component_name):
+        if component_name == 'rgt_arm':
+            return self.rgt_hnd
+        elif component_name == 'lft_arm':
+            return self.lft_hnd
+        else:
+            raise ValueError("The given jlc does not have a hand!")
 
     def move_to(self, pos, rotmat):
         self.pos = pos